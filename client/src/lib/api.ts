@@ -11,6 +11,7 @@ export interface RecommendationsRequest {
 
 export interface RecommendationsResponse {
   recommendations: Book[];
+  session_id?: string;
 }
 
 export interface ApiResponse<T> {
@@ -19,6 +20,20 @@ export interface ApiResponse<T> {
   data?: T;
 }
 
+const SESSION_STORAGE_KEY = 'shelfScannerSessionId';
+
+/**
+ * The server keeps a library per session, so recommendations only cover newly scanned books
+ */
+const sessionHeaders = (): Record<string, string> => {
+  let sessionId = localStorage.getItem(SESSION_STORAGE_KEY);
+  if (!sessionId) {
+    sessionId = crypto.randomUUID().replace(/-/g, '');
+    localStorage.setItem(SESSION_STORAGE_KEY, sessionId);
+  }
+  return { 'X-Session-Id': sessionId };
+};
+
 /**
  * Process an image to extract book information
  */
@@ -31,6 +46,7 @@ export const processImage = async (imageFile: File): Promise<ProcessedImageRespo
   try {
     const response = await fetch(`/api/process-image`, {
       method: 'POST',
+      headers: sessionHeaders(),
       body: formData,
     });
 
@@ -60,6 +76,7 @@ export const getRecommendations = async (books: Book[]): Promise<Recommendations
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        ...sessionHeaders(),
       },
       body: JSON.stringify({ books }),
     });
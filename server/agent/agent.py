@@ -1,13 +1,14 @@
-from langgraph.graph import StateGraph, MessagesState, START, END
+from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import HumanMessage
-from agent.nodes import llm_call
+from agent.nodes import after_llm_call, llm_call
+from agent.schemas import AgentState
 from config.logging_manager import get_logger
 
-logger = get_logger()
+logger = get_logger(__name__)
 
 # Build workflow
 logger.info("Building agent workflow")
-agent_builder = StateGraph(MessagesState)
+agent_builder = StateGraph(AgentState)
 
 # Add nodes
 logger.debug("Adding nodes to agent workflow")
@@ -16,7 +17,8 @@ agent_builder.add_node("llm_call", llm_call)
 # Add edges to connect nodes
 logger.debug("Adding edges to agent workflow")
 agent_builder.add_edge(START, "llm_call")
-agent_builder.add_edge("llm_call", END)
+# A request the fast model failed on runs llm_call again on the strong model
+agent_builder.add_conditional_edges("llm_call", after_llm_call, ["llm_call", END])
 
 # Compile the agent
 logger.info("Compiling agent")
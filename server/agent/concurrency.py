@@ -0,0 +1,186 @@
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from config.logging_manager import get_logger
+from config.metrics import registry, record_event
+
+logger = get_logger(__name__)
+
+
+class LLMOverloadedError(Exception):
+    """
+    Raised when an LLM call cannot be admitted because the wait queue is full
+    or the caller waited longer than the configured queue timeout.
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMConcurrencyLimiter:
+    """
+    Caps the number of concurrent LLM calls and bounds how many callers may wait for a slot.
+
+    Slots are handed directly from a releasing caller to the oldest waiter, so admission is FIFO.
+    The limiter does not bind to an event loop at construction time, which keeps it safe to create
+    at import time and to use from test clients that spin up their own loops.
+
+    When adaptive, the number of slots moves between min_concurrency and max_concurrency
+    AIMD-style, like TCP's congestion window: each healthy call adds 1/limit of a slot (one
+    slot per limit's worth of calls), and a slow or failed call multiplies the limit by
+    backoff, at most once per decrease_interval so one burst of timeouts counts once.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float, retry_after: int,
+                 min_concurrency: int = 1, adaptive: bool = False, backoff: float = 0.5,
+                 decrease_interval: float = 5.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.adaptive = adaptive
+        self.backoff = backoff
+        self.decrease_interval = decrease_interval
+        self._limit = float(self.max_concurrency)
+        self._next_decrease = 0.0
+        self._active = 0
+        self._waiters = deque()
+
+    @property
+    def limit(self) -> int:
+        """Number of calls admitted at once right now."""
+        return max(self.min_concurrency, int(self._limit))
+
+    @property
+    def active(self) -> int:
+        """Number of LLM calls currently holding a slot."""
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        """Number of callers waiting for a slot."""
+        return len(self._waiters)
+
+    def is_saturated(self) -> bool:
+        """True if a new caller would be rejected right now because the wait queue is full."""
+        return self._active >= self.limit and len(self._waiters) >= self.max_queue
+
+    async def acquire(self):
+        """
+        Acquire a slot, waiting in the bounded queue if all slots are taken.
+
+        Raises:
+            LLMOverloadedError: If the queue is full or the queue timeout elapses.
+        """
+        if self.try_acquire():
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            logger.warning("LLM wait queue full (%d waiting), rejecting request", self.max_queue)
+            record_event("llm_queue_full")
+            raise LLMOverloadedError("Server is busy, please retry shortly", self.retry_after)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up; pass it on.
+                self.release()
+            else:
+                waiter.cancel()
+                self._remove_waiter(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                logger.warning("Timed out after %ss waiting for an LLM slot", self.queue_timeout)
+                record_event("llm_queue_timeout")
+                raise LLMOverloadedError("Timed out waiting for the model, please retry shortly", self.retry_after) from e
+            raise
+
+    def try_acquire(self) -> bool:
+        """Takes a slot if one is free and nobody is queued for it, without waiting."""
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return True
+        return False
+
+    def release(self):
+        """Release a slot, handing it to the oldest live waiter if there is one."""
+        # After a decrease the slot is retired instead, until the calls fit the new limit
+        if self._active <= self.limit and self._hand_over():
+            return
+        self._active -= 1
+
+    def record_success(self):
+        """Additive increase: a call finished quickly and without error."""
+        if not self.adaptive or self._limit >= self.max_concurrency:
+            return
+        self._limit = min(float(self.max_concurrency), self._limit + 1.0 / self._limit)
+        # A grown limit admits waiters straight away rather than on the next release
+        while self._active < self.limit and self._hand_over():
+            self._active += 1
+
+    def record_congestion(self):
+        """Multiplicative decrease: a call was slow, failed or timed out."""
+        if not self.adaptive:
+            return
+        now = time.monotonic()
+        if now < self._next_decrease:
+            return
+        self._next_decrease = now + self.decrease_interval
+        previous = self.limit
+        self._limit = max(float(self.min_concurrency), self._limit * self.backoff)
+        if self.limit < previous:
+            logger.warning("LLM concurrency limit lowered from %d to %d", previous, self.limit)
+            record_event("llm_limit_decreased")
+
+    def _hand_over(self) -> bool:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return True
+        return False
+
+    def _remove_waiter(self, waiter):
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    @asynccontextmanager
+    async def slot(self):
+        """Async context manager that holds a slot for the duration of the block."""
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+
+llm_limiter = LLMConcurrencyLimiter(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "32")),
+    queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30")),
+    retry_after=int(os.getenv("LLM_RETRY_AFTER_SECONDS", "5")),
+    min_concurrency=int(os.getenv("LLM_MIN_CONCURRENCY", "1")),
+    adaptive=os.getenv("LLM_ADAPTIVE_CONCURRENCY", "true").lower() == "true",
+    backoff=float(os.getenv("LLM_AIMD_BACKOFF", "0.5")),
+    decrease_interval=float(os.getenv("LLM_AIMD_DECREASE_INTERVAL_SECONDS", "5")),
+)
+registry.gauge(
+    "shelf_scanner_llm_calls", "LLM calls holding a slot (active) or queued for one (waiting).", ("state",),
+    callback=lambda: {("active",): llm_limiter.active, ("waiting",): llm_limiter.waiting},
+)
+registry.gauge(
+    "shelf_scanner_llm_concurrency_limit", "Concurrent LLM calls currently admitted by the adaptive limiter.",
+    callback=lambda: {(): llm_limiter.limit},
+)
+logger.debug(
+    "LLM concurrency limiter initialized (max_concurrency=%d, max_queue=%d, adaptive=%s)",
+    llm_limiter.max_concurrency, llm_limiter.max_queue, llm_limiter.adaptive,
+)
@@ -0,0 +1,284 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from config.logging_manager import get_logger
+
+logger = get_logger(__name__)
+
+# A small catalog of well-known books so fake output looks like a real shelf.
+_KNOWN_BOOKS = [
+    ("Dune", "An epic science fiction saga set on a desert planet, delving into politics, religion, and ecological warfare."),
+    ("Pride and Prejudice", "A timeless romantic novel exploring societal expectations and the complexities of love in 19th-century England."),
+    ("The Hitchhiker's Guide to the Galaxy", "A comedic space opera that follows an unwitting human's misadventures across the universe after Earth's destruction."),
+    ("1984", "A chilling dystopian vision of a surveillance state where truth itself is rewritten by the Party."),
+    ("To Kill a Mockingbird", "A powerful coming-of-age story about racial injustice and moral courage in the American South."),
+    ("The Great Gatsby", "A glittering portrait of Jazz Age excess and the hollow pursuit of the American Dream."),
+    ("Brave New World", "A dystopian novel exploring a future society where technological control replaces individual freedom."),
+    ("The Catcher in the Rye", "A coming-of-age story following a teenager's journey of self-discovery and alienation in 1950s America."),
+    ("Fahrenheit 451", "A dystopian tale about a future where books are banned and firemen burn them instead of extinguishing fires."),
+    ("Beloved", "A haunting novel about a formerly enslaved woman confronting the ghost of her painful past."),
+    ("One Hundred Years of Solitude", "A magical realist chronicle of seven generations of the Buendía family in the town of Macondo."),
+    ("The Name of the Wind", "A lyrical fantasy in which a legendary wizard recounts the story of his extraordinary youth."),
+    ("Sapiens", "A sweeping history of humankind from the Stone Age to the age of algorithms."),
+    ("The Left Hand of Darkness", "A thoughtful science fiction classic about an envoy navigating a world without fixed gender."),
+    ("Middlemarch", "A rich portrait of provincial English life, ambition and marriage in the 1830s."),
+    ("The Road", "A stark, tender journey of a father and son crossing a burned post-apocalyptic America."),
+    ("Jane Eyre", "A fiercely independent governess finds love and secrets at the brooding Thornfield Hall."),
+    ("The Hobbit", "A reluctant hobbit joins a band of dwarves on a quest to reclaim a dragon-guarded treasure."),
+    ("Neuromancer", "A washed-up hacker is hired for one last job in the cyberpunk novel that defined the genre."),
+    ("Thinking, Fast and Slow", "A Nobel laureate's tour of the two systems that drive the way we think and decide."),
+]
+
+_ADJECTIVES = ["Silent", "Hidden", "Last", "Broken", "Golden", "Distant", "Forgotten", "Crimson", "Endless", "Quiet"]
+_NOUNS = ["Garden", "River", "Empire", "Lighthouse", "Archive", "Winter", "Orchard", "Harbor", "Kingdom", "Library"]
+_GENRES = ["literary novel", "thriller", "fantasy epic", "family saga", "mystery", "historical novel", "memoir", "science fiction adventure"]
+_THEMES = ["grief and renewal", "ambition and its cost", "found family", "memory and identity", "power and corruption", "love across divides"]
+
+
+def _synthetic_book(index: int) -> tuple:
+    """Returns a plausible made-up title and gist, unique per index, for shelves larger than the known catalog."""
+    adjective = _ADJECTIVES[index % len(_ADJECTIVES)]
+    noun = _NOUNS[(index // len(_ADJECTIVES)) % len(_NOUNS)]
+    volume = index // (len(_ADJECTIVES) * len(_NOUNS))
+    title = f"The {adjective} {noun}" + (f": Volume {volume + 1}" if volume else "")
+    genre = _GENRES[index % len(_GENRES)]
+    theme = _THEMES[index % len(_THEMES)]
+    return title, f"A gripping {genre} about {theme}, set around a {noun.lower()} that holds a {adjective.lower()} secret."
+
+
+def _requested_titles(message: BaseMessage) -> Optional[List[str]]:
+    if not isinstance(message.content, str):
+        return None
+    try:
+        titles = json.loads(message.content)
+    except ValueError:
+        return None
+    if isinstance(titles, list) and titles and all(isinstance(title, str) for title in titles):
+        return titles
+    return None
+
+
+# A re-ranking prompt lists the books to choose from as a JSON list after this heading
+_CANDIDATES = re.compile(r"\*\*Candidates:\*\*\s*(\[.*?\])\s*$", re.MULTILINE | re.DOTALL)
+
+
+def _candidate_titles(message: BaseMessage) -> Optional[List[str]]:
+    if not isinstance(message.content, str):
+        return None
+    match = _CANDIDATES.search(message.content)
+    if match is None:
+        return None
+    try:
+        titles = json.loads(match.group(1))
+    except ValueError:
+        return None
+    if isinstance(titles, list) and titles and all(isinstance(title, str) for title in titles):
+        return titles
+    return None
+
+
+def _is_identify_only(message: BaseMessage) -> bool:
+    if not isinstance(message.content, list):
+        return False
+    kinds = {part.get("type") for part in message.content if isinstance(part, dict)}
+    return {"image_url", "text"} <= kinds
+
+
+# Gemini bills a small image as 258 tokens; text is roughly 4 characters per token
+_IMAGE_TOKENS = 258
+_CHARS_PER_TOKEN = 4
+
+
+def _message_tokens(message: BaseMessage) -> int:
+    if isinstance(message.content, str):
+        return len(message.content) // _CHARS_PER_TOKEN
+    tokens = 0
+    for part in message.content:
+        if isinstance(part, dict) and part.get("type") == "image_url":
+            tokens += _IMAGE_TOKENS
+        elif isinstance(part, dict):
+            tokens += len(part.get("text", "")) // _CHARS_PER_TOKEN
+        else:
+            tokens += len(part) // _CHARS_PER_TOKEN
+    return tokens
+
+
+class FakeShelfLLM(BaseChatModel):
+    """
+    Deterministic offline stand-in for the Gemini chat model.
+
+    Replies with realistic title -> gist JSON. The book count and the latency are drawn from
+    configurable distributions seeded by the input messages, so the same request always gets
+    the same reply while different requests vary. A message that is a JSON list of titles gets
+    gists for exactly those titles, a re-ranking prompt gets some of its candidates back, and
+    an image sent with an instruction (identify-only scans) gets titles with empty gists.
+    Supports invoke, ainvoke and astream.
+
+    A share of replies (malformed_rate) comes out malformed the ways cheap models' replies do:
+    cut off midway, with a trailing comma, in an unterminated code fence, or as prose.
+
+    Replies carry usage metadata estimated like Gemini's, with a leading system message
+    counted as read from the provider's prompt cache once the same one has been sent before.
+    """
+
+    latency_ms: float = 800.0
+    latency_sigma: float = 0.35
+    min_books: int = 3
+    max_books: int = 20
+    fenced: bool = False
+    seed: int = 0
+    stream_chunk_chars: int = 24
+    malformed_rate: float = 0.0
+
+    def model_post_init(self, __context: Any) -> None:
+        self._cached_prefixes = set()
+        self._cache_lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-shelf"
+
+    def _usage(self, messages: List[BaseMessage], text: str) -> dict:
+        input_tokens = sum(_message_tokens(message) for message in messages)
+        cache_read = 0
+        if messages and isinstance(messages[0], SystemMessage):
+            prefix = hashlib.sha1(str(messages[0].content).encode("utf-8")).digest()
+            with self._cache_lock:
+                if prefix in self._cached_prefixes:
+                    cache_read = _message_tokens(messages[0])
+                self._cached_prefixes.add(prefix)
+        output_tokens = len(text) // _CHARS_PER_TOKEN
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+            "input_token_details": {"cache_read": cache_read},
+        }
+
+    def _rng(self, messages: List[BaseMessage]) -> random.Random:
+        digest = hashlib.sha1(str(self.seed).encode("utf-8"))
+        for message in messages:
+            digest.update(str(message.content).encode("utf-8"))
+        return random.Random(digest.digest())
+
+    def _reply(self, messages: List[BaseMessage]) -> tuple:
+        """Returns (reply text, latency in seconds) for the given input."""
+        rng = self._rng(messages)
+        latency = self.latency_ms / 1000.0
+        if self.latency_sigma > 0:
+            # Lognormal around the configured median, like real provider latencies
+            latency *= math.exp(rng.gauss(0.0, self.latency_sigma))
+
+        requested = _requested_titles(messages[-1]) if messages else None
+        candidates = _candidate_titles(messages[-1]) if messages else None
+        known_gists = dict(_KNOWN_BOOKS)
+        if candidates is not None:
+            # A re-ranking prompt gets a reordered subset of its candidates
+            picks = rng.sample(candidates, rng.randint(1, len(candidates)))
+            books = {title: known_gists.get(title) or _synthetic_book(rng.randrange(1000))[1] for title in picks}
+        elif requested is not None:
+            # A plain list of titles asks for their gists
+            books = {title: known_gists.get(title) or _synthetic_book(rng.randrange(1000))[1] for title in requested}
+        else:
+            num_books = rng.randint(self.min_books, max(self.min_books, self.max_books))
+            known = rng.sample(_KNOWN_BOOKS, min(num_books, len(_KNOWN_BOOKS)))
+            books = dict(known)
+            if num_books > len(known):
+                offset = rng.randrange(1000)
+                books.update(_synthetic_book(offset + i) for i in range(num_books - len(known)))
+            if messages and _is_identify_only(messages[-1]):
+                # An image plus an instruction asks for titles only
+                books = {title: "" for title in books}
+        text = json.dumps(books, indent=2, ensure_ascii=False)
+        if self.fenced:
+            text = f"```json\n{text}\n```"
+        if self.malformed_rate > 0 and rng.random() < self.malformed_rate:
+            text = _malform(text, rng)
+        return text, latency
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text, latency = self._reply(messages)
+        time.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=self._usage(messages, text)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text, latency = self._reply(messages)
+        await asyncio.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=self._usage(messages, text)))])
+
+    def _chunks(self, text: str) -> List[str]:
+        size = max(1, self.stream_chunk_chars)
+        return [text[i:i + size] for i in range(0, len(text), size)]
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text, latency = self._reply(messages)
+        chunks = self._chunks(text)
+        usage = self._usage(messages, text)
+        for i, chunk in enumerate(chunks):
+            time.sleep(latency / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage if i == len(chunks) - 1 else None))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text, latency = self._reply(messages)
+        chunks = self._chunks(text)
+        usage = self._usage(messages, text)
+        for i, chunk in enumerate(chunks):
+            await asyncio.sleep(latency / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk, usage_metadata=usage if i == len(chunks) - 1 else None))
+
+
+def _malform(text: str, rng: random.Random) -> str:
+    """Breaks a JSON reply in one of the ways model replies come out malformed."""
+    mode = rng.choice(("truncated", "trailing_comma", "unterminated_fence", "prose"))
+    if mode == "truncated":
+        return text[:rng.randint(len(text) // 2, len(text) - 2)]
+    if mode == "trailing_comma":
+        return text[:text.rfind('"') + 1] + ",\n}"
+    if mode == "unterminated_fence":
+        return f"```json\n{text.strip('`').removeprefix('json').strip()}\n"
+    return "I can see a bookshelf, but the spines are too small for me to read the titles reliably."
+
+
+class ReplayLLM(BaseChatModel):
+    """
+    Replays recorded model replies from a JSONL file, one {"content": "..."} object per line,
+    cycling through them in order. Useful for profiling against real response shapes offline.
+    """
+
+    path: str
+    latency_ms: float = 0.0
+
+    def model_post_init(self, __context: Any) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            replies = [json.loads(line)["content"] for line in f if line.strip()]
+        if not replies:
+            raise ValueError(f"Replay file '{self.path}' contains no replies")
+        self._replies = itertools.cycle(replies)
+        self._lock = threading.Lock()
+        logger.info("Loaded %d replies for replay from %s", len(replies), self.path)
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay"
+
+    def _next_reply(self) -> str:
+        with self._lock:
+            return next(self._replies)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency_ms / 1000.0)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._next_reply()))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency_ms / 1000.0)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._next_reply()))])
@@ -1,23 +1,115 @@
 import os
-from langchain_google_genai import ChatGoogleGenerativeAI
+import threading
+from typing import Callable, Dict, Optional, Tuple
+from langchain_core.language_models.chat_models import BaseChatModel
 from config.logging_manager import get_logger
 from dotenv import load_dotenv
 
 load_dotenv()
 
-logger = get_logger()
-logger.info("Initializing Gemini LLM model")
-
-# Get API key from environment variable with validation
-gemini_api_key = os.getenv("GEMINI_API_KEY")
-if not gemini_api_key:
-    raise ValueError("GEMINI_API_KEY environment variable is required")
+logger = get_logger(__name__)
 
 # Get model name from environment variable, default to gemini-2.5-flash
 gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# The cheaper model tried first by the router (agent/routing.py), escalating to GEMINI_MODEL;
+# leave empty, or set to GEMINI_MODEL, to send every call to GEMINI_MODEL
+fast_model = os.getenv("LLM_FAST_MODEL", "gemini-2.5-flash-lite")
+
+# Which backend get_llm() builds: gemini (default), fake or replay
+llm_backend = os.getenv("LLM_BACKEND", "gemini").lower()
+
+
+def _build_gemini(model: str = None) -> BaseChatModel:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    model = model or gemini_model
+    logger.info("Initializing Gemini LLM model %s", model)
+
+    # Get API key from environment variable with validation
+    gemini_api_key = os.getenv("GEMINI_API_KEY")
+    if not gemini_api_key:
+        raise ValueError("GEMINI_API_KEY environment variable is required")
+
+    # The client's own retries run inside the resilience layer's deadline (agent/resilience.py)
+    gemini = ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=gemini_api_key,
+        max_retries=int(os.getenv("GEMINI_MAX_RETRIES", "2")),
+    )
+    logger.debug("Gemini LLM model initialized successfully")
+    return gemini
+
+
+def _build_fake(model: str = None) -> BaseChatModel:
+    from agent.fake_llm import FakeShelfLLM
+
+    logger.info("Initializing fake offline LLM backend%s", f" for {model}" if model else "")
+    # Malformed replies, to exercise JSON repair and escalation, come only from the fast model
+    is_fast = bool(model) and model == fast_model and model != gemini_model
+    return FakeShelfLLM(
+        latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "800")),
+        latency_sigma=float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.35")),
+        min_books=int(os.getenv("FAKE_LLM_MIN_BOOKS", "3")),
+        max_books=int(os.getenv("FAKE_LLM_MAX_BOOKS", "20")),
+        fenced=os.getenv("FAKE_LLM_FENCED", "false").lower() == "true",
+        seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+        malformed_rate=float(os.getenv("FAKE_LLM_FAST_MALFORMED_RATE", "0")) if is_fast else 0.0,
+    )
+
+
+def _build_replay(model: str = None) -> BaseChatModel:
+    from agent.fake_llm import ReplayLLM
+
+    replay_file = os.getenv("LLM_REPLAY_FILE")
+    if not replay_file:
+        raise ValueError("LLM_REPLAY_FILE environment variable is required for the replay backend")
+    logger.info("Initializing replay LLM backend from %s", replay_file)
+    return ReplayLLM(path=replay_file, latency_ms=float(os.getenv("REPLAY_LLM_LATENCY_MS", "0")))
+
+
+_BACKENDS: Dict[str, Callable[..., BaseChatModel]] = {
+    "gemini": _build_gemini,
+    "fake": _build_fake,
+    "replay": _build_replay,
+}
+_instances: Dict[Tuple[str, Optional[str]], BaseChatModel] = {}
+_lock = threading.Lock()
+
+
+def register_backend(name: str, factory: Callable[..., BaseChatModel]):
+    """
+    Registers an LLM backend factory under a name selectable through LLM_BACKEND. The factory
+    is called with no arguments for the default model, or with a model name.
+    """
+    _BACKENDS[name.lower()] = factory
+
+
+def get_llm(backend: str = None, model: str = None) -> BaseChatModel:
+    """
+    Returns the chat model for the configured backend, constructing it on first use.
+
+    Args:
+        backend: Optional backend name; defaults to the LLM_BACKEND environment variable.
+        model: Optional model name; defaults to the backend's own (GEMINI_MODEL for Gemini).
+
+    Returns:
+        The shared chat model instance for that backend and model.
+    """
+    key = ((backend or llm_backend).lower(), model or None)
+    instance = _instances.get(key)
+    if instance is not None:
+        return instance
+    with _lock:
+        if key not in _instances:
+            factory = _BACKENDS.get(key[0])
+            if factory is None:
+                raise ValueError(f"Unknown LLM_BACKEND '{key[0]}', expected one of {sorted(_BACKENDS)}")
+            _instances[key] = factory(model) if model else factory()
+        return _instances[key]
+
 
-gemini = ChatGoogleGenerativeAI(
-    model=gemini_model,
-    google_api_key=gemini_api_key
-)
-logger.debug("Gemini LLM model initialized successfully")
+def __getattr__(name: str):
+    # Keeps `from agent.llm import gemini` working while deferring construction to first use.
+    if name == "gemini":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
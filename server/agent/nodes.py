@@ -1,43 +1,132 @@
-from langgraph.graph import MessagesState
-from langchain_core.messages import SystemMessage, AIMessage
-from agent.llm import gemini
-from agent.prompts.retrieve_prompts import read_md_file
-from agent.post_process import post_process_llm_response # Import the new post-process function
+import time
+from typing import AsyncIterator, List, Optional
+from langchain_core.messages import SystemMessage, AIMessage, BaseMessage
+from langgraph.graph import END
+from agent import routing
+from agent.concurrency import LLMOverloadedError
+from agent.prompts.registry import prompts
+from agent.resilience import LLMUnavailableError, invoke_model, model_available, stream_model
+from agent.post_process import repair_book_gists, try_parse_book_gists
+from agent.schemas import AgentState
 from config.logging_manager import get_logger
-import json # Import json for converting dict to string
+from config.metrics import stage, record_event
 
-logger = get_logger()
+logger = get_logger(__name__)
+
+
+def with_system_prompt(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Puts the system prompt in front of a request. Callers with their own instructions (e.g.
+    recommendations) send a system message first and keep it; anything else is a scan and
+    gets the scan prompt. Either way the request opens with the same static text on every
+    call, which is the prefix the provider can cache.
+    """
+    if messages and isinstance(messages[0], SystemMessage):
+        return list(messages)
+    return [SystemMessage(content=prompts.get("sys_prompt"))] + list(messages)
+
+
+def record_usage(usage: Optional[dict]):
+    """
+    Records the input tokens of a model call, and how many of them the provider served
+    from its prompt cache.
+    """
+    if not usage:
+        return
+    record_event("llm_input_tokens", usage.get("input_tokens", 0))
+    record_event("llm_output_tokens", usage.get("output_tokens", 0))
+    cached = (usage.get("input_token_details") or {}).get("cache_read") or 0
+    record_event("llm_cached_input_tokens", cached)
 
-# Load the system prompt content
-SYSTEM_PROMPT_CONTENT = read_md_file("sys_prompt.md")
 
 # Nodes
-def llm_call(state: MessagesState):
+async def llm_call(state: AgentState):
     """
-    Invokes the LLM and post-processes its response to ensure it conforms to BookGistResponse schema.
+    Invokes the LLM and parses its response into a validated BookGistResponse, stored on the state
+    as book_gists (None if the reply could not be parsed).
+    The call is awaited so the event loop keeps serving other requests, and it goes through the
+    resilience layer: a deadline, the shared adaptive concurrency limiter, optional hedging and
+    the circuit breaker.
+    The call goes to the model of the state's routing tier, the fast one by default. A reply
+    that does not parse is repaired locally; if that fails, or the fast model's call errors or
+    its circuit breaker is open, the state is marked for escalation and the graph runs this
+    node again on the strong model.
     """
+    tier = state.get("tier") or routing.first_tier()
+    start = time.monotonic()
     # Invoke the LLM to get a raw string response
-    llm_response_message = gemini.invoke(
-        [
-            SystemMessage(
-                content=SYSTEM_PROMPT_CONTENT
-            )
-        ]
-        + state["messages"]
-    )
-    
+    try:
+        with stage("llm"):
+            llm_response_message = await invoke_model(with_system_prompt(state["messages"]), routing.model_for(tier))
+    except LLMUnavailableError:
+        routing.record(tier, "error", time.monotonic() - start)
+        # The fast model is down, not the server overloaded: the strong one may still answer
+        if not routing.can_escalate(tier):
+            raise
+        logger.warning("Escalating to the strong model, the fast model's circuit breaker is open")
+        return _escalate()
+    except LLMOverloadedError:
+        routing.record(tier, "error", time.monotonic() - start)
+        raise
+    except Exception as e:
+        routing.record(tier, "error", time.monotonic() - start)
+        if not routing.can_escalate(tier):
+            raise
+        logger.warning("Escalating to the strong model, the fast model's call failed: %r", e)
+        return _escalate()
+    record_usage(getattr(llm_response_message, "usage_metadata", None))
+
     raw_content = llm_response_message.content
-    
-    # Use the new post-processing function
-    processed_content = post_process_llm_response(raw_content)
 
-    # AIMessage content expects a string or a list, not a dict directly.
-    # Convert the dictionary to a JSON string if it's a dict.
-    if isinstance(processed_content, dict):
-        final_content = json.dumps(processed_content, indent=2)
-    else:
-        final_content = processed_content
+    with stage("post_process"):
+        book_gists = try_parse_book_gists(raw_content)
+        outcome = "ok"
+        if book_gists is None:
+            book_gists = repair_book_gists(raw_content)
+            outcome = "repaired" if book_gists is not None else "failed"
+    routing.record(tier, outcome, time.monotonic() - start)
+    if outcome == "repaired":
+        record_event("llm_reply_repaired")
+    if book_gists is None:
+        record_event("parse_failure")
+        if routing.can_escalate(tier):
+            logger.warning("Escalating to the strong model, the fast model's reply could not be repaired")
+            return _escalate()
 
     return {
-        "messages": [AIMessage(content=final_content)]
+        "messages": [AIMessage(content=raw_content)],
+        "book_gists": book_gists,
+        "tier": tier,
+        "escalate": False,
     }
+
+
+def _escalate() -> dict:
+    record_event("llm_escalations")
+    return {"book_gists": None, "tier": routing.STRONG, "escalate": True}
+
+
+def after_llm_call(state: AgentState) -> str:
+    """Sends an escalated request back to llm_call, on the strong model, and ends otherwise."""
+    return "llm_call" if state.get("escalate") else END
+
+
+async def stream_llm_call(messages: List[BaseMessage], tier: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Streams the text of the LLM's reply to the scan prompt chunk by chunk.
+
+    Used by the streaming endpoint, which parses books out of the partial reply as they
+    arrive. A concurrency limiter slot is held until the stream is exhausted or closed. Books
+    already streamed can't be taken back, so streams stay on the tier they start on, which is
+    the strong one while the fast model's circuit breaker is open.
+    """
+    tier = tier or routing.first_tier()
+    if routing.can_escalate(tier) and not model_available(routing.model_for(tier)):
+        tier = routing.STRONG
+    async for chunk in stream_model(with_system_prompt(messages), routing.model_for(tier)):
+        # Providers report usage on the last chunk
+        record_usage(getattr(chunk, "usage_metadata", None))
+        if isinstance(chunk.content, str):
+            yield chunk.content
+        else:
+            yield "".join(part if isinstance(part, str) else part.get("text", "") for part in chunk.content)
@@ -1,10 +1,168 @@
 import json
 import re
 from agent.schemas import BookGistResponse
-from typing import Union, Dict
+from typing import Union, Dict, Optional
+from pydantic import ValidationError
 from config.logging_manager import get_logger
 
-logger = get_logger()
+logger = get_logger(__name__)
+
+_decoder = json.JSONDecoder()
+
+# Code fence markers, opening or closing, anywhere in the reply
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def parse_book_gists(raw_content: str) -> BookGistResponse:
+    """
+    Extracts and validates the JSON object in an LLM response in a single pass.
+
+    Handles both a bare JSON object and one wrapped in a ```json fence, with or without
+    surrounding prose. The span between the first "{" and the last "}" is validated directly
+    by pydantic-core, which parses and validates in one step. Only if that span is not a
+    valid object (e.g. prose after the fence contains a brace) does it fall back to decoding
+    exactly one object starting at the first "{".
+
+    Args:
+        raw_content: The raw string content from the LLM's response.
+
+    Returns:
+        The validated BookGistResponse.
+
+    Raises:
+        ValueError: If no JSON object can be extracted or it does not match the schema.
+    """
+    start = raw_content.find("{")
+    end = raw_content.rfind("}")
+    if start == -1 or end < start:
+        raise ValueError("No JSON object found in LLM response")
+
+    try:
+        return BookGistResponse.model_validate_json(raw_content[start:end + 1])
+    except ValidationError as e:
+        if any(error["type"] != "json_invalid" for error in e.errors()):
+            raise ValueError(f"Error validating LLM response: {e}") from e
+
+    try:
+        parsed, _ = _decoder.raw_decode(raw_content, start)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Failed to parse JSON from LLM response: {e}") from e
+    try:
+        return BookGistResponse.model_validate(parsed)
+    except ValidationError as e:
+        raise ValueError(f"Error validating LLM response: {e}") from e
+
+
+def try_parse_book_gists(raw_content: str) -> Optional[BookGistResponse]:
+    """
+    Like parse_book_gists, but logs and returns None instead of raising.
+    """
+    logger.debug("Post-processing LLM response (length: %d)", len(raw_content))
+    try:
+        book_gists = parse_book_gists(raw_content)
+    except ValueError as e:
+        logger.warning("Could not extract book gists from LLM response: %s", e)
+        return None
+    logger.info("Successfully validated LLM response with Pydantic model")
+    return book_gists
+
+
+def repair_json_object(raw_content: str) -> Optional[str]:
+    """
+    Repairs the ways a model's JSON object most often comes out malformed: code fences left
+    unterminated, trailing commas, raw newlines inside strings, and replies cut off midway,
+    which are cut back to their last complete member and closed.
+
+    Args:
+        raw_content: The raw string content from the LLM's response.
+
+    Returns:
+        The text of the repaired object, or None if there is no object, or a truncated one
+        has no complete member to keep.
+    """
+    text = _FENCE.sub("", raw_content)
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    out = []
+    # Open brackets, and for each open object whether its next string is a value
+    stack = []
+    in_string = escaped = is_value = False
+    previous = ""
+    # Length of out after the last complete member of the outermost object
+    last_member_end = None
+    for ch in text[start:]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+                previous = ch
+                out.append(ch)
+                if len(stack) == 1 and is_value:
+                    last_member_end = len(out)
+                continue
+            out.append(_STRING_ESCAPES.get(ch, ch))
+            continue
+
+        if ch == '"':
+            in_string = True
+            is_value = previous == ":"
+        elif ch in "{[":
+            stack.append(ch)
+        elif ch in "}]":
+            _drop_trailing_comma(out)
+            opener = stack.pop()
+            ch = "}" if opener == "{" else "]"
+            if not stack:
+                out.append(ch)
+                return "".join(out)
+        elif ch == "," and len(stack) == 1:
+            _drop_trailing_comma(out)
+            last_member_end = len(out)
+        out.append(ch)
+        if len(stack) == 1 and ch in "}]":
+            last_member_end = len(out)
+        if not ch.isspace():
+            previous = ch
+
+    # Cut off midway: keep the complete members and close the object
+    if last_member_end is None:
+        return None
+    out = out[:last_member_end]
+    _drop_trailing_comma(out)
+    return "".join(out) + "}"
+
+
+def _drop_trailing_comma(out: list):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_book_gists(raw_content: str) -> Optional[BookGistResponse]:
+    """
+    Repairs a reply that try_parse_book_gists could not parse and validates the result.
+
+    Returns:
+        The validated BookGistResponse, or None if the reply could not be repaired.
+    """
+    repaired = repair_json_object(raw_content)
+    if repaired is None:
+        return None
+    try:
+        book_gists = BookGistResponse.model_validate_json(repaired)
+    except ValidationError as e:
+        logger.warning("Repaired LLM response still does not match the schema: %d errors", e.error_count())
+        return None
+    logger.info("Repaired malformed JSON in LLM response (%d books)", len(book_gists.root))
+    return book_gists
+
 
 def post_process_llm_response(raw_content: str) -> Union[Dict[str, str], str]:
     """
@@ -16,45 +174,11 @@ def post_process_llm_response(raw_content: str) -> Union[Dict[str, str], str]:
     Returns:
         A dictionary representing the validated JSON response, or an error string.
     """
-    logger.debug(f"Post-processing LLM response (length: {len(raw_content)})")
-    parsed_json_data = None
-    
-    # Attempt to extract JSON from markdown code block (```json { ... } ```)
-    json_match = re.search(r"```json\s*(\{.*?\})\s*```", raw_content, re.DOTALL)
-    
-    if json_match:
-        json_string = json_match.group(1)
-        logger.debug("Found JSON in markdown code block")
-        try:
-            parsed_json_data = json.loads(json_string)
-            logger.debug("Successfully parsed JSON from markdown block")
-        except json.JSONDecodeError as e:
-            logger.warning(f"Failed to parse JSON from markdown block: {e}")
-            # If markdown block is present but content is not valid JSON, try raw content
-            pass
-    
-    if parsed_json_data is None:
-        # If no markdown block or parsing failed, try to parse the raw content directly
-        logger.debug("Attempting to parse raw content as JSON")
-        try:
-            parsed_json_data = json.loads(raw_content)
-            logger.debug("Successfully parsed raw content as JSON")
-        except json.JSONDecodeError as e:
-            logger.warning(f"Failed to parse raw content as JSON: {e}")
-            # If all parsing fails, return the raw content as an error string
-            logger.debug("Returning raw content as error string")
-            return raw_content
-
-    # Validate with Pydantic model
-    logger.debug("Validating parsed JSON with Pydantic model")
     try:
-        validated_response = BookGistResponse.model_validate(parsed_json_data)
-        logger.info("Successfully validated LLM response with Pydantic model")
-        # Return the validated Pydantic object's root content (the dict)
-        return validated_response.root
-    except Exception as e:
-        # If Pydantic validation fails, return an error message along with the raw content
-        logger.error(f"Error validating LLM response with Pydantic model: {e}")
-        error_msg = f"Error validating LLM response: {e}\nRaw content: {raw_content}"
-        logger.debug("Returning validation error message")
-        return error_msg
+        return parse_book_gists(raw_content).root
+    except ValueError as e:
+        repaired = repair_book_gists(raw_content)
+        if repaired is not None:
+            return repaired.root
+        logger.error("Error post-processing LLM response: %s", e)
+        return f"{e}\nRaw content: {raw_content}"
@@ -0,0 +1,162 @@
+"""
+Registry of the prompt templates in agent/prompts.
+
+Every *.md file in this directory is a template named after the file ("sys_prompt.md" is
+"sys_prompt"). All templates are read and validated once, at import, so a missing or broken
+prompt stops the server at startup instead of being sent to the model. Requests then render
+from memory; with hot reload on, the files' mtimes are checked at most once per
+PROMPT_RELOAD_INTERVAL seconds and changed files are re-read, keeping the previous version
+if the new one does not validate.
+
+Templates use string.Template placeholders ("${books}"), so the JSON examples in the prompts
+need no escaping; a literal dollar sign is written "$$".
+"""
+import os
+import string
+import threading
+import time
+from typing import Dict, FrozenSet, Mapping, NamedTuple
+
+from config.logging_manager import get_logger
+
+logger = get_logger(__name__)
+
+PROMPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROMPT_HOT_RELOAD = os.getenv("PROMPT_HOT_RELOAD", "true").lower() == "true"
+PROMPT_RELOAD_INTERVAL = float(os.getenv("PROMPT_RELOAD_INTERVAL", "2.0"))
+
+# The templates the server uses, with the placeholders each must declare
+REQUIRED_PROMPTS: Dict[str, FrozenSet[str]] = {
+    "sys_prompt": frozenset(),
+    "identify_prompt": frozenset(),
+    "recommendation_prompt": frozenset(),
+    "recommendation_input": frozenset({"books"}),
+    "recommendation_rerank": frozenset({"books", "candidates", "count"}),
+}
+
+
+class PromptError(Exception):
+    """Raised when a prompt template is missing, invalid or rendered with the wrong values."""
+
+
+class _Template(NamedTuple):
+    text: str
+    template: string.Template
+    placeholders: FrozenSet[str]
+    mtime_ns: int
+
+
+class PromptRegistry:
+    """
+    Prompt templates loaded from a directory, validated against the placeholders each
+    required template must declare.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        required: Mapping[str, FrozenSet[str]],
+        hot_reload: bool = True,
+        reload_interval: float = 2.0,
+    ):
+        self.directory = directory
+        self.required = dict(required)
+        self.hot_reload = hot_reload
+        self.reload_interval = reload_interval
+        self._templates: Dict[str, _Template] = {}
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads and validates every template.
+
+        Raises:
+            PromptError: If a required template is missing or any template is invalid.
+        """
+        templates = {name: self._read(name, path) for name, path in self._paths().items()}
+        missing = sorted(set(self.required) - set(templates))
+        if missing:
+            raise PromptError(f"Missing prompt templates in {self.directory}: {', '.join(missing)}")
+        self._templates = templates
+        self._next_check = time.monotonic() + self.reload_interval
+        logger.info("Loaded %d prompt templates: %s", len(templates), ", ".join(sorted(templates)))
+
+    def get(self, name: str) -> str:
+        """Returns a template's text as written (for templates without placeholders)."""
+        return self._template(name).text
+
+    def render(self, name: str, **values) -> str:
+        """
+        Fills in a template's placeholders.
+
+        Raises:
+            PromptError: If a placeholder is left without a value.
+        """
+        template = self._template(name)
+        try:
+            return template.template.substitute(values)
+        except KeyError as e:
+            raise PromptError(f"Prompt '{name}' needs a value for {e}") from None
+
+    def _template(self, name: str) -> _Template:
+        if self.hot_reload and time.monotonic() >= self._next_check:
+            self._reload_changed()
+        template = self._templates.get(name)
+        if template is None:
+            raise PromptError(f"Unknown prompt template '{name}'")
+        return template
+
+    def _reload_changed(self):
+        # One request does the stat calls; the others keep rendering the current versions
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_check = time.monotonic() + self.reload_interval
+            templates = dict(self._templates)
+            for name, path in self._paths().items():
+                current = templates.get(name)
+                try:
+                    if current is not None and os.stat(path).st_mtime_ns == current.mtime_ns:
+                        continue
+                    templates[name] = self._read(name, path)
+                except (OSError, PromptError) as e:
+                    logger.error("Keeping the previous version of prompt '%s': %s", name, e)
+                    continue
+                logger.info("Reloaded prompt template '%s'", name)
+            self._templates = templates
+        finally:
+            self._lock.release()
+
+    def _paths(self) -> Dict[str, str]:
+        return {
+            filename[:-3]: os.path.join(self.directory, filename)
+            for filename in os.listdir(self.directory)
+            if filename.endswith(".md")
+        }
+
+    def _read(self, name: str, path: str) -> _Template:
+        mtime_ns = os.stat(path).st_mtime_ns
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        if not text.strip():
+            raise PromptError(f"Prompt '{name}' is empty")
+        template = string.Template(text)
+        if not template.is_valid():
+            raise PromptError(f"Prompt '{name}' has a malformed placeholder; write a literal '$' as '$$'")
+        placeholders = frozenset(template.get_identifiers())
+        expected = self.required.get(name)
+        if expected is not None and placeholders != expected:
+            raise PromptError(
+                f"Prompt '{name}' declares placeholders {sorted(placeholders)}, expected {sorted(expected)}"
+            )
+        return _Template(text=text, template=template, placeholders=placeholders, mtime_ns=mtime_ns)
+
+
+prompts = PromptRegistry(
+    PROMPTS_DIR,
+    REQUIRED_PROMPTS,
+    hot_reload=PROMPT_HOT_RELOAD,
+    reload_interval=PROMPT_RELOAD_INTERVAL,
+)
+prompts.load()
@@ -0,0 +1,481 @@
+"""
+Resilience around model calls: deadlines, adaptive concurrency, hedging and circuit breaking.
+
+Every call gets a deadline: LLM_CALL_TIMEOUT_SECONDS, cut short by whatever is left of the
+budget of the request it serves (see request_budget), so a stalled provider call gives up
+while the client is still waiting for an answer. Calls go through the shared concurrency
+limiter, whose limit adapts (AIMD) to the latencies and failures seen here: a call slower
+than LLM_AIMD_LATENCY_FACTOR times the recent median, or one that fails, shrinks it.
+
+With LLM_HEDGE_ENABLED, a call still running after the recent p95 latency gets a second,
+identical request if a slot is free; whichever answers first is used and the other is
+cancelled. Consecutive failures open a circuit breaker: for LLM_BREAKER_RESET_SECONDS calls
+fail fast (a 503 with Retry-After) instead of queueing behind a dead provider, then one
+probe call decides whether it closes again. While the breaker is open, or when a call fails,
+a recent reply to the identical request is served from a small stale-reply cache if there
+is one.
+
+The latency window and the breaker are kept per model, and stale replies are keyed by model,
+so a routed call to the strong model (see agent/routing.py) is judged against its own
+latencies and is not blocked by the fast model's outage. The concurrency limit is shared.
+"""
+import asyncio
+import contextvars
+import hashlib
+import os
+import statistics
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Dict, Generic, List, Optional, TypeVar
+
+from langchain_core.messages import BaseMessage
+
+from agent.concurrency import LLMOverloadedError, llm_limiter
+from agent.llm import gemini_model, get_llm
+from config.logging_manager import get_logger
+from config.metrics import record_event, registry
+
+logger = get_logger(__name__)
+
+LLM_CALL_TIMEOUT_SECONDS = float(os.getenv("LLM_CALL_TIMEOUT_SECONDS", "60"))
+LLM_REQUEST_BUDGET_SECONDS = float(os.getenv("LLM_REQUEST_BUDGET_SECONDS", "90"))
+LLM_AIMD_LATENCY_FACTOR = float(os.getenv("LLM_AIMD_LATENCY_FACTOR", "2.0"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+LLM_STALE_CACHE_SIZE = int(os.getenv("LLM_STALE_CACHE_SIZE", "256"))
+
+# Less time than this left in the request budget is not worth starting a call with
+_MIN_CALL_SECONDS = 1.0
+# Latencies observed before the tracker's quantiles are trusted for hedging and AIMD
+_MIN_LATENCY_SAMPLES = 20
+
+# Absolute time.monotonic() by which the current request must be answered, if it has a budget
+_request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+class LLMUnavailableError(LLMOverloadedError):
+    """Raised without calling the model while the circuit breaker is open."""
+
+
+class LLMTimeoutError(LLMOverloadedError):
+    """Raised when a model call misses its deadline, or there is no budget left to start one."""
+
+
+@contextmanager
+def request_budget(seconds: float = None):
+    """
+    Gives the model calls made inside the block a shared deadline, e.g. one image of a batch.
+
+    Args:
+        seconds: The budget; defaults to LLM_REQUEST_BUDGET_SECONDS.
+    """
+    token = _request_deadline.set(time.monotonic() + (LLM_REQUEST_BUDGET_SECONDS if seconds is None else seconds))
+    try:
+        yield
+    finally:
+        _request_deadline.reset(token)
+
+
+def call_timeout() -> float:
+    """
+    Returns the seconds the next model call may take: LLM_CALL_TIMEOUT_SECONDS or what is left
+    of the request budget, whichever is less.
+
+    Raises:
+        LLMTimeoutError: If the budget is too nearly spent to start a call.
+    """
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return LLM_CALL_TIMEOUT_SECONDS
+    remaining = deadline - time.monotonic()
+    if remaining < _MIN_CALL_SECONDS:
+        record_event("llm_budget_exhausted")
+        raise LLMTimeoutError("The request ran out of time before the model could be called", llm_limiter.retry_after)
+    return min(LLM_CALL_TIMEOUT_SECONDS, remaining)
+
+
+class LatencyTracker:
+    """Keeps the latencies of the most recent successful calls for quantile estimates."""
+
+    def __init__(self, window: int = 200):
+        self._latencies = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def add(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns the q-quantile of the window, or None until enough calls have been seen."""
+        if len(self._latencies) < _MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def is_slow(self, seconds: float, factor: float) -> bool:
+        """Whether a latency is more than factor times the recent median."""
+        if len(self._latencies) < _MIN_LATENCY_SAMPLES:
+            return False
+        return seconds > factor * statistics.median(self._latencies)
+
+
+class CircuitBreaker:
+    """
+    Closed, open or half-open breaker over consecutive call failures.
+
+    Closed lets every call through and opens after failure_threshold failures in a row. Open
+    rejects calls for reset_timeout seconds, then turns half-open and lets a single probe
+    call through: success closes the breaker, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock=time.monotonic, model: str = None):
+        self.failure_threshold = max(1, failure_threshold)
+        self.model = model
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def retry_after(self) -> int:
+        """Whole seconds until the breaker lets a probe through."""
+        return max(1, int(self._opened_at + self.reset_timeout - self._clock() + 0.999))
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead. In half-open state only the first caller is the probe."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probing:
+            self._state = self.HALF_OPEN
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        if self._state != self.CLOSED:
+            logger.info("LLM circuit breaker%s closed", self._for_model)
+            record_event("llm_circuit_closed")
+        self._state = self.CLOSED
+        self._failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                logger.warning("LLM circuit breaker%s opened after %d consecutive failures", self._for_model, self._failures)
+                record_event("llm_circuit_opened")
+            self._state = self.OPEN
+            self._opened_at = self._clock()
+        self._probing = False
+
+    def release_probe(self):
+        """Lets another caller probe when the probe ended without a verdict (e.g. cancelled)."""
+        self._probing = False
+
+    @property
+    def _for_model(self) -> str:
+        return f" for {self.model}" if self.model else ""
+
+
+T = TypeVar("T")
+
+
+class PerModel(Generic[T]):
+    """
+    State kept separately for each model, created on first use from the model's name. None
+    stands for the backend's default model, GEMINI_MODEL.
+    """
+
+    def __init__(self, factory: Callable[[str], T]):
+        self._factory = factory
+        self._states: Dict[str, T] = {}
+
+    def __call__(self, model: Optional[str] = None) -> T:
+        name = model or gemini_model
+        state = self._states.get(name)
+        if state is None:
+            state = self._states.setdefault(name, self._factory(name))
+        return state
+
+    def items(self):
+        return list(self._states.items())
+
+
+class StaleReplyCache:
+    """LRU of the latest reply to each distinct request, served only when the model is not."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._replies: "OrderedDict[str, BaseMessage]" = OrderedDict()
+
+    @staticmethod
+    def key(messages: List[BaseMessage], model: str = None) -> str:
+        """
+        Hashes the model's name and the messages part by part; long strings such as an image's
+        data URI are fed to the hash in slices rather than encoded (copied) whole.
+        """
+        digest = hashlib.sha256()
+        _hash_text(digest, model or gemini_model)
+        for message in messages:
+            _hash_text(digest, message.type)
+            parts = [message.content] if isinstance(message.content, str) else message.content
+            for part in parts:
+                if isinstance(part, str):
+                    _hash_text(digest, part)
+                    continue
+                for name, value in sorted(part.items()):
+                    _hash_text(digest, name)
+                    if isinstance(value, dict):
+                        for field, text in sorted(value.items()):
+                            _hash_text(digest, field)
+                            _hash_text(digest, str(text))
+                    else:
+                        _hash_text(digest, str(value))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[BaseMessage]:
+        reply = self._replies.get(key)
+        if reply is not None:
+            self._replies.move_to_end(key)
+        return reply
+
+    def put(self, key: str, reply: BaseMessage):
+        if self.max_entries <= 0:
+            return
+        self._replies[key] = reply
+        self._replies.move_to_end(key)
+        while len(self._replies) > self.max_entries:
+            self._replies.popitem(last=False)
+
+
+_HASH_SLICE_CHARS = 64 * 1024
+
+
+def _hash_text(digest, text: str):
+    # Length-prefixed, so adjacent parts cannot run together
+    digest.update(len(text).to_bytes(8, "little"))
+    for start in range(0, len(text), _HASH_SLICE_CHARS):
+        digest.update(text[start:start + _HASH_SLICE_CHARS].encode("utf-8"))
+
+
+latencies: PerModel[LatencyTracker] = PerModel(lambda model: LatencyTracker())
+breakers: PerModel[CircuitBreaker] = PerModel(
+    lambda model: CircuitBreaker(LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_SECONDS, model=model)
+)
+stale_replies = StaleReplyCache(LLM_STALE_CACHE_SIZE)
+
+_BREAKER_STATES = (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN)
+registry.gauge(
+    "shelf_scanner_llm_circuit_state", "1 for each model's circuit breaker state, 0 for the others.", ("model", "state"),
+    callback=lambda: {
+        (model, state): int(breaker.state == state) for model, breaker in breakers.items() for state in _BREAKER_STATES
+    },
+)
+registry.gauge(
+    "shelf_scanner_llm_latency_seconds", "Recent LLM call latency quantiles per model (hedging and AIMD inputs).",
+    ("model", "quantile"),
+    callback=lambda: {
+        (model, str(q)): value
+        for model, tracker in latencies.items()
+        for q in (0.5, LLM_HEDGE_QUANTILE) if (value := tracker.quantile(q)) is not None
+    },
+)
+
+
+def model_available(model: str = None) -> bool:
+    """False while the model's circuit breaker is open, so calls to it would fail fast."""
+    return breakers(model).state != CircuitBreaker.OPEN
+
+
+def _record_success(model: Optional[str], seconds: float):
+    tracker = latencies(model)
+    slow = tracker.is_slow(seconds, LLM_AIMD_LATENCY_FACTOR)
+    tracker.add(seconds)
+    breakers(model).record_success()
+    if slow:
+        record_event("llm_slow_call")
+        llm_limiter.record_congestion()
+    else:
+        llm_limiter.record_success()
+
+
+def _record_failure(model: Optional[str], event: str):
+    record_event(event)
+    breakers(model).record_failure()
+    llm_limiter.record_congestion()
+
+
+def _reject(model: Optional[str], key: Optional[str]) -> BaseMessage:
+    """Serves a stale reply while the model's breaker is open, or fails fast."""
+    reply = stale_replies.get(key) if key else None
+    if reply is not None:
+        record_event("llm_stale_reply")
+        return reply
+    record_event("llm_circuit_rejected")
+    raise LLMUnavailableError("The model is unavailable, please retry shortly", breakers(model).retry_after())
+
+
+async def invoke_model(messages: List[BaseMessage], model: str = None) -> BaseMessage:
+    """
+    Calls the model with a deadline, through the concurrency limiter and the circuit breaker,
+    hedging slow calls if enabled.
+
+    Args:
+        messages: The request.
+        model: The model to call (see agent/routing.py); defaults to the backend's own.
+
+    Returns:
+        The model's reply, or a stale reply to the identical request if the model is
+        unavailable or the call fails and one is cached.
+
+    Raises:
+        LLMOverloadedError: If no slot frees up in time (LLMTimeoutError and LLMUnavailableError
+            are subclasses, for a missed deadline and an open breaker).
+    """
+    key = StaleReplyCache.key(messages, model) if stale_replies.max_entries > 0 else None
+    breaker = breakers(model)
+    # Before allow(): a half-open breaker's probe must not be taken by a call that never starts
+    timeout = call_timeout()
+    if not breaker.allow():
+        return _reject(model, key)
+
+    deadline = time.monotonic() + timeout
+    called = False
+    try:
+        async with llm_limiter.slot():
+            called = True
+            start = time.monotonic()
+            reply = await asyncio.wait_for(_hedged(messages, model), timeout=max(0.0, deadline - start))
+    except LLMOverloadedError:
+        breaker.release_probe()
+        raise
+    except asyncio.CancelledError:
+        breaker.release_probe()
+        raise
+    except Exception as e:
+        if not called:
+            breaker.release_probe()
+            raise
+        timed_out = isinstance(e, TimeoutError)
+        _record_failure(model, "llm_timeout" if timed_out else "llm_error")
+        if timed_out:
+            logger.warning("LLM call failed: timed out after %.1fs", timeout)
+        else:
+            logger.warning("LLM call failed: %r", e)
+        reply = stale_replies.get(key) if key else None
+        if reply is not None:
+            record_event("llm_stale_reply")
+            return reply
+        if timed_out:
+            raise LLMTimeoutError("The model took too long to answer, please retry shortly", llm_limiter.retry_after) from e
+        raise
+
+    _record_success(model, time.monotonic() - start)
+    if key:
+        stale_replies.put(key, reply)
+    return reply
+
+
+def _llm(model: Optional[str]):
+    return get_llm(model=model) if model else get_llm()
+
+
+async def _hedged(messages: List[BaseMessage], model: Optional[str]) -> BaseMessage:
+    llm = _llm(model)
+    delay = latencies(model).quantile(LLM_HEDGE_QUANTILE) if LLM_HEDGE_ENABLED else None
+    if delay is None:
+        return await llm.ainvoke(messages)
+
+    primary = asyncio.ensure_future(llm.ainvoke(messages))
+    hedge = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        # A hedge only uses spare capacity; it never queues behind other requests
+        if not llm_limiter.try_acquire():
+            record_event("llm_hedge_skipped")
+            return await primary
+        record_event("llm_hedged")
+        logger.debug("Hedging an LLM call still running after %.2fs", delay)
+        hedge = asyncio.ensure_future(llm.ainvoke(messages))
+        hedge.add_done_callback(lambda _: llm_limiter.release())
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        record_event("llm_hedge_won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def stream_model(messages: List[BaseMessage], model: str = None) -> AsyncIterator[BaseMessage]:
+    """
+    Streams the model's reply chunks through the circuit breaker and the concurrency limiter,
+    with the call's deadline applied to the whole stream. Streams are not hedged.
+
+    Raises:
+        LLMOverloadedError: As invoke_model, before the first chunk.
+    """
+    breaker = breakers(model)
+    timeout = call_timeout()
+    if not breaker.allow():
+        record_event("llm_circuit_rejected")
+        raise LLMUnavailableError("The model is unavailable, please retry shortly", breaker.retry_after())
+
+    deadline = time.monotonic() + timeout
+    outcome = None
+    try:
+        async with llm_limiter.slot():
+            start = time.monotonic()
+            chunks = _llm(model).astream(messages).__aiter__()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, deadline - time.monotonic()))
+                    except StopAsyncIteration:
+                        break
+                    yield chunk
+            except TimeoutError as e:
+                outcome = "llm_timeout"
+                raise LLMTimeoutError("The model took too long to answer, please retry shortly", llm_limiter.retry_after) from e
+            except (LLMOverloadedError, asyncio.CancelledError, GeneratorExit):
+                raise
+            except Exception:
+                outcome = "llm_error"
+                raise
+            finally:
+                await chunks.aclose()
+            outcome = "ok"
+    finally:
+        if outcome == "ok":
+            _record_success(model, time.monotonic() - start)
+        elif outcome is not None:
+            _record_failure(model, outcome)
+        else:
+            breaker.release_probe()
@@ -0,0 +1,81 @@
+"""
+Routing of model calls between a fast, cheap model and a stronger one.
+
+Calls go to LLM_FAST_MODEL first. A reply that does not parse is repaired locally (see
+agent.post_process.repair_book_gists), and only when that fails, or the fast model's call
+errors, is the request sent again to the strong model, GEMINI_MODEL. Scans whose images look
+hard for the fast model go to the strong model directly: shelves with at least
+LLM_ROUTE_STRONG_MIN_SPINES spines, or fewer than LLM_ROUTE_MIN_SPINE_PIXELS of image width
+per spine once downscaled for the model. Every call's latency is recorded by tier and
+outcome (ok, repaired, failed, error), so the success rate of each route can be read off
+/api/metrics and the thresholds tuned.
+"""
+import os
+from typing import Iterable, Optional
+
+from PIL import Image
+
+from agent.llm import fast_model, gemini_model
+from config.logging_manager import get_logger
+from config.metrics import registry
+from services.spine_crop import estimate_spine_count
+
+logger = get_logger(__name__)
+
+LLM_ROUTING_ENABLED = os.getenv("LLM_ROUTING_ENABLED", "true").lower() == "true"
+LLM_ROUTE_STRONG_MIN_SPINES = int(os.getenv("LLM_ROUTE_STRONG_MIN_SPINES", "60"))
+LLM_ROUTE_MIN_SPINE_PIXELS = float(os.getenv("LLM_ROUTE_MIN_SPINE_PIXELS", "20"))
+
+FAST = "fast"
+STRONG = "strong"
+
+route_seconds = registry.histogram(
+    "shelf_scanner_llm_route_duration_seconds",
+    "Model call latency by routing tier and outcome (ok, repaired, failed, error).",
+    ("tier", "outcome"),
+)
+scan_spines = registry.histogram(
+    "shelf_scanner_scan_spines", "Estimated spines per image sent to the model.", (),
+    buckets=(5, 10, 20, 30, 40, 60, 80, 120, 160),
+)
+
+
+def routing_enabled() -> bool:
+    """True if calls are routed: routing is on and the fast model differs from the strong one."""
+    return LLM_ROUTING_ENABLED and bool(fast_model) and fast_model != gemini_model
+
+
+def first_tier() -> Optional[str]:
+    """The tier a call starts on when nothing suggests otherwise, or None without routing."""
+    return FAST if routing_enabled() else None
+
+
+def model_for(tier: Optional[str]) -> Optional[str]:
+    """The model a tier calls; None for the backend's default (GEMINI_MODEL)."""
+    return fast_model if tier == FAST else None
+
+
+def can_escalate(tier: Optional[str]) -> bool:
+    """True if a failed call on this tier can be retried on the strong model."""
+    return tier == FAST
+
+
+def record(tier: Optional[str], outcome: str, seconds: float):
+    """Records the latency and outcome of one model call on a tier."""
+    route_seconds.observe(seconds, tier or STRONG, outcome)
+
+
+def image_tier(images: Iterable[Image.Image]) -> Optional[str]:
+    """
+    Picks the tier for a scan from the images sent to the model (several for a panorama's
+    tiles): the strong model if any of them has many spines, or too few pixels per spine.
+    """
+    if not routing_enabled():
+        return None
+    for image in images:
+        spines = estimate_spine_count(image)
+        scan_spines.observe(spines)
+        if spines >= LLM_ROUTE_STRONG_MIN_SPINES or (spines and image.width / spines < LLM_ROUTE_MIN_SPINE_PIXELS):
+            logger.info("Routing scan to the strong model: about %d spines across %dpx", spines, image.width)
+            return STRONG
+    return FAST
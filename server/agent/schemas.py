@@ -1,8 +1,9 @@
 from pydantic import RootModel, Field
-from typing import Dict
+from typing import Dict, Optional
+from langgraph.graph import MessagesState
 from config.logging_manager import get_logger
 
-logger = get_logger()
+logger = get_logger(__name__)
 logger.debug("Loading BookGistResponse schema")
 
 # NOTE: This model has been moved to server/models.py but is kept here for 
@@ -23,4 +24,15 @@ class BookGistResponse(RootModel[Dict[str, str]]):
         description="A dictionary where keys are book titles and values are their one-liner gists."
     )
 
+class AgentState(MessagesState):
+    """
+    Graph state for the agent: the conversation plus the validated BookGistResponse parsed from
+    the model's final reply, so callers never have to re-parse the message text. Callers may
+    set the routing tier to start on (see agent/routing.py); escalate is set when a call on the
+    fast model failed and the request goes to the strong one.
+    """
+    book_gists: Optional[BookGistResponse]
+    tier: Optional[str]
+    escalate: Optional[bool]
+
 logger.debug("BookGistResponse schema loaded successfully")
@@ -0,0 +1,137 @@
+import json
+from typing import List, Tuple
+from config.logging_manager import get_logger
+
+logger = get_logger(__name__)
+
+# Parser states
+_BEFORE_OBJECT = 0
+_EXPECT_KEY = 1
+_IN_KEY = 2
+_EXPECT_COLON = 3
+_EXPECT_VALUE = 4
+_IN_VALUE = 5
+_EXPECT_COMMA = 6
+_DONE = 7
+_FAILED = 8
+
+_WHITESPACE = " \t\r\n"
+
+
+class IncrementalBookParser:
+    """
+    Incrementally parses a streamed title -> gist JSON object.
+
+    Chunks of model output are fed in as they arrive and every key/value pair is returned
+    as soon as its value string closes, so callers can forward books before the model has
+    finished the whole object. Anything before the first "{" (such as a ```json fence or a
+    sentence of prose) and anything after the closing "}" is ignored.
+    """
+
+    def __init__(self):
+        self._state = _BEFORE_OBJECT
+        self._buffer = ""
+        self._key = None
+        self._open_quote = 0
+        self.books = {}
+
+    @property
+    def done(self) -> bool:
+        """True once the closing brace of the object has been seen."""
+        return self._state == _DONE
+
+    @property
+    def failed(self) -> bool:
+        """True if the stream did not match the expected flat string -> string object."""
+        return self._state == _FAILED
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """
+        Consumes the next chunk of model output.
+
+        Args:
+            chunk: The next piece of raw text from the model's token stream.
+
+        Returns:
+            The (title, gist) pairs completed by this chunk, in order.
+        """
+        if self._state in (_DONE, _FAILED):
+            return []
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+        pos = 0
+        length = len(buffer)
+
+        while pos < length and self._state not in (_DONE, _FAILED):
+            state = self._state
+            if state == _BEFORE_OBJECT:
+                brace = buffer.find("{", pos)
+                if brace == -1:
+                    pos = length
+                    break
+                pos = brace + 1
+                self._state = _EXPECT_KEY
+                continue
+
+            if state in (_IN_KEY, _IN_VALUE):
+                end = self._find_string_end(buffer, self._open_quote + 1)
+                if end == -1:
+                    pos = length
+                    break
+                text = json.loads(buffer[self._open_quote:end + 1], strict=False)
+                pos = end + 1
+                if state == _IN_KEY:
+                    self._key = text
+                    self._state = _EXPECT_COLON
+                else:
+                    self.books[self._key] = text
+                    completed.append((self._key, text))
+                    self._state = _EXPECT_COMMA
+                continue
+
+            char = buffer[pos]
+            pos += 1
+            if char in _WHITESPACE:
+                continue
+            if state == _EXPECT_KEY and char == '"':
+                self._state = _IN_KEY
+                self._open_quote = pos - 1
+            elif state == _EXPECT_KEY and char == "}" and not self.books:
+                self._state = _DONE
+            elif state == _EXPECT_COLON and char == ":":
+                self._state = _EXPECT_VALUE
+            elif state == _EXPECT_VALUE and char == '"':
+                self._state = _IN_VALUE
+                self._open_quote = pos - 1
+            elif state == _EXPECT_COMMA and char == ",":
+                self._state = _EXPECT_KEY
+            elif state == _EXPECT_COMMA and char == "}":
+                self._state = _DONE
+            else:
+                logger.warning("Unexpected character %r in streamed JSON, stopping incremental parse", char)
+                self._state = _FAILED
+
+        # Keep only the unconsumed tail; an open string is kept from its opening quote.
+        if self._state in (_IN_KEY, _IN_VALUE):
+            self._buffer = buffer[self._open_quote:]
+            self._open_quote = 0
+        else:
+            self._buffer = buffer[pos:]
+        return completed
+
+    @staticmethod
+    def _find_string_end(buffer: str, pos: int) -> int:
+        """Returns the index of the closing quote of the string starting at pos, or -1."""
+        while True:
+            quote = buffer.find('"', pos)
+            if quote == -1:
+                return -1
+            backslashes = 0
+            index = quote - 1
+            while index >= pos and buffer[index] == "\\":
+                backslashes += 1
+                index -= 1
+            if backslashes % 2 == 0:
+                return quote
+            pos = quote + 1
@@ -0,0 +1,317 @@
+"""
+End-to-end benchmark and load test for the scan and recommendation paths.
+
+Drives /api/process-image and /api/books/recommendations against the offline fake LLM
+backend, both in-process (ASGI transport, no sockets) and over HTTP (a local uvicorn server).
+Reports per-stage timings for the scan pipeline, p50/p95/p99 latency and requests/sec at
+several concurrency levels, and peak RSS, and writes everything to a JSON file so runs can
+be compared.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_e2e --output bench.json
+    python -m benchmarks.bench_e2e --output new.json --compare bench.json
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+RESOLUTIONS = [(640, 480), (1920, 1080), (4032, 3024)]
+FORMATS = ["JPEG", "PNG", "WEBP"]
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+def make_shelf_image(size, seed: int):
+    """Draws a synthetic bookshelf: rows of coloured spines with noise, roughly as hard to compress as a photo."""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    width, height = size
+    img = Image.new("RGB", size, (rng.randrange(150, 230),) * 3)
+    draw = ImageDraw.Draw(img)
+    rows = 3
+    row_height = height // rows
+    for row in range(rows):
+        top = row * row_height + row_height // 10
+        x = rng.randrange(width // 20)
+        while x < width:
+            spine = rng.randrange(max(4, width // 80), max(8, width // 25))
+            colour = tuple(rng.randrange(256) for _ in range(3))
+            draw.rectangle([x, top + rng.randrange(row_height // 8), x + spine, top + row_height * 8 // 10], fill=colour)
+            x += spine + rng.randrange(3)
+    noise = Image.effect_noise((max(1, width // 4), max(1, height // 4)), 40).convert("RGB").resize(size)
+    return Image.blend(img, noise, 0.15)
+
+
+def build_corpus(resolutions, formats):
+    """Returns [(name, bytes, mime type)] for every resolution/format combination."""
+    corpus = []
+    for index, size in enumerate(resolutions):
+        img = make_shelf_image(size, seed=index)
+        for fmt in formats:
+            buffer = io.BytesIO()
+            img.save(buffer, format=fmt, quality=90) if fmt != "PNG" else img.save(buffer, format=fmt)
+            corpus.append((f"{size[0]}x{size[1]}.{fmt.lower()}", buffer.getvalue(), MIME_TYPES[fmt]))
+    return corpus
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if platform.system() == "Darwin" else peak / 1024
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def pick(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+    return {
+        "p50_ms": round(pick(50) * 1000, 2),
+        "p95_ms": round(pick(95) * 1000, 2),
+        "p99_ms": round(pick(99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+async def stage_breakdown(corpus, repeat: int):
+    """
+    Times each stage of the scan pipeline separately for every corpus image.
+    """
+    from fastapi import UploadFile
+    from langchain_core.messages import HumanMessage
+    from agent.agent import agent
+    from agent.llm import gemini_model
+    from agent.post_process import parse_book_gists
+    from models.models import BooksResponse, BookResponse
+    from services.image_preprocessing import max_edge_for_model, preprocess_image
+    from PIL import Image
+
+    max_edge = max_edge_for_model(gemini_model)
+    results = {}
+    for name, data, mime_type in corpus:
+        timings = {stage: [] for stage in ("upload_read", "decode", "encode", "agent", "post_process", "serialize")}
+        for _ in range(repeat):
+            upload = UploadFile(file=io.BytesIO(data), filename=name)
+            start = time.perf_counter()
+            image_data = await upload.read()
+            timings["upload_read"].append(time.perf_counter() - start)
+
+            # Decode only (draft + full pixel load), then the full preprocess including re-encode
+            start = time.perf_counter()
+            img = Image.open(io.BytesIO(image_data))
+            if img.format == "JPEG":
+                img.draft("RGB", (max_edge, max_edge))
+            img.load()
+            decode = time.perf_counter() - start
+            timings["decode"].append(decode)
+
+            start = time.perf_counter()
+            prepared = preprocess_image(image_data, max_edge)
+            data_uri = f"data:{prepared.mime_type};base64,{base64.b64encode(prepared.data).decode('utf-8')}"
+            timings["encode"].append(max(0.0, time.perf_counter() - start - decode))
+
+            message = HumanMessage(content=[{"type": "image_url", "image_url": {"url": data_uri}}])
+            start = time.perf_counter()
+            response = await agent.ainvoke({"messages": [message]})
+            timings["agent"].append(time.perf_counter() - start)
+
+            raw_reply = response["messages"][-1].content
+            start = time.perf_counter()
+            book_gists = parse_book_gists(raw_reply).root
+            timings["post_process"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            BooksResponse(books=[
+                BookResponse(id=i, title=title, description=gist, cover="")
+                for i, (title, gist) in enumerate(book_gists.items(), start=1)
+            ]).model_dump_json()
+            timings["serialize"].append(time.perf_counter() - start)
+
+        results[name] = {
+            "upload_bytes": len(data),
+            "model_bytes": len(prepared.data),
+            "stages_ms": {stage: round(statistics.median(values) * 1000, 3) for stage, values in timings.items()},
+        }
+    return results
+
+
+async def drive(client, corpus, concurrency: int, requests: int, endpoint: str):
+    """
+    Sends `requests` calls with at most `concurrency` in flight and measures each one.
+    """
+    latencies = []
+    statuses = {}
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            if endpoint == "scan":
+                name, data, mime_type = corpus[i % len(corpus)]
+                response = await client.post("/api/process-image", files={"image": (name, data, mime_type)})
+            else:
+                titles = random.Random(i).sample(["Dune", "Emma", "Beloved", "Middlemarch", "Neuromancer", "Sapiens"], 3)
+                response = await client.post("/api/books/recommendations", json={"books": [{"title": t} for t in titles]})
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "requests_per_sec": round(requests / elapsed, 2),
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        **percentiles(latencies),
+    }
+
+
+async def load_test(app, base_url, corpus, levels, requests: int):
+    import httpx
+
+    if base_url is None:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=120)
+    else:
+        client = httpx.AsyncClient(base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=max(levels)))
+    results = {"scan": [], "recommendations": []}
+    async with client:
+        for endpoint in results:
+            for concurrency in levels:
+                result = await drive(client, corpus, concurrency, max(requests, concurrency), endpoint)
+                result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+                results[endpoint].append(result)
+                print(f"  {endpoint:<16} c={concurrency:<4} {result['requests_per_sec']:>8} req/s  "
+                      f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms  {result['statuses']}")
+    return results
+
+
+def start_http_server(app):
+    """Starts uvicorn on a free local port in a background thread and returns (server, base_url)."""
+    import uvicorn
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def compare(current, baseline_path):
+    """Prints the change in p50 latency and throughput against a previous results file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nComparison against {baseline_path}:")
+    for mode in ("in_process", "http"):
+        for endpoint, runs in current.get(mode, {}).items():
+            previous = {run["concurrency"]: run for run in baseline.get(mode, {}).get(endpoint, [])}
+            for run in runs:
+                old = previous.get(run["concurrency"])
+                if not old:
+                    continue
+                rps = (run["requests_per_sec"] / old["requests_per_sec"] - 1) * 100
+                p50 = (run["p50_ms"] / old["p50_ms"] - 1) * 100 if old["p50_ms"] else 0.0
+                print(f"  {mode:<10} {endpoint:<16} c={run['concurrency']:<4} req/s {rps:+6.1f}%  p50 {p50:+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="A previous results file to compare against")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--stage-repeat", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="Median latency of the fake LLM")
+    parser.add_argument("--no-http", action="store_true", help="Skip the over-HTTP run")
+    args = parser.parse_args()
+
+    # Configure the offline backend before the app is imported
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ.setdefault("SCAN_CACHE_ENABLED", "false")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(max(args.concurrency)))
+    os.environ.setdefault("LLM_MAX_QUEUE", str(max(args.concurrency) * 4))
+    # Keep the log, caches and databases the app opens out of the tree, as tests/conftest.py does
+    state_dir = tempfile.mkdtemp(prefix="shelf-scanner-bench-")
+    os.environ.setdefault("LOG_FILE", os.path.join(state_dir, "server.log"))
+    os.environ.setdefault("SCAN_CACHE_DIR", os.path.join(state_dir, "scans"))
+    os.environ.setdefault("RATE_LIMIT_DB", os.path.join(state_dir, "rate_limits.db"))
+    os.environ.setdefault("CATALOG_DB", os.path.join(state_dir, "catalog.db"))
+    os.environ.setdefault("CATALOG_COVERS_DIR", os.path.join(state_dir, "covers"))
+    os.environ.setdefault("RECOMMENDER_DIR", os.path.join(state_dir, "recommender"))
+    os.environ.setdefault("SCAN_JOB_DB", os.path.join(state_dir, "scan_jobs.db"))
+    os.environ.setdefault("SCAN_JOB_DIR", os.path.join(state_dir, "scan_jobs"))
+
+    from config.logging_manager import get_logger
+    import logging
+    get_logger().set_level(logging.WARNING)
+
+    from main import app
+    from config.rate_limit import rate_limiter
+
+    # The benchmark measures serving capacity, not the per-client rate limits
+    rate_limiter.enabled = False
+
+    corpus = build_corpus(RESOLUTIONS, FORMATS)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "llm_latency_ms": args.llm_latency_ms,
+        "corpus": [{"name": name, "bytes": len(data)} for name, data, _ in corpus],
+    }
+
+    print("Per-stage timings (median ms):")
+    results["stages"] = asyncio.run(stage_breakdown(corpus, args.stage_repeat))
+    for name, result in results["stages"].items():
+        stages = "  ".join(f"{stage}={ms}" for stage, ms in result["stages_ms"].items())
+        print(f"  {name:<16} {result['upload_bytes']:>9}B -> {result['model_bytes']:>8}B  {stages}")
+
+    print("In-process load test:")
+    results["in_process"] = asyncio.run(load_test(app, None, corpus, args.concurrency, args.requests))
+
+    if not args.no_http:
+        print("HTTP load test:")
+        server, base_url = start_http_server(app)
+        try:
+            results["http"] = asyncio.run(load_test(app, base_url, corpus, args.concurrency, args.requests))
+        finally:
+            server.should_exit = True
+
+    results["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    print(f"Peak RSS: {results['peak_rss_mb']} MiB")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
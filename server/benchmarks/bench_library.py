@@ -0,0 +1,75 @@
+"""
+Benchmark for incremental recommendations over a session library.
+
+Simulates a user scanning --scans shelves of --books-per-scan books and asking for
+recommendations after each, with the client re-sending its whole growing list every time,
+once without a session (every call prompts with the full list) and once with an
+X-Session-Id (only the books added since the last call are sent). Reports the titles and
+prompt characters sent to the model and the request latency at a few points as the library
+grows, against the offline fake model.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_library [--scans 20] [--books-per-scan 15]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=20)
+    parser.add_argument("--books-per-scan", type=int, default=15)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LLM_BACKEND", "fake")
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    os.environ.setdefault("CATALOG_ENABLED", "false")
+    os.environ.setdefault("RECOMMENDER_ENABLED", "false")
+    os.environ.setdefault("RECOMMENDER_MODE", "llm")
+    import logging
+    from fastapi.testclient import TestClient
+    from agent.fake_llm import _synthetic_book
+    from config.logging_manager import get_logger
+    import routes.recommendations as recommendations
+    from main import app
+
+    get_logger().set_level(logging.WARNING)
+    sent = []
+    model_recommendations = recommendations._model_recommendations
+
+    async def recording(books_titles, shortlist):
+        sent.append((len(books_titles), len(json.dumps(books_titles, ensure_ascii=False))))
+        return await model_recommendations(books_titles, shortlist)
+
+    recommendations._model_recommendations = recording
+    client = TestClient(app)
+    titles = [_synthetic_book(i)[0] for i in range(args.scans * args.books_per_scan)]
+    checkpoints = sorted({1, args.scans // 4, args.scans // 2, args.scans} - {0})
+
+    print(f"{'mode':>8} {'scan':>5} {'library':>8} {'titles sent':>12} {'prompt chars':>13} {'latency ms':>11}")
+    for mode in ("full", "session"):
+        headers = {"X-Session-Id": f"bench-{time.time_ns()}"} if mode == "session" else {}
+        latencies = []
+        for scan in range(1, args.scans + 1):
+            books = [{"title": title} for title in titles[:scan * args.books_per_scan]]
+            del sent[:]
+            start = time.perf_counter()
+            response = client.post("/api/books/recommendations", json={"books": books}, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+            if scan in checkpoints:
+                count, chars = sent[0] if sent else (0, 0)
+                print(f"{mode:>8} {scan:>5} {len(books):>8} {count:>12} {chars:>13} {latencies[-1] * 1e3:>11.1f}")
+        print(f"{mode:>8} median latency over {args.scans} calls: {statistics.median(latencies) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Micro-benchmark for the HTTP middleware stack.
+
+Compares the previous stack (BaseHTTPMiddleware security headers, Starlette's TrustedHost and
+CORS middleware) with the single pure ASGI HTTPEdgeMiddleware, with and without JSON
+compression, on /ping and on BooksResponse payloads of several sizes. Requests are driven
+straight through the ASGI interface, so the numbers isolate framework and middleware cost.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_middleware [--requests 5000] [--concurrency 1 64]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.trustedhost import TrustedHostMiddleware
+
+from config.http_middleware import HTTPEdgeMiddleware
+from models.models import BooksResponse
+
+CORS_SETTINGS = dict(
+    allow_origins=["http://localhost", "http://localhost:3000", "http://localhost:5173"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Request-ID"],
+)
+REQUEST_HEADERS = [
+    (b"host", b"localhost"),
+    (b"origin", b"http://localhost:5173"),
+    (b"accept-encoding", b"gzip, deflate, br"),
+    (b"user-agent", b"bench"),
+]
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """The previous security-header middleware, kept here for comparison."""
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["Strict-Transport-Security"] = "max-age=3153600; includeSubDomains"
+        return response
+
+
+def make_books(num_books: int) -> BooksResponse:
+    return BooksResponse(books=[
+        {
+            "id": i,
+            "title": f"Synthetic Book Title Number {i}",
+            "description": f"A sweeping story number {i} about memory, loss and the long road home.",
+            "cover": f"https://picsum.photos/200/300?random={i}",
+        }
+        for i in range(num_books)
+    ])
+
+
+def build_app(stack: str, payloads) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"status": "healthy", "message": "Server is running"}
+
+    for num_books, payload in payloads.items():
+        async def books(payload=payload):
+            return payload
+        app.add_api_route(f"/books/{num_books}", books, methods=["GET"], response_model=BooksResponse)
+
+    if stack == "legacy":
+        app.add_middleware(LegacySecurityHeadersMiddleware)
+        app.add_middleware(TrustedHostMiddleware, allowed_hosts=["localhost"])
+        app.add_middleware(CORSMiddleware, **CORS_SETTINGS)
+    else:
+        app.add_middleware(
+            HTTPEdgeMiddleware,
+            allowed_hosts=["localhost"],
+            compress_min_bytes=1024 if stack == "asgi+gzip" else None,
+            **CORS_SETTINGS,
+        )
+    return app
+
+
+async def call(app, path: str) -> int:
+    """Runs one GET through the ASGI app and returns the number of body bytes sent."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": REQUEST_HEADERS, "client": ("127.0.0.1", 1234), "server": ("localhost", 80),
+    }
+    sent = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal sent
+        if message["type"] == "http.response.body":
+            sent += len(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return sent
+
+
+async def measure(app, path: str, requests: int, concurrency: int):
+    """Returns (requests/sec, body bytes per response)."""
+    body_bytes = await call(app, path)
+    for _ in range(50):
+        await call(app, path)
+
+    async def worker(count: int):
+        for _ in range(count):
+            await call(app, path)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return (requests // concurrency) * concurrency / elapsed, body_bytes
+
+
+async def run(args):
+    payloads = {num_books: make_books(num_books) for num_books in args.books}
+    stacks = ["legacy", "asgi", "asgi+gzip"]
+    apps = {stack: build_app(stack, payloads) for stack in stacks}
+    paths = ["/ping"] + [f"/books/{num_books}" for num_books in args.books]
+
+    print(f"{'path':>12} {'conc':>5} " + " ".join(f"{stack + ' req/s':>16} {'bytes':>7}" for stack in stacks) + f" {'speedup':>8}")
+    for path in paths:
+        for concurrency in args.concurrency:
+            row = {stack: await measure(apps[stack], path, args.requests, concurrency) for stack in stacks}
+            cells = " ".join(f"{row[stack][0]:>16.0f} {row[stack][1]:>7}" for stack in stacks)
+            print(f"{path:>12} {concurrency:>5} {cells} {row['asgi'][0] / row['legacy'][0]:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 64])
+    parser.add_argument("--books", type=int, nargs="+", default=[10, 100])
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
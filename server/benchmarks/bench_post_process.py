@@ -0,0 +1,86 @@
+"""
+Micro-benchmark for the LLM response post-processing path.
+
+Compares the previous per-request work (regex extraction, json.loads, Pydantic validation,
+json.dumps back into the AIMessage, then the whole thing again in the route) with the
+single-pass parse_book_gists used by the agent node today.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_post_process [--books 500] [--repeat 200]
+"""
+import argparse
+import json
+import re
+import sys
+import os
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from agent.post_process import parse_book_gists
+from agent.schemas import BookGistResponse
+
+
+def make_response(num_books: int, fenced: bool) -> str:
+    """Builds a realistic title -> gist response with the given number of books."""
+    books = {
+        f"Synthetic Book Title Number {i}: A Subtitle": (
+            f"A sweeping story number {i} about memory, loss and the long road home, told across three generations."
+        )
+        for i in range(num_books)
+    }
+    body = json.dumps(books, indent=2)
+    return f"```json\n{body}\n```" if fenced else body
+
+
+def legacy_post_process(raw_content: str):
+    """The previous implementation: regex scan, then json.loads, then Pydantic validation."""
+    parsed = None
+    match = re.search(r"```json\s*(\{.*?\})\s*```", raw_content, re.DOTALL)
+    if match:
+        try:
+            parsed = json.loads(match.group(1))
+        except json.JSONDecodeError:
+            pass
+    if parsed is None:
+        parsed = json.loads(raw_content)
+    return BookGistResponse.model_validate(parsed).root
+
+
+def legacy_round_trip(raw_content: str):
+    """What a request used to pay: node post-process + json.dumps + route post-process."""
+    processed = legacy_post_process(raw_content)
+    return legacy_post_process(json.dumps(processed, indent=2))
+
+
+def single_pass(raw_content: str):
+    return parse_book_gists(raw_content).root
+
+
+def bench(func, raw_content: str, repeat: int) -> float:
+    """Returns the mean time per call in microseconds."""
+    func(raw_content)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(raw_content)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'books':>6} {'fenced':>7} {'bytes':>9} {'legacy us':>11} {'single us':>11} {'speedup':>8}")
+    for num_books in args.books:
+        for fenced in (False, True):
+            raw_content = make_response(num_books, fenced)
+            assert legacy_round_trip(raw_content) == single_pass(raw_content)
+            legacy = bench(legacy_round_trip, raw_content, args.repeat)
+            new = bench(single_pass, raw_content, args.repeat)
+            print(f"{num_books:>6} {str(fenced):>7} {len(raw_content):>9} {legacy:>11.1f} {new:>11.1f} {legacy / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark for the local recommender.
+
+Builds an index over a synthetic catalog whose books are drawn from a few hundred topics
+(each with its own vocabulary and authors, plus words shared by all), then reports the build
+time and the latency of single and batched queries, for the exact scan and, when the catalog
+is large enough, the inverted-file index. For the IVF it also reports recall@k against the
+exact results and the "score ratio": the summed similarity of its picks over that of the
+exact picks, which stays high when it swaps a book for a near-tie.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_recommender [--books 1000000] [--probes 8 16 32]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def synthetic_books(count: int, topics: int, seed: int = 7):
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ren", "sa", "tor", "vel", "qui", "dra", "nos", "pel", "ung"]
+
+    def word():
+        return "".join(rng.choice(syllables) for _ in range(rng.randint(2, 3)))
+
+    shared = [word() for _ in range(300)]
+    vocabularies = [[word() for _ in range(40)] for _ in range(topics)]
+    authors = [[f"{word().title()} {word().title()}" for _ in range(8)] for _ in range(topics)]
+    for i in range(count):
+        topic = rng.randrange(topics)
+        vocabulary = vocabularies[topic]
+        title = " ".join(rng.choice(vocabulary) for _ in range(3)).title() + f" {i}"
+        gist = " ".join(rng.choice(vocabulary) if rng.random() < 0.6 else rng.choice(shared) for _ in range(18))
+        yield title, rng.choice(authors[topic]), gist
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def time_queries(index, queries, k):
+    latencies = []
+    for titles in queries:
+        start = time.perf_counter()
+        index.recommend(titles, k)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--probes", type=int, nargs="+", default=[8, 16, 32, 64])
+    args = parser.parse_args()
+
+    os.environ.setdefault("CATALOG_ENABLED", "false")
+    os.environ.setdefault("RECOMMENDER_ENABLED", "false")
+    from services.recommender import BookRecommender, build_index
+
+    rng = random.Random(11)
+    with tempfile.TemporaryDirectory() as exact_dir, tempfile.TemporaryDirectory() as ivf_dir:
+        start = time.perf_counter()
+        build_index(synthetic_books(args.books, args.topics), exact_dir, ivf_min_books=args.books + 1)
+        print(f"Built exact index of {args.books} books in {time.perf_counter() - start:.1f}s")
+        exact = BookRecommender(exact_dir)
+        queries = [rng.sample(exact.titles, rng.randint(1, 5)) for _ in range(args.queries)]
+
+        print(f"{'search':>12} {'p50 ms':>8} {'p99 ms':>8} {'batched ms/query':>17} {'recall@k':>9} {'score ratio':>12}")
+        latencies = time_queries(exact, queries, args.k)
+        start = time.perf_counter()
+        for i in range(0, len(queries), args.batch):
+            exact.recommend_many(queries[i:i + args.batch], args.k)
+        batched = (time.perf_counter() - start) / len(queries)
+        print(f"{'exact':>12} {statistics.median(latencies) * 1e3:>8.2f} {percentile(latencies, 0.99) * 1e3:>8.2f} "
+              f"{batched * 1e3:>17.2f} {1.0:>9.3f} {1.0:>12.3f}")
+        expected = [exact.recommend(titles, args.k) for titles in queries]
+
+        start = time.perf_counter()
+        build_index(synthetic_books(args.books, args.topics), ivf_dir, ivf_min_books=0)
+        print(f"Built IVF index in {time.perf_counter() - start:.1f}s")
+        for probes in args.probes:
+            ivf = BookRecommender(ivf_dir, probes=probes)
+            latencies = time_queries(ivf, queries, args.k)
+            found = [ivf.recommend(titles, args.k) for titles in queries]
+            recall = statistics.mean(
+                len({r.title for r in got} & {r.title for r in want}) / max(1, len(want)) for got, want in zip(found, expected)
+            )
+            ratio = statistics.mean(
+                sum(r.score for r in got) / sum(r.score for r in want) for got, want in zip(found, expected) if want
+            )
+            print(f"{f'ivf/{probes}':>12} {statistics.median(latencies) * 1e3:>8.2f} "
+                  f"{percentile(latencies, 0.99) * 1e3:>8.2f} {'':>17} {recall:>9.3f} {ratio:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark for the resilience layer around model calls.
+
+Drives invoke_model against a simulated provider whose latencies are lognormal with a share
+of stragglers (--straggler-rate calls take --straggler-factor times longer), first without
+and then with hedging, and reports p50/p99 latency and how many extra provider calls the
+hedges cost. A final phase makes every call fail and reports how quickly callers are turned
+away once the circuit breaker opens.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_resilience [--calls 400] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+class SimulatedProvider:
+    def __init__(self, median: float, straggler_rate: float, straggler_factor: float, seed: int = 5):
+        self.median = median
+        self.straggler_rate = straggler_rate
+        self.straggler_factor = straggler_factor
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.failing = False
+
+    async def ainvoke(self, messages):
+        from langchain_core.messages import AIMessage
+
+        self.calls += 1
+        if self.failing:
+            await asyncio.sleep(self.median)
+            raise RuntimeError("503 Service Unavailable")
+        latency = self.median * math.exp(self.rng.gauss(0.0, 0.25))
+        if self.rng.random() < self.straggler_rate:
+            latency *= self.straggler_factor
+        await asyncio.sleep(latency)
+        return AIMessage(content="{}")
+
+
+async def run_calls(calls: int, concurrency: int):
+    from langchain_core.messages import HumanMessage
+    from agent.resilience import invoke_model
+
+    slots = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with slots:
+            start = time.perf_counter()
+            try:
+                await invoke_model([HumanMessage(content=f"request {i}")])
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(calls)))
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--median-ms", type=float, default=50)
+    parser.add_argument("--straggler-rate", type=float, default=0.05)
+    parser.add_argument("--straggler-factor", type=float, default=10)
+    args = parser.parse_args()
+
+    os.environ.setdefault("CATALOG_ENABLED", "false")
+    os.environ.setdefault("RECOMMENDER_ENABLED", "false")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(args.concurrency * 2))
+    import agent.resilience as resilience
+    from agent.resilience import CircuitBreaker, LatencyTracker, PerModel
+
+    print(f"{'mode':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'provider calls':>15} {'errors':>7}")
+    for hedge in (False, True):
+        provider = SimulatedProvider(args.median_ms / 1000, args.straggler_rate, args.straggler_factor)
+        resilience.get_llm = lambda: provider
+        resilience.LLM_HEDGE_ENABLED = hedge
+        resilience.latencies = PerModel(lambda model: LatencyTracker())
+        latencies, errors = asyncio.run(run_calls(args.calls, args.concurrency))
+        ordered = sorted(latencies)
+        print(f"{'hedged' if hedge else 'plain':>10} {statistics.median(ordered) * 1e3:>8.1f} "
+              f"{ordered[int(0.99 * (len(ordered) - 1))] * 1e3:>8.1f} {ordered[-1] * 1e3:>8.1f} "
+              f"{provider.calls:>15} {errors:>7}")
+
+    provider.failing = True
+    resilience.LLM_HEDGE_ENABLED = False
+    resilience.breakers = PerModel(lambda model: CircuitBreaker(resilience.LLM_BREAKER_FAILURE_THRESHOLD, reset_timeout=60))
+    resilience.stale_replies.max_entries = 0
+    calls_before = provider.calls
+    latencies, errors = asyncio.run(run_calls(args.calls, args.concurrency))
+    print(f"\nOutage: {errors}/{args.calls} calls failed, {provider.calls - calls_before} reached the provider; "
+          f"median time to fail {statistics.median(latencies) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark for cheap-first model routing.
+
+Runs --requests scans through the agent graph against two offline fake models: a fast one
+(--fast-ms median latency) whose replies come out malformed at --malformed-rate (cut off,
+trailing comma, unterminated fence or prose), and a strong one (--strong-ms) that always
+answers cleanly. Compares sending everything to the strong model, the fast model alone,
+the fast model with JSON repair, and the full route (repair, then escalation), reporting
+the share of scans that parsed, p50/p99 latency, how many calls reached the strong model,
+and the model cost relative to strong-only, with a strong call costing --cost-ratio fast calls.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_routing [--requests 400] [--malformed-rate 0.15]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+class CountingModel:
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        return await self.model.ainvoke(messages)
+
+
+async def run_scans(requests: int, concurrency: int, tier):
+    from langchain_core.messages import HumanMessage
+    from agent.agent import agent
+
+    slots = asyncio.Semaphore(concurrency)
+    latencies, parsed = [], 0
+
+    async def one(i):
+        nonlocal parsed
+        async with slots:
+            start = time.perf_counter()
+            state = await agent.ainvoke({"messages": [HumanMessage(content=f"Shelf photo {i}")], "tier": tier})
+            latencies.append(time.perf_counter() - start)
+            parsed += state.get("book_gists") is not None
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies, parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--fast-ms", type=float, default=40)
+    parser.add_argument("--strong-ms", type=float, default=120)
+    parser.add_argument("--malformed-rate", type=float, default=0.15)
+    parser.add_argument("--cost-ratio", type=float, default=4.0)
+    args = parser.parse_args()
+
+    os.environ.setdefault("CATALOG_ENABLED", "false")
+    os.environ.setdefault("RECOMMENDER_ENABLED", "false")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(args.concurrency * 2))
+    import logging
+    import agent.nodes as nodes
+    import agent.resilience as resilience
+    import agent.routing as routing
+    from agent.fake_llm import FakeShelfLLM
+    from agent.llm import fast_model
+    from config.logging_manager import get_logger
+
+    get_logger().set_level(logging.ERROR)
+    resilience.stale_replies.max_entries = 0
+    repair, can_escalate = nodes.repair_book_gists, routing.can_escalate
+    strategies = [
+        ("strong only", routing.STRONG, repair, can_escalate),
+        ("fast only", routing.FAST, lambda raw: None, lambda tier: False),
+        ("fast+repair", routing.FAST, repair, lambda tier: False),
+        ("routed", routing.FAST, repair, can_escalate),
+    ]
+
+    print(f"{'strategy':>12} {'parsed':>7} {'p50 ms':>8} {'p99 ms':>8} {'strong calls':>13} {'cost':>6}")
+    for name, tier, repair_fn, escalate_fn in strategies:
+        fast = CountingModel(FakeShelfLLM(latency_ms=args.fast_ms, malformed_rate=args.malformed_rate, seed=1))
+        strong = CountingModel(FakeShelfLLM(latency_ms=args.strong_ms, seed=2))
+        resilience.get_llm = lambda model=None: fast if model == fast_model else strong
+        resilience.latencies = resilience.PerModel(lambda model: resilience.LatencyTracker())
+        nodes.repair_book_gists, routing.can_escalate = repair_fn, escalate_fn
+        latencies, parsed = asyncio.run(run_scans(args.requests, args.concurrency, tier))
+        ordered = sorted(latencies)
+        cost = (fast.calls + strong.calls * args.cost_ratio) / (args.requests * args.cost_ratio)
+        print(f"{name:>12} {parsed / args.requests:>7.1%} {statistics.median(ordered) * 1e3:>8.1f} "
+              f"{ordered[int(0.99 * (len(ordered) - 1))] * 1e3:>8.1f} {strong.calls:>13} {cost:>6.2f}")
+
+
+if __name__ == "__main__":
+    main()
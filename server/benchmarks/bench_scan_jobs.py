@@ -0,0 +1,92 @@
+"""
+Benchmark for the scan job queue.
+
+Submits --jobs distinct uploads of --image-kb each to a fresh job store while a worker pool
+drains it with a handler that stands in for a scan (--scan-ms of waiting, like a model
+call), for each pool size. Reports the submit latency clients see, which stays flat however
+long the scans take, and the throughput and queue wait, which are governed by the pool size.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_scan_jobs [--jobs 200] [--workers 1 4 16]
+"""
+import argparse
+import asyncio
+import hashlib
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(store, jobs: int, image_bytes: int, scan_seconds: float, workers: int):
+    from starlette.concurrency import run_in_threadpool
+    from services.scan_jobs import JobWorkerPool
+    from services.uploads import SpooledUpload
+
+    async def handler(upload):
+        await asyncio.sleep(scan_seconds)
+        return {"books": []}
+
+    pool = JobWorkerPool(store, handler, workers, poll_interval=0.05)
+    await pool.start()
+    submits = []
+    start = time.perf_counter()
+    try:
+        for i in range(jobs):
+            data = i.to_bytes(8, "little") + os.urandom(image_bytes - 8)
+            upload = SpooledUpload(f"{i}.jpg", io.BytesIO(data), len(data), hashlib.sha256(data).hexdigest())
+            began = time.perf_counter()
+            await run_in_threadpool(store.submit, upload)
+            submits.append(time.perf_counter() - began)
+            pool.wake()
+        while True:
+            counts = await run_in_threadpool(store.counts)
+            if counts["queued"] == 0 and counts["running"] == 0:
+                break
+            await asyncio.sleep(0.02)
+        elapsed = time.perf_counter() - start
+    finally:
+        await pool.stop()
+    rows = store._connection().execute("SELECT started_at - created_at FROM jobs").fetchall()
+    waits = [wait for (wait,) in rows]
+    return submits, elapsed, waits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=500)
+    parser.add_argument("--scan-ms", type=float, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    os.environ.setdefault("CATALOG_ENABLED", "false")
+    os.environ.setdefault("RECOMMENDER_ENABLED", "false")
+    os.environ.setdefault("SCAN_JOB_DB", os.path.join(tempfile.mkdtemp(prefix="bench-jobs-"), "scan_jobs.db"))
+    import logging
+    from config.logging_manager import get_logger
+    from services.scan_jobs import ScanJobStore
+
+    get_logger().set_level(logging.WARNING)
+
+    print(f"{'workers':>8} {'submit p50 ms':>14} {'submit p99 ms':>14} {'jobs/s':>8} {'wait p50 s':>11} {'wait max s':>11}")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            store = ScanJobStore(os.path.join(directory, "jobs.db"), os.path.join(directory, "images"),
+                                 max_queued=args.jobs)
+            submits, elapsed, waits = asyncio.run(run(store, args.jobs, args.image_kb * 1024, args.scan_ms / 1000, workers))
+        print(f"{workers:>8} {statistics.median(submits) * 1e3:>14.2f} {percentile(submits, 0.99) * 1e3:>14.2f} "
+              f"{args.jobs / elapsed:>8.1f} {statistics.median(waits):>11.2f} {max(waits):>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark for the spine-region crop pre-pass.
+
+Generates 12 MP shelf photos (a band of book spines on a plain wall, at several sizes within
+the frame), then reports the time find_spine_region takes on the full-resolution decode and
+on the JPEG draft preprocess_image actually uses, and the payload preprocess_image produces
+with and without the crop.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_spine_crop [--runs 20]
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from services.image_preprocessing import DEFAULT_MAX_EDGE, preprocess_image
+from services.spine_crop import find_spine_region
+
+SIZE = (4000, 3000)
+# Fraction of the frame's width and height taken by the shelf
+SHELF_FRACTIONS = [0.3, 0.5, 0.7, 0.9]
+
+
+def shelf_photo(rng: random.Random, fraction: float) -> bytes:
+    width, height = SIZE
+    img = Image.effect_noise(SIZE, 12).convert("RGB")
+    img = Image.blend(img, Image.new("RGB", SIZE, (200, 195, 185)), 0.85)
+    draw = ImageDraw.Draw(img)
+    shelf_width, shelf_height = int(width * fraction), int(height * fraction)
+    left, upper = (width - shelf_width) // 2, (height - shelf_height) // 2
+    row_height = shelf_height // 3
+    for row in range(3):
+        top = upper + row * row_height
+        x = left
+        while x < left + shelf_width:
+            spine = rng.randint(25, 90)
+            draw.rectangle((x, top + rng.randint(0, row_height // 5), x + spine - 1, top + row_height - 15),
+                           fill=tuple(rng.randrange(256) for _ in range(3)))
+            x += spine
+        draw.rectangle((left, top + row_height - 15, left + shelf_width, top + row_height), fill=(120, 90, 60))
+    buffer = io.BytesIO()
+    img.filter(ImageFilter.SMOOTH).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def time_ms(fn, runs: int) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-edge", type=int, default=DEFAULT_MAX_EDGE)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    print(f"{'shelf':>6} {'full-res ms':>12} {'draft ms':>9} {'kept':>6} {'full bytes':>11} {'crop bytes':>11} {'saved':>6}")
+    for fraction in SHELF_FRACTIONS:
+        data = shelf_photo(rng, fraction)
+        full_res = Image.open(io.BytesIO(data))
+        full_res.load()
+        draft = Image.open(io.BytesIO(data))
+        draft.draft("RGB", (args.max_edge, args.max_edge))
+        draft.load()
+
+        full_res_ms = time_ms(lambda: find_spine_region(full_res), args.runs)
+        draft_ms = time_ms(lambda: find_spine_region(draft), args.runs)
+        region = find_spine_region(draft)
+        full = preprocess_image(data, args.max_edge, crop_spines=False)
+        cropped = preprocess_image(data, args.max_edge)
+        kept = f"{region.kept_area:.0%}" if region is not None else "-"
+        print(f"{fraction:>6.0%} {full_res_ms:>12.1f} {draft_ms:>9.1f} {kept:>6} {len(full.data):>11} "
+              f"{len(cropped.data):>11} {1 - len(cropped.data) / len(full.data):>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
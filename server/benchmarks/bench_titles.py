@@ -0,0 +1,127 @@
+"""
+Benchmark for title canonicalization against a large title index.
+
+Builds a TitleIndex of synthetic titles, then times lookups of titles as a model might write
+them: exact, decorated ("DUNE (Frank Herbert)"), with a typo, and unknown. Reports build time,
+memory growth and per-lookup p50/p99 latency for each kind, plus how many resolved correctly.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_titles [--titles 1000000] [--queries 2000]
+"""
+import argparse
+import itertools
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# Keep the benchmark away from the real catalog and its background seeding
+os.environ.setdefault("CATALOG_ENABLED", "false")
+
+from services.title_index import TitleIndex
+from services.titles import stable_book_id
+
+CONSONANTS = "tnshrdlcmwfgypbvkjxqz"
+CONSONANT_WEIGHTS = [9.1, 6.7, 6.3, 6.1, 6.0, 4.3, 4.0, 2.8, 2.4, 2.4, 2.2, 2.0, 2.0, 1.9, 1.5, 1.0, 0.8, 0.2, 0.2, 0.1, 0.1]
+VOWELS = "eaoiu"
+VOWEL_WEIGHTS = [12.7, 8.2, 7.5, 7.0, 2.8]
+AUTHORS = ["Frank Herbert", "Toni Morrison", "Ursula K. Le Guin", "Jane Austen", "Haruki Murakami"]
+
+
+def make_words(rng: random.Random, count: int):
+    """English-looking words with English letter frequencies, in random order."""
+    words = set()
+    while len(words) < count:
+        letters = []
+        for i in range(rng.randint(3, 10)):
+            pool, weights = (VOWELS, VOWEL_WEIGHTS) if (i + len(words)) % 2 else (CONSONANTS, CONSONANT_WEIGHTS)
+            letters.append(rng.choices(pool, weights)[0])
+        words.add("".join(letters).capitalize())
+    return sorted(words, key=lambda word: rng.random())
+
+
+def make_titles(rng: random.Random, count: int):
+    # Word use follows Zipf's law, as in real titles
+    words = make_words(rng, 50000)
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+    titles = set()
+    while len(titles) < count:
+        title = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(1, 5)))
+        roll = rng.random()
+        if roll < 0.2:
+            title = "The " + title
+        elif roll < 0.3:
+            title += f": {rng.choice(words)} {rng.choice(words)}"
+        elif roll < 0.35:
+            title += f" {rng.randint(2, 9)}"
+        titles.add(title)
+    return list(titles)
+
+
+def with_typo(rng: random.Random, title: str) -> str:
+    # Swap two adjacent letters somewhere past the first word's first letter
+    positions = [i for i in range(1, len(title) - 1) if title[i].isalpha() and title[i + 1].isalpha()]
+    if not positions:
+        return title
+    i = rng.choice(positions)
+    return title[:i] + title[i + 1] + title[i] + title[i + 2:]
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_lookups(index: TitleIndex, queries):
+    """Returns (per-lookup microseconds, how many resolved to the expected book)."""
+    timings, correct = [], 0
+    for query, expected in queries:
+        start = time.perf_counter()
+        match = index.lookup(query)
+        timings.append((time.perf_counter() - start) * 1e6)
+        if (match.id if match is not None else None) == expected:
+            correct += 1
+    return timings, correct
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--titles", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    titles = make_titles(rng, args.titles)
+    unknown = make_titles(random.Random(args.seed + 1), args.queries)
+    known = set(titles)
+
+    index = TitleIndex()
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    index.add_many(titles)
+    build_seconds = time.perf_counter() - start
+    print(f"Indexed {len(index)} titles in {build_seconds:.1f}s ({build_seconds / len(index) * 1e6:.1f}us per title), "
+          f"peak RSS +{rss_mb() - rss_before:.0f} MB")
+
+    sample = rng.sample(titles, args.queries)
+    kinds = {
+        "exact": [(title, stable_book_id(title)) for title in sample],
+        "decorated": [(f"{title.upper()} ({rng.choice(AUTHORS)})", stable_book_id(title)) for title in sample],
+        "typo": [(with_typo(rng, title), stable_book_id(title)) for title in sample if len(title) >= 12],
+        "unknown": [(title, None) for title in unknown if title not in known],
+    }
+
+    print(f"{'kind':>10} {'queries':>8} {'p50 us':>8} {'p99 us':>8} {'max us':>8} {'resolved':>9}")
+    for kind, queries in kinds.items():
+        timings, correct = time_lookups(index, queries)
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        print(f"{kind:>10} {len(queries):>8} {statistics.median(timings):>8.1f} {p99:>8.1f} {timings[-1]:>8.0f} "
+              f"{correct / len(queries):>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
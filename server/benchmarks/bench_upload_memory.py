@@ -0,0 +1,164 @@
+"""
+Memory benchmark for the upload path.
+
+Runs N concurrent scans of a 12 MP JPEG through the preparation path, up to the moment the
+model would be called, and holds each scan's messages as if waiting on the model. "legacy"
+is the previous path: the whole upload read into bytes and kept for the life of the request,
+a decode drafted to a square box (so a 4:3 photo decoded at full size) and oriented with a
+full-size copy, then base64 bytes, a str and a data: URI f-string. "spooled" is the current
+one: open_upload on the multipart parser's spool, decoding from it, encode_data_uri and
+intermediates released early.
+
+Every (mode, concurrency) pair runs in a fresh process, since the allocator rarely returns
+memory to the OS and the RSS high-water mark cannot be reset. Reports peak RSS above the
+warmed-up baseline, in all and per concurrent scan.
+
+Run from the server/ directory:
+    python -m benchmarks.bench_upload_memory [--concurrency 1 4 16]
+"""
+import argparse
+import asyncio
+import base64
+import io
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Model wait each scan holds its messages for, so the scans overlap
+HOLD_SECONDS = 0.5
+
+
+def make_photo(path: str):
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(3)
+    img = Image.effect_noise((4032, 3024), 40).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    x = 0
+    while x < img.width:
+        spine = rng.randint(30, 120)
+        draw.rectangle((x, 600, x + spine, 2400), fill=tuple(rng.randrange(256) for _ in range(3)))
+        x += spine + 2
+    img.save(path, format="JPEG", quality=92)
+
+
+def legacy_preprocess(image_data: bytes, max_edge: int):
+    """The previous preprocess_image, kept here for comparison."""
+    from PIL import Image, ImageOps
+
+    img = Image.open(io.BytesIO(image_data))
+    if img.format == "JPEG":
+        img.draft("RGB", (max_edge, max_edge))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue(), "image/jpeg"
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def legacy_scan(data: bytes, max_edge: int):
+    from fastapi import UploadFile
+    from langchain_core.messages import HumanMessage
+    from starlette.concurrency import run_in_threadpool
+
+    upload = UploadFile(io.BytesIO(data), filename="shelf.jpg")
+    image_data = await upload.read()
+    payload, mime_type = await run_in_threadpool(legacy_preprocess, image_data, max_edge)
+    encoded_image = base64.b64encode(payload).decode("utf-8")
+    image_url_data_uri = f"data:{mime_type};base64,{encoded_image}"
+    messages = [HumanMessage(content=[{"type": "image_url", "image_url": {"url": image_url_data_uri}}])]
+    await asyncio.sleep(HOLD_SECONDS)
+    return len(messages)
+
+
+async def spooled_scan(data: bytes, max_edge: int):
+    from fastapi import UploadFile
+    from langchain_core.messages import HumanMessage
+    from starlette.concurrency import run_in_threadpool
+    from services.image_preprocessing import preprocess_image
+    from services.uploads import UPLOAD_SPOOL_BYTES, encode_data_uri, open_upload
+
+    # The multipart parser's spool, as the route receives it
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    spool.write(data)
+    with await open_upload(UploadFile(spool, filename="shelf.jpg")) as upload:
+        prepared = await run_in_threadpool(preprocess_image, upload.file, max_edge)
+    payload, mime_type = prepared.data, prepared.mime_type
+    prepared = None
+    data_uri = await run_in_threadpool(encode_data_uri, payload, mime_type)
+    payload = None
+    messages = [HumanMessage(content=[{"type": "image_url", "image_url": {"url": data_uri}}])]
+    await asyncio.sleep(HOLD_SECONDS)
+    return len(messages)
+
+
+def measure(mode: str, concurrency: int, photo_path: str, max_edge: int, results):
+    os.environ.setdefault("CATALOG_ENABLED", "false")
+    scan = legacy_scan if mode == "legacy" else spooled_scan
+    with open(photo_path, "rb") as f:
+        photo = f.read()
+    # Each scan gets its own copy of the upload, as separate requests would
+    uploads = [bytes(photo) for _ in range(concurrency)]
+    # Warm up imports, thread pool and allocator arenas
+    asyncio.run(scan(photo, max_edge))
+    baseline = peak = rss_bytes()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, rss_bytes())
+            time.sleep(0.002)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+
+    async def run():
+        return await asyncio.gather(*(scan(upload, max_edge) for upload in uploads))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    results.put((peak - baseline, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--max-edge", type=int, default=1536)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        photo_path = os.path.join(tmp, "shelf.jpg")
+        make_photo(photo_path)
+        print(f"12 MP JPEG upload: {os.path.getsize(photo_path) / 1e6:.1f} MB")
+        print(f"{'mode':>8} {'conc':>5} {'peak RSS MB':>12} {'MB per scan':>12} {'seconds':>8}")
+        context = multiprocessing.get_context("spawn")
+        for concurrency in args.concurrency:
+            for mode in ("legacy", "spooled"):
+                results = context.Queue()
+                process = context.Process(target=measure, args=(mode, concurrency, photo_path, args.max_edge, results))
+                process.start()
+                growth, elapsed = results.get()
+                process.join()
+                print(f"{mode:>8} {concurrency:>5} {growth / 1e6:>12.1f} {growth / 1e6 / concurrency:>12.1f} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,49 +1,57 @@
 import os
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
-from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from slowapi import _rate_limit_exceeded_handler
+from fastapi.responses import JSONResponse
+from config.http_middleware import HTTPEdgeMiddleware
+from config.metrics import MetricsMiddleware, record_event
+from config.rate_limit import RateLimitExceeded
+from services.uploads import BATCH_MAX_REQUEST_BYTES, UPLOAD_MAX_REQUEST_BYTES, RequestTooLargeError, UploadLimitMiddleware
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+def _env_list(name: str, default: str):
+    return [item.strip() for item in os.getenv(name, default).split(",") if item.strip()]
 
 def setup_middleware(app):
     """Setup all middleware for the FastAPI application."""
-    
-    # Add security headers middleware
-    app.add_middleware(SecurityHeadersMiddleware)
 
-    # Set up rate limiting
-    app.state.limiter = limiter
+    # Turn rate-limit rejections into 429 responses
     app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    app.add_exception_handler(RequestTooLargeError, _request_too_large_handler)
 
-    # Add Trusted Host middleware
-    trusted_hosts = os.getenv("TRUSTED_HOSTS", "*").split(",")
-    app.add_middleware(TrustedHostMiddleware, allowed_hosts=trusted_hosts)
-
-    # Add CORS middleware with environment-driven settings
-    allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost,http://localhost:3000,http://localhost:5173").split(",")
-    allow_credentials = os.getenv("ALLOW_CREDENTIALS", "true").lower() == "true"
-    allow_methods = os.getenv("ALLOW_METHODS", "*").split(",")
-    allow_headers = os.getenv("ALLOW_HEADERS", "*").split(",")
+    # Cap request bodies while they are received, before the multipart parser spools them
+    # (innermost, so a 413 still gets the CORS headers below)
+    app.add_middleware(
+        UploadLimitMiddleware,
+        max_bytes=UPLOAD_MAX_REQUEST_BYTES,
+        path_limits={"/api/process-images/batch": BATCH_MAX_REQUEST_BYTES},
+    )
 
+    # Trusted hosts, CORS, security headers and JSON compression in one pure ASGI layer,
+    # with environment-driven settings
+    compression_enabled = os.getenv("RESPONSE_COMPRESSION_ENABLED", "true").lower() == "true"
     app.add_middleware(
-        CORSMiddleware,
-        allow_origins=allowed_origins,
-        allow_credentials=allow_credentials,
-        allow_methods=allow_methods,
-        allow_headers=allow_headers,
+        HTTPEdgeMiddleware,
+        allowed_hosts=_env_list("TRUSTED_HOSTS", "*"),
+        allow_origins=_env_list("ALLOWED_ORIGINS", "http://localhost,http://localhost:3000,http://localhost:5173"),
+        allow_credentials=os.getenv("ALLOW_CREDENTIALS", "true").lower() == "true",
+        allow_methods=_env_list("ALLOW_METHODS", "*"),
+        allow_headers=_env_list("ALLOW_HEADERS", "*"),
+        expose_headers=["Server-Timing", "X-Request-ID", "X-Session-Id"],
+        compress_min_bytes=int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024")) if compression_enabled else None,
+        compress_level=int(os.getenv("RESPONSE_COMPRESSION_LEVEL", "6")),
     )
 
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    """Middleware to add security headers to responses."""
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=3153600; includeSubDomains"
-        return response
+    # Time every request and add Server-Timing headers (outermost, so it sees the full latency)
+    app.add_middleware(MetricsMiddleware)
+
+async def _rate_limit_exceeded_handler(request, exc: RateLimitExceeded):
+    """Returns 429 with a Retry-After header telling the client when its bucket has a token again."""
+    record_event("rate_limited")
+    return JSONResponse(
+        content={"status": "error", "message": str(exc)},
+        status_code=429,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+async def _request_too_large_handler(request, exc: RequestTooLargeError):
+    """Returns 413 for a request body cut off at the upload limit."""
+    record_event("request_too_large")
+    return JSONResponse(content={"status": "error", "message": exc.detail}, status_code=413, headers={"Connection": "close"})
@@ -0,0 +1,249 @@
+import gzip
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from config.logging_manager import get_logger
+
+logger = get_logger(__name__)
+
+ALL_METHODS = ("DELETE", "GET", "HEAD", "OPTIONS", "PATCH", "POST", "PUT")
+SAFELISTED_HEADERS = {"Accept", "Accept-Language", "Content-Language", "Content-Type"}
+
+SECURITY_HEADERS = (
+    ("X-Content-Type-Options", "nosniff"),
+    ("X-Frame-Options", "DENY"),
+    ("X-XSS-Protection", "1; mode=block"),
+    ("Strict-Transport-Security", "max-age=3153600; includeSubDomains"),
+)
+
+Header = Tuple[bytes, bytes]
+
+
+def _encode(headers: Iterable[Tuple[str, str]]) -> List[Header]:
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+class HTTPEdgeMiddleware:
+    """
+    Pure ASGI middleware combining trusted-host checks, CORS, security headers and optional
+    gzip compression of JSON responses.
+
+    Everything that does not depend on the request is encoded to header byte-pairs once, at
+    startup, and appended to the response in http.response.start. Unlike BaseHTTPMiddleware it
+    never wraps the response body in a task or stream, so streaming responses pass straight
+    through. CORS behaviour matches Starlette's CORSMiddleware for the options used here.
+    """
+
+    def __init__(
+        self,
+        app,
+        allowed_hosts: Sequence[str] = ("*",),
+        allow_origins: Sequence[str] = (),
+        allow_methods: Sequence[str] = ("GET",),
+        allow_headers: Sequence[str] = (),
+        allow_credentials: bool = False,
+        expose_headers: Sequence[str] = (),
+        max_age: int = 600,
+        compress_min_bytes: Optional[int] = None,
+        compress_level: int = 6,
+    ):
+        self.app = app
+
+        # Trusted hosts: exact names and "*.example.com" suffix patterns
+        self.allow_any_host = "*" in allowed_hosts
+        self.exact_hosts = frozenset(h for h in allowed_hosts if not h.startswith("*"))
+        self.host_suffixes = tuple(h[1:] for h in allowed_hosts if h.startswith("*") and h != "*")
+
+        # CORS
+        if "*" in allow_methods:
+            allow_methods = ALL_METHODS
+        self.allow_origins = frozenset(allow_origins)
+        self.allow_all_origins = "*" in allow_origins
+        self.allow_all_headers = "*" in allow_headers
+        self.allow_methods = frozenset(allow_methods)
+        allow_headers = sorted(SAFELISTED_HEADERS | set(allow_headers))
+        self.allowed_request_headers = frozenset(h.lower() for h in allow_headers)
+        self.preflight_explicit_allow_origin = not self.allow_all_origins or allow_credentials
+
+        simple = []
+        if self.allow_all_origins:
+            simple.append(("Access-Control-Allow-Origin", "*"))
+        if allow_credentials:
+            simple.append(("Access-Control-Allow-Credentials", "true"))
+        if expose_headers:
+            simple.append(("Access-Control-Expose-Headers", ", ".join(expose_headers)))
+        self.simple_headers = _encode(simple)
+
+        preflight = [("Vary", "Origin")] if self.preflight_explicit_allow_origin else [("Access-Control-Allow-Origin", "*")]
+        preflight += [("Access-Control-Allow-Methods", ", ".join(allow_methods)), ("Access-Control-Max-Age", str(max_age))]
+        if not self.allow_all_headers:
+            preflight.append(("Access-Control-Allow-Headers", ", ".join(allow_headers)))
+        if allow_credentials:
+            preflight.append(("Access-Control-Allow-Credentials", "true"))
+        self.preflight_headers = _encode(preflight)
+
+        self.security_headers = _encode(SECURITY_HEADERS)
+
+        # Compression of complete (non-streamed) JSON bodies; None disables it
+        self.compress_min_bytes = compress_min_bytes
+        self.compress_level = compress_level
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        host = origin = accept_encoding = request_method = request_headers = None
+        has_cookie = False
+        for name, value in scope["headers"]:
+            if name == b"host":
+                host = value
+            elif name == b"origin":
+                origin = value
+            elif name == b"accept-encoding":
+                accept_encoding = value
+            elif name == b"cookie":
+                has_cookie = True
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+
+        if not self.allow_any_host and not self._is_trusted_host(host):
+            await self._plain_response(send, 400, b"Invalid host header", [])
+            return
+
+        if origin is not None and scope["method"] == "OPTIONS" and request_method is not None:
+            await self._preflight(send, origin.decode("latin-1"), request_method.decode("latin-1"), request_headers)
+            return
+
+        extra_headers = list(self.security_headers)
+        vary_origin = False
+        if origin is not None:
+            extra_headers += self.simple_headers
+            origin_text = origin.decode("latin-1")
+            # Echo the origin for credentialed wildcard requests and for listed origins
+            if (self.allow_all_origins and has_cookie) or (not self.allow_all_origins and origin_text in self.allow_origins):
+                extra_headers = [h for h in extra_headers if h[0] != b"access-control-allow-origin"]
+                extra_headers.append((b"access-control-allow-origin", origin))
+                vary_origin = True
+
+        compress = (
+            self.compress_min_bytes is not None
+            and accept_encoding is not None
+            and accepted_encodings(accept_encoding.decode("latin-1"))["gzip"] > 0
+            and scope["method"] != "HEAD"
+        )
+        pending_start = None
+
+        async def send_wrapper(message):
+            nonlocal pending_start
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", [])) + extra_headers
+                if vary_origin:
+                    _add_vary(headers, b"Origin")
+                message["headers"] = headers
+                if compress and _is_uncompressed_json(headers):
+                    # Hold the start message until we know whether the body is complete
+                    pending_start = message
+                    return
+                await send(message)
+                return
+
+            if pending_start is not None and message["type"] == "http.response.body":
+                start, pending_start = pending_start, None
+                body = message.get("body", b"")
+                if not message.get("more_body", False) and len(body) >= self.compress_min_bytes:
+                    body = gzip.compress(body, self.compress_level, mtime=0)
+                    headers = [h for h in start["headers"] if h[0] != b"content-length"]
+                    headers += [(b"content-encoding", b"gzip"), (b"content-length", str(len(body)).encode("latin-1"))]
+                    _add_vary(headers, b"Accept-Encoding")
+                    start["headers"] = headers
+                    message = {"type": "http.response.body", "body": body, "more_body": False}
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _is_trusted_host(self, host: Optional[bytes]) -> bool:
+        if host is None:
+            return False
+        name = host.decode("latin-1").split(":")[0]
+        return name in self.exact_hosts or (bool(self.host_suffixes) and name.endswith(self.host_suffixes))
+
+    async def _preflight(self, send, origin: str, method: str, requested_headers: Optional[bytes]):
+        headers = list(self.preflight_headers)
+        failures = []
+
+        if self.allow_all_origins or origin in self.allow_origins:
+            if self.preflight_explicit_allow_origin:
+                headers.append((b"access-control-allow-origin", origin.encode("latin-1")))
+        else:
+            failures.append("origin")
+
+        if method not in self.allow_methods:
+            failures.append("method")
+
+        # Allowing all headers means mirroring back whatever was requested
+        if self.allow_all_headers and requested_headers is not None:
+            headers.append((b"access-control-allow-headers", requested_headers))
+        elif requested_headers is not None:
+            requested = (h.strip().lower() for h in requested_headers.decode("latin-1").split(","))
+            if any(h not in self.allowed_request_headers for h in requested):
+                failures.append("headers")
+
+        if failures:
+            await self._plain_response(send, 400, ("Disallowed CORS " + ", ".join(failures)).encode("utf-8"), headers)
+        else:
+            await self._plain_response(send, 200, b"OK", headers)
+
+    async def _plain_response(self, send, status: int, body: bytes, headers: List[Header]):
+        headers = headers + self.security_headers + [
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+        ]
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """
+    Parses Accept-Encoding into coding -> q-value for br and gzip. A "*" entry covers codings
+    not named; q=0 (or a malformed q) refuses a coding.
+    """
+    named, wildcard = {}, 0.0
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = min(1.0, max(0.0, float(value)))
+                except ValueError:
+                    quality = 0.0
+        if coding == "*":
+            wildcard = quality
+        else:
+            named[coding] = quality
+    return {coding: named.get(coding, wildcard) for coding in ("br", "gzip")}
+
+
+def _is_uncompressed_json(headers: List[Header]) -> bool:
+    is_json = False
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type" and value.startswith(b"application/json"):
+            is_json = True
+    return is_json
+
+
+def _add_vary(headers: List[Header], value: bytes):
+    for index, (name, existing) in enumerate(headers):
+        if name == b"vary":
+            if value.lower() not in existing.lower():
+                headers[index] = (name, existing + b", " + value)
+            return
+    headers.append((b"vary", value))
@@ -1,81 +1,240 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
-from typing import Optional
-from datetime import datetime
+from typing import Dict, Optional
+from datetime import datetime, timezone
 
-class LoggingManager:
+# Request ID of the request being served, stamped onto every record logged while serving it
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+ROOT_LOGGER_NAME = 'shelf_scanner'
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(funcName)s - %(message)s'
+
+
+class _RequestContextFilter(logging.Filter):
     """
-    Centralized logging manager for the shelf-scanner application.
-    Provides consistent logging format across the entire application.
+    Stamps the current request ID onto records. Runs in the logging thread, before the record is
+    queued, because context variables are not visible to the background writer.
     """
-    
-    _instance = None
-    _initialized = False
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(LoggingManager, cls).__new__(cls)
-        return cls._instance
-    
-    def __init__(self):
-        if not self._initialized:
-            self.logger = logging.getLogger('shelf_scanner')
-            self.logger.setLevel(logging.DEBUG)  # Set to lowest level, handlers will filter
-            
-            # Create formatter with level, filename:line_no and other necessary details
-            formatter = logging.Formatter(
-                '%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(funcName)s - %(message)s',
-                datefmt='%Y-%m-%d %H:%M:%S'
-            )
-            
-            # Console handler
-            console_handler = logging.StreamHandler(sys.stdout)
-            console_handler.setFormatter(formatter)
-            self.logger.addHandler(console_handler)
-            
-            # File handler
-            file_handler = logging.FileHandler('server.log')
-            file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
-            
-            # Set default level to INFO
-            self.set_level(logging.INFO)
-            
-            self._initialized = True
-    
-    def set_level(self, level: int):
-        """Set the logging level for all handlers."""
-        self.logger.setLevel(level)
-        for handler in self.logger.handlers:
-            handler.setLevel(level)
-    
-    def get_current_level(self) -> int:
-        """Get the current logging level."""
-        return self.logger.level
-    
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    A QueueHandler that leaves formatting to the listener thread.
+
+    The stock prepare() runs the full formatter on the calling thread, exception traceback
+    included, and folds exc_info into the message, so JsonFormatter never sees it. Here only
+    the %-arguments are rendered, while they still hold the values being logged; exc_info,
+    stack_info and the structured extras travel with the record to the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including request ID and stage timings when present."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "location": f"{record.filename}:{record.lineno}",
+            "function": record.funcName,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        stage_timings = getattr(record, "stage_timings", None)
+        if stage_timings:
+            entry["stage_timings_ms"] = stage_timings
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class ModuleLogger:
+    """
+    Logging facade bound to one logger. Supports lazy %-style arguments, so messages that are
+    filtered out by level are never formatted, and reports the caller's file and line.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self.logger = logger
+
     def info(self, message: str, *args, **kwargs):
         """Log an info message."""
+        kwargs.setdefault("stacklevel", 2)
         self.logger.info(message, *args, **kwargs)
-    
+
     def debug(self, message: str, *args, **kwargs):
         """Log a debug message."""
+        kwargs.setdefault("stacklevel", 2)
         self.logger.debug(message, *args, **kwargs)
-    
+
     def warning(self, message: str, *args, **kwargs):
         """Log a warning message."""
+        kwargs.setdefault("stacklevel", 2)
         self.logger.warning(message, *args, **kwargs)
-    
+
     def error(self, message: str, *args, **kwargs):
         """Log an error message."""
+        kwargs.setdefault("stacklevel", 2)
         self.logger.error(message, *args, **kwargs)
-    
+
     def critical(self, message: str, *args, **kwargs):
         """Log a critical message."""
+        kwargs.setdefault("stacklevel", 2)
         self.logger.critical(message, *args, **kwargs)
 
+    def is_enabled_for(self, level: int) -> bool:
+        """True if a message at this level would be emitted; use to guard expensive log arguments."""
+        return self.logger.isEnabledFor(level)
+
+
+class LoggingManager(ModuleLogger):
+    """
+    Centralized logging manager for the shelf-scanner application.
+    Provides consistent logging format across the entire application.
+
+    Callers only put records on a queue; a background listener thread formats them and writes
+    to stdout and the (rotating) log file, so disk I/O never adds latency to a request. Modules
+    get child loggers through get_logger(__name__), whose levels can be set individually.
+
+    Configuration (environment):
+        LOG_LEVEL: Default level (info).
+        LOG_LEVELS: Per-module levels, e.g. "agent.nodes=debug,services=warning".
+        LOG_FORMAT: "text" (default) or "json" lines.
+        LOG_FILE: Log file path (server.log); empty disables file logging.
+        LOG_ROTATE_BYTES / LOG_BACKUP_COUNT: Size-based rotation (10 MB, 5 backups).
+        LOG_ROTATE_WHEN: Time-based rotation instead, e.g. "midnight" or "H".
+    """
+
+    _instance = None
+    _initialized = False
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(LoggingManager, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            super().__init__(logging.getLogger(ROOT_LOGGER_NAME))
+            self.logger.propagate = False
+            self._module_levels: Dict[str, int] = {}
+
+            if os.getenv("LOG_FORMAT", "text").lower() == "json":
+                formatter = JsonFormatter()
+            else:
+                # Create formatter with level, filename:line_no and other necessary details
+                formatter = logging.Formatter(TEXT_FORMAT, datefmt='%Y-%m-%d %H:%M:%S')
+
+            # Console handler
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(formatter)
+            handlers = [console_handler]
+
+            # File handler, rotated by size or by time
+            log_file = os.getenv("LOG_FILE", "server.log")
+            if log_file:
+                rotate_when = os.getenv("LOG_ROTATE_WHEN")
+                backup_count = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+                if rotate_when:
+                    file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when=rotate_when, backupCount=backup_count)
+                else:
+                    file_handler = logging.handlers.RotatingFileHandler(
+                        log_file, maxBytes=int(os.getenv("LOG_ROTATE_BYTES", str(10 * 1024 * 1024))), backupCount=backup_count
+                    )
+                file_handler.setFormatter(formatter)
+                handlers.append(file_handler)
+
+            # Callers only enqueue; the listener thread does the formatting and writing
+            log_queue = queue.SimpleQueue()
+            queue_handler = DeferredQueueHandler(log_queue)
+            queue_handler.addFilter(_RequestContextFilter())
+            self.logger.addHandler(queue_handler)
+            self._listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+            self._listener.start()
+            atexit.register(self._listener.stop)
+
+            # Set default level to INFO
+            self.set_level(logging.getLevelName(os.getenv("LOG_LEVEL", "info").upper()))
+            for entry in filter(None, os.getenv("LOG_LEVELS", "").split(",")):
+                module, _, level = entry.partition("=")
+                self.set_level(logging.getLevelName(level.strip().upper()), module.strip())
+
+            self._initialized = True
+
+    def set_level(self, level: int, module: Optional[str] = None):
+        """
+        Set the logging level for the application, or for one module (and its submodules).
+
+        Args:
+            level: A logging level such as logging.DEBUG.
+            module: Optional module or package name, e.g. "agent.nodes". Passing a level of
+                logging.NOTSET makes the module follow the application level again.
+        """
+        if not isinstance(level, int):
+            raise ValueError(f"Unknown logging level: {level}")
+        if module is None:
+            self.logger.setLevel(level)
+            return
+        logging.getLogger(self._qualified_name(module)).setLevel(level)
+        if level == logging.NOTSET:
+            self._module_levels.pop(module, None)
+        else:
+            self._module_levels[module] = level
+
+    def get_current_level(self, module: Optional[str] = None) -> int:
+        """Get the current logging level, or the effective level for a module."""
+        if module is None:
+            return self.logger.level
+        return logging.getLogger(self._qualified_name(module)).getEffectiveLevel()
+
+    def get_module_levels(self) -> Dict[str, int]:
+        """Get the modules with their own level set."""
+        return dict(self._module_levels)
+
+    def get_module_logger(self, name: str) -> ModuleLogger:
+        """Get a logger for one module, a child of the application logger."""
+        return ModuleLogger(logging.getLogger(self._qualified_name(name)))
+
+    def flush(self):
+        """Block until every record queued so far has been written."""
+        self._listener.stop()
+        self._listener.start()
+
+    @staticmethod
+    def _qualified_name(module: str) -> str:
+        if module == ROOT_LOGGER_NAME or module.startswith(ROOT_LOGGER_NAME + "."):
+            return module
+        return f"{ROOT_LOGGER_NAME}.{module}"
+
+
 # Global logger instance
 logger = LoggingManager()
 
-def get_logger() -> LoggingManager:
-    """Get the global logger instance."""
-    return logger
+def get_logger(name: Optional[str] = None):
+    """
+    Get the global logger instance, or a per-module logger when given the module's __name__.
+    """
+    if name is None:
+        return logger
+    return logger.get_module_logger(name)
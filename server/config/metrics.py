@@ -0,0 +1,300 @@
+import bisect
+import contextvars
+import logging
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from starlette.responses import JSONResponse
+from config.logging_manager import get_logger, request_id_var
+
+logger = get_logger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond stages up to slow model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Payload buckets in bytes, from small crops up to full-size uploads
+BYTE_BUCKETS = (16_384, 32_768, 65_536, 131_072, 262_144, 524_288, 1_048_576, 2_097_152, 4_194_304, 8_388_608)
+
+# Client-supplied request IDs are echoed back only if they look like IDs
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+# Per-request stage timings, collected for the Server-Timing response header
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """
+    A monotonically increasing count, optionally split by labels. With a callback, the values
+    are read from an existing stats source at scrape time instead of being incremented here.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), callback: Callable[[], Dict[Tuple[str, ...], float]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def get(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def samples(self):
+        values = self.callback() if self.callback is not None else self._values
+        for label_values, value in list(values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Gauge:
+    """A value that goes up and down, either set directly or read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), callback: Callable[[], Dict[Tuple[str, ...], float]] = None):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values: str):
+        self._values[label_values] = value
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def dec(self, *label_values: str, amount: float = 1.0):
+        self.inc(*label_values, amount=-amount)
+
+    def samples(self):
+        values = self.callback() if self.callback is not None else self._values
+        for label_values, value in list(values.items()):
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    """A latency distribution with fixed cumulative buckets, as Prometheus expects."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self):
+        for label_values, series in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", _format_labels(self.labels, label_values, f'le="{bound}"'), cumulative
+            cumulative += series[len(self.buckets)]
+            yield f"{self.name}_bucket", _format_labels(self.labels, label_values, 'le="+Inf"'), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labels, label_values), series[-1]
+            yield f"{self.name}_count", _format_labels(self.labels, label_values), cumulative
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            return self._metrics[metric.name]
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = (), callback=None) -> Counter:
+        return self.register(Counter(name, help_text, labels, callback))
+
+    def gauge(self, name: str, help_text: str, labels: Tuple[str, ...] = (), callback=None) -> Gauge:
+        return self.register(Gauge(name, help_text, labels, callback))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{labels} {value:g}" if isinstance(value, float) else f"{name}{labels} {value}")
+            except Exception as e:
+                logger.warning("Failed to collect metric %s: %s", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "shelf_scanner_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",)
+)
+request_seconds = registry.histogram(
+    "shelf_scanner_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+requests_in_flight = registry.gauge(
+    "shelf_scanner_http_requests_in_flight", "HTTP requests currently being served."
+)
+image_payload_bytes = registry.histogram(
+    "shelf_scanner_image_payload_bytes",
+    "Encoded image bytes sent to the model, by whether the spine crop was applied.",
+    ("crop",),
+    buckets=BYTE_BUCKETS,
+)
+spine_crop_kept_area = registry.histogram(
+    "shelf_scanner_spine_crop_kept_area_ratio",
+    "Fraction of the image area kept by the spine crop, when it was applied.",
+    buckets=(0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+)
+events = registry.counter(
+    "shelf_scanner_events_total",
+    "Notable events: cache hits and misses, parse failures, rate-limit and overload rejections.",
+    ("event",),
+)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times a block as a named pipeline stage.
+
+    Records the duration in the stage histogram and, when called while serving a request,
+    adds it to that request's Server-Timing header.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, name)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+def record_event(event: str, amount: float = 1.0):
+    """
+    Increments the counter for a notable event, e.g. "scan_cache_hit_exact" or "parse_failure".
+    """
+    events.inc(event, amount=amount)
+
+
+class TimedJSONResponse(JSONResponse):
+    """
+    The app's default response class: a JSONResponse whose encoding is timed as the
+    "serialize" stage. Responses render when constructed, before the headers are sent, so
+    the stage appears in the request's Server-Timing header.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with stage("serialize"):
+            return super().render(content)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware that times every HTTP request by route template, tracks in-flight
+    requests and adds a Server-Timing header with the stages recorded while handling it.
+
+    It also assigns each request an ID (reusing a well-formed incoming X-Request-ID), returns
+    it in the X-Request-ID header, stamps it on every log record written while serving the
+    request, and logs one completion line carrying the stage timings.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = _incoming_request_id(scope) or uuid.uuid4().hex[:16]
+        request_id_token = request_id_var.set(request_id)
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                if timings:
+                    header = ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings)
+                    headers.append((b"server-timing", header.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            requests_in_flight.dec()
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            request_seconds.observe(elapsed, scope["method"], getattr(route, "path", "other"), str(status[0]))
+            if logger.is_enabled_for(logging.INFO):
+                stage_timings = {name: round(seconds * 1000, 1) for name, seconds in timings}
+                logger.info(
+                    "%s %s -> %d in %.1fms %s",
+                    scope["method"], scope["path"], status[0], elapsed * 1000,
+                    " ".join(f"{name}={ms}ms" for name, ms in stage_timings.items()),
+                    extra={"stage_timings": stage_timings},
+                )
+            _request_timings.reset(token)
+            request_id_var.reset(request_id_token)
+
+
+def _incoming_request_id(scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"x-request-id":
+            candidate = value.decode("latin-1")
+            return candidate if _REQUEST_ID_PATTERN.match(candidate) else ""
+    return ""
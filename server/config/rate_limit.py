@@ -0,0 +1,228 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Tuple
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from config.logging_manager import get_logger
+
+logger = get_logger(__name__)
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+_RATE_PATTERN = re.compile(r"^\s*(\d+)\s*(?:/|per)\s*(\d*)\s*(second|minute|hour|day)s?\s*$", re.IGNORECASE)
+
+# Rows are pruned once this many checks have passed since the last sweep
+_PRUNE_EVERY = 1024
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised when a client has used up its token bucket for an endpoint.
+    """
+
+    def __init__(self, limit: "RateLimit", retry_after: int):
+        super().__init__(f"Rate limit exceeded: {limit.text}")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class RateLimit(NamedTuple):
+    """A token bucket: holds up to `capacity` requests and refills at `rate` requests per second."""
+    text: str
+    capacity: float
+    rate: float
+
+
+def parse_rate(text: str) -> RateLimit:
+    """
+    Parses a limit such as "15/minute", "100 per hour" or "5/10seconds" into a token bucket.
+
+    The bucket allows a burst of the full count and refills evenly over the period, so a
+    steady client gets exactly the configured rate while a burst is never larger than it.
+
+    Args:
+        text: The limit string.
+
+    Returns:
+        The corresponding RateLimit.
+    """
+    match = _RATE_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Invalid rate limit '{text}', expected e.g. '15/minute'")
+    count, multiplier, unit = int(match.group(1)), int(match.group(2) or 1), match.group(3).lower()
+    if count <= 0:
+        raise ValueError(f"Invalid rate limit '{text}', the count must be positive")
+    return RateLimit(text.strip(), float(count), count / (multiplier * _PERIODS[unit]))
+
+
+class MemoryBucketStore:
+    """Token buckets kept in this process; limits are per worker."""
+
+    # A check only takes an uncontended in-process lock, so it can run on the event loop
+    blocking = False
+
+    def __init__(self):
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._checks = 0
+
+    def take(self, key: str, limit: RateLimit, now: float) -> Tuple[bool, float]:
+        """Takes one token from the key's bucket. Returns (allowed, tokens left)."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [limit.capacity, now, now]
+            tokens = min(limit.capacity, bucket[0] + max(0.0, now - bucket[1]) * limit.rate)
+            allowed = tokens >= 1.0
+            if allowed:
+                tokens -= 1.0
+            # [tokens, last update, time the bucket is full again]
+            bucket[:] = [tokens, now, now + (limit.capacity - tokens) / limit.rate]
+
+            self._checks += 1
+            if self._checks % _PRUNE_EVERY == 0:
+                # A bucket idle long enough to refill completely is the same as no bucket
+                for idle in [k for k, b in self._buckets.items() if b[2] < now]:
+                    del self._buckets[idle]
+            return allowed, tokens
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets in a SQLite database in WAL mode, shared by every worker process on the host.
+
+    Each check is a single atomic UPSERT ... RETURNING statement that refills the bucket for the
+    elapsed time and takes a token if one is available, so concurrent workers can never both
+    spend the last token. WAL commits do not fsync with synchronous=NORMAL, which keeps a check
+    in the tens of microseconds.
+    """
+
+    # Under lock contention a check can wait up to busy_timeout_ms, so it runs off the event loop
+    blocking = True
+
+    _TAKE = """
+        INSERT INTO buckets (key, tokens, updated, full_at, allowed)
+        VALUES (:key, :capacity - 1, :now, :now + 1 / :rate, 1)
+        ON CONFLICT(key) DO UPDATE SET
+            tokens = min(:capacity, tokens + max(0, :now - updated) * :rate)
+                     - (min(:capacity, tokens + max(0, :now - updated) * :rate) >= 1),
+            allowed = min(:capacity, tokens + max(0, :now - updated) * :rate) >= 1,
+            full_at = :now + (:capacity - min(:capacity, tokens + max(0, :now - updated) * :rate)
+                     + (min(:capacity, tokens + max(0, :now - updated) * :rate) >= 1)) / :rate,
+            updated = :now
+        RETURNING allowed, tokens
+    """
+
+    def __init__(self, path: str, busy_timeout_ms: int = 50):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._checks = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, "
+            "full_at REAL NOT NULL, allowed INTEGER NOT NULL) WITHOUT ROWID"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, limit: RateLimit, now: float) -> Tuple[bool, float]:
+        """Takes one token from the key's bucket. Returns (allowed, tokens left)."""
+        conn = self._connection()
+        allowed, tokens = conn.execute(
+            self._TAKE, {"key": key, "capacity": limit.capacity, "rate": limit.rate, "now": now}
+        ).fetchone()
+
+        self._checks += 1
+        if self._checks % _PRUNE_EVERY == 0:
+            conn.execute("DELETE FROM buckets WHERE full_at < ?", (now,))
+        return bool(allowed), tokens
+
+
+class RateLimiter:
+    """
+    Per-client, per-endpoint token-bucket rate limiting.
+
+    Endpoints declare a named limit with `Depends(rate_limiter.limit(...))`; the limit string is
+    read from the environment once, at import time. Buckets are keyed by limit name and client
+    address, so endpoints sharing a name share a budget.
+    """
+
+    def __init__(self, store, enabled: bool = True):
+        self.store = store
+        self.enabled = enabled
+
+    def check(self, name: str, client: str, limit: RateLimit):
+        """
+        Spends one request from the client's bucket for the named limit.
+
+        Raises:
+            RateLimitExceeded: If the bucket is empty.
+        """
+        if not self.enabled:
+            return
+        try:
+            allowed, tokens = self.store.take(f"{name}:{client}", limit, time.time())
+        except sqlite3.Error as e:
+            # Rate limiting protects the service but must not take it down; fail open.
+            logger.warning("Rate limit check for '%s' failed, allowing request: %s", name, e)
+            return
+        if not allowed:
+            retry_after = max(1, math.ceil((1.0 - tokens) / limit.rate))
+            raise RateLimitExceeded(limit, retry_after)
+
+    def limit(self, name: str, env_var: str, default: str):
+        """
+        Builds a FastAPI dependency enforcing a named limit.
+
+        Args:
+            name: Bucket name; endpoints with the same name share a budget.
+            env_var: Environment variable that overrides the limit.
+            default: Limit used when the variable is unset, e.g. "15/minute".
+
+        Returns:
+            A dependency callable for use with `Depends`.
+        """
+        limit = parse_rate(os.getenv(env_var, default))
+        logger.debug("Rate limit '%s': %s", name, limit.text)
+
+        # async so FastAPI runs in-memory checks inline; a store that can block (SQLite waiting
+        # on a lock) is checked in the threadpool instead, keeping the event loop free
+        async def dependency(request: Request):
+            client = request.client.host if request.client else "unknown"
+            if self.enabled and getattr(self.store, "blocking", True):
+                await run_in_threadpool(self.check, name, client, limit)
+            else:
+                self.check(name, client, limit)
+
+        return dependency
+
+
+def _build_store():
+    backend = os.getenv("RATE_LIMIT_BACKEND", "sqlite").lower()
+    if backend == "memory":
+        return MemoryBucketStore()
+    if backend != "sqlite":
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND '{backend}', expected 'sqlite' or 'memory'")
+    path = os.getenv("RATE_LIMIT_DB", os.path.join(os.path.dirname(__file__), "..", ".cache", "rate_limits.db"))
+    try:
+        return SQLiteBucketStore(path, int(os.getenv("RATE_LIMIT_BUSY_TIMEOUT_MS", "50")))
+    except sqlite3.Error as e:
+        logger.warning("Could not open rate limit database %s, falling back to per-worker limits: %s", path, e)
+        return MemoryBucketStore()
+
+
+rate_limiter = RateLimiter(_build_store(), enabled=os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true")
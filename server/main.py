@@ -1,7 +1,7 @@
 import os
-from fastapi import FastAPI
-from fastapi.responses import FileResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 
 from config.logging_manager import get_logger
 
@@ -11,10 +11,24 @@ load_dotenv() # Load environment variables from .env file
 from routes.image_processing import router as image_processing_router
 from routes.recommendations import router as recommendations_router
 from routes.logging import router as logging_router
+from routes.metrics import router as metrics_router
+from routes.catalog import router as catalog_router
+from routes.jobs import router as jobs_router, scan_job_workers
 from config.config import setup_middleware
+from config.metrics import TimedJSONResponse
+from services.static_site import StaticSite
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Scan job workers run on the server's event loop, next to the requests
+    await scan_job_workers.start()
+    try:
+        yield
+    finally:
+        await scan_job_workers.stop()
 
 # Initialize FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
 
 # Setup middleware from config
 setup_middleware(app)
@@ -23,24 +37,28 @@ setup_middleware(app)
 app.include_router(image_processing_router, prefix="/api")
 app.include_router(recommendations_router, prefix="/api")
 app.include_router(logging_router, prefix="/api")
+app.include_router(metrics_router, prefix="/api")
+app.include_router(catalog_router, prefix="/api")
+app.include_router(jobs_router, prefix="/api")
+
+logger = get_logger(__name__)
 
-# Mount static files if they exist (built frontend)
+# Load the built frontend into memory if it exists
 static_dir = os.path.join(os.path.dirname(__file__), "..", "client", "dist")
-if os.path.exists(static_dir):
-    app.mount("/assets", StaticFiles(directory=os.path.join(static_dir, "assets")), name="assets")
+static_site = StaticSite(static_dir) if os.path.isdir(static_dir) else None
 
-logger = get_logger()
+# Paths that belong to the API and must not fall through to the SPA
+API_PREFIXES = ("api/", "process-image", "books/", "logging/", "ping", "recommendations")
 
 # Root endpoint - serve index.html or ping for health checks
 @app.get("/")
 @app.head("/")
-async def root():
+async def root(request: Request):
     """
     Root endpoint. Serves index.html for GET requests (SPA) or responds to HEAD for health checks.
     """
-    index_file = os.path.join(static_dir, "index.html")
-    if os.path.exists(index_file):
-        return FileResponse(index_file)
+    if static_site is not None and static_site.has_index:
+        return await static_site.serve("index.html", request.headers)
     return {"status": "ok"}
 
 # Ping endpoint for health checks
@@ -53,26 +71,31 @@ async def ping():
     """
     return {"status": "healthy", "message": "Server is running"}
 
+# Built frontend bundles, served from memory with long-lived caching for hashed names
+@app.get("/assets/{asset_path:path}")
+@app.head("/assets/{asset_path:path}")
+async def serve_asset(asset_path: str, request: Request):
+    """
+    Serve a file from the frontend's assets directory.
+    """
+    response = await static_site.serve(f"assets/{asset_path}", request.headers, load_missing=True) if static_site else None
+    return response or JSONResponse({"error": "Not Found"}, status_code=404)
+
 # SPA routing: serve index.html for all non-API routes
 @app.get("/{full_path:path}")
 @app.head("/{full_path:path}")
-async def serve_spa(full_path: str):
+async def serve_spa(full_path: str, request: Request):
     """
     Serve the React SPA for all routes that are not API endpoints.
     This enables client-side routing for the React application.
     """
-    # List of API routes that should not be intercepted
-    api_prefixes = ["api/", "process-image", "books/", "logging/", "ping", "recommendations"]
-    
     # Check if this is an API route
-    for prefix in api_prefixes:
-        if full_path.startswith(prefix):
-            return JSONResponse({"error": "Not Found"}, status_code=404)
-    
-    # Serve index.html for all other routes (SPA routing)
-    index_file = os.path.join(static_dir, "index.html")
-    if os.path.exists(index_file):
-        return FileResponse(index_file)
-    
-    return JSONResponse({"error": "Frontend not built"}, status_code=404)
+    if full_path.startswith(API_PREFIXES):
+        return JSONResponse({"error": "Not Found"}, status_code=404)
+
+    if static_site is None or not static_site.has_index:
+        return JSONResponse({"error": "Frontend not built"}, status_code=404)
 
+    # Top-level files from the build (favicon, robots.txt, ...) are served as themselves;
+    # everything else is a client-side route and gets index.html
+    return await static_site.serve(full_path, request.headers) or await static_site.serve("index.html", request.headers)
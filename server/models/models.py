@@ -1,8 +1,8 @@
 from pydantic import BaseModel, RootModel, Field
-from typing import Dict, List
+from typing import Dict, List, Optional
 from config.logging_manager import get_logger
 
-logger = get_logger()
+logger = get_logger(__name__)
 logger.debug("Loading models module")
 
 # Model for recommendations request
@@ -19,6 +19,8 @@ class BookResponse(BaseModel):
 # Model for recommendations response
 class RecommendationsResponse(BaseModel):
     recommendations: List[BookResponse]
+    # Sent back as X-Session-Id so the next request only covers newly added books
+    session_id: Optional[str] = None
 
 # Model for books response
 class BooksResponse(BaseModel):
@@ -0,0 +1,41 @@
+from fastapi import APIRouter
+from fastapi.responses import FileResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from config.logging_manager import get_logger
+from services.catalog import catalog
+
+# Create API router
+router = APIRouter()
+logger = get_logger(__name__)
+
+
+@router.get("/catalog/search")
+async def search_catalog(q: str, limit: int = 10):
+    """
+    Full-text search of the local book catalog by title and author. Needs no model call.
+    """
+    if catalog is None:
+        return JSONResponse(content={"status": "error", "message": "The catalog is disabled"}, status_code=404)
+    try:
+        entries = await run_in_threadpool(catalog.search, q, max(1, min(limit, 50)))
+        return {
+            "books": [
+                {"title": entry.title, "author": entry.author, "description": entry.gist, "cover": catalog.cover_url(entry)}
+                for entry in entries
+            ]
+        }
+    except Exception as e:
+        logger.error("Error searching the catalog: %s", e, exc_info=True)
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+
+
+@router.get("/catalog/covers/{cover_path:path}")
+async def get_cover(cover_path: str):
+    """
+    Serves a cover image stored under the catalog's covers directory.
+    """
+    cover_file = catalog.cover_file(cover_path) if catalog is not None else None
+    if cover_file is None:
+        return JSONResponse(content={"status": "error", "message": "Cover not found"}, status_code=404)
+    return FileResponse(cover_file, headers={"Cache-Control": "public, max-age=86400"})
@@ -1,81 +1,598 @@
-import logging, io, base64
-from PIL import Image
-from fastapi import APIRouter, UploadFile, File, Request
-from fastapi.responses import JSONResponse
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+import asyncio, logging, json, os
+from contextlib import nullcontext
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from fastapi import APIRouter, Depends, UploadFile, File, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from langchain_core.messages import HumanMessage
+from starlette.concurrency import run_in_threadpool
 
 from agent.agent import agent
-from agent.post_process import post_process_llm_response
+from agent.llm import gemini_model
+from agent.concurrency import LLMOverloadedError, llm_limiter
+from agent.nodes import stream_llm_call
+from agent.resilience import request_budget
+from agent.routing import image_tier
+from agent.post_process import repair_book_gists, try_parse_book_gists
+from agent.prompts.registry import prompts
+from agent.stream_parser import IncrementalBookParser
 from config.logging_manager import get_logger
-from models.models import BooksResponse
-
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+from config.metrics import stage, record_event, image_payload_bytes
+from config.rate_limit import rate_limiter
+from models.models import BooksResponse, BookResponse
+from services.catalog import CATALOG_LEARN_FROM_SCANS, CatalogEntry, catalog
+from services.library import SESSION_HEADER, session_id_from, session_library
+from services.image_preprocessing import InvalidImageError, PreparedImage, preprocess_image, preprocess_tiles, max_edge_for_model
+from services.scan_cache import scan_cache, perceptual_hash
+from services.single_flight import image_scans
+from services.title_index import title_index
+from services.titles import canonical_key, merge_book_gists, merge_tile_gists, stable_book_id
+from services.uploads import SpooledUpload, UploadRoute, UploadTooLargeError, encode_data_uri, open_upload
 
 # Create API router
-router = APIRouter()
-logger = get_logger()
+router = APIRouter(route_class=UploadRoute)
+logger = get_logger(__name__)
+
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+# Concurrent model calls for the tiles of one panorama
+IMAGE_TILE_CONCURRENCY = int(os.getenv("IMAGE_TILE_CONCURRENCY", "4"))
+
+_NO_LIMIT = nullcontext()
+
+# Single and streaming scans share one per-client budget; batches have their own
+process_image_rate_limit = rate_limiter.limit("process_image", "PROCESS_IMAGE_RATE_LIMIT", "15/minute")
+batch_rate_limit = rate_limiter.limit("process_images_batch", "BATCH_RATE_LIMIT", "15/minute")
+
+class ScanInput(NamedTuple):
+    """
+    A prepared upload: either a cached result or the messages to send to the agent, one set
+    per tile for a panorama.
+    """
+    image_hash: str
+    image_phash: Optional[int]
+    cached: Optional[Dict[str, str]]
+    messages: Optional[List[HumanMessage]]
+    identify_only: bool = False
+    tile_messages: Optional[List[List[HumanMessage]]] = None
+    # The routing tier the scan's model calls start on (see agent/routing.py)
+    tier: Optional[str] = None
+
 
-@router.post("/process-image")
-@limiter.limit("15/minute")  # Using the same rate limit as in the original
+class ScannedBooks(NamedTuple):
+    """A scan's title -> gist dictionary and the catalog entries of the titles it knows."""
+    book_gists: Dict[str, str]
+    entries: Dict[str, CatalogEntry]
+
+
+@router.post("/process-image", dependencies=[Depends(process_image_rate_limit)])
 async def process_image(request: Request, image: UploadFile = File(...)):
     """
     Accepts an image file, processes the image, and returns a response from the agent.
     """
     try:
-        logger.info(f"Received image: {image.filename} ({image.content_type})")
-
-        # Read image content
-        image_data = await image.read()
-        img = Image.open(io.BytesIO(image_data))
-        logger.info(f"Image size: {img.size} (width, height)")
-
-        # Base64 encode the image data
-        encoded_image = base64.b64encode(image_data).decode("utf-8")
-        # Construct the data URI for the image
-        image_url_data_uri = f"data:{image.content_type};base64,{encoded_image}"
-        logger.debug(f"Image data URI (first 50 chars): {image_url_data_uri[:50]}...")
-
-        # Create the initial message for the agent
-        # The query is now implicitly handled by the system prompt, so we send a generic text or empty string
-        messages_for_agent = [
-            HumanMessage(
-                content=[
-                    {"type": "image_url", "image_url": {"url": image_url_data_uri}},
-                ]
-            )
-        ]
-        
-        # Invoke the agent with the messages
-        agent_response = agent.invoke({"messages": messages_for_agent})
-        
-        # Extract the content from the agent's response
-        # Assuming the agent's response is a dict with a 'messages' key,
-        # and the last message contains the final answer.
-        final_response_content = post_process_llm_response(agent_response["messages"][-1].content)
-        logger.info("Agent response successfully retrieved.")
-
-        # Transform the response to match the client's expected format
-        books = []
-        if isinstance(final_response_content, dict):
-            # Generate mock book data with IDs, descriptions, and cover images
-            id_counter = 1
-            for title, description in final_response_content.items():
-                books.append({
-                    "id": id_counter,
-                    "title": title,
-                    "description": description,
-                    "cover": f"https://picsum.photos/200/300?random={id_counter}"  # Mock cover image
-                })
-                id_counter += 1
-        else:
-            # Handle error case
-            return JSONResponse(content={"status": "error", "message": "Invalid response format"}, status_code=500)
-
-        # Return response using the defined model
-        return BooksResponse(books=books)
+        logger.info("Received image: %s (%s)", image.filename, image.content_type)
+
+        # Hash the multipart parser's spool in chunks; the upload is read from it in place
+        with stage("upload_read"):
+            upload = await open_upload(image)
+        with upload:
+            books = await scan_books(upload)
+        _add_to_library(request, [book.title for book in books.books])
+        return books
+    except UploadTooLargeError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=413)
+    except InvalidImageError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    except LLMOverloadedError as e:
+        return JSONResponse(
+            content={"status": "error", "message": str(e)},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
-        logger.error(f"Error processing image: {e}", exc_info=True)
+        logger.error("Error processing image: %s", e, exc_info=True)
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+
+
+@router.post("/process-image/stream", dependencies=[Depends(process_image_rate_limit)])
+async def process_image_stream(request: Request, image: UploadFile = File(...)):
+    """
+    Streaming variant of /process-image. Responds with Server-Sent Events: one "book" event in the
+    BookResponse shape as soon as each title/gist pair is complete in the model's token stream,
+    then a "done" event with the total count, or an "error" event if the scan fails midway.
+    """
+    try:
+        logger.info("Received image for streaming scan: %s (%s)", image.filename, image.content_type)
+        with stage("upload_read"):
+            upload = await open_upload(image)
+        with upload:
+            if image_scans.in_flight(upload.sha256):
+                # The same image is already being scanned; wait for it and replay the result.
+                scanned = await image_scans.do(upload.sha256, lambda: _scan_image(upload))
+                if scanned is None:
+                    return JSONResponse(content={"status": "error", "message": "Invalid response format"}, status_code=500)
+                scan = ScanInput(upload.sha256, None, scanned.book_gists, None)
+            else:
+                # Streamed books are shown as they arrive from one model reply, so always ask for
+                # their gists up front and send panoramas whole
+                scan = await _prepare_scan(upload, allow_identify_only=False, allow_tiling=False)
+
+        # Reject up front while we can still send a status code; once streaming, errors become events.
+        if scan.cached is None and llm_limiter.is_saturated():
+            raise LLMOverloadedError("Server is busy, please retry shortly", llm_limiter.retry_after)
+    except UploadTooLargeError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=413)
+    except InvalidImageError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=400)
+    except LLMOverloadedError as e:
+        return JSONResponse(
+            content={"status": "error", "message": str(e)},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except Exception as e:
+        logger.error("Error preparing streaming scan: %s", e, exc_info=True)
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+
+    return StreamingResponse(
+        _scan_events(scan, session_id_from(request.headers.get(SESSION_HEADER), create=False)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/process-images/batch", dependencies=[Depends(batch_rate_limit)])
+async def process_images_batch(request: Request, images: List[UploadFile] = File(...)):
+    """
+    Accepts many shelf images in one request and streams results back as NDJSON.
+
+    Each line is a JSON object. An "image" line is emitted for every upload as soon as it
+    finishes (in completion order, tagged with its index), followed by one "summary" line
+    holding the merged, de-duplicated book list. Books carry stable IDs derived from their
+    normalized title, so the same book keeps the same ID across images and batches.
+    """
+    if len(images) > BATCH_MAX_IMAGES:
+        return JSONResponse(
+            content={"status": "error", "message": f"Too many images, the limit is {BATCH_MAX_IMAGES} per batch"},
+            status_code=413,
+        )
+    logger.info("Received batch of %d images", len(images))
+
+    # Starlette closes the multipart files once this handler returns, so the batch takes
+    # them over until the stream is done
+    uploads = []
+    try:
+        for image in images:
+            uploads.append(await open_upload(image, detach=True))
+    except UploadTooLargeError as e:
+        for upload in uploads:
+            upload.close()
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=413)
+
+    session_id = session_id_from(request.headers.get(SESSION_HEADER), create=False)
+    return StreamingResponse(_batch_lines(uploads, session_id), media_type="application/x-ndjson")
+
+
+async def scan_books(upload: SpooledUpload) -> BooksResponse:
+    """
+    Scans a spooled upload into the response /process-image returns. Identical uploads
+    arriving together share one scan (and one model call). Also used by the scan job workers.
+
+    Raises:
+        InvalidImageError: If the upload is not an image that can be decoded.
+        ValueError: If the model's reply could not be parsed.
+        LLMOverloadedError: If the model is saturated or unavailable.
+    """
+    scanned = await image_scans.do(upload.sha256, lambda: _scan_image(upload))
+    logger.info("Agent response successfully retrieved.")
+
+    if scanned is None:
+        raise ValueError("Invalid response format")
+
+    # Return response using the defined model; its JSON encoding is timed as "serialize"
+    with stage("build_response"):
+        return _to_books_response(scanned.book_gists, scanned.entries)
+
+
+async def _prepare_scan(upload: SpooledUpload, allow_identify_only: bool = True, allow_tiling: bool = True) -> ScanInput:
+    """
+    Runs the cache lookups and preprocessing for an upload and builds the agent messages on a miss.
+    When the catalog holds gists for most recently scanned titles, the model is asked only to
+    identify the titles. Panoramas are cut into overlapping tiles, each scanned separately.
+    """
+    image_hash = upload.sha256
+    # Serve repeated uploads of the same bytes straight from the cache
+    if scan_cache is not None:
+        with stage("cache_lookup"):
+            cached = await run_in_threadpool(scan_cache.get_exact, image_hash)
+        if cached is not None:
+            logger.info("Scan cache hit (exact) for %.12s", image_hash)
+            record_event("scan_cache_hit_exact")
+            return ScanInput(image_hash, None, cached, None)
+
+    # Downscale, orient and re-encode before anything touches the pixels again
+    max_edge = max_edge_for_model(gemini_model)
+    with stage("preprocess"):
+        tiled = await run_in_threadpool(preprocess_tiles, upload.file, max_edge) if allow_tiling else None
+        prepared = tiled or await run_in_threadpool(preprocess_image, upload.file, max_edge)
+    if tiled is not None:
+        logger.info(
+            "Image size: %s -> %d tiles of %s (width, height), %d -> %d bytes",
+            tiled.original_size, len(tiled.tiles), tiled.tiles[0].image.size, upload.size, tiled.data_size,
+        )
+        record_event("tiled_scans")
+        record_event("scan_tiles", len(tiled.tiles))
+        image_payload_bytes.observe(tiled.data_size, "tiled")
+    else:
+        logger.info(
+            "Image size: %s -> %s (width, height), %d -> %d bytes, spine crop %s",
+            prepared.original_size, prepared.image.size, upload.size, len(prepared.data), prepared.crop_box,
+        )
+        _record_spine_crop(prepared)
+
+    # Near-identical photos (re-taken, recompressed, resized) match on the perceptual hash
+    image_phash = None
+    if scan_cache is not None:
+        with stage("cache_lookup"):
+            image_phash = await run_in_threadpool(perceptual_hash, prepared.image)
+            cached = await run_in_threadpool(scan_cache.get_similar, image_phash)
+        if cached is not None:
+            logger.info("Scan cache hit (perceptual) for %.12s", image_hash)
+            record_event("scan_cache_hit_perceptual")
+            return ScanInput(image_hash, image_phash, cached, None)
+        record_event("scan_cache_miss")
+
+    # Dense shelves and small spines go straight to the strong model
+    is_tiled = tiled is not None
+    with stage("route"):
+        tier = await run_in_threadpool(image_tier, [tile.image for tile in tiled.tiles] if is_tiled else [prepared.image])
+
+    # Keep only the encoded payloads, letting the decoded pixels go before the data URIs
+    # are built, and drop each payload once it is encoded
+    payloads = [(image.data, image.mime_type) for image in (tiled.tiles if is_tiled else [prepared])]
+    tiled = prepared = None
+    data_uris = []
+    with stage("encode"):
+        while payloads:
+            data, mime_type = payloads.pop(0)
+            data_uris.append(await run_in_threadpool(encode_data_uri, data, mime_type))
+    logger.debug("Image data URI (first 50 chars): %.50s...", data_uris[0])
+
+    # Create the initial message for the agent
+    # The query is implicitly handled by the system prompt; identify-only scans add their instruction
+    identify_only = allow_identify_only and catalog is not None and catalog.prefers_identify_only()
+    messages = [_scan_messages(data_uri, identify_only) for data_uri in data_uris]
+    if is_tiled:
+        return ScanInput(image_hash, image_phash, None, None, identify_only, messages, tier)
+    return ScanInput(image_hash, image_phash, None, messages[0], identify_only, tier=tier)
+
+
+def _record_spine_crop(prepared: PreparedImage):
+    """Records the payload sent to the model, labelled by whether the spine crop was applied."""
+    if prepared.crop_box is None:
+        image_payload_bytes.observe(len(prepared.data), "full")
+    else:
+        record_event("spine_crops")
+        image_payload_bytes.observe(len(prepared.data), "cropped")
+
+
+def _scan_messages(image_url_data_uri: str, identify_only: bool) -> List[HumanMessage]:
+    # The identify instruction is static, so it goes before the image and extends the prefix
+    # shared with other identify-only scans
+    content = [{"type": "image_url", "image_url": {"url": image_url_data_uri}}]
+    if identify_only:
+        content.insert(0, {"type": "text", "text": prompts.get("identify_prompt")})
+    return [HumanMessage(content=content)]
+
+
+async def _scan_image(upload: SpooledUpload, prepare_slots=_NO_LIMIT, agent_slots=_NO_LIMIT) -> Optional[ScannedBooks]:
+    """
+    Scans one image end to end: cache lookup, preprocessing, agent call, catalog lookup and
+    cache store. Preprocessing and the agent call each run inside the given slots, if any.
+
+    Returns:
+        The books with their catalog entries, or None if the model's reply could not be parsed.
+    """
+    async with prepare_slots:
+        scan = await _prepare_scan(upload)
+    if scan.cached is not None:
+        return ScannedBooks(scan.cached, await _lookup_catalog(scan.cached))
+
+    # Invoke the agent with the messages. The model calls for this image, including any
+    # follow-up for missing gists, share one time budget, which starts once it has a slot
+    async with agent_slots:
+        with request_budget(), stage("agent"):
+            if scan.tile_messages is not None:
+                book_gists = await _scan_tiles(scan.tile_messages, scan.tier)
+            else:
+                agent_response = await agent.ainvoke({"messages": scan.messages, "tier": scan.tier})
+                # The agent node has already parsed and validated the model's reply
+                parsed = agent_response.get("book_gists")
+                book_gists = parsed.root if parsed is not None else None
+
+            if book_gists is None:
+                return None
+            # Variants of one title ("Dune", "Dune (Frank Herbert)") become one canonical book
+            # (off the event loop: a fuzzy match scans postings and learning takes the index's lock)
+            canonical = await run_in_threadpool(title_index.canonicalize_gists, book_gists)
+            completed, entries = await _complete_from_catalog(canonical, scan.identify_only)
+    await _store_scan(scan, completed)
+    return ScannedBooks(completed, entries)
+
+
+async def _scan_tiles(tile_messages: List[List[HumanMessage]], tier: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """
+    Runs the agent on the tiles of a panorama, IMAGE_TILE_CONCURRENCY at a time, and merges
+    their books, de-duplicating those read twice where tiles overlap.
+
+    A tile whose call fails (overload, timeout, an upstream error) is treated like one whose
+    reply did not parse: the other tiles are still merged.
+
+    Returns:
+        The merged title -> gist dictionary, or None if every tile's reply failed to parse.
+
+    Raises:
+        Exception: The first tile's error, if every tile failed and at least one raised.
+    """
+    tile_slots = asyncio.Semaphore(IMAGE_TILE_CONCURRENCY)
+
+    async def scan_tile(messages: List[HumanMessage]) -> Optional[Dict[str, str]]:
+        async with tile_slots:
+            agent_response = await agent.ainvoke({"messages": messages, "tier": tier})
+        book_gists = agent_response.get("book_gists")
+        return book_gists.root if book_gists is not None else None
+
+    outcomes = await asyncio.gather(*(scan_tile(messages) for messages in tile_messages), return_exceptions=True)
+    errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    results = [None if isinstance(outcome, BaseException) else outcome for outcome in outcomes]
+    failed = sum(1 for result in results if result is None)
+    if failed == len(results):
+        if errors:
+            raise errors[0]
+        return None
+    for error in errors:
+        logger.warning("A tile's scan failed: %s", error)
+    if failed:
+        logger.warning("%d of %d tiles failed; merging the rest", failed, len(results))
+        record_event("scan_tiles_failed", failed)
+    merged = merge_tile_gists(results)
+    logger.info("Merged %d tiles into %d books", len(results), len(merged))
+    return merged
+
+
+async def _complete_from_catalog(
+    book_gists: Dict[str, str], identify_only: bool
+) -> Tuple[Dict[str, str], Dict[str, CatalogEntry]]:
+    """
+    Replaces the model's gists with stored ones for titles the catalog knows. After an
+    identify-only scan, gists for the remaining titles come from one text-only model call.
+    New gists are remembered for later scans.
+
+    Returns:
+        The title -> gist dictionary to cache and return, and the catalog entries of the
+        titles the catalog knows (for covers and canonical titles).
+    """
+    if catalog is None or not book_gists:
+        return book_gists, {}
+    with stage("catalog"):
+        entries = await run_in_threadpool(catalog.lookup_many, list(book_gists))
+    known = {title: entry.gist for title, entry in entries.items() if entry.gist}
+    catalog.record_hit_rate(len(known), len(book_gists))
+    record_event("catalog_hit", len(known))
+    record_event("catalog_miss", len(book_gists) - len(known))
+
+    generated = {title: gist for title, gist in book_gists.items() if title not in known and gist}
+    if identify_only:
+        missing = [title for title in book_gists if title not in known]
+        generated = await _describe_titles(missing) if missing else {}
+    if CATALOG_LEARN_FROM_SCANS and generated:
+        await run_in_threadpool(catalog.remember, generated)
+    return {title: known.get(title) or generated.get(title, "") for title in book_gists}, entries
+
+
+async def _describe_titles(titles: List[str]) -> Dict[str, str]:
+    """
+    Asks the model for gists of the given titles (text only, no image).
+
+    Returns:
+        The title -> gist dictionary for the titles the model described.
+    """
+    with stage("describe"):
+        agent_response = await agent.ainvoke({"messages": [HumanMessage(content=json.dumps(titles))]})
+    book_gists = agent_response.get("book_gists")
+    if book_gists is None:
+        logger.warning("Could not parse gists for %d titles missing from the catalog", len(titles))
+        return {}
+    described = {canonical_key(title): gist for title, gist in book_gists.root.items()}
+    return {title: described[canonical_key(title)] for title in titles if described.get(canonical_key(title))}
+
+
+async def _lookup_catalog(titles) -> Dict[str, CatalogEntry]:
+    """
+    Looks titles up in the catalog, for covers and canonical titles and gists.
+    """
+    titles = list(titles)
+    if catalog is None or not titles:
+        return {}
+    with stage("catalog"):
+        return await run_in_threadpool(catalog.lookup_many, titles)
+
+
+async def _store_scan(scan: ScanInput, book_gists: Dict[str, str]):
+    """
+    Stores a successful scan result in the cache.
+    """
+    if scan_cache is not None and scan.image_phash is not None:
+        await run_in_threadpool(scan_cache.put, scan.image_hash, scan.image_phash, book_gists)
+
+
+async def _scan_events(scan: ScanInput, session_id: Optional[str] = None):
+    """
+    Yields the Server-Sent Events for a streaming scan, adding its books to the session's
+    library, if any, once it completes.
+    """
+    if scan.cached is not None:
+        entries = await _lookup_catalog(scan.cached)
+        for book_id, (title, description) in enumerate(scan.cached.items(), start=1):
+            yield _sse("book", _to_book_response(book_id, title, description, entries.get(title)).model_dump())
+        if session_id is not None:
+            session_library.add_books(session_id, scan.cached)
+        yield _sse("done", {"count": len(scan.cached)})
+        return
+
+    parser = IncrementalBookParser()
+    raw_chunks = []
+    # Canonical title -> gist of the books sent so far; repeats of a book are not sent again
+    book_gists = {}
+    try:
+        async for chunk in stream_llm_call(scan.messages, scan.tier):
+            raw_chunks.append(chunk)
+            for title, description in parser.feed(chunk):
+                title = (await run_in_threadpool(title_index.canonicalize, title)).title
+                if title not in book_gists:
+                    book_gists[title] = description
+                    entry = (await _lookup_catalog([title])).get(title)
+                    yield _sse("book", _to_book_response(len(book_gists), title, description, entry).model_dump())
+    except LLMOverloadedError as e:
+        yield _sse("error", {"message": str(e), "retry_after": e.retry_after})
+        return
+    except Exception as e:
+        logger.error("Error streaming scan: %s", e, exc_info=True)
+        yield _sse("error", {"message": str(e)})
+        return
+
+    if not parser.done:
+        # The reply did not stream as one clean object; fall back to parsing it whole and
+        # emit whatever the incremental parser could not.
+        raw_content = "".join(raw_chunks)
+        parsed = try_parse_book_gists(raw_content) or repair_book_gists(raw_content)
+        if parsed is None:
+            yield _sse("error", {"message": "Invalid response format"})
+            return
+        for title, description in parsed.root.items():
+            title = (await run_in_threadpool(title_index.canonicalize, title)).title
+            if title not in book_gists:
+                book_gists[title] = description
+                entry = (await _lookup_catalog([title])).get(title)
+                yield _sse("book", _to_book_response(len(book_gists), title, description, entry).model_dump())
+
+    logger.info("Streamed %d books", len(book_gists))
+    completed, _ = await _complete_from_catalog(book_gists, identify_only=False)
+    await _store_scan(scan, completed)
+    if session_id is not None:
+        session_library.add_books(session_id, book_gists)
+    yield _sse("done", {"count": len(book_gists)})
+
+
+async def _scan_one(index: int, upload: SpooledUpload, prepare_slots: asyncio.Semaphore, agent_slots: asyncio.Semaphore):
+    """
+    Scans a single image of a batch. Preprocessing and the agent call take separate slots,
+    so the next images are decoded while earlier ones are waiting on the model. Duplicate
+    frames within the batch (or in flight elsewhere) share a single scan.
+
+    Returns:
+        (index, filename, ScannedBooks or None, error message or None)
+    """
+    filename = upload.filename
+    try:
+        scanned = await image_scans.do(
+            upload.sha256, lambda: _scan_image(upload, prepare_slots, agent_slots)
+        )
+        if scanned is None:
+            return index, filename, None, "Invalid response format"
+        return index, filename, scanned, None
+    except (InvalidImageError, LLMOverloadedError) as e:
+        logger.warning("Could not scan batch image %d (%s): %s", index, filename, e)
+        return index, filename, None, str(e)
+    except Exception as e:
+        # Other errors can carry internals (file objects, paths, upstream responses); log them only
+        logger.error("Error processing batch image %d (%s): %s", index, filename, e, exc_info=True)
+        return index, filename, None, "The image could not be scanned"
+
+
+async def _batch_lines(uploads: List[SpooledUpload], session_id: Optional[str] = None):
+    """
+    Runs the scans of a batch concurrently and yields NDJSON lines as each one completes.
+    The merged books are added to the session's library, if any.
+    """
+    prepare_slots = asyncio.Semaphore(os.cpu_count() or 1)
+    agent_slots = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    tasks = [
+        asyncio.create_task(_scan_one(index, upload, prepare_slots, agent_slots))
+        for index, upload in enumerate(uploads)
+    ]
+    results = [None] * len(uploads)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, filename, scanned, error = await next_done
+            results[index] = scanned.book_gists if scanned is not None else {}
+            line = {"type": "image", "index": index, "filename": filename}
+            if error is None:
+                line["status"] = "ok"
+                line["books"] = [
+                    _to_book_response(stable_book_id(title), title, description, scanned.entries.get(title)).model_dump()
+                    for title, description in scanned.book_gists.items()
+                ]
+            else:
+                line["status"] = "error"
+                line["message"] = error
+            yield json.dumps(line) + "\n"
+    finally:
+        # Stop outstanding model calls if the client goes away mid-batch
+        for task in tasks:
+            task.cancel()
+        for upload in uploads:
+            upload.close()
+
+    merged_gists = merge_book_gists(results)
+    entries = await _lookup_catalog(title for _, title, _ in merged_gists)
+    merged = [
+        _to_book_response(book_id, title, description, entries.get(title)).model_dump()
+        for book_id, title, description in merged_gists
+    ]
+    failed = sum(1 for task in tasks if task.result()[3] is not None)
+    if session_id is not None:
+        session_library.add_books(session_id, [book["title"] for book in merged])
+    logger.info("Batch of %d images produced %d unique books (%d failed)", len(uploads), len(merged), failed)
+    yield json.dumps({"type": "summary", "images": len(uploads), "failed": failed, "books": merged}) + "\n"
+
+
+def _add_to_library(request: Request, titles: List[str]):
+    """
+    Adds scanned books to the library of the client's session, if it named one.
+    """
+    session_id = session_id_from(request.headers.get(SESSION_HEADER), create=False)
+    if session_id is not None:
+        session_library.add_books(session_id, titles)
+
+
+def _sse(event: str, data: dict) -> str:
+    """
+    Formats a single Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _to_book_response(book_id: int, title: str, description: str, entry: Optional[CatalogEntry] = None) -> BookResponse:
+    """
+    Builds a single BookResponse, taking the canonical title, gist and cover from the catalog
+    entry when there is one, and a mock cover image otherwise.
+    """
+    cover = catalog.cover_url(entry) if entry is not None else None
+    return BookResponse(
+        id=book_id,
+        title=entry.title if entry is not None else title,
+        description=(entry.gist if entry is not None else "") or description,
+        cover=cover or f"https://picsum.photos/200/300?random={book_id}"  # Mock cover image
+    )
+
+
+def _to_books_response(book_gists: dict, entries: Optional[Dict[str, CatalogEntry]] = None) -> BooksResponse:
+    """
+    Transforms a title -> gist dictionary into the client's expected BooksResponse format.
+    """
+    entries = entries or {}
+    return BooksResponse(books=[
+        _to_book_response(book_id, title, description, entries.get(title))
+        for book_id, (title, description) in enumerate(book_gists.items(), start=1)
+    ])
@@ -0,0 +1,172 @@
+import asyncio, json, os
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from config.logging_manager import get_logger
+from config.metrics import record_event, stage
+from agent.concurrency import LLMOverloadedError
+from config.rate_limit import rate_limiter
+from routes.image_processing import scan_books
+from services.image_preprocessing import InvalidImageError
+from services.library import SESSION_HEADER, session_id_from, session_library
+from services.scan_jobs import (
+    SCAN_JOB_POLL_SECONDS, SCAN_JOB_WORKERS, JobDeferredError, JobQueueFullError, JobRejectedError, JobWorkerPool,
+    ScanJob, QUEUED, scan_jobs,
+)
+from services.uploads import SpooledUpload, UploadRoute, UploadTooLargeError, open_upload
+
+# Create API router
+router = APIRouter(route_class=UploadRoute)
+logger = get_logger(__name__)
+
+SCAN_JOB_MAX_PRIORITY = int(os.getenv("SCAN_JOB_MAX_PRIORITY", "10"))
+# Seconds between status checks of an event stream, and between its keep-alive comments
+SCAN_JOB_EVENTS_POLL_SECONDS = float(os.getenv("SCAN_JOB_EVENTS_POLL_SECONDS", "0.5"))
+SCAN_JOB_EVENTS_KEEPALIVE_SECONDS = 15.0
+
+# Jobs are cheap to submit but each one is a scan, so they get their own per-client budget
+scan_jobs_rate_limit = rate_limiter.limit("scan_jobs", "SCAN_JOBS_RATE_LIMIT", "60/minute")
+
+
+async def run_scan_job(upload: SpooledUpload) -> Dict[str, Any]:
+    """
+    Runs a job's scan through the /process-image pipeline, returning the response to store.
+    An overloaded model puts the job off without using up an attempt; an upload that is not an
+    image fails it outright.
+    """
+    try:
+        return (await scan_books(upload)).model_dump()
+    except LLMOverloadedError as e:
+        raise JobDeferredError(str(e), e.retry_after) from e
+    except InvalidImageError as e:
+        raise JobRejectedError(str(e)) from e
+
+
+# Workers started with the app when SCAN_JOB_WORKERS > 0; otherwise `python -m services.scan_jobs work` runs them
+scan_job_workers = JobWorkerPool(scan_jobs, run_scan_job, SCAN_JOB_WORKERS, SCAN_JOB_POLL_SECONDS)
+
+
+@router.post("/scan-jobs", status_code=202, dependencies=[Depends(scan_jobs_rate_limit)])
+async def submit_scan_job(request: Request, image: UploadFile = File(...), priority: int = Form(0)):
+    """
+    Queues a scan of an image and returns its job ID right away. The result is fetched from
+    /scan-jobs/{job_id} or pushed by /scan-jobs/{job_id}/events. An image that already has a
+    live job is not scanned again; the existing job is returned.
+    """
+    try:
+        logger.info("Received image for a scan job: %s (%s)", image.filename, image.content_type)
+        with stage("upload_read"):
+            upload = await open_upload(image)
+        with upload:
+            priority = max(-SCAN_JOB_MAX_PRIORITY, min(priority, SCAN_JOB_MAX_PRIORITY))
+            job, deduplicated = await run_in_threadpool(scan_jobs.submit, upload, priority)
+    except UploadTooLargeError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=413)
+    except JobQueueFullError as e:
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=503, headers={"Retry-After": "30"})
+    except Exception as e:
+        logger.error("Error queueing scan job: %s", e, exc_info=True)
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+
+    record_event("scan_job_deduplicated" if deduplicated else "scan_job_submitted")
+    if not deduplicated:
+        scan_job_workers.wake()
+    return JSONResponse(
+        content={"job_id": job.id, "status": job.status, "deduplicated": deduplicated},
+        status_code=202,
+        headers={"Location": f"{request.url.path}/{job.id}"},
+    )
+
+
+@router.get("/scan-jobs/{job_id}")
+async def get_scan_job(request: Request, job_id: str):
+    """
+    Returns a scan job's status, with its result once done or its error once failed. A done
+    job's books are added to the library of the client's session, if it names one.
+    """
+    job = await run_in_threadpool(scan_jobs.get, job_id)
+    if job is None:
+        return JSONResponse(content={"status": "error", "message": "Scan job not found"}, status_code=404)
+    session_id = session_id_from(request.headers.get(SESSION_HEADER), create=False)
+    if session_id is not None and job.result is not None:
+        session_library.add_books(session_id, [book["title"] for book in job.result.get("books", [])])
+    return await run_in_threadpool(_job_body, job)
+
+
+@router.get("/scan-jobs/{job_id}/events")
+async def scan_job_events(job_id: str):
+    """
+    Streams a scan job's progress as Server-Sent Events: a "status" event whenever its status
+    changes, then one "result" or "error" event once it finishes.
+    """
+    job = await run_in_threadpool(scan_jobs.get, job_id)
+    if job is None:
+        return JSONResponse(content={"status": "error", "message": "Scan job not found"}, status_code=404)
+    return StreamingResponse(
+        _job_events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _job_events(job: Optional[ScanJob]):
+    """
+    Yields the Server-Sent Events for a scan job, polling the store until it finishes.
+    """
+    last_status = None
+    idle = 0.0
+    while True:
+        if job is None:
+            yield _sse("error", {"message": "Scan job expired"})
+            return
+        if job.status != last_status:
+            last_status = job.status
+            idle = 0.0
+            yield _sse("status", await run_in_threadpool(_job_body, job, False))
+        if job.finished:
+            if job.result is not None:
+                yield _sse("result", job.result)
+            else:
+                yield _sse("error", {"message": job.error or "The scan failed"})
+            return
+        await asyncio.sleep(SCAN_JOB_EVENTS_POLL_SECONDS)
+        idle += SCAN_JOB_EVENTS_POLL_SECONDS
+        if idle >= SCAN_JOB_EVENTS_KEEPALIVE_SECONDS:
+            # Keep proxies from closing a stream that has been quiet for a while
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        job = await run_in_threadpool(scan_jobs.get, job.id)
+
+
+def _job_body(job: ScanJob, with_result: bool = True) -> Dict[str, Any]:
+    """
+    Builds the JSON describing a job. Queued jobs report how many jobs run before them.
+    """
+    body = {
+        "job_id": job.id,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+    if job.status == QUEUED:
+        body["position"] = scan_jobs.position(job)
+        if job.not_before is not None:
+            body["not_before"] = job.not_before
+    if job.error is not None:
+        body["error"] = job.error
+    if with_result and job.result is not None:
+        body["result"] = job.result
+    return body
+
+
+def _sse(event: str, data: dict) -> str:
+    """
+    Formats a single Server-Sent Event.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -1,4 +1,5 @@
 import logging
+from typing import Optional
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 
@@ -9,26 +10,32 @@ router = APIRouter()
 logger = get_logger()
 
 
+_LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
 @router.post("/logging/level")
-async def set_logging_level(level: str):
+async def set_logging_level(level: str, module: Optional[str] = None):
     """
-    Set the logging level for the application.
-    Accepts 'info' or 'debug' as the level parameter.
+    Set the logging level for the application, or only for one module when `module` is given
+    (e.g. "agent.nodes" or the package "services").
+    Accepts 'debug', 'info', 'warning' or 'error' as the level parameter; with a module,
+    'default' makes it follow the application level again.
     """
     try:
         level = level.lower()
-        if level == 'info':
-            logger.set_level(logging.INFO)
-            logger.info("Logging level set to INFO")
-            return JSONResponse(content={"status": "success", "message": "Logging level set to INFO"})
-        elif level == 'debug':
-            logger.set_level(logging.DEBUG)
-            logger.info("Logging level set to DEBUG")
-            return JSONResponse(content={"status": "success", "message": "Logging level set to DEBUG"})
-        else:
-            return JSONResponse(content={"status": "error", "message": "Invalid logging level. Use 'info' or 'debug'."}, status_code=400)
+        if module and level == "default":
+            logger.set_level(logging.NOTSET, module)
+            logger.info("Logging level for %s reset to the default", module)
+            return JSONResponse(content={"status": "success", "message": f"Logging level for {module} reset to the default"})
+        if level not in _LEVELS:
+            return JSONResponse(content={"status": "error", "message": "Invalid logging level. Use 'debug', 'info', 'warning' or 'error'."}, status_code=400)
+
+        logger.set_level(_LEVELS[level], module)
+        target = f" for {module}" if module else ""
+        logger.info("Logging level%s set to %s", target, level.upper())
+        return JSONResponse(content={"status": "success", "message": f"Logging level{target} set to {level.upper()}"})
     except Exception as e:
-        logger.error(f"Error setting logging level: {e}", exc_info=True)
+        logger.error("Error setting logging level: %s", e, exc_info=True)
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
 
 
@@ -40,8 +47,9 @@ async def get_logging_level():
     try:
         current_level = logger.get_current_level()
         level_name = logging.getLevelName(current_level)
-        logger.info(f"Current logging level is {level_name}")
-        return JSONResponse(content={"level": level_name.lower()})
+        logger.info("Current logging level is %s", level_name)
+        modules = {module: logging.getLevelName(level).lower() for module, level in logger.get_module_levels().items()}
+        return JSONResponse(content={"level": level_name.lower(), "modules": modules})
     except Exception as e:
-        logger.error(f"Error getting logging level: {e}", exc_info=True)
+        logger.error("Error getting logging level: %s", e, exc_info=True)
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
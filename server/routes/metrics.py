@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from config.logging_manager import get_logger
+from config.metrics import registry
+
+# Create API router
+router = APIRouter()
+logger = get_logger(__name__)
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Exposes latency histograms, event counters and in-flight gauges in the Prometheus text format.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
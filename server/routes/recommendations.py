@@ -1,71 +1,211 @@
-import os
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, Request, Response
 from fastapi.responses import JSONResponse
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from langchain_core.messages import HumanMessage
+import asyncio
+import json
+import os
+from typing import Dict, List, Optional
+from langchain_core.messages import HumanMessage, SystemMessage
+from starlette.concurrency import run_in_threadpool
 
 from agent.agent import agent
-from agent.post_process import post_process_llm_response
+from agent.concurrency import LLMOverloadedError
+from agent.prompts.registry import prompts
 from config.logging_manager import get_logger
+from config.metrics import record_event, stage
+from config.rate_limit import rate_limiter
 from models.models import RecommendationsRequest, RecommendationsResponse, BookResponse
-
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
+from services.catalog import catalog
+from services.library import SESSION_HEADER, session_id_from, session_library
+from services.recommender import Recommendation, recommender
+from services.single_flight import recommendation_requests
+from services.title_index import title_index
+from services.titles import canonical_key
 
 # Create API router
 router = APIRouter()
-logger = get_logger()
+logger = get_logger(__name__)
+
+recommendations_rate_limit = rate_limiter.limit("recommendations", "RECOMMENDATIONS_RATE_LIMIT", "5/minute")
+
+# llm: the model recommends freely; rerank: it picks from the local shortlist; local: no model call
+RECOMMENDER_MODE = os.getenv("RECOMMENDER_MODE", "rerank").lower()
+RECOMMENDATIONS_COUNT = int(os.getenv("RECOMMENDATIONS_COUNT", "8"))
+RECOMMENDER_SHORTLIST = int(os.getenv("RECOMMENDER_SHORTLIST", "24"))
+# Past this the model call is abandoned and the local recommendations are served
+RECOMMENDER_LLM_TIMEOUT_SECONDS = float(os.getenv("RECOMMENDER_LLM_TIMEOUT_SECONDS", "15"))
 
-@router.post("/books/recommendations")
-@limiter.limit(os.getenv("RECOMMENDATIONS_RATE_LIMIT", "5/minute"))
-async def get_recommendations(request: Request, req: RecommendationsRequest):
+_LOCAL_DESCRIPTION = "Similar to the books on your shelf."
+
+@router.post("/books/recommendations", dependencies=[Depends(recommendations_rate_limit)])
+async def get_recommendations(request: Request, response: Response, req: RecommendationsRequest):
     """
     Returns recommendations based on provided books.
+
+    With an X-Session-Id header the books are added to that session's library: only the books
+    added since the session's last recommendations are sent to the model, and its suggestions
+    are merged with the earlier ones. Without one, the request's books are all there is and no
+    session is created.
     """
     try:
+        session_id = session_id_from(request.headers.get(SESSION_HEADER), create=False)
+
         # Use the books from the request model
         books = req.books
-        logger.info(f"Generating recommendations for {len(books)} books")
-        
-        # Create a prompt for the LLM to generate recommendations
-        books_titles = [book['title'] for book in books]
-        logger.debug(f"Book titles for recommendations: {books_titles}")
-        
-        # Read the recommendation prompt from the file
-        with open('agent/prompts/recommendation_prompt.md', 'r') as file:
-            recommendation_prompt = file.read()
-        logger.debug("Loaded recommendation prompt from file")
-        
-        # Create the final prompt with the books list
-        final_prompt = f"{recommendation_prompt}\n\n**Input Books:**\n{books_titles}\n\n**Your Response:**"
-        
-        # Generate content using the model
-        logger.debug("Sending prompt to agent for recommendations")
-        agent_response = agent.invoke({"messages": [HumanMessage(content=final_prompt)]})
-        
-        # Extract the text response
-        recommendations = post_process_llm_response(agent_response["messages"][-1].content)
-        logger.info(f"Received {len(recommendations) if isinstance(recommendations, dict) else 'unknown'} recommendations")
+        if session_id is None:
+            books_titles = [book['title'] for book in books]
+            previous = {}
+        else:
+            response.headers[SESSION_HEADER] = session_id
+            session_library.add_books(session_id, [book['title'] for book in books])
+            books_titles = session_library.pending(session_id)
+            previous = session_library.recommendations(session_id)
+        logger.info("Generating recommendations for %d new of %d books", len(books_titles), len(books))
+        logger.debug("Book titles for recommendations: %s", books_titles)
+
+        if not books_titles and previous:
+            # Nothing new since the last request
+            record_event("recommendations_session_reused")
+            recommendations = previous
+        else:
+            if not books_titles and session_id is not None:
+                books_titles = session_library.books(session_id)
+            # Identical requests in flight (the same set of books, however spelled) share one model call
+            request_key = tuple(sorted({title_index.book_id(title) for title in books_titles}))
+            recommendations = await recommendation_requests.do(request_key, lambda: _generate_recommendations(books_titles))
+            if isinstance(recommendations, dict) and session_id is not None:
+                recommendations = session_library.merge_recommendations(session_id, books_titles, recommendations)
+            elif previous:
+                logger.warning("Serving the session's earlier recommendations, the new ones could not be parsed")
+                recommendations = previous
+        logger.info("Received %s recommendations", len(recommendations) if isinstance(recommendations, dict) else "unknown")
         
         # Transform the response to match the client's expected format
         recommended_books = []
         id_counter = 1
         if isinstance(recommendations, dict):
+            # Books the catalog knows get their canonical title, stored gist and real cover
+            entries = await run_in_threadpool(catalog.lookup_many, list(recommendations)) if catalog is not None else {}
             for title, description in recommendations.items():
+                entry = entries.get(title)
                 recommended_books.append({
                     "id": id_counter,
-                    "title": title,
-                    "description": description,
-                    "cover": f"https://picsum.photos/200/300?random={id_counter}"  # Mock cover image
+                    "title": entry.title if entry else title,
+                    "description": (entry.gist if entry else "") or description,
+                    "cover": (catalog.cover_url(entry) if entry else None) or f"https://picsum.photos/200/300?random={id_counter}"  # Mock cover image
                 })
                 id_counter += 1
-            logger.debug(f"Transformed {len(recommended_books)} recommendations to client format")
+            logger.debug("Transformed %d recommendations to client format", len(recommended_books))
         else:
             logger.warning("Recommendations response is not in expected dictionary format")
         
         # Return response using the defined model
-        return RecommendationsResponse(recommendations=recommended_books)
+        return RecommendationsResponse(recommendations=recommended_books, session_id=session_id)
+    except LLMOverloadedError as e:
+        return JSONResponse(
+            content={"status": "error", "message": str(e)},
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)},
+        )
     except Exception as e:
-        logger.error(f"Error generating recommendations: {e}", exc_info=True)
+        logger.error("Error generating recommendations: %s", e, exc_info=True)
         return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+
+
+async def _generate_recommendations(books_titles: list) -> Optional[Dict[str, str]]:
+    """
+    Recommends books for the given titles.
+
+    In local mode the local recommender answers alone. Otherwise the model is asked, in rerank
+    mode to choose from the local shortlist, and the local recommendations are served instead
+    when the model is overloaded, slower than RECOMMENDER_LLM_TIMEOUT_SECONDS, fails or replies
+    with nothing usable.
+
+    Returns:
+        The title -> description dictionary, or None if the model's reply could not be parsed
+        and there are no local recommendations.
+    """
+    local = await _local_recommendations(books_titles)
+    if RECOMMENDER_MODE == "local" and local:
+        record_event("recommendations_local")
+        return _local_gists(local)
+
+    shortlist = [recommendation.title for recommendation in local] if RECOMMENDER_MODE == "rerank" else []
+    try:
+        book_gists = await asyncio.wait_for(
+            _model_recommendations(books_titles, shortlist), timeout=RECOMMENDER_LLM_TIMEOUT_SECONDS
+        )
+    except Exception as e:
+        if not local:
+            raise
+        reason = "timed out" if isinstance(e, TimeoutError) else str(e) or type(e).__name__
+        logger.warning("Serving local recommendations, the model call failed: %s", reason)
+        record_event("recommendations_local_fallback")
+        return _local_gists(local)
+
+    if book_gists and shortlist:
+        book_gists = _keep_shortlisted(book_gists, shortlist)
+    if not book_gists and local:
+        logger.warning("Serving local recommendations, the model's reply had none to use")
+        record_event("recommendations_local_fallback")
+        return _local_gists(local)
+    return book_gists
+
+
+async def _local_recommendations(books_titles: list) -> List[Recommendation]:
+    """Returns the local recommender's picks, as many as a shortlist needs, or none without an index."""
+    if recommender is None:
+        return []
+    count = max(RECOMMENDATIONS_COUNT, RECOMMENDER_SHORTLIST) if RECOMMENDER_MODE == "rerank" else RECOMMENDATIONS_COUNT
+    with stage("local_recommendations"):
+        return await run_in_threadpool(recommender.recommend, books_titles, count)
+
+
+def _local_gists(local: List[Recommendation]) -> Dict[str, str]:
+    # The catalog supplies real gists where it has them
+    return {recommendation.title: _LOCAL_DESCRIPTION for recommendation in local[:RECOMMENDATIONS_COUNT]}
+
+
+def _keep_shortlisted(book_gists: Dict[str, str], shortlist: List[str]) -> Dict[str, str]:
+    """Keeps the model's picks that are on the shortlist, under their shortlisted titles."""
+    shortlisted = {canonical_key(title): title for title in shortlist}
+    kept = {}
+    for title, description in book_gists.items():
+        match = shortlisted.get(canonical_key(title))
+        if match is not None and match not in kept:
+            kept[match] = description
+    if len(kept) < len(book_gists):
+        logger.debug("Dropped %d recommendations that were not on the shortlist", len(book_gists) - len(kept))
+    return dict(list(kept.items())[:RECOMMENDATIONS_COUNT])
+
+
+async def _model_recommendations(books_titles: list, shortlist: List[str]) -> Optional[Dict[str, str]]:
+    """
+    Prompts the agent for recommendations based on the given titles, restricted to the
+    shortlist if there is one.
+
+    Returns:
+        The title -> description dictionary, or None if the model's reply could not be parsed.
+    """
+    # The instructions are the same on every call and go first, as the system prompt, so the
+    # provider can cache them; only the books differ
+    with stage("prompt"):
+        books = json.dumps(books_titles, ensure_ascii=False)
+        if shortlist:
+            request = prompts.render(
+                "recommendation_rerank",
+                books=books,
+                candidates=json.dumps(shortlist, ensure_ascii=False),
+                count=RECOMMENDATIONS_COUNT,
+            )
+        else:
+            request = prompts.render("recommendation_input", books=books)
+        messages = [SystemMessage(content=prompts.get("recommendation_prompt")), HumanMessage(content=request)]
+
+    # Generate content using the model
+    logger.debug("Sending prompt to agent for recommendations")
+    with stage("agent"):
+        agent_response = await agent.ainvoke({"messages": messages})
+
+    # The agent node has already parsed and validated the model's reply
+    book_gists = agent_response.get("book_gists")
+    return book_gists.root if book_gists is not None else None
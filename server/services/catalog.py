@@ -0,0 +1,319 @@
+"""
+Local book catalog: canonical titles, authors, gists and covers in SQLite with an FTS5 index.
+
+Bulk-load a dump from the server/ directory:
+    python -m services.catalog ingest books.csv more_books.jsonl
+    python -m services.catalog search "hitchhiker galaxy"
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from config.logging_manager import get_logger
+from services.titles import canonical_key, normalize_title
+
+logger = get_logger(__name__)
+
+# Accepted column names in CSV/JSONL dumps, in order of preference
+_FIELD_ALIASES = {
+    "title": ("title", "name", "book_title"),
+    "author": ("author", "authors", "author_name"),
+    "gist": ("gist", "description", "summary", "blurb"),
+    "cover": ("cover", "cover_url", "cover_path", "image", "image_url"),
+}
+
+# SQLite caps the number of bound parameters per statement
+_MAX_PARAMS = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    norm_title TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL DEFAULT '',
+    gist TEXT NOT NULL DEFAULT '',
+    cover TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL DEFAULT 'import'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title, author, content='books', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS books_ai AFTER INSERT ON books BEGIN
+    INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+CREATE TRIGGER IF NOT EXISTS books_ad AFTER DELETE ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+END;
+CREATE TRIGGER IF NOT EXISTS books_au AFTER UPDATE OF title, author ON books BEGIN
+    INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+END;
+"""
+
+# Imported rows replace what is stored, but never blank out a field the dump leaves empty
+_UPSERT_IMPORT = """
+    INSERT INTO books (norm_title, title, author, gist, cover, source) VALUES (?, ?, ?, ?, ?, 'import')
+    ON CONFLICT(norm_title) DO UPDATE SET
+        title = excluded.title,
+        author = CASE WHEN excluded.author != '' THEN excluded.author ELSE author END,
+        gist = CASE WHEN excluded.gist != '' THEN excluded.gist ELSE gist END,
+        cover = CASE WHEN excluded.cover != '' THEN excluded.cover ELSE cover END,
+        source = 'import'
+"""
+
+# Gists learned from scans only fill gaps; curated data always wins
+_UPSERT_LEARNED = """
+    INSERT INTO books (norm_title, title, gist, source) VALUES (?, ?, ?, 'scan')
+    ON CONFLICT(norm_title) DO UPDATE SET gist = excluded.gist WHERE gist = ''
+"""
+
+
+class CatalogEntry(NamedTuple):
+    """A catalog record: canonical title, author, gist and cover (URL or path under the covers directory)."""
+    title: str
+    author: str
+    gist: str
+    cover: str
+
+
+class BookCatalog:
+    """
+    SQLite-backed catalog of known books, keyed by normalized title and full-text indexed on
+    title and author.
+
+    Scans use it to replace placeholder covers and freshly generated gists with stored ones,
+    and, once most titles on recent shelves have a stored gist, to ask the model only to
+    identify titles rather than describe them.
+    """
+
+    def __init__(self, path: str, covers_dir: str, match_threshold: float = 0.75,
+                 identify_only: str = "auto", identify_only_min_hit_rate: float = 0.8):
+        self.path = path
+        self.covers_dir = covers_dir
+        self.match_threshold = match_threshold
+        self.identify_only = identify_only
+        self.identify_only_min_hit_rate = identify_only_min_hit_rate
+        self._hit_rate = 0.0
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA busy_timeout = 5000")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT count(*) FROM books").fetchone()[0]
+
+    def ingest(self, path: str) -> int:
+        """
+        Bulk-loads a CSV (with a header row) or JSONL dump. Rows need a title; author, gist
+        and cover are optional and also accepted under common aliases such as "description".
+
+        Returns:
+            The number of rows loaded.
+        """
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            if path.endswith((".jsonl", ".ndjson")):
+                records = (json.loads(line) for line in f if line.strip())
+                count = self.ingest_records(records)
+            else:
+                count = self.ingest_records(csv.DictReader(f))
+        logger.info("Ingested %d catalog rows from %s", count, path)
+        return count
+
+    def ingest_records(self, records: Iterable[dict]) -> int:
+        """Loads records in one transaction. Returns the number of rows loaded."""
+        rows = []
+        for record in records:
+            fields = {name: _first_value(record, aliases) for name, aliases in _FIELD_ALIASES.items()}
+            norm_title = canonical_key(fields["title"])
+            if norm_title:
+                rows.append((norm_title, fields["title"].strip(), fields["author"], fields["gist"], fields["cover"]))
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(_UPSERT_IMPORT, rows)
+        return len(rows)
+
+    def remember(self, book_gists: Dict[str, str]) -> int:
+        """Stores model-generated gists for titles the catalog has no gist for. Returns the rows offered."""
+        rows = [(canonical_key(title), title, gist) for title, gist in book_gists.items() if gist and canonical_key(title)]
+        if rows:
+            with self._write_lock:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(_UPSERT_LEARNED, rows)
+        return len(rows)
+
+    def titles(self) -> Iterator[str]:
+        """Yields every stored title, e.g. to seed the title index."""
+        for (title,) in self._connection().execute("SELECT title FROM books ORDER BY id"):
+            yield title
+
+    def books(self) -> Iterator[CatalogEntry]:
+        """Yields every stored book, e.g. to build the recommender index."""
+        for row in self._connection().execute("SELECT title, author, gist, cover FROM books ORDER BY id"):
+            yield CatalogEntry(*row)
+
+    def lookup_many(self, titles: Iterable[str]) -> Dict[str, CatalogEntry]:
+        """
+        Looks up many titles at once: one indexed query for exact canonical-key matches, then a
+        full-text search for each remaining title, accepting the best candidate whose words
+        overlap the title's by at least the match threshold (Jaccard).
+
+        Returns:
+            A dictionary from each matched input title to its catalog entry.
+        """
+        norms = {title: canonical_key(title) for title in titles}
+        wanted = list({norm for norm in norms.values() if norm})
+        conn = self._connection()
+
+        found: Dict[str, CatalogEntry] = {}
+        for start in range(0, len(wanted), _MAX_PARAMS):
+            chunk = wanted[start:start + _MAX_PARAMS]
+            rows = conn.execute(
+                f"SELECT norm_title, title, author, gist, cover FROM books WHERE norm_title IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for norm_title, *entry in rows:
+                found[norm_title] = CatalogEntry(*entry)
+
+        result = {}
+        for title, norm in norms.items():
+            entry = found.get(norm) if norm else None
+            if entry is None and norm:
+                entry = self._closest(norm)
+            if entry is not None:
+                result[title] = entry
+        return result
+
+    def search(self, query: str, limit: int = 10) -> List[CatalogEntry]:
+        """Full-text search over titles and authors, best matches first."""
+        match = _match_expression(normalize_title(query).split(), operator="AND")
+        if not match:
+            return []
+        rows = self._connection().execute(
+            "SELECT b.title, b.author, b.gist, b.cover FROM books_fts JOIN books b ON b.id = books_fts.rowid "
+            "WHERE books_fts MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit),
+        )
+        return [CatalogEntry(*row) for row in rows]
+
+    def _closest(self, norm: str) -> Optional[CatalogEntry]:
+        words = set(norm.split())
+        match = _match_expression(sorted(words), operator="OR", column="title")
+        if not match:
+            return None
+        best, best_score = None, self.match_threshold
+        rows = self._connection().execute(
+            "SELECT b.norm_title, b.title, b.author, b.gist, b.cover FROM books_fts JOIN books b ON b.id = books_fts.rowid "
+            "WHERE books_fts MATCH ? ORDER BY rank LIMIT 5",
+            (match,),
+        )
+        for norm_title, *entry in rows:
+            candidate = set(norm_title.split())
+            score = len(words & candidate) / len(words | candidate)
+            if score >= best_score:
+                best, best_score = CatalogEntry(*entry), score
+        return best
+
+    def record_hit_rate(self, hits: int, total: int, smoothing: float = 0.2):
+        """Feeds the fraction of a scan's titles that had a stored gist into a moving average."""
+        if total:
+            self._hit_rate += smoothing * (hits / total - self._hit_rate)
+
+    @property
+    def hit_rate(self) -> float:
+        return self._hit_rate
+
+    def prefers_identify_only(self) -> bool:
+        """True if scans should ask the model for titles only, taking gists from the catalog."""
+        if self.identify_only == "always":
+            return True
+        if self.identify_only == "never":
+            return False
+        return self._hit_rate >= self.identify_only_min_hit_rate
+
+    def cover_url(self, entry: CatalogEntry) -> Optional[str]:
+        """The URL to serve for an entry's cover: absolute URLs as they are, local files through the API."""
+        if not entry.cover:
+            return None
+        if entry.cover.startswith(("http://", "https://", "/")):
+            return entry.cover
+        return f"/api/catalog/covers/{entry.cover}"
+
+    def cover_file(self, cover_path: str) -> Optional[str]:
+        """Resolves a cover path to a file under the covers directory, or None if it escapes or is missing."""
+        root = os.path.realpath(self.covers_dir)
+        full_path = os.path.realpath(os.path.join(root, cover_path))
+        if not full_path.startswith(root + os.sep) or not os.path.isfile(full_path):
+            return None
+        return full_path
+
+
+def _first_value(record: dict, aliases) -> str:
+    for alias in aliases:
+        value = record.get(alias)
+        if value:
+            return ", ".join(value) if isinstance(value, list) else str(value).strip()
+    return ""
+
+
+def _match_expression(words: List[str], operator: str, column: Optional[str] = None) -> str:
+    # Quote every word so FTS5 never reads user text as query syntax
+    terms = f" {operator} ".join('"' + word.replace('"', '""') + '"' for word in words if word)
+    if not terms:
+        return ""
+    return f"{column} : ({terms})" if column else terms
+
+
+_server_dir = os.path.join(os.path.dirname(__file__), "..")
+
+catalog = None
+if os.getenv("CATALOG_ENABLED", "true").lower() == "true":
+    catalog = BookCatalog(
+        path=os.getenv("CATALOG_DB", os.path.join(_server_dir, "data", "catalog.db")),
+        covers_dir=os.getenv("CATALOG_COVERS_DIR", os.path.join(_server_dir, "data", "covers")),
+        match_threshold=float(os.getenv("CATALOG_MATCH_THRESHOLD", "0.75")),
+        identify_only=os.getenv("CATALOG_IDENTIFY_ONLY", "auto").lower(),
+        identify_only_min_hit_rate=float(os.getenv("CATALOG_IDENTIFY_ONLY_MIN_HIT_RATE", "0.8")),
+    )
+
+# Whether gists the model writes for unknown titles are kept for later scans
+CATALOG_LEARN_FROM_SCANS = os.getenv("CATALOG_LEARN_FROM_SCANS", "true").lower() == "true"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="load CSV or JSONL dumps")
+    ingest.add_argument("files", nargs="+")
+    search = commands.add_parser("search", help="full-text search the catalog")
+    search.add_argument("query")
+    search.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    if catalog is None:
+        parser.error("the catalog is disabled (CATALOG_ENABLED=false)")
+    if args.command == "ingest":
+        total = sum(catalog.ingest(path) for path in args.files)
+        print(f"Loaded {total} rows; the catalog now holds {len(catalog)} books")
+    else:
+        for entry in catalog.search(args.query, args.limit):
+            print(f"{entry.title} — {entry.author or 'unknown author'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import io
+import logging
+import math
+import os
+from typing import BinaryIO, Dict, List, NamedTuple, Optional, Tuple, Union
+from PIL import Image, ImageOps, UnidentifiedImageError
+from config.logging_manager import get_logger
+from config.metrics import spine_crop_kept_area, stage
+from services.spine_crop import SPINE_CROP_ENABLED, find_spine_region
+
+logger = get_logger(__name__)
+
+# Default long-edge targets per model. Gemini bills images in 768px tiles, so sending more
+# pixels than the model can use only costs bandwidth, base64 CPU and image tokens.
+DEFAULT_MODEL_MAX_EDGES: Dict[str, int] = {
+    "gemini-2.5-flash": 1536,
+    "gemini-2.5-flash-lite": 1536,
+    "gemini-2.5-pro": 2048,
+}
+
+_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+# Upload formats the model accepts as they are, by PIL format name
+_PASSTHROUGH_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+_METADATA_KEYS = ("exif", "icc_profile", "xmp", "XML:com.adobe.xmp")
+
+
+# Raw upload bytes, or a seekable file holding them (e.g. a spooled upload)
+ImageSource = Union[bytes, BinaryIO]
+
+
+class InvalidImageError(ValueError):
+    """Raised when an upload is not an image, or is one that cannot be decoded."""
+
+    def __init__(self, message: str = "The upload is not an image in a supported format"):
+        super().__init__(message)
+
+
+class PreparedImage(NamedTuple):
+    """Result of the preprocessing stage, ready to be base64-encoded for the model."""
+    data: bytes
+    mime_type: str
+    image: Image.Image
+    original_size: Tuple[int, int]
+    # The region kept by the spine crop, in the oriented, decoded image's pixels, or None
+    crop_box: Optional[Tuple[int, int, int, int]] = None
+
+
+class TiledImage(NamedTuple):
+    """A panorama cut into overlapping tiles along the shelf, each prepared for the model."""
+    tiles: List[PreparedImage]
+    image: Image.Image
+    original_size: Tuple[int, int]
+
+    @property
+    def data_size(self) -> int:
+        return sum(len(tile.data) for tile in self.tiles)
+
+
+def _parse_model_targets(raw: str) -> Dict[str, int]:
+    """
+    Parses "model=edge,model=edge" pairs (e.g. "gemini-2.5-pro=2048") from the environment.
+    """
+    targets = {}
+    for pair in filter(None, (item.strip() for item in raw.split(","))):
+        model, _, edge = pair.partition("=")
+        try:
+            targets[model.strip()] = int(edge)
+        except ValueError:
+            logger.warning("Ignoring invalid IMAGE_MODEL_MAX_EDGES entry: %s", pair)
+    return targets
+
+
+MODEL_MAX_EDGES = {**DEFAULT_MODEL_MAX_EDGES, **_parse_model_targets(os.getenv("IMAGE_MODEL_MAX_EDGES", ""))}
+DEFAULT_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1536"))
+OUTPUT_FORMAT = os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg").lower()
+OUTPUT_QUALITY = int(os.getenv("IMAGE_OUTPUT_QUALITY", "85"))
+
+# Panoramas (long edge at least TILE_MIN_ASPECT times the short edge) are cut into tiles
+# TILE_ASPECT times as long as the shelf is high, overlapping by TILE_OVERLAP of a tile
+TILING_ENABLED = os.getenv("IMAGE_TILING_ENABLED", "true").lower() == "true"
+TILE_MIN_ASPECT = float(os.getenv("IMAGE_TILE_MIN_ASPECT", "2.5"))
+TILE_ASPECT = float(os.getenv("IMAGE_TILE_ASPECT", "1.5"))
+TILE_OVERLAP = float(os.getenv("IMAGE_TILE_OVERLAP", "0.15"))
+MAX_TILES = int(os.getenv("IMAGE_MAX_TILES", "6"))
+
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+if OUTPUT_FORMAT not in _FORMATS:
+    logger.warning("Unsupported IMAGE_OUTPUT_FORMAT '%s', falling back to jpeg", OUTPUT_FORMAT)
+    OUTPUT_FORMAT = "jpeg"
+
+
+def max_edge_for_model(model: Optional[str]) -> int:
+    """
+    Returns the long-edge pixel target for the given model name.
+    """
+    return MODEL_MAX_EDGES.get(model, DEFAULT_MAX_EDGE) if model else DEFAULT_MAX_EDGE
+
+
+def preprocess_image(
+    image_data: ImageSource,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    output_format: str = OUTPUT_FORMAT,
+    quality: int = OUTPUT_QUALITY,
+    crop_spines: bool = SPINE_CROP_ENABLED,
+) -> PreparedImage:
+    """
+    Decodes, orients, downscales and re-encodes an uploaded image for the model.
+
+    JPEG uploads are decoded with Image.draft so the decoder does the bulk of the
+    downscaling in the DCT domain instead of materializing every pixel. EXIF orientation
+    is applied to the pixels and all metadata is dropped on re-encode. With crop_spines,
+    the image is first cropped to the shelf when one stands out from its surroundings. An
+    upload that needed none of this and is smaller than its re-encoding is sent as it is.
+
+    Args:
+        image_data: The raw uploaded bytes, or a seekable file holding them.
+        max_edge: The maximum length in pixels of the output's long edge.
+        output_format: "jpeg" or "webp".
+        quality: Encoder quality (1-100).
+        crop_spines: Whether to run the spine-region crop (see services.spine_crop).
+
+    Returns:
+        A PreparedImage with the compact encoded bytes and the decoded, resized image.
+    """
+    img, original_size = _decode(image_data, max_edge)
+    region = None
+    if crop_spines:
+        with stage("spine_crop"):
+            region = find_spine_region(img)
+        if region is not None:
+            # Keep the scale the full image would have had, so the spines keep their
+            # resolution and the payload shrinks with the area cropped away
+            full_edge = max(img.size)
+            img = img.crop(region.box)
+            max_edge = max(1, math.ceil(max_edge * max(img.size) / full_edge))
+            spine_crop_kept_area.observe(region.kept_area)
+    prepared = _encode(img, original_size, max_edge, output_format, quality)
+    if region is not None:
+        prepared = prepared._replace(crop_box=region.box)
+    elif prepared.image.size == original_size:
+        prepared = _keep_original_if_smaller(image_data, prepared)
+    logger.debug(
+        "Preprocessed image %s -> %s, %d bytes (%s), crop %s",
+        original_size, prepared.image.size, len(prepared.data), prepared.mime_type, prepared.crop_box,
+    )
+    return prepared
+
+
+def plan_tiles(
+    size: Tuple[int, int],
+    min_aspect: float = TILE_MIN_ASPECT,
+    tile_aspect: float = TILE_ASPECT,
+    overlap: float = TILE_OVERLAP,
+    max_tiles: int = MAX_TILES,
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Plans overlapping tiles along the long (shelf) axis of a panorama.
+
+    Tiles are tile_aspect times as long as the short edge and spread evenly, so each overlap
+    is at least the requested fraction of a tile. If that would take more than max_tiles,
+    the tiles grow instead so that max_tiles still cover the whole shelf.
+
+    Args:
+        size: The (width, height) of the oriented image.
+
+    Returns:
+        The crop boxes (left, upper, right, lower) in shelf order, or an empty list if the
+        image is not elongated enough to need tiling.
+    """
+    width, height = size
+    long_edge, short_edge = max(size), min(size)
+    if short_edge == 0 or long_edge < min_aspect * short_edge or max_tiles < 2:
+        return []
+
+    tile = short_edge * tile_aspect
+    count = min(max_tiles, math.ceil((long_edge - tile) / (tile * (1 - overlap))) + 1)
+    if count < 2:
+        return []
+    # n tiles overlapping by `overlap` cover n - (n - 1) * overlap tile lengths
+    tile = max(tile, long_edge / (count - (count - 1) * overlap))
+    step = (long_edge - tile) / (count - 1)
+
+    boxes = []
+    for index in range(count):
+        start = round(index * step)
+        end = min(long_edge, round(index * step + tile))
+        boxes.append((start, 0, end, height) if width >= height else (0, start, width, end))
+    return boxes
+
+
+def preprocess_tiles(
+    image_data: ImageSource,
+    max_edge: int = DEFAULT_MAX_EDGE,
+    output_format: str = OUTPUT_FORMAT,
+    quality: int = OUTPUT_QUALITY,
+) -> Optional[TiledImage]:
+    """
+    Cuts a panoramic upload into overlapping tiles, each downscaled to max_edge and encoded
+    like preprocess_image. Sending the whole panorama would shrink every spine to a few pixels.
+
+    Returns:
+        The tiles in shelf order, or None if the image does not need tiling.
+    """
+    if not TILING_ENABLED:
+        return None
+    with _open(image_data) as header:
+        width, height = header.size
+        if header.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+    boxes = plan_tiles((width, height))
+    if not boxes:
+        return None
+
+    # Decode only as many pixels as the tiles can use: each tile's long edge becomes max_edge
+    tile_length = max(boxes[0][2] - boxes[0][0], boxes[0][3] - boxes[0][1])
+    scale = min(1.0, max_edge / tile_length)
+    img, original_size = _decode(image_data, math.ceil(max(width, height) * scale))
+    scale_x, scale_y = img.size[0] / width, img.size[1] / height
+
+    tiles = []
+    for left, upper, right, lower in boxes:
+        box = (round(left * scale_x), round(upper * scale_y), round(right * scale_x), round(lower * scale_y))
+        tiles.append(_encode(img.crop(box), original_size, max_edge, output_format, quality))
+    if logger.is_enabled_for(logging.DEBUG):
+        logger.debug(
+            "Tiled image %s into %d tiles of %s, %d bytes",
+            original_size, len(tiles), tiles[0].image.size, sum(len(tile.data) for tile in tiles),
+        )
+    return TiledImage(tiles=tiles, image=img, original_size=original_size)
+
+
+def _open(image_data: ImageSource) -> Image.Image:
+    """
+    Opens an upload lazily, reading only its header.
+
+    Raises:
+        InvalidImageError: If the data is not in a format PIL recognizes.
+    """
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        image_data = io.BytesIO(image_data)
+    image_data.seek(0)
+    try:
+        return Image.open(image_data)
+    except UnidentifiedImageError:
+        # PIL's message names the file object; keep that out of responses
+        raise InvalidImageError() from None
+
+
+def _keep_original_if_smaller(image_data: ImageSource, prepared: PreparedImage) -> PreparedImage:
+    """
+    Returns the upload's own bytes in place of a re-encoding that came out larger, provided
+    the upload is in a format the model accepts and has no metadata (so no EXIF orientation
+    was applied and nothing needs stripping) or transparency to flatten.
+    """
+    with _open(image_data) as header:
+        mime_type = _PASSTHROUGH_MIME_TYPES.get(header.format)
+        has_metadata = header.getexif() or any(header.info.get(key) for key in _METADATA_KEYS)
+        if mime_type is None or header.mode not in ("RGB", "L") or has_metadata:
+            return prepared
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        if len(image_data) >= len(prepared.data):
+            return prepared
+        original = bytes(image_data)
+    else:
+        if image_data.seek(0, io.SEEK_END) >= len(prepared.data):
+            return prepared
+        image_data.seek(0)
+        original = image_data.read()
+    return prepared._replace(data=original, mime_type=mime_type)
+
+
+def _decode(image_data: ImageSource, draft_edge: int) -> Tuple[Image.Image, Tuple[int, int]]:
+    """
+    Decodes an upload to an oriented RGB or L image, letting JPEG decode at reduced scale
+    as long as the long edge stays at least draft_edge.
+
+    Returns:
+        The image and the upload's original (width, height).
+    """
+    img = _open(image_data)
+    original_size = img.size
+
+    if img.format == "JPEG":
+        # Lets libjpeg decode at 1/2, 1/4 or 1/8 scale while staying >= the requested size.
+        # Draft keeps both edges at least as long as the box, so the box has the image's aspect
+        # ratio: a square one would keep a 4:3 photo at full size for want of a short edge
+        width, height = original_size
+        long_edge = max(width, height)
+        img.draft("RGB", (math.ceil(width * draft_edge / long_edge), math.ceil(height * draft_edge / long_edge)))
+
+    # Orient without the full-size copy exif_transpose makes by default
+    try:
+        img.load()
+    except OSError as e:
+        raise InvalidImageError("The image is truncated or corrupt") from e
+    ImageOps.exif_transpose(img, in_place=True)
+
+    if img.mode not in ("RGB", "L"):
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        else:
+            img = img.convert("RGB")
+    return img, original_size
+
+
+def _encode(img: Image.Image, original_size: Tuple[int, int], max_edge: int, output_format: str, quality: int) -> PreparedImage:
+    if max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    pil_format, mime_type = _FORMATS.get(output_format, _FORMATS["jpeg"])
+    buffer = io.BytesIO()
+    img.save(buffer, format=pil_format, quality=quality)
+    return PreparedImage(data=buffer.getvalue(), mime_type=mime_type, image=img, original_size=original_size)
@@ -0,0 +1,165 @@
+"""
+Per-session libraries: the books a user has scanned so far and the recommendations made for them.
+
+A session is named by the X-Session-Id header the client sends with its scans and
+recommendation requests. Each one keeps its books as canonical book ID -> title, the IDs
+already sent to the model for recommendations, and the merged recommendations, so a
+recommendation request only has to ask about the books added since the last one. Sessions
+live in memory, in LRU order: one idle for SESSION_IDLE_SECONDS is dropped, as are the least
+recently used past SESSION_MAX_SESSIONS. A dropped session is rebuilt from the books the
+client sends next.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config.logging_manager import get_logger
+from config.metrics import registry
+from services.title_index import title_index
+
+logger = get_logger(__name__)
+
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "3600"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_BOOKS = int(os.getenv("SESSION_MAX_BOOKS", "2000"))
+# Recommendations kept per session, newest first, across incremental requests
+SESSION_MAX_RECOMMENDATIONS = int(os.getenv("SESSION_MAX_RECOMMENDATIONS", "16"))
+
+SESSION_HEADER = "X-Session-Id"
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+
+def session_id_from(value: Optional[str], create: bool = True) -> Optional[str]:
+    """Returns the client's session ID if it is well formed, or else a new one (None if not create)."""
+    if value and _SESSION_ID.match(value):
+        return value
+    return uuid.uuid4().hex if create else None
+
+
+class _Session:
+    __slots__ = ("books", "covered", "recommendations", "last_seen")
+
+    def __init__(self, now: float):
+        # Canonical book ID -> title, in the order the books were added
+        self.books: Dict[int, str] = {}
+        # IDs of the books recommendations have already been made for
+        self.covered: Set[int] = set()
+        # Canonical book ID -> (title, description), newest first
+        self.recommendations: Dict[int, Tuple[str, str]] = {}
+        self.last_seen = now
+
+
+class SessionLibrary:
+    """
+    In-memory libraries keyed by session ID, evicted when idle or least recently used.
+    """
+
+    def __init__(self, idle_seconds: float, max_sessions: int, max_books: int, max_recommendations: int):
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max(1, max_sessions)
+        self.max_books = max_books
+        self.max_recommendations = max_recommendations
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "evicted": 0}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _session(self, session_id: str, now: Optional[float]) -> _Session:
+        """Returns a session, creating it if needed, after evicting idle ones. Call with the lock held."""
+        now = time.time() if now is None else now
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_seen <= self.idle_seconds:
+                break
+            del self._sessions[oldest_id]
+            self.stats["evicted"] += 1
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session(now)
+            self.stats["created"] += 1
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.stats["evicted"] += 1
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_seen = now
+        return session
+
+    def add_books(self, session_id: str, titles: Iterable[str], now: float = None) -> int:
+        """
+        Adds books to a session's library, once each however they are spelled.
+
+        Returns:
+            The number of books that were new to the library.
+        """
+        identified = [(title_index.book_id(title), title) for title in titles if title]
+        with self._lock:
+            session = self._session(session_id, now)
+            before = len(session.books)
+            for book_id, title in identified:
+                if len(session.books) >= self.max_books:
+                    logger.warning("Session library is full (%d books); ignoring the rest", self.max_books)
+                    break
+                session.books.setdefault(book_id, title)
+            return len(session.books) - before
+
+    def books(self, session_id: str, now: float = None) -> List[str]:
+        """Returns the titles in a session's library, oldest first."""
+        with self._lock:
+            return list(self._session(session_id, now).books.values())
+
+    def pending(self, session_id: str, now: float = None) -> List[str]:
+        """Returns the titles recommendations have not been made for yet."""
+        with self._lock:
+            session = self._session(session_id, now)
+            return [title for book_id, title in session.books.items() if book_id not in session.covered]
+
+    def recommendations(self, session_id: str, now: float = None) -> Dict[str, str]:
+        """Returns a session's current recommendations, newest first."""
+        with self._lock:
+            return dict(self._session(session_id, now).recommendations.values())
+
+    def merge_recommendations(self, session_id: str, covered: Iterable[str], recommendations: Dict[str, str],
+                              now: float = None) -> Dict[str, str]:
+        """
+        Records recommendations made for some of a session's books.
+
+        The new recommendations go before the earlier ones, books already in the library or
+        recommended are skipped, and the oldest are dropped past the session's limit.
+
+        Args:
+            covered: The titles the recommendations were made for.
+            recommendations: Title -> description.
+
+        Returns:
+            The session's merged recommendations, newest first.
+        """
+        covered_ids = [title_index.book_id(title) for title in covered]
+        fresh = [(title_index.book_id(title), title, description) for title, description in recommendations.items()]
+        with self._lock:
+            session = self._session(session_id, now)
+            session.covered.update(covered_ids)
+            merged = {}
+            previous = [(book_id, title, description) for book_id, (title, description) in session.recommendations.items()]
+            for book_id, title, description in fresh + previous:
+                if book_id in session.books or book_id in merged or len(merged) >= self.max_recommendations:
+                    continue
+                merged[book_id] = (title, description)
+            session.recommendations = merged
+            return dict(merged.values())
+
+
+session_library = SessionLibrary(
+    SESSION_IDLE_SECONDS, SESSION_MAX_SESSIONS, SESSION_MAX_BOOKS, SESSION_MAX_RECOMMENDATIONS
+)
+registry.gauge(
+    "shelf_scanner_sessions", "Session libraries held in memory.",
+    callback=lambda: {(): len(session_library)},
+)
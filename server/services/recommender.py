@@ -0,0 +1,409 @@
+"""
+Local content-based recommender over the book catalog.
+
+Every catalog book is embedded as a hashed bag of the words and word pairs in its title and
+gist plus its author, weighted by inverse document frequency and L2-normalized. The vectors
+are saved as one float32 matrix that is memory-mapped when loaded, so pages are read on
+demand and shared between worker processes. A request's books are averaged into a query and
+the nearest books by cosine similarity are found with chunked matrix products, several
+queries at a time. Catalogs of RECOMMENDER_IVF_MIN_BOOKS or more also get an inverted-file
+index: rows are clustered with spherical k-means and stored grouped by cluster, and a query
+scores only the rows of the RECOMMENDER_IVF_PROBES clusters nearest to it.
+
+The recommendations route answers from it directly or hands its shortlist to the model, and
+falls back to it when the model is overloaded, slow or replies with nothing usable.
+
+Build the index from the catalog, from the server/ directory:
+    python -m services.recommender build
+    python -m services.recommender query "Dune" "Neuromancer"
+
+Benchmark:
+    python -m benchmarks.bench_recommender --books 1000000
+"""
+import argparse
+import json
+import math
+import os
+import zlib
+from array import array
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from config.logging_manager import get_logger
+from services.titles import canonical_key, normalize_title
+
+logger = get_logger(__name__)
+
+_server_dir = os.path.join(os.path.dirname(__file__), "..")
+
+RECOMMENDER_ENABLED = os.getenv("RECOMMENDER_ENABLED", "true").lower() == "true"
+RECOMMENDER_DIR = os.getenv("RECOMMENDER_DIR", os.path.join(_server_dir, "data", "recommender"))
+RECOMMENDER_DIM = int(os.getenv("RECOMMENDER_DIM", "256"))
+RECOMMENDER_IVF_MIN_BOOKS = int(os.getenv("RECOMMENDER_IVF_MIN_BOOKS", "200000"))
+RECOMMENDER_IVF_PROBES = int(os.getenv("RECOMMENDER_IVF_PROBES", "32"))
+
+_FORMAT_VERSION = 1
+_BOOKS_FILE = "books.json"
+_VECTORS_FILE = "vectors.npy"
+_IDF_FILE = "idf.npy"
+_IVF_FILE = "ivf.npz"
+
+# Rows per matrix product, which bounds the scores held per query during a scan
+_CHUNK_ROWS = 65536
+_KMEANS_ITERATIONS = 20
+_KMEANS_SAMPLE_PER_LIST = 64
+# A shared author says more than any one shared word
+_AUTHOR_WEIGHT = 2.0
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has his her in into is it its of on or that the their "
+    "this to who whose with was were".split()
+)
+
+
+class Recommendation(NamedTuple):
+    """A recommended book: its title as indexed and its cosine similarity to the query."""
+    title: str
+    score: float
+
+
+def _words(text: str) -> List[str]:
+    return [word for word in normalize_title(text).split() if len(word) > 1 and word not in _STOPWORDS]
+
+
+def _features(title: str, author: str = "", gist: str = "") -> List[Tuple[str, float]]:
+    """Returns the weighted features of a book: title and gist words and word pairs, and its author."""
+    features = []
+    for text in (title, gist):
+        words = _words(text)
+        features.extend((word, 1.0) for word in words)
+        features.extend((f"{first} {second}", 1.0) for first, second in zip(words, words[1:]))
+    author = normalize_title(author)
+    if author:
+        features.append(("@" + author, _AUTHOR_WEIGHT))
+    return features
+
+
+def _hash_features(features: List[Tuple[str, float]], dim: int) -> Tuple[List[int], List[float]]:
+    """Maps features to buckets, with a sign from the hash so collisions cancel out on average."""
+    buckets, values = [], []
+    for feature, weight in features:
+        h = zlib.crc32(feature.encode("utf-8"))
+        buckets.append(h % dim)
+        values.append(weight if (h // dim) & 1 else -weight)
+    return buckets, values
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def _top(rows: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns the k best (rows, scores), best first."""
+    if len(scores) > k:
+        best = np.argpartition(-scores, k - 1)[:k]
+        rows, scores = rows[best], scores[best]
+    order = np.argsort(-scores, kind="stable")
+    return rows[order], scores[order]
+
+
+def build_index(books: Iterable[Tuple[str, str, str]], directory: str, dim: int = RECOMMENDER_DIM,
+                ivf_min_books: int = RECOMMENDER_IVF_MIN_BOOKS, seed: int = 0) -> int:
+    """
+    Embeds books and writes the index to a directory, replacing the one there.
+
+    Args:
+        books: (title, author, gist) triples; a title whose canonical key was already seen is skipped.
+        directory: Where to write the index files.
+        dim: The vector size.
+        ivf_min_books: The book count from which an inverted-file index is built.
+        seed: Seeds the k-means sampling.
+
+    Returns:
+        The number of books indexed.
+    """
+    os.makedirs(directory, exist_ok=True)
+    titles: List[str] = []
+    keys: List[str] = []
+    seen: Set[str] = set()
+    counts = array("i")
+    buckets = array("i")
+    values = array("f")
+    for title, author, gist in books:
+        key = canonical_key(title)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        book_buckets, book_values = _hash_features(_features(title, author, gist), dim)
+        titles.append(title.strip())
+        keys.append(key)
+        counts.append(len(book_buckets))
+        buckets.extend(book_buckets)
+        values.extend(book_values)
+    seen.clear()
+
+    count = len(titles)
+    counts_np = np.frombuffer(counts, dtype=np.int32) if count else np.zeros(0, dtype=np.int32)
+    buckets_np = np.frombuffer(buckets, dtype=np.int32) if len(buckets) else np.zeros(0, dtype=np.int32)
+    values_np = np.frombuffer(values, dtype=np.float32) if len(values) else np.zeros(0, dtype=np.float32)
+    rows_np = np.repeat(np.arange(count, dtype=np.int64), counts_np)
+    offsets = np.concatenate(([0], np.cumsum(counts_np, dtype=np.int64)))
+
+    # Document frequency per bucket, counting each book once
+    df = np.bincount(np.unique(rows_np * dim + buckets_np) % dim, minlength=dim)
+    idf = (np.log((count + 1) / (df + 1)) + 1.0).astype(np.float32)
+
+    unsorted_path = os.path.join(directory, "vectors.unsorted.tmp")
+    vectors = np.lib.format.open_memmap(unsorted_path, mode="w+", dtype=np.float32, shape=(count, dim))
+    for start in range(0, count, _CHUNK_ROWS):
+        end = min(start + _CHUNK_ROWS, count)
+        first, last = offsets[start], offsets[end]
+        cells = (rows_np[first:last] - start) * dim + buckets_np[first:last]
+        block = np.bincount(cells, weights=values_np[first:last], minlength=(end - start) * dim)
+        vectors[start:end] = _normalize_rows(block.reshape(end - start, dim).astype(np.float32) * idf)
+    del rows_np, buckets_np, values_np, counts, buckets, values
+
+    ivf = None
+    order = np.arange(count)
+    if count and count >= ivf_min_books:
+        lists = max(1, min(4096, int(math.sqrt(count))))
+        centroids = _spherical_kmeans(vectors, lists, np.random.default_rng(seed))
+        assignment = _nearest_centroids(vectors, centroids)
+        order = np.argsort(assignment, kind="stable")
+        list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=lists))))
+        ivf = (centroids, list_offsets)
+
+    if ivf is None:
+        vectors.flush()
+        del vectors
+        sorted_path = unsorted_path
+    else:
+        # Store each cluster's rows contiguously, so a probe reads one slice of the file
+        sorted_path = os.path.join(directory, "vectors.tmp")
+        stored = np.lib.format.open_memmap(sorted_path, mode="w+", dtype=np.float32, shape=(count, dim))
+        for start in range(0, count, _CHUNK_ROWS):
+            stored[start:start + _CHUNK_ROWS] = vectors[order[start:start + _CHUNK_ROWS]]
+        stored.flush()
+        del stored, vectors
+        os.remove(unsorted_path)
+
+    np.save(os.path.join(directory, "idf.tmp.npy"), idf)
+    if ivf is not None:
+        np.savez(os.path.join(directory, "ivf.tmp.npz"), centroids=ivf[0], offsets=ivf[1])
+    meta = {
+        "version": _FORMAT_VERSION,
+        "dim": dim,
+        "titles": [titles[row] for row in order],
+        "keys": [keys[row] for row in order],
+    }
+    with open(os.path.join(directory, "books.tmp"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    # The book list goes last, so a reader never pairs it with another build's vectors
+    os.replace(sorted_path, os.path.join(directory, _VECTORS_FILE))
+    os.replace(os.path.join(directory, "idf.tmp.npy"), os.path.join(directory, _IDF_FILE))
+    if ivf is not None:
+        os.replace(os.path.join(directory, "ivf.tmp.npz"), os.path.join(directory, _IVF_FILE))
+    elif os.path.exists(os.path.join(directory, _IVF_FILE)):
+        os.remove(os.path.join(directory, _IVF_FILE))
+    os.replace(os.path.join(directory, "books.tmp"), os.path.join(directory, _BOOKS_FILE))
+    logger.info("Built recommender index of %d books in %s%s", count, directory, f" with {len(ivf[0])} IVF lists" if ivf else "")
+    return count
+
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _CHUNK_ROWS):
+        assignment[start:start + _CHUNK_ROWS] = np.argmax(vectors[start:start + _CHUNK_ROWS] @ centroids.T, axis=1)
+    return assignment
+
+
+def _spherical_kmeans(vectors: np.ndarray, lists: int, rng: np.random.Generator) -> np.ndarray:
+    """Clusters a sample of the rows by cosine similarity and returns the unit-length centroids."""
+    sample_size = min(len(vectors), lists * _KMEANS_SAMPLE_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, lists, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assignment = _nearest_centroids(sample, centroids)
+        order = np.argsort(assignment, kind="stable")
+        sizes = np.bincount(assignment, minlength=lists)
+        filled = np.flatnonzero(sizes)
+        starts = np.concatenate(([0], np.cumsum(sizes[filled])[:-1]))
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(sample[order], starts, axis=0)
+        # Empty clusters restart from random rows
+        empty = np.flatnonzero(sizes == 0)
+        sums[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        centroids = _normalize_rows(sums)
+    return centroids
+
+
+class BookRecommender:
+    """
+    Cosine nearest-neighbour search over the memory-mapped book vectors written by build_index.
+    """
+
+    def __init__(self, directory: str, probes: int = RECOMMENDER_IVF_PROBES):
+        with open(os.path.join(directory, _BOOKS_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported recommender index version {meta.get('version')}")
+        self.directory = directory
+        self.probes = probes
+        self.titles: List[str] = meta["titles"]
+        self._rows = {key: row for row, key in enumerate(meta["keys"])}
+        self._vectors = np.load(os.path.join(directory, _VECTORS_FILE), mmap_mode="r")
+        self._idf = np.load(os.path.join(directory, _IDF_FILE))
+        self.dim = self._vectors.shape[1]
+        if self._vectors.shape[0] != len(self.titles) or len(self._idf) != self.dim:
+            raise ValueError("Recommender index files do not match")
+        self._centroids = self._offsets = None
+        ivf_path = os.path.join(directory, _IVF_FILE)
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                self._centroids, self._offsets = ivf["centroids"], ivf["offsets"]
+
+    def __len__(self) -> int:
+        return len(self.titles)
+
+    @property
+    def approximate(self) -> bool:
+        """Whether searches probe an inverted-file index rather than scan every book."""
+        return self._centroids is not None
+
+    def embed(self, title: str, author: str = "", gist: str = "") -> np.ndarray:
+        """Embeds a book the way build_index does, with this index's dimension and IDF weights."""
+        buckets, values = _hash_features(_features(title, author, gist), self.dim)
+        vector = np.bincount(buckets, weights=values, minlength=self.dim).astype(np.float32) * self._idf
+        return _normalize_rows(vector)
+
+    def recommend(self, titles: Sequence[str], k: int = 8) -> List[Recommendation]:
+        """
+        Recommends the k indexed books most similar to the given ones.
+
+        Args:
+            titles: The reader's books. Indexed titles use their stored vectors; others are
+                embedded from the title alone.
+            k: The number of recommendations.
+
+        Returns:
+            Up to k recommendations, most similar first, never including the input books.
+        """
+        return self.recommend_many([titles], k)[0]
+
+    def recommend_many(self, requests: Sequence[Sequence[str]], k: int = 8) -> List[List[Recommendation]]:
+        """Like recommend, for several lists of books at once, sharing each pass over the matrix."""
+        if not requests:
+            return []
+        queries = np.zeros((len(requests), self.dim), dtype=np.float32)
+        excluded: List[Set[int]] = []
+        for i, titles in enumerate(requests):
+            queries[i], rows = self._query(titles)
+            excluded.append(rows)
+        want = min(len(self), k + max(len(rows) for rows in excluded))
+        if want <= 0:
+            return [[] for _ in requests]
+        if self.approximate:
+            candidates = [self._search_ivf(query, want) for query in queries]
+        else:
+            candidates = self._search_exact(queries, want)
+
+        results = []
+        for (rows, scores), skip in zip(candidates, excluded):
+            picks = [
+                Recommendation(self.titles[row], float(score))
+                for row, score in zip(rows.tolist(), scores.tolist())
+                if row not in skip and score > 0
+            ]
+            results.append(picks[:k])
+        return results
+
+    def _query(self, titles: Sequence[str]) -> Tuple[np.ndarray, Set[int]]:
+        rows: Set[int] = set()
+        parts = []
+        for title in titles:
+            row = self._rows.get(canonical_key(title))
+            if row is not None:
+                rows.add(row)
+                parts.append(np.asarray(self._vectors[row]))
+            else:
+                parts.append(self.embed(title))
+        if not parts:
+            return np.zeros(self.dim, dtype=np.float32), rows
+        return _normalize_rows(np.mean(parts, axis=0)), rows
+
+    def _search_exact(self, queries: np.ndarray, want: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self), _CHUNK_ROWS):
+            block = self._vectors[start:start + _CHUNK_ROWS]
+            scores = np.concatenate((best_scores, queries @ block.T), axis=1)
+            rows = np.concatenate(
+                (best_rows, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))), axis=1
+            )
+            if scores.shape[1] > want:
+                keep = np.argpartition(-scores, want - 1, axis=1)[:, :want]
+                scores = np.take_along_axis(scores, keep, axis=1)
+                rows = np.take_along_axis(rows, keep, axis=1)
+            best_rows, best_scores = rows, scores
+        return [_top(rows, scores, want) for rows, scores in zip(best_rows, best_scores)]
+
+    def _search_ivf(self, query: np.ndarray, want: int) -> Tuple[np.ndarray, np.ndarray]:
+        probes = min(self.probes, len(self._centroids))
+        lists = np.argpartition(-(self._centroids @ query), probes - 1)[:probes]
+        rows, scores = [], []
+        for cluster in lists.tolist():
+            start, end = int(self._offsets[cluster]), int(self._offsets[cluster + 1])
+            if end > start:
+                rows.append(np.arange(start, end))
+                scores.append(self._vectors[start:end] @ query)
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return _top(np.concatenate(rows), np.concatenate(scores), want)
+
+
+def load_recommender(directory: str = RECOMMENDER_DIR, probes: int = RECOMMENDER_IVF_PROBES) -> Optional[BookRecommender]:
+    """Opens the index in a directory, or returns None if there is no usable one."""
+    if not os.path.exists(os.path.join(directory, _BOOKS_FILE)):
+        logger.info("No recommender index in %s; build one with: python -m services.recommender build", directory)
+        return None
+    try:
+        index = BookRecommender(directory, probes)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error("Could not open the recommender index in %s: %s", directory, e)
+        return None
+    logger.info("Loaded recommender index of %d books%s", len(index), " (IVF)" if index.approximate else "")
+    return index
+
+
+recommender = load_recommender() if RECOMMENDER_ENABLED else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="embed every catalog book and write the index")
+    query = commands.add_parser("query", help="recommend books similar to the given titles")
+    query.add_argument("titles", nargs="+")
+    query.add_argument("--limit", type=int, default=8)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from services.catalog import catalog
+
+        if catalog is None:
+            parser.error("the catalog is disabled (CATALOG_ENABLED=false)")
+        count = build_index(((entry.title, entry.author, entry.gist) for entry in catalog.books()), RECOMMENDER_DIR)
+        print(f"Indexed {count} books in {RECOMMENDER_DIR}")
+    else:
+        index = load_recommender()
+        if index is None:
+            parser.error(f"no recommender index in {RECOMMENDER_DIR}; run the build command first")
+        for recommendation in index.recommend(args.titles, args.limit):
+            print(f"{recommendation.score:.3f}  {recommendation.title}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from PIL import Image
+from config.logging_manager import get_logger
+from config.metrics import registry
+
+logger = get_logger(__name__)
+
+# Files in the disk tier are named "<sha256>_<phash as 16 hex digits>.json" so the
+# perceptual index can be rebuilt from a directory listing without reading any file.
+_DISK_SUFFIX = ".json"
+
+# Flat, low-detail images (blank walls, solid colours) hash to almost all zeros or ones and
+# would all match each other, so they are only ever served from the exact tier.
+_MIN_DETAIL_BITS = 8
+
+
+def content_hash(data: bytes) -> str:
+    """
+    Returns the SHA-256 hex digest of the raw upload bytes.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(img: Image.Image) -> int:
+    """
+    Computes a 64-bit difference hash (dHash) of a decoded image.
+
+    The image is reduced to a 9x8 grayscale thumbnail and each bit records whether a pixel
+    is brighter than its right-hand neighbour, so re-compressed, re-sized or slightly
+    re-taken photos of the same shelf land within a few bits of each other.
+
+    Args:
+        img: A decoded PIL image.
+
+    Returns:
+        The hash as an unsigned 64-bit integer.
+    """
+    small = img.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class ScanCache:
+    """
+    Two-tier cache of scan results keyed by the upload's SHA-256 and its perceptual hash.
+
+    The memory tier is an LRU of the most recent results. The optional disk tier keeps
+    JSON files bounded by a TTL and a total size budget, evicting the oldest files first.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        cache_dir: Optional[str],
+        ttl_seconds: float,
+        max_disk_bytes: int,
+        phash_distance: int,
+    ):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir or None
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+        self.phash_distance = phash_distance
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._phashes: Dict[str, int] = {}
+        self._disk_files: Dict[str, tuple] = {}
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "perceptual_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if self.cache_dir:
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            name = entry.name
+            if not name.endswith(_DISK_SUFFIX) or "_" not in name:
+                continue
+            sha, phash_hex = name[: -len(_DISK_SUFFIX)].split("_", 1)
+            stat = entry.stat()
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._unlink(entry.path)
+                continue
+            self._disk_files[sha] = (entry.path, stat.st_size, stat.st_mtime)
+            self._disk_bytes += stat.st_size
+            self._phashes[sha] = int(phash_hex, 16)
+        logger.info("Scan cache loaded %d entries (%d bytes) from %s", len(self._disk_files), self._disk_bytes, self.cache_dir)
+
+    def get_exact(self, sha: str) -> Optional[Dict[str, str]]:
+        """
+        Looks up a result by the exact SHA-256 of the upload.
+
+        Returns:
+            The cached title -> gist dictionary, or None on a miss.
+        """
+        with self._lock:
+            books = self._get_locked(sha)
+            if books is not None:
+                self.stats["exact_hits"] += 1
+            return books
+
+    def get_similar(self, phash: int) -> Optional[Dict[str, str]]:
+        """
+        Looks up a result for the closest stored perceptual hash within the configured Hamming distance.
+        Counts a miss when nothing is close enough.
+
+        Returns:
+            The cached title -> gist dictionary, or None on a miss.
+        """
+        if not _MIN_DETAIL_BITS <= phash.bit_count() <= 64 - _MIN_DETAIL_BITS:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            best_sha, best_distance = None, self.phash_distance + 1
+            for sha, stored in self._phashes.items():
+                distance = (stored ^ phash).bit_count()
+                if distance < best_distance:
+                    best_sha, best_distance = sha, distance
+                    if distance == 0:
+                        break
+            books = self._get_locked(best_sha) if best_sha is not None else None
+            if books is None:
+                self.stats["misses"] += 1
+                return None
+            logger.debug("Perceptual cache hit for %.12s (distance %d)", best_sha, best_distance)
+            self.stats["perceptual_hits"] += 1
+            return books
+
+    def put(self, sha: str, phash: int, books: Dict[str, str]):
+        """
+        Stores a successful scan result in both tiers.
+        """
+        with self._lock:
+            self._put_memory(sha, phash, books)
+            if self.cache_dir:
+                self._write_disk(sha, phash, books)
+
+    def _get_locked(self, sha: str) -> Optional[Dict[str, str]]:
+        entry = self._memory.get(sha)
+        if entry is not None:
+            self._memory.move_to_end(sha)
+            return entry[1]
+        disk = self._disk_files.get(sha)
+        if disk is None:
+            return None
+        path, size, mtime = disk
+        if time.time() - mtime > self.ttl_seconds:
+            self._drop_disk(sha)
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                books = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Dropping unreadable scan cache file %s: %s", path, e)
+            self._drop_disk(sha)
+            return None
+        self.stats["disk_hits"] += 1
+        self._put_memory(sha, self._phashes[sha], books)
+        return books
+
+    def _put_memory(self, sha: str, phash: int, books: Dict[str, str]):
+        self._memory[sha] = (phash, books)
+        self._memory.move_to_end(sha)
+        self._phashes[sha] = phash
+        while len(self._memory) > self.max_entries:
+            evicted, _ = self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+            if evicted not in self._disk_files:
+                self._phashes.pop(evicted, None)
+
+    def _write_disk(self, sha: str, phash: int, books: Dict[str, str]):
+        if sha in self._disk_files:
+            self._drop_disk(sha)
+        path = os.path.join(self.cache_dir, f"{sha}_{phash:016x}{_DISK_SUFFIX}")
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(books, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning("Failed to write scan cache file %s: %s", path, e)
+            return
+        size = os.path.getsize(path)
+        self._disk_files[sha] = (path, size, time.time())
+        self._disk_bytes += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        for sha, _ in sorted(self._disk_files.items(), key=lambda item: item[1][2]):
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._drop_disk(sha)
+            self.stats["evictions"] += 1
+
+    def _drop_disk(self, sha: str):
+        path, size, _ = self._disk_files.pop(sha)
+        self._disk_bytes -= size
+        if sha not in self._memory:
+            self._phashes.pop(sha, None)
+        self._unlink(path)
+
+    @staticmethod
+    def _unlink(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+scan_cache: Optional[ScanCache] = None
+if os.getenv("SCAN_CACHE_ENABLED", "true").lower() == "true":
+    scan_cache = ScanCache(
+        max_entries=int(os.getenv("SCAN_CACHE_MAX_ENTRIES", "512")),
+        cache_dir=os.getenv("SCAN_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", ".cache", "scans")),
+        ttl_seconds=float(os.getenv("SCAN_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+        max_disk_bytes=int(os.getenv("SCAN_CACHE_MAX_DISK_BYTES", str(64 * 1024 * 1024))),
+        phash_distance=int(os.getenv("SCAN_CACHE_PHASH_DISTANCE", "4")),
+    )
+    registry.counter(
+        "shelf_scanner_scan_cache_total", "Scan cache lookups by outcome, and evictions.", ("outcome",),
+        callback=lambda: {(outcome,): count for outcome, count in scan_cache.stats.items()},
+    )
@@ -0,0 +1,494 @@
+"""
+Persistent queue of scan jobs and the worker pool that runs them.
+
+A job is an uploaded image waiting to be scanned. Submitting one copies the image under
+SCAN_JOB_DIR (named by its SHA-256, so duplicates share a file) and inserts a row into a
+SQLite database in WAL mode, which any number of worker processes on the host can share.
+An image already queued, running or finished (and not yet expired) is not queued again: the
+existing job is returned. Workers claim the highest-priority, oldest job with one atomic
+UPDATE ... RETURNING and hold it under a lease; a job whose worker died is claimed again
+once its lease runs out, up to SCAN_JOB_MAX_ATTEMPTS times, so queued and running jobs
+survive restarts. A failed attempt is retried after a backoff that doubles from
+SCAN_JOB_RETRY_BACKOFF_SECONDS; a job put off because the model is overloaded waits out the
+Retry-After without using up an attempt. Finished results are kept for
+SCAN_JOB_RESULT_TTL_SECONDS.
+
+Workers run in their own processes, from the server/ directory, so scans don't compete with
+HTTP requests for the server's event loop:
+    python -m services.scan_jobs work --workers 4
+    python -m services.scan_jobs stats
+Setting SCAN_JOB_WORKERS above 0 makes the server run that many worker tasks itself instead,
+which is convenient in development and on single-process deployments.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from config.logging_manager import get_logger
+from config.metrics import record_event, registry
+from services.uploads import SpooledUpload
+
+logger = get_logger(__name__)
+
+_server_dir = os.path.join(os.path.dirname(__file__), "..")
+
+SCAN_JOB_DB = os.getenv("SCAN_JOB_DB", os.path.join(_server_dir, ".cache", "scan_jobs.db"))
+SCAN_JOB_DIR = os.getenv("SCAN_JOB_DIR", os.path.join(_server_dir, ".cache", "scan_jobs"))
+SCAN_JOB_WORKERS = int(os.getenv("SCAN_JOB_WORKERS", "0"))
+SCAN_JOB_MAX_QUEUED = int(os.getenv("SCAN_JOB_MAX_QUEUED", "1000"))
+SCAN_JOB_MAX_ATTEMPTS = int(os.getenv("SCAN_JOB_MAX_ATTEMPTS", "3"))
+SCAN_JOB_LEASE_SECONDS = float(os.getenv("SCAN_JOB_LEASE_SECONDS", "300"))
+SCAN_JOB_RETRY_BACKOFF_SECONDS = float(os.getenv("SCAN_JOB_RETRY_BACKOFF_SECONDS", "5"))
+SCAN_JOB_RESULT_TTL_SECONDS = float(os.getenv("SCAN_JOB_RESULT_TTL_SECONDS", str(24 * 3600)))
+SCAN_JOB_POLL_SECONDS = float(os.getenv("SCAN_JOB_POLL_SECONDS", "0.5"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+STATUSES = (QUEUED, RUNNING, DONE, FAILED)
+
+# Expired jobs are purged every this many claims
+_PURGE_EVERY = 100
+# Cap on the doubling retry backoff
+_MAX_RETRY_BACKOFF_SECONDS = 600.0
+
+scan_job_wait_seconds = registry.histogram(
+    "shelf_scanner_scan_job_wait_seconds", "Time scan jobs spent queued before a worker started them.",
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0, 4 * 3600.0),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    image_sha TEXT NOT NULL,
+    filename TEXT NOT NULL DEFAULT '',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL,
+    result TEXT,
+    error TEXT,
+    not_before REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at);
+CREATE INDEX IF NOT EXISTS jobs_image ON jobs (image_sha, status);
+"""
+
+_COLUMNS = "id, image_sha, filename, priority, status, attempts, created_at, started_at, finished_at, result, error, not_before"
+
+# The queued job first in line and not waiting out a backoff, or a running one whose worker
+# let its lease run out
+_CLAIM = f"""
+    UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = :now, lease_until = :lease, not_before = NULL
+    WHERE id = (
+        SELECT id FROM jobs
+        WHERE (status = 'queued' AND (not_before IS NULL OR not_before <= :now))
+            OR (status = 'running' AND lease_until < :now)
+        ORDER BY priority DESC, created_at
+        LIMIT 1
+    )
+    RETURNING {_COLUMNS}
+"""
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job is submitted while SCAN_JOB_MAX_QUEUED jobs are already waiting."""
+
+
+class JobDeferredError(Exception):
+    """
+    Raised by a job handler to run the job again after retry_after seconds without counting the
+    attempt, e.g. while the model is overloaded.
+    """
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobRejectedError(Exception):
+    """Raised by a job handler when retrying cannot help, e.g. the upload is not an image."""
+
+
+class ScanJob(NamedTuple):
+    """A scan job as stored: its status, and the result (the /process-image response) once done."""
+    id: str
+    image_sha: str
+    filename: str
+    priority: int
+    status: str
+    attempts: int
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    result: Optional[Dict[str, Any]]
+    error: Optional[str]
+    # A queued job is not claimed before this time (a retry's backoff)
+    not_before: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+def _job(row) -> ScanJob:
+    values = list(row)
+    values[9] = json.loads(values[9]) if values[9] else None
+    return ScanJob(*values)
+
+
+class ScanJobStore:
+    """
+    Scan jobs in SQLite and their images on disk, shared by every process on the host.
+    """
+
+    def __init__(self, path: str, image_dir: str, max_queued: int = 1000, max_attempts: int = 3,
+                 lease_seconds: float = 300.0, result_ttl: float = 24 * 3600.0, retry_backoff: float = 5.0):
+        self.path = path
+        self.image_dir = image_dir
+        self.max_queued = max_queued
+        self.max_attempts = max(1, max_attempts)
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.retry_backoff = retry_backoff
+        self._local = threading.local()
+        self._claims = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        os.makedirs(image_dir, exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA busy_timeout = 5000")
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def image_path(self, image_sha: str) -> str:
+        return os.path.join(self.image_dir, image_sha)
+
+    def submit(self, upload: SpooledUpload, priority: int = 0, now: float = None) -> Tuple[ScanJob, bool]:
+        """
+        Queues a scan of an upload, unless the same image already has a live job.
+
+        Args:
+            upload: The spooled image; its SHA-256 identifies duplicates.
+            priority: Higher runs first. Resubmitting a queued image can raise its priority.
+            now: The current time, for tests.
+
+        Returns:
+            (the job, whether it already existed).
+
+        Raises:
+            JobQueueFullError: If the queue is full.
+        """
+        now = time.time() if now is None else now
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM jobs WHERE image_sha = ? AND status != 'failed' "
+                "AND (finished_at IS NULL OR finished_at >= ?) ORDER BY created_at DESC LIMIT 1",
+                (upload.sha256, now - self.result_ttl),
+            ).fetchone()
+            if row is not None:
+                job = _job(row)
+                if job.status == QUEUED and priority > job.priority:
+                    conn.execute("UPDATE jobs SET priority = ? WHERE id = ?", (priority, job.id))
+                    job = job._replace(priority=priority)
+                conn.execute("COMMIT")
+                return job, True
+            queued = conn.execute("SELECT count(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise JobQueueFullError(f"The scan queue is full ({queued} jobs waiting), please retry shortly")
+            job = ScanJob(uuid.uuid4().hex, upload.sha256, upload.filename or "", priority, QUEUED, 0, now,
+                          None, None, None, None)
+            conn.execute(
+                "INSERT INTO jobs (id, image_sha, filename, priority, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job.id, job.image_sha, job.filename, job.priority, job.status, job.created_at),
+            )
+            # Only an accepted job's image is written, so a rejected one leaves nothing behind.
+            # Writing under the lock makes other writers wait; readers carry on (WAL)
+            self._store_image(upload)
+            conn.execute("COMMIT")
+            return job, False
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _store_image(self, upload: SpooledUpload):
+        path = self.image_path(upload.sha256)
+        if os.path.exists(path):
+            return
+        partial = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(partial, "wb") as f:
+            shutil.copyfileobj(upload.open(), f)
+        os.replace(partial, path)
+
+    def get(self, job_id: str, now: float = None) -> Optional[ScanJob]:
+        """Returns a job, or None if there is no such job or its result has expired."""
+        now = time.time() if now is None else now
+        row = self._connection().execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = _job(row)
+        if job.finished_at is not None and job.finished_at < now - self.result_ttl:
+            return None
+        return job
+
+    def position(self, job: ScanJob) -> int:
+        """Returns how many queued jobs run before a queued job (0 for the next one)."""
+        return self._connection().execute(
+            "SELECT count(*) FROM jobs WHERE status = 'queued' "
+            "AND (priority > ? OR (priority = ? AND created_at < ?))",
+            (job.priority, job.priority, job.created_at),
+        ).fetchone()[0]
+
+    def claim(self, now: float = None) -> Optional[ScanJob]:
+        """Takes the next job for a worker, under a lease. Returns None if there is nothing to do."""
+        now = time.time() if now is None else now
+        conn = self._connection()
+        self._claims += 1
+        if self._claims % _PURGE_EVERY == 1:
+            self.purge(now)
+        # Jobs whose workers kept dying on them are given up on rather than claimed again
+        abandoned = conn.execute(
+            "UPDATE jobs SET status = 'failed', finished_at = :now, lease_until = NULL, "
+            "error = 'The scan was interrupted too many times' "
+            "WHERE status = 'running' AND lease_until < :now AND attempts >= :max_attempts RETURNING id",
+            {"now": now, "max_attempts": self.max_attempts},
+        ).fetchall()
+        if abandoned:
+            logger.warning("Gave up on %d scan jobs after %d interrupted attempts", len(abandoned), self.max_attempts)
+            record_event("scan_job_failed", len(abandoned))
+        row = conn.execute(_CLAIM, {"now": now, "lease": now + self.lease_seconds}).fetchone()
+        return _job(row) if row is not None else None
+
+    def complete(self, job: ScanJob, result: Dict[str, Any], now: float = None):
+        """Stores a job's result."""
+        now = time.time() if now is None else now
+        self._connection().execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ?, lease_until = NULL WHERE id = ?",
+            (json.dumps(result, ensure_ascii=False), now, job.id),
+        )
+        self._drop_image_if_unused(job.image_sha)
+
+    def fail(self, job: ScanJob, error: str, now: float = None, retry: bool = True) -> bool:
+        """
+        Records a failed attempt: the job is queued again while it has attempts left, after a
+        backoff that doubles with each attempt.
+
+        Args:
+            retry: False to fail the job outright, when running it again cannot help.
+
+        Returns:
+            True if the job will be retried.
+        """
+        now = time.time() if now is None else now
+        retry = retry and job.attempts < self.max_attempts
+        not_before = now + min(self.retry_backoff * 2 ** max(0, job.attempts - 1), _MAX_RETRY_BACKOFF_SECONDS)
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?, not_before = ?, lease_until = NULL WHERE id = ?",
+            (QUEUED if retry else FAILED, error, None if retry else now, not_before if retry else None, job.id),
+        )
+        if not retry:
+            self._drop_image_if_unused(job.image_sha)
+        return retry
+
+    def defer(self, job: ScanJob, seconds: float, error: str = None, now: float = None):
+        """Puts a claimed job back in the queue to run after a delay, without counting the attempt."""
+        now = time.time() if now is None else now
+        self._connection().execute(
+            "UPDATE jobs SET status = 'queued', attempts = max(0, attempts - 1), error = ?, not_before = ?, "
+            "lease_until = NULL WHERE id = ? AND status = 'running'",
+            (error, now + seconds, job.id),
+        )
+
+    def release(self, job: ScanJob):
+        """Puts a claimed job back in the queue without counting the attempt, e.g. on shutdown."""
+        self._connection().execute(
+            "UPDATE jobs SET status = 'queued', attempts = max(0, attempts - 1), lease_until = NULL "
+            "WHERE id = ? AND status = 'running'",
+            (job.id,),
+        )
+
+    def counts(self) -> Dict[str, int]:
+        """Returns the number of jobs in each status."""
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(self._connection().execute("SELECT status, count(*) FROM jobs GROUP BY status").fetchall())
+        return counts
+
+    def purge(self, now: float = None) -> int:
+        """Deletes jobs whose results have expired. Returns the number deleted."""
+        now = time.time() if now is None else now
+        deleted = self._connection().execute(
+            "DELETE FROM jobs WHERE finished_at < ? RETURNING image_sha", (now - self.result_ttl,)
+        ).fetchall()
+        for image_sha in {image_sha for (image_sha,) in deleted}:
+            self._drop_image_if_unused(image_sha)
+        if deleted:
+            logger.info("Purged %d expired scan jobs", len(deleted))
+        return len(deleted)
+
+    def _drop_image_if_unused(self, image_sha: str):
+        live = self._connection().execute(
+            "SELECT 1 FROM jobs WHERE image_sha = ? AND status IN ('queued', 'running') LIMIT 1", (image_sha,)
+        ).fetchone()
+        if live is None:
+            try:
+                os.remove(self.image_path(image_sha))
+            except FileNotFoundError:
+                pass
+
+
+class JobWorkerPool:
+    """
+    Worker tasks that claim jobs from the store and run each through a handler, which gets the
+    job's image as a SpooledUpload and returns the JSON result to store.
+    """
+
+    def __init__(self, store: ScanJobStore, handler: Callable[[SpooledUpload], Awaitable[Dict[str, Any]]],
+                 workers: int, poll_interval: float = 0.5):
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        """Starts the worker tasks on the running event loop."""
+        if self.workers <= 0 or self._tasks:
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(f"scan-worker-{i}")) for i in range(self.workers)]
+        logger.info("Started %d scan job workers", self.workers)
+
+    async def stop(self):
+        """Stops the workers; jobs they were running go back to the queue."""
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def wake(self):
+        """Tells idle workers in this process that a job was just queued."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run_once(self) -> bool:
+        """Claims and runs one job. Returns False if the queue was empty."""
+        job = await run_in_threadpool(self.store.claim)
+        if job is None:
+            return False
+        await self._run(job)
+        return True
+
+    async def _work(self, name: str):
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("%s: %s", name, e, exc_info=True)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except TimeoutError:
+                pass
+
+    async def _run(self, job: ScanJob):
+        logger.info("Running scan job %s (attempt %d)", job.id, job.attempts)
+        scan_job_wait_seconds.observe(max(0.0, (job.started_at or job.created_at) - job.created_at))
+        try:
+            with open(self.store.image_path(job.image_sha), "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                result = await self.handler(SpooledUpload(job.filename, f, size, job.image_sha))
+        except asyncio.CancelledError:
+            await run_in_threadpool(self.store.release, job)
+            raise
+        except JobDeferredError as e:
+            await run_in_threadpool(self.store.defer, job, e.retry_after, str(e))
+            logger.info("Scan job %s put off for %ss: %s", job.id, e.retry_after, e)
+            record_event("scan_job_deferred")
+            return
+        except Exception as e:
+            retry = await run_in_threadpool(
+                self.store.fail, job, str(e) or type(e).__name__, retry=not isinstance(e, JobRejectedError)
+            )
+            logger.warning("Scan job %s failed%s: %s", job.id, ", will retry" if retry else "", e)
+            record_event("scan_job_retried" if retry else "scan_job_failed")
+            return
+        await run_in_threadpool(self.store.complete, job, result)
+        record_event("scan_job_done")
+
+
+scan_jobs = ScanJobStore(
+    SCAN_JOB_DB,
+    SCAN_JOB_DIR,
+    max_queued=SCAN_JOB_MAX_QUEUED,
+    max_attempts=SCAN_JOB_MAX_ATTEMPTS,
+    lease_seconds=SCAN_JOB_LEASE_SECONDS,
+    result_ttl=SCAN_JOB_RESULT_TTL_SECONDS,
+    retry_backoff=SCAN_JOB_RETRY_BACKOFF_SECONDS,
+)
+registry.gauge(
+    "shelf_scanner_scan_jobs", "Scan jobs by status (finished jobs until their results expire).", ("status",),
+    callback=lambda: {(status,): count for status, count in scan_jobs.counts().items()},
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    work = commands.add_parser("work", help="run scan job workers until interrupted")
+    work.add_argument("--workers", type=int, default=max(1, SCAN_JOB_WORKERS))
+    commands.add_parser("stats", help="count jobs by status")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        for status, count in scan_jobs.counts().items():
+            print(f"{status:>8} {count}")
+        return
+
+    # The handler is the server's scan pipeline, so workers share its cache and settings
+    from routes.jobs import run_scan_job
+
+    async def run():
+        pool = JobWorkerPool(scan_jobs, run_scan_job, args.workers, SCAN_JOB_POLL_SECONDS)
+        await pool.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await pool.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
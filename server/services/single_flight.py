@@ -0,0 +1,81 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from config.logging_manager import get_logger
+from config.metrics import registry
+
+logger = get_logger(__name__)
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single execution.
+
+    The first caller for a key starts the work as a task; callers arriving while it is in
+    flight await the same task and receive the same result or exception. A caller that is
+    cancelled only stops waiting; the shared work is cancelled once no callers are left.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = {"calls": 0, "coalesced": 0}
+
+    def in_flight(self, key: Hashable) -> bool:
+        """True if a call for the key is currently running."""
+        return key in self._calls
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Runs func() for the key, or joins the call already in flight for it.
+
+        Args:
+            key: Identifies duplicate work (e.g. an image content hash).
+            func: Zero-argument coroutine function performing the work.
+
+        Returns:
+            The result of the shared call.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(func()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.stats["calls"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            logger.debug("Coalesced duplicate %s call (%d already waiting)", self.name, call.waiters)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Every caller has gone away; stop the work and let the next caller start afresh.
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+image_scans = SingleFlight("image scan")
+recommendation_requests = SingleFlight("recommendations")
+
+registry.counter(
+    "shelf_scanner_single_flight_total", "Calls started and duplicate calls coalesced onto them.", ("flight", "kind"),
+    callback=lambda: {
+        (flight.name, kind): count
+        for flight in (image_scans, recommendation_requests)
+        for kind, count in flight.stats.items()
+    },
+)
@@ -0,0 +1,173 @@
+"""
+Vectorized pre-pass that finds the books in a shelf photo, so the wall, floor and ceiling
+around them can be cropped away before the image is encoded for the model.
+
+Book spines are tall, narrow strips side by side, so a shelf is where vertical edges are
+dense. The pass works on a grayscale copy about 512px on its long edge: it marks pixels
+whose horizontal gradient is strong and dominates the vertical one, projects their density
+onto rows to find the band of shelf rows, then onto columns within that band to find the
+spines, and crops to the bounding box plus a margin. Anything it is unsure about keeps the
+full image.
+"""
+import os
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from config.logging_manager import get_logger
+
+logger = get_logger(__name__)
+
+SPINE_CROP_ENABLED = os.getenv("SPINE_CROP_ENABLED", "true").lower() == "true"
+# Margin added on every side, as a fraction of the crop's width and height
+SPINE_CROP_MARGIN = float(os.getenv("SPINE_CROP_MARGIN", "0.05"))
+# Minimum ratio of edge density inside the crop to outside it
+SPINE_CROP_MIN_CONTRAST = float(os.getenv("SPINE_CROP_MIN_CONTRAST", "3.0"))
+
+# Long edge of the grayscale copy the projections are computed on
+_ANALYSIS_EDGE = 512
+# Gray-level step that counts as an edge; well above JPEG noise on a plain wall
+_EDGE_STEP = 16
+# A row or column belongs to the shelf when its smoothed density is this fraction of the peak
+_ACTIVE_FRACTION = 0.15
+# Below this overall edge density there is nothing that looks like a shelf
+_MIN_DENSITY = 0.01
+# Crops keeping more than this much of the area save too little to be worth the risk;
+# crops keeping less than the minimum have most likely found a single object, not a shelf
+_MAX_KEPT_AREA = 0.85
+_MIN_KEPT_AREA = 0.04
+# A column is a boundary between spines only if at least this share of the shelf rows has an edge there
+_BOUNDARY_MIN_DENSITY = 0.3
+
+
+class SpineRegion(NamedTuple):
+    """The crop found by find_spine_region, in the coordinates of the image it was given."""
+    box: Tuple[int, int, int, int]
+    kept_area: float
+    contrast: float
+
+
+def find_spine_region(
+    img: Image.Image,
+    margin: float = SPINE_CROP_MARGIN,
+    min_contrast: float = SPINE_CROP_MIN_CONTRAST,
+) -> Optional[SpineRegion]:
+    """
+    Locates the shelf rows and spines in an oriented image.
+
+    Args:
+        img: The decoded image, already oriented upright.
+        margin: Fraction of the crop's size added on each side.
+        min_contrast: Minimum ratio of edge density inside the crop to outside it.
+
+    Returns:
+        The region to crop to, or None to keep the full image: when there are too few edges,
+        the edges are not concentrated in one area, or cropping would remove too little.
+    """
+    width, height = img.size
+    analysis = _vertical_edges(img)
+    if analysis is None:
+        return None
+    edges, small_size = analysis
+    total = np.count_nonzero(edges)
+    if total < _MIN_DENSITY * edges.size:
+        return None
+
+    rows = _active_span(edges.mean(axis=1, dtype=np.float32))
+    if rows is None:
+        return None
+    top, bottom = rows
+    columns = _active_span(edges[top:bottom].mean(axis=0, dtype=np.float32))
+    if columns is None:
+        return None
+    left, right = columns
+
+    inside = np.count_nonzero(edges[top:bottom, left:right])
+    inside_area = (bottom - top) * (right - left)
+    outside_area = edges.size - inside_area
+    contrast = (inside / inside_area) / max((total - inside) / outside_area, 1e-6) if outside_area else 0.0
+    if contrast < min_contrast:
+        logger.debug("Spine crop skipped: contrast %.2f below %.2f", contrast, min_contrast)
+        return None
+
+    # Back to the input's coordinates, with the margin
+    scale_x, scale_y = width / small_size[0], height / small_size[1]
+    pad_x, pad_y = margin * (right - left), margin * (bottom - top)
+    box = (
+        max(0, int((left - pad_x) * scale_x)),
+        max(0, int((top - pad_y) * scale_y)),
+        min(width, int((right + pad_x) * scale_x + 0.5)),
+        min(height, int((bottom + pad_y) * scale_y + 0.5)),
+    )
+    kept_area = (box[2] - box[0]) * (box[3] - box[1]) / (width * height)
+    if not _MIN_KEPT_AREA <= kept_area <= _MAX_KEPT_AREA:
+        logger.debug("Spine crop skipped: would keep %.0f%% of the image", kept_area * 100)
+        return None
+    return SpineRegion(box=box, kept_area=kept_area, contrast=float(contrast))
+
+
+def estimate_spine_count(img: Image.Image) -> int:
+    """
+    Estimates how many spines an image shows by counting the boundaries between them: runs
+    of columns where, across the band of shelf rows, vertical edges are markedly denser than
+    on the spines themselves. Spines narrower than a few pixels of the analysis copy merge.
+
+    Returns:
+        The estimated count, or 0 if there are too few edges to tell.
+    """
+    analysis = _vertical_edges(img)
+    if analysis is None:
+        return 0
+    edges, _ = analysis
+    if np.count_nonzero(edges) < _MIN_DENSITY * edges.size:
+        return 0
+    rows = _active_span(edges.mean(axis=1, dtype=np.float32))
+    top, bottom = rows if rows is not None else (0, edges.shape[0])
+    profile = edges[top:bottom].mean(axis=0, dtype=np.float32)
+    boundaries = profile >= max(profile.mean() + profile.std(), _BOUNDARY_MIN_DENSITY)
+    runs = int(boundaries[0]) + np.count_nonzero(boundaries[1:] & ~boundaries[:-1])
+    return runs + 1 if runs else 0
+
+
+def _vertical_edges(img: Image.Image) -> Optional[Tuple[np.ndarray, Tuple[int, int]]]:
+    """
+    Marks the vertical edges of a grayscale copy about _ANALYSIS_EDGE on its long edge.
+
+    Returns:
+        (the boolean edge map, the copy's size), or None if the image is too small.
+    """
+    width, height = img.size
+    small = img
+    factor = max(width, height) / _ANALYSIS_EDGE
+    if factor > 2:
+        # Box-averaging a 12 MP image takes longer than the whole analysis, so subsample to
+        # twice the analysis size and average only the last 2x2 step, which still evens out noise
+        subsampled = (max(2, round(width / factor) * 2), max(2, round(height / factor) * 2))
+        small = img.resize(subsampled, Image.Resampling.NEAREST).reduce(2)
+    elif factor > 1:
+        small = img.reduce(2)
+    gray = np.asarray(small.convert("L"), dtype=np.int16)
+    if gray.shape[0] < 16 or gray.shape[1] < 16:
+        return None
+
+    # Vertical edges: a strong step between horizontal neighbours, stronger than the vertical step
+    dx = np.abs(np.diff(gray, axis=1))[:-1]
+    dy = np.abs(np.diff(gray, axis=0))[:, :-1]
+    return (dx >= _EDGE_STEP) & (dx > dy), small.size
+
+
+def _active_span(profile: np.ndarray) -> Optional[Tuple[int, int]]:
+    """
+    Smooths a density projection and returns the [start, end) span from the first to the
+    last position at _ACTIVE_FRACTION of its peak, or None if the profile is empty.
+    """
+    # Spine edges are single columns a few pixels apart, so smooth over several spines; the
+    # span is then widened by half a window, which smoothing shaved off each end
+    window = max(3, len(profile) // 20)
+    smoothed = np.convolve(profile, np.ones(window, dtype=np.float32) / window, mode="same")
+    peak = smoothed.max()
+    if peak <= 0:
+        return None
+    active = np.flatnonzero(smoothed >= _ACTIVE_FRACTION * peak)
+    return max(0, int(active[0]) - window // 2), min(len(profile), int(active[-1]) + 1 + window // 2)
@@ -0,0 +1,197 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from typing import Dict, Mapping, NamedTuple, Optional
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from config.http_middleware import accepted_encodings
+from config.logging_manager import get_logger
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip variants are served
+    brotli = None
+
+logger = get_logger(__name__)
+
+# Vite emits content-hashed bundles such as assets/index-BdF3k2a1.js; these never change in place
+_HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$")
+
+# Already-compressed formats gain nothing from another pass
+_COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/manifest+json")
+_MIN_COMPRESS_BYTES = 512
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+STATIC_GZIP_LEVEL = int(os.getenv("STATIC_GZIP_LEVEL", "9"))
+STATIC_BROTLI_QUALITY = int(os.getenv("STATIC_BROTLI_QUALITY", "11"))
+STATIC_RELOAD_INTERVAL_SECONDS = float(os.getenv("STATIC_RELOAD_INTERVAL_SECONDS", "2"))
+
+
+class StaticAsset(NamedTuple):
+    """A file held in memory with its precompressed variants and validators."""
+    body: bytes
+    gzip: Optional[bytes]
+    br: Optional[bytes]
+    etag: str
+    media_type: str
+    cache_control: str
+    mtime: float
+
+
+class StaticSite:
+    """
+    Serves the built frontend from memory.
+
+    Every file under the dist directory is read once at startup, along with gzip and (when the
+    optional brotli package is installed) brotli variants; matching .gz/.br files written by the
+    build are used instead of compressing again. Responses carry strong per-encoding ETags and
+    answer If-None-Match with 304. Content-hashed bundles are marked immutable, while index.html
+    is revalidated by browsers and reloaded here when its mtime changes, checked at most every
+    STATIC_RELOAD_INTERVAL_SECONDS so serving a page costs no filesystem call.
+    """
+
+    def __init__(self, root: str, reload_interval: float = STATIC_RELOAD_INTERVAL_SECONDS):
+        self.root = os.path.realpath(root)
+        self.reload_interval = reload_interval
+        self._assets: Dict[str, StaticAsset] = {}
+        self._index_checked = 0.0
+        self._lock = threading.Lock()
+
+        start = time.perf_counter()
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith((".gz", ".br")):
+                    continue
+                path = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, "/")
+                self._load(path)
+        self._index_checked = time.monotonic()
+        logger.info(
+            "Loaded %d static files from %s in %.0fms (brotli %s)",
+            len(self._assets), self.root, (time.perf_counter() - start) * 1000,
+            "enabled" if brotli is not None else "unavailable",
+        )
+
+    @property
+    def has_index(self) -> bool:
+        return "index.html" in self._assets
+
+    def get(self, path: str, load_missing: bool = False) -> Optional[StaticAsset]:
+        """
+        Returns the asset for a path relative to the site root.
+
+        Args:
+            path: e.g. "index.html" or "assets/index-BdF3k2a1.js".
+            load_missing: Look on disk for files added after startup (e.g. a new build's bundles).
+        """
+        if path == "index.html":
+            self._maybe_reload_index()
+        asset = self._assets.get(path)
+        if asset is None and load_missing:
+            with self._lock:
+                asset = self._assets.get(path) or self._load(path)
+        return asset
+
+    def response(self, path: str, headers: Mapping[str, str], load_missing: bool = False) -> Optional[Response]:
+        """
+        Builds the response for a path, negotiating the encoding from Accept-Encoding and
+        honouring If-None-Match. Returns None if there is no such file.
+        """
+        asset = self.get(path, load_missing)
+        return self._respond(asset, headers) if asset is not None else None
+
+    async def serve(self, path: str, headers: Mapping[str, str], load_missing: bool = False) -> Optional[Response]:
+        """
+        response() for async handlers. Assets already in memory are answered on the event
+        loop; reading and compressing one (a new bundle, or index.html changed on disk) runs
+        in the threadpool.
+        """
+        asset = self._assets.get(path)
+        if (asset is None and load_missing) or (path == "index.html" and self._index_due()):
+            asset = await run_in_threadpool(self.get, path, load_missing)
+        return self._respond(asset, headers) if asset is not None else None
+
+    def _respond(self, asset: StaticAsset, headers: Mapping[str, str]) -> Response:
+
+        accepted = accepted_encodings(headers.get("accept-encoding", ""))
+        # The client's most preferred variant we hold, brotli winning ties
+        quality, body, encoding = 0.0, asset.body, None
+        for name, variant in (("br", asset.br), ("gzip", asset.gzip)):
+            if variant is not None and accepted[name] > quality:
+                quality, body, encoding = accepted[name], variant, name
+
+        etag = f'"{asset.etag}-{encoding}"' if encoding else f'"{asset.etag}"'
+        response_headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+        if asset.gzip is not None or asset.br is not None:
+            response_headers["Vary"] = "Accept-Encoding"
+
+        if _etag_matches(headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=response_headers)
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        return Response(content=body, media_type=asset.media_type, headers=response_headers)
+
+    def _index_due(self) -> bool:
+        return time.monotonic() - self._index_checked >= self.reload_interval
+
+    def _maybe_reload_index(self):
+        if not self._index_due():
+            return
+        self._index_checked = time.monotonic()
+        try:
+            mtime = os.stat(os.path.join(self.root, "index.html")).st_mtime
+        except OSError:
+            return
+        current = self._assets.get("index.html")
+        if current is None or current.mtime != mtime:
+            with self._lock:
+                logger.info("index.html changed on disk, reloading")
+                self._load("index.html")
+
+    def _load(self, path: str) -> Optional[StaticAsset]:
+        full_path = os.path.realpath(os.path.join(self.root, path))
+        if not full_path.startswith(self.root + os.sep) or not os.path.isfile(full_path):
+            return None
+        with open(full_path, "rb") as f:
+            body = f.read()
+        mtime = os.stat(full_path).st_mtime
+
+        media_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or media_type == "application/javascript":
+            media_type += "; charset=utf-8"
+        gzip_body = br_body = None
+        if media_type.startswith(_COMPRESSIBLE_TYPES) and len(body) >= _MIN_COMPRESS_BYTES:
+            gzip_body = _read_variant(full_path + ".gz") or gzip.compress(body, STATIC_GZIP_LEVEL, mtime=0)
+            br_body = _read_variant(full_path + ".br")
+            if br_body is None and brotli is not None:
+                br_body = brotli.compress(body, quality=STATIC_BROTLI_QUALITY)
+            # Keep a variant only if it is actually smaller
+            gzip_body = gzip_body if gzip_body is not None and len(gzip_body) < len(body) else None
+            br_body = br_body if br_body is not None and len(br_body) < len(body) else None
+
+        cache_control = IMMUTABLE_CACHE_CONTROL if _HASHED_NAME.search(path) else REVALIDATE_CACHE_CONTROL
+        asset = StaticAsset(body, gzip_body, br_body, hashlib.sha256(body).hexdigest()[:20], media_type, cache_control, mtime)
+        self._assets[path] = asset
+        return asset
+
+
+def _read_variant(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match
+    return any(candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(","))
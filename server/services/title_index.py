@@ -0,0 +1,285 @@
+"""
+In-memory index mapping the title strings a model writes onto canonical books.
+
+The same book comes back as "Dune", "DUNE", "Dune (Frank Herbert)" or "Dune: Deluxe Edition"
+depending on the shelf and the model's mood. The index resolves each string in three steps:
+an exact canonical-key lookup (decorations and edition notes are not part of the key), a
+main-title lookup for a subtitle on one side only, and a bounded trigram similarity search,
+so lookups stay under a millisecond with a million titles. Both inexact steps require the
+similarity threshold, so a series title never swallows its installments.
+
+The index proper holds the catalog's titles, which are the canonical spellings and IDs. Titles
+the model returns that match none of them are learned in a small tier of recent titles
+(TITLE_INDEX_MAX_LEARNED), under their cleaned spelling, so variants seen together still merge;
+the least recently seen are forgotten. Learned titles never change a book's ID: book_id is the
+catalog book's, or that of the title's own canonical key.
+
+Benchmark from the server/ directory:
+    python -m benchmarks.bench_titles --titles 1000000
+"""
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from itertools import chain, compress, islice
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from config.logging_manager import get_logger
+from services.catalog import catalog
+from services.titles import canonical_key, clean_title, split_subtitle, stable_book_id
+
+logger = get_logger(__name__)
+
+_DIGITS = re.compile(r"\d+")
+
+# Marks a main title shared by several indexed books
+_AMBIGUOUS = -1
+
+
+class TitleMatch(NamedTuple):
+    """
+    A resolved title: the stable ID and display title of the canonical book, and how closely
+    the input matched (1.0 for the same canonical key, trigram Jaccard similarity otherwise).
+    """
+    id: int
+    title: str
+    score: float
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _quadgrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 4] for i in range(len(padded) - 3)}
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class TitleIndex:
+    """
+    Canonical titles with an exact-key map and a 4-gram inverted index.
+
+    Fuzzy matches are scored by trigram Jaccard similarity, but candidates are drawn from the
+    postings of the query's rarest 4-grams, reading at most max_scan row numbers, so the cost
+    of a lookup does not grow with the index. The search is approximate: a near-duplicate that
+    shares none of those 4-grams is missed and the title becomes a new canonical book.
+
+    Postings are compact arrays of row numbers (about 260 bytes per title in all, titles
+    included) and rows are only ever appended, so lookups need no lock. Titles that differ in a
+    number ("Volume 2" and "Volume 3") are never matched, however similar the rest.
+    """
+
+    def __init__(self, threshold: float = 0.6, max_titles: int = 2_000_000, max_scan: int = 2_000, max_candidates: int = 8,
+                 max_learned: int = 10_000):
+        self.threshold = threshold
+        self.max_titles = max_titles
+        self.max_scan = max_scan
+        self.max_candidates = max_candidates
+        self.max_learned = max_learned
+        self._titles: List[str] = []
+        self._keys: List[str] = []
+        self._sizes = array("H")
+        self._rows: Dict[str, int] = {}
+        # Main title -> the one indexed book with a subtitle under it, or _AMBIGUOUS
+        self._mains: Dict[str, int] = {}
+        self._postings: Dict[str, array] = {}
+        self._lock = threading.Lock()
+        # Learned titles in two generations of max_learned / 2: once the current one is full it
+        # replaces the previous one, whose titles are forgotten unless seen again meanwhile
+        self._learned: Optional[TitleIndex] = None
+        self._previous: Optional[TitleIndex] = None
+
+    def __len__(self) -> int:
+        """The number of indexed (catalog) titles; learned titles are not counted."""
+        return len(self._titles)
+
+    def canonicalize(self, title: str) -> TitleMatch:
+        """
+        Resolves a title against the indexed titles, then the recently learned ones, learning
+        it under its cleaned spelling if nothing matches.
+
+        Returns:
+            The match for the title, which is the cleaned title itself if it was learned.
+        """
+        match = self.lookup(title)
+        if match is not None:
+            return match
+        key = canonical_key(title)
+        if not key or self.max_learned <= 0:
+            return TitleMatch(stable_book_id(title), clean_title(title), 1.0)
+        learned, previous = self._learned, self._previous
+        match = learned.lookup(title) if learned is not None else None
+        if match is not None:
+            return match
+        match = previous.lookup(title) if previous is not None else None
+        # A title seen again is learned afresh, under the spelling it was first learned as
+        return self._learn(match.title if match is not None else clean_title(title), match)
+
+    def add_many(self, titles: Iterable[str]) -> int:
+        """Indexes many titles, e.g. a whole catalog, skipping ones that are already known. Returns the count added."""
+        before = len(self._titles)
+        for title in titles:
+            key = canonical_key(title)
+            if key and key not in self._rows and len(self._titles) < self.max_titles:
+                with self._lock:
+                    if key not in self._rows:
+                        self._append(title, key)
+        return len(self._titles) - before
+
+    def lookup(self, title: str, threshold: Optional[float] = None) -> Optional[TitleMatch]:
+        """
+        Resolves a title to an indexed book without indexing it.
+
+        Args:
+            title: The title as returned by the model.
+            threshold: Minimum trigram similarity for a fuzzy match; defaults to the index's.
+
+        Returns:
+            The match, or None if no indexed book is close enough.
+        """
+        key = canonical_key(title)
+        if not key:
+            return None
+        row = self._rows.get(key)
+        if row is not None:
+            return self._match(row, 1.0)
+
+        threshold = self.threshold if threshold is None else threshold
+        grams = _trigrams(key)
+        # A subtitle on one side only: the title against an indexed bare main title, or a bare
+        # title against the one indexed book with a subtitle under it. This finds the book
+        # however rare its 4-grams, but it must be as close as a fuzzy match, so "Star Wars:
+        # A New Hope" does not become "Star Wars"
+        main, subtitle = split_subtitle(title)
+        row = self._rows.get(main) if subtitle else self._mains.get(key)
+        if row is not None and row != _AMBIGUOUS and not (subtitle and split_subtitle(self._titles[row])[1]):
+            score = _similarity(grams, _trigrams(self._keys[row]))
+            if score >= threshold:
+                return self._match(row, score)
+
+        return self._closest(key, grams, threshold)
+
+    def canonicalize_gists(self, book_gists: Dict[str, str]) -> Dict[str, str]:
+        """
+        Rewrites a title -> gist dictionary onto canonical titles, merging entries that are the
+        same book. The first non-empty gist wins; order is first-seen.
+        """
+        merged: Dict[str, str] = {}
+        for title, gist in book_gists.items():
+            canonical = self.canonicalize(title).title
+            if not merged.get(canonical):
+                merged[canonical] = gist
+        return merged
+
+    def book_id(self, title: str) -> int:
+        """
+        The stable ID of the book a title resolves to among the indexed titles, or else of the
+        title's own canonical key, for keying caches; does not index the title.
+        """
+        match = self.lookup(title)
+        return match.id if match is not None else stable_book_id(title)
+
+    def _learn(self, title: str, match: Optional[TitleMatch]) -> TitleMatch:
+        key = canonical_key(title)
+        with self._lock:
+            learned = self._learned
+            if learned is None or len(learned) >= max(1, self.max_learned // 2):
+                learned = TitleIndex(self.threshold, max(1, self.max_learned // 2), self.max_scan, self.max_candidates, 0)
+                self._previous, self._learned = self._learned, learned
+            row = learned._rows.get(key)
+            if row is None:
+                row = learned._append(title, key)
+        learned_match = learned._match(row, 1.0)
+        return learned_match._replace(score=match.score) if match is not None else learned_match
+
+    def _match(self, row: int, score: float) -> TitleMatch:
+        title = self._titles[row]
+        return TitleMatch(stable_book_id(title), title, score)
+
+    def _append(self, title: str, key: str) -> int:
+        row = len(self._titles)
+        grams = _trigrams(key)
+        self._titles.append(title)
+        self._keys.append(key)
+        self._sizes.append(min(len(grams), 0xFFFF))
+        self._rows[key] = row
+        main, subtitle = split_subtitle(title)
+        if subtitle and main != key:
+            self._mains[main] = row if main not in self._mains else _AMBIGUOUS
+        for gram in _quadgrams(key):
+            postings = self._postings.get(gram)
+            if postings is None:
+                self._postings[gram] = array("I", (row,))
+            else:
+                postings.append(row)
+        return row
+
+    def _closest(self, key: str, grams: Set[str], threshold: float) -> Optional[TitleMatch]:
+        # Candidates come from the query's rarest 4-grams: they are the ones a near-duplicate is
+        # most likely to share and the cheapest to look up. Count hits over their postings, up
+        # to max_scan entries in all, then score only the titles with the most hits.
+        postings = self._postings
+        ordered = sorted((len(postings[gram]), gram) for gram in _quadgrams(key) if gram in postings)
+        probe, scanned = [], 0
+        for length, gram in ordered:
+            if scanned + length > self.max_scan:
+                if not probe:
+                    # Even the rarest is common: settle for the titles indexed first (the catalog)
+                    probe.append(postings[gram][:self.max_scan])
+                break
+            probe.append(postings[gram])
+            scanned += length
+        if not probe:
+            return None
+
+        hits = Counter(chain.from_iterable(probe))
+        # Score the titles found under more than one of those 4-grams, most hits first, or if
+        # there are none, the first few found (compress and map keep the filtering in C)
+        candidates = list(compress(hits, map((1).__lt__, hits.values())))
+        if len(candidates) > self.max_candidates:
+            candidates.sort(key=hits.__getitem__, reverse=True)
+        candidates = candidates[:self.max_candidates] or list(islice(hits, self.max_candidates))
+
+        size = len(grams)
+        min_size, max_size = threshold * size, size / threshold
+        sizes, keys = self._sizes, self._keys
+        best_row, best_score = None, threshold
+        digits = _DIGITS.findall(key)
+        for row in candidates:
+            if not min_size <= sizes[row] <= max_size:
+                continue
+            candidate = keys[row]
+            score = _similarity(grams, _trigrams(candidate))
+            if score >= best_score and _DIGITS.findall(candidate) == digits:
+                best_row, best_score = row, score
+        return self._match(best_row, best_score) if best_row is not None else None
+
+
+title_index = TitleIndex(
+    threshold=float(os.getenv("TITLE_MATCH_THRESHOLD", "0.6")),
+    max_titles=int(os.getenv("TITLE_INDEX_MAX_TITLES", "2000000")),
+    max_scan=int(os.getenv("TITLE_INDEX_MAX_SCAN", "2000")),
+    max_learned=int(os.getenv("TITLE_INDEX_MAX_LEARNED", "10000")),
+)
+
+
+def _seed_from_catalog():
+    try:
+        added = title_index.add_many(catalog.titles())
+    except Exception as e:
+        logger.error("Could not load catalog titles into the title index: %s", e, exc_info=True)
+        return
+    logger.info("Title index loaded %d catalog titles", added)
+
+
+# Catalog titles become the canonical spellings; loading runs in the background so a large
+# catalog does not hold up startup, and lookups meanwhile see the titles loaded so far
+if catalog is not None and os.getenv("TITLE_INDEX_SEED_FROM_CATALOG", "true").lower() == "true":
+    threading.Thread(target=_seed_from_catalog, name="title-index-seed", daemon=True).start()
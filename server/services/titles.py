@@ -0,0 +1,170 @@
+import hashlib
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+from config.logging_manager import get_logger
+
+logger = get_logger(__name__)
+
+_NON_WORD = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Decorations the model adds around a title: "(Frank Herbert)", "[Paperback]", ", by Frank Herbert"
+_BRACKETED = re.compile(r"\s*[(\[{][^)\]}]*[)\]}]")
+# Only after a comma (a bracketed byline goes with the brackets), so "Stand by Me" and
+# "Death by Black Hole" stay whole
+_BY_AUTHOR = re.compile(r"\s*,\s*by\s+(?:[A-Z][\w.'’-]*\s*){1,4}$")
+# A trailing edition or format note: "Dune: Deluxe Edition", "Emma - A Novel", ", Paperback"
+_EDITION_NOTE = re.compile(
+    r"\s*(?::|\s[-–—]\s|,)\s*(?:[\w.'’-]+\s+){0,3}"
+    r"(?:edition|novel|paperback|hardcover|hardback|unabridged|abridged|illustrated|annotated|reprint)\s*$",
+    re.IGNORECASE,
+)
+_LEADING_ARTICLE = re.compile(r"^(?:the|a|an) (?=\S)")
+# Main title / subtitle separators: "Dune: Deluxe Edition", "Dune - Frank Herbert"
+_SUBTITLE = re.compile(r"\s*(?::|\s[-–—]\s)\s*")
+_SPACED_DASH = re.compile(r"\s[-–—]\s")
+
+
+def normalize_title(title: str) -> str:
+    """
+    Normalizes a book title for comparison: Unicode compatibility folding, case folding,
+    punctuation removal and whitespace collapsing.
+
+    Args:
+        title: The title as returned by the model.
+
+    Returns:
+        The normalized title, e.g. "The Hitchhiker's Guide" -> "the hitchhikers guide".
+    """
+    folded = _strip_latin_accents(unicodedata.normalize("NFKC", title).casefold()).replace("'", "").replace("’", "")
+    return _WHITESPACE.sub(" ", _NON_WORD.sub(" ", folded)).strip()
+
+
+def canonical_key(title: str) -> str:
+    """
+    Reduces a title to the key that identifies the book: the normalized title without bracketed
+    notes, a trailing ", by <Author>" or edition note, or a leading article. Titles with the
+    same key are the same book; a subtitle is kept, since "Dune" and "Dune Messiah" are not,
+    and neither are "Star Wars" and "Star Wars: A New Hope".
+
+    Args:
+        title: The title as returned by the model.
+
+    Returns:
+        The key, e.g. "The Hobbit (J.R.R. Tolkien) [Paperback]" -> "hobbit".
+    """
+    stripped = _EDITION_NOTE.sub("", _BY_AUTHOR.sub("", _BRACKETED.sub("", title)))
+    key = normalize_title(stripped) or normalize_title(title)
+    return _LEADING_ARTICLE.sub("", key)
+
+
+def clean_title(title: str) -> str:
+    """
+    Strips the decorations canonical_key ignores from a title, keeping its spelling for display.
+
+    Returns:
+        The cleaned title, e.g. "Dune (Frank Herbert) [Paperback]" -> "Dune", or the title
+        itself if nothing would be left.
+    """
+    cleaned = _WHITESPACE.sub(" ", _EDITION_NOTE.sub("", _BY_AUTHOR.sub("", _BRACKETED.sub("", title)))).strip()
+    return cleaned if normalize_title(cleaned) else title.strip()
+
+
+def split_subtitle(title: str) -> Tuple[str, str]:
+    """
+    Splits a raw title at its first subtitle separator (a colon or a spaced dash).
+
+    Returns:
+        The (main title, subtitle) keys; the subtitle is "" if there is none.
+    """
+    if ":" not in title and not _SPACED_DASH.search(title):
+        return canonical_key(title), ""
+    parts = _SUBTITLE.split(_BRACKETED.sub("", title), maxsplit=1)
+    if len(parts) == 1 or not normalize_title(parts[0]):
+        return canonical_key(title), ""
+    return canonical_key(parts[0]), canonical_key(parts[1])
+
+
+def _strip_latin_accents(text: str) -> str:
+    # "Cien años" -> "cien anos", but combining marks on other scripts (e.g. Japanese dakuten) carry meaning
+    if text.isascii():
+        return text
+    decomposed = unicodedata.normalize("NFKD", text)
+    kept = []
+    for char in decomposed:
+        if unicodedata.combining(char) and kept and kept[-1] < "ɐ":
+            continue
+        kept.append(char)
+    return unicodedata.normalize("NFC", "".join(kept))
+
+
+def stable_book_id(title: str) -> int:
+    """
+    Derives a stable numeric ID from a title, so the same book gets the same ID across
+    responses, whatever decorations the model adds. The ID fits in 52 bits so it stays exact
+    as a JavaScript number.
+    """
+    digest = hashlib.sha1(canonical_key(title).encode("utf-8")).hexdigest()
+    return int(digest[:13], 16)
+
+
+def merge_book_gists(results: Iterable[Dict[str, str]]) -> List[Tuple[int, str, str]]:
+    """
+    Merges several title -> gist dictionaries, dropping titles that normalize to one already seen.
+
+    Args:
+        results: The per-image dictionaries, in the order they should take precedence.
+
+    Returns:
+        (stable_id, title, gist) tuples in first-seen order.
+    """
+    merged = {}
+    for book_gists in results:
+        for title, gist in book_gists.items():
+            book_id = stable_book_id(title)
+            if book_id not in merged:
+                merged[book_id] = (book_id, title, gist)
+    return list(merged.values())
+
+
+def merge_tile_gists(tiles: Sequence[Optional[Dict[str, str]]]) -> Dict[str, str]:
+    """
+    Merges the title -> gist dictionaries read from overlapping tiles of one shelf.
+
+    A book in an overlap usually shows up in both neighbouring tiles, sometimes cut off in
+    one of them ("Harry Potter" next to "Harry Potter and the Goblet of Fire"). Titles with the
+    same canonical key are one book wherever they appear; in adjacent tiles, so are titles
+    whose words (at least two) are all part of the other's. The longer title and gist win.
+
+    Args:
+        tiles: The per-tile dictionaries in shelf order; None for a tile that failed, which
+            also means its neighbours are not treated as adjacent.
+
+    Returns:
+        The merged title -> gist dictionary in shelf order.
+    """
+    entries: List[List[str]] = []  # [title, gist] in first-seen order
+    by_key: Dict[str, int] = {}
+    previous: List[Tuple[FrozenSet[str], int]] = []
+    for tile in tiles:
+        current = []
+        for title, gist in (tile or {}).items():
+            key = canonical_key(title)
+            words = frozenset(key.split())
+            index = by_key.get(key)
+            if index is None and len(words) >= 2:
+                index = next((i for other, i in previous if len(other) >= 2 and (words <= other or other <= words)), None)
+            if index is None:
+                index = len(entries)
+                entries.append([title, gist])
+            else:
+                entry = entries[index]
+                if len(title) > len(entry[0]):
+                    entry[0] = title
+                if len(gist) > len(entry[1]):
+                    entry[1] = gist
+            by_key[key] = index
+            current.append((words, index))
+        previous = current
+    return {title: gist for title, gist in entries}
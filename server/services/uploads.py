@@ -0,0 +1,241 @@
+"""
+Memory-bounded handling of uploaded images.
+
+UploadLimitMiddleware caps each request body before the app sees it: a Content-Length over
+the cap is refused outright, and a body without one is cut off as soon as the bytes received
+pass it, so Starlette never spools more than the cap. Routes built with UploadRoute parse
+their forms with SpooledMultiPartParser, whose SpooledTemporaryFile keeps images up to
+UPLOAD_SPOOL_BYTES in memory and moves larger ones to disk. That spool is then used in place:
+open_upload hashes it in chunks for the scan cache key and checks the per-image limit, and
+decoding reads straight from it.
+
+Benchmark from the server/ directory:
+    python -m benchmarks.bench_upload_memory
+"""
+import binascii
+import hashlib
+import io
+import os
+from typing import BinaryIO, Callable, Dict, Optional
+
+from fastapi import Request, UploadFile
+from fastapi.routing import APIRoute
+from starlette.datastructures import FormData
+from starlette.exceptions import HTTPException
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from config.logging_manager import get_logger
+
+logger = get_logger(__name__)
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+# Uploads larger than this are spooled to a temporary file instead of memory
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+# Whole request bodies: one image plus room for the multipart framing and form fields, and
+# a larger budget for the batch endpoint's many images
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(UPLOAD_MAX_BYTES + 64 * 1024)))
+BATCH_MAX_REQUEST_BYTES = int(os.getenv("BATCH_MAX_REQUEST_BYTES", str(100 * 1024 * 1024)))
+
+_READ_CHUNK_BYTES = 256 * 1024
+# Base64 turns every 3 bytes into 4 characters, so chunks that are a multiple of 3 encode
+# to pieces that concatenate into the base64 of the whole
+_BASE64_CHUNK_BYTES = 3 * 64 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds the configured size limit."""
+
+    def __init__(self, filename: Optional[str], max_bytes: int):
+        name = f"'{filename}' " if filename else ""
+        super().__init__(f"Image {name}is too large, the limit is {max_bytes / (1024 * 1024):g} MB")
+        self.max_bytes = max_bytes
+
+
+class RequestTooLargeError(HTTPException):
+    """
+    Raised from the request's receive channel once its body passes the cap. It is an
+    HTTPException so FastAPI re-raises it from form parsing instead of turning it into a 400.
+    """
+
+    def __init__(self, max_bytes: int):
+        super().__init__(413, f"Request is too large, the limit is {max_bytes / (1024 * 1024):g} MB")
+        self.max_bytes = max_bytes
+
+
+class UploadLimitMiddleware:
+    """
+    Pure ASGI middleware capping request bodies at max_bytes, or at a path's own limit.
+    """
+
+    def __init__(self, app, max_bytes: int, path_limits: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.path_limits.get(scope["path"], self.max_bytes)
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > limit:
+                    await _too_large(send, limit)
+                    return
+                break
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise RequestTooLargeError(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except RequestTooLargeError:
+            # Raised where no exception handler turned it into a response
+            if started:
+                raise
+            await _too_large(send, limit)
+
+
+class SpooledMultiPartParser(MultiPartParser):
+    """Multipart parser whose uploads stay in memory up to UPLOAD_SPOOL_BYTES."""
+
+    max_file_size = UPLOAD_SPOOL_BYTES
+
+
+class UploadRequest(Request):
+    """A request that parses multipart forms with SpooledMultiPartParser."""
+
+    async def _get_form(self, *, max_files: int = 1000, max_fields: int = 1000) -> FormData:
+        content_type = self.headers.get("content-type", "")
+        if self._form is None and content_type.lower().startswith("multipart/form-data"):
+            parser = SpooledMultiPartParser(self.headers, self.stream(), max_files=max_files, max_fields=max_fields)
+            try:
+                self._form = await parser.parse()
+            except MultiPartException as exc:
+                raise HTTPException(status_code=400, detail=exc.message)
+        return await super()._get_form(max_files=max_files, max_fields=max_fields)
+
+
+class UploadRoute(APIRoute):
+    """
+    Route class for routers that take image uploads, so their forms are spooled with
+    UPLOAD_SPOOL_BYTES without changing Starlette's parser for the rest of the app.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def upload_handler(request: Request):
+            return await handler(UploadRequest(request.scope, request.receive))
+
+        return upload_handler
+
+
+async def _too_large(send, limit: int):
+    body = (
+        b'{"status":"error","message":"Request is too large, the limit is '
+        + f"{limit / (1024 * 1024):g}".encode("ascii") + b' MB"}'
+    )
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class SpooledUpload:
+    """
+    An upload held in a SpooledTemporaryFile (or any seekable file), with its size and
+    SHA-256 hex digest.
+    """
+
+    def __init__(self, filename: Optional[str], file: BinaryIO, size: int, sha256: str):
+        self.filename = filename
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+
+    def open(self) -> BinaryIO:
+        """Returns the spooled file, rewound to the start."""
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self) -> "SpooledUpload":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def open_upload(upload: UploadFile, max_bytes: Optional[int] = None, detach: bool = False) -> SpooledUpload:
+    """
+    Wraps a received multipart file, reading it once in chunks to hash it and check its size.
+    The file is not copied: the returned upload reads the parser's own spool.
+
+    Args:
+        upload: The multipart file as received.
+        max_bytes: The size limit; defaults to UPLOAD_MAX_BYTES.
+        detach: Take the file over from the request, for uploads used after the handler
+            returns (Starlette closes the request's files then); the caller closes it.
+
+    Returns:
+        The upload, rewound.
+
+    Raises:
+        UploadTooLargeError: As soon as the upload is found to pass the limit.
+    """
+    max_bytes = UPLOAD_MAX_BYTES if max_bytes is None else max_bytes
+    digest = hashlib.sha256()
+    size = 0
+    await upload.seek(0)
+    while chunk := await upload.read(_READ_CHUNK_BYTES):
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLargeError(upload.filename, max_bytes)
+        digest.update(chunk)
+    await upload.seek(0)
+    file = upload.file
+    if detach:
+        # Starlette closes the request's copy of the file; leave it an empty stand-in
+        upload.file = io.BytesIO()
+    logger.debug("Opened upload %s: %d bytes", upload.filename, size)
+    return SpooledUpload(upload.filename, file, size, digest.hexdigest())
+
+
+def encode_data_uri(data: bytes, mime_type: str) -> str:
+    """
+    Builds a base64 data URI for an encoded image.
+
+    The prefix and the base64 of each chunk are written into one preallocated buffer, so
+    apart from the input, the only full-size copy made is the returned string.
+    """
+    prefix = f"data:{mime_type};base64,".encode("ascii")
+    buffer = bytearray(len(prefix) + 4 * ((len(data) + 2) // 3))
+    buffer[:len(prefix)] = prefix
+    offset = len(prefix)
+    view = memoryview(data)
+    for start in range(0, len(data), _BASE64_CHUNK_BYTES):
+        encoded = binascii.b2a_base64(view[start:start + _BASE64_CHUNK_BYTES], newline=False)
+        buffer[offset:offset + len(encoded)] = encoded
+        offset += len(encoded)
+    return buffer.decode("ascii")
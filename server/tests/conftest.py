@@ -0,0 +1,18 @@
+import os
+import tempfile
+
+# Run the suite against the deterministic offline LLM backend and a throwaway scan cache,
+# so tests need neither Gemini credentials nor network access. Set before any app import.
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_LLM_LATENCY_MS", "0")
+os.environ.setdefault("SCAN_CACHE_DIR", tempfile.mkdtemp(prefix="shelf-scanner-test-cache-"))
+# Every test request comes from the same client address; per-client limits are covered by
+# tests/test_rate_limit.py, which builds its own limiters.
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("RATE_LIMIT_DB", os.path.join(tempfile.mkdtemp(prefix="shelf-scanner-test-limits-"), "rate_limits.db"))
+# Keep test runs from appending to the tracked server.log
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.mkdtemp(prefix="shelf-scanner-test-logs-"), "server.log"))
+os.environ.setdefault("CATALOG_DB", os.path.join(tempfile.mkdtemp(prefix="shelf-scanner-test-catalog-"), "catalog.db"))
+os.environ.setdefault("RECOMMENDER_DIR", tempfile.mkdtemp(prefix="shelf-scanner-test-recommender-"))
+os.environ.setdefault("SCAN_JOB_DB", os.path.join(tempfile.mkdtemp(prefix="shelf-scanner-test-jobs-"), "scan_jobs.db"))
+os.environ.setdefault("SCAN_JOB_DIR", tempfile.mkdtemp(prefix="shelf-scanner-test-job-images-"))
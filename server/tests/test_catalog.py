@@ -0,0 +1,138 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import json
+import tempfile
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from PIL import Image
+from agent.fake_llm import _KNOWN_BOOKS
+from routes import image_processing
+from services.catalog import BookCatalog
+from main import app
+
+client = TestClient(app)
+
+
+def _catalog(**options):
+    root = tempfile.mkdtemp()
+    return BookCatalog(os.path.join(root, "catalog.db"), os.path.join(root, "covers"), **options)
+
+
+def _noise_png(seed):
+    buf = io.BytesIO()
+    Image.effect_noise((64, 64), 40 + seed).convert("RGB").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_ingest_csv_and_jsonl():
+    catalog = _catalog()
+    root = tempfile.mkdtemp()
+    csv_path = os.path.join(root, "books.csv")
+    Path(csv_path).write_text("title,author,description,cover_url\nDune,Frank Herbert,Spice and sandworms.,https://covers.test/dune.jpg\n,Nobody,No title,\n")
+    jsonl_path = os.path.join(root, "books.jsonl")
+    Path(jsonl_path).write_text(json.dumps({"title": "Beloved", "authors": ["Toni Morrison"], "gist": "A haunting."}) + "\n")
+
+    assert catalog.ingest(csv_path) == 1
+    assert catalog.ingest(jsonl_path) == 1
+    assert len(catalog) == 2
+
+    entry = catalog.lookup_many(["DUNE"])["DUNE"]
+    assert (entry.title, entry.author, entry.gist) == ("Dune", "Frank Herbert", "Spice and sandworms.")
+    assert catalog.cover_url(entry) == "https://covers.test/dune.jpg"
+    assert catalog.lookup_many(["Beloved"])["Beloved"].author == "Toni Morrison"
+
+
+def test_lookup_falls_back_to_full_text_match():
+    catalog = _catalog()
+    catalog.ingest_records([
+        {"title": "The Hitchhiker's Guide to the Galaxy", "author": "Douglas Adams", "gist": "Towels."},
+        {"title": "Dune Messiah", "author": "Frank Herbert"},
+    ])
+
+    found = catalog.lookup_many(["Hitchhiker's Guide to the Galaxy", "Dune", "Unknown Book"])
+    assert found["Hitchhiker's Guide to the Galaxy"].title == "The Hitchhiker's Guide to the Galaxy"
+    # Sharing a word is not enough
+    assert "Dune" not in found
+    assert "Unknown Book" not in found
+    assert [entry.title for entry in catalog.search("adams galaxy")] == ["The Hitchhiker's Guide to the Galaxy"]
+
+
+def test_learned_gists_never_replace_curated_ones():
+    catalog = _catalog()
+    catalog.ingest_records([{"title": "Dune", "gist": "Curated."}, {"title": "Beloved"}])
+    catalog.remember({"Dune": "Generated.", "Beloved": "Generated.", "New Book": "Generated."})
+
+    found = catalog.lookup_many(["Dune", "Beloved", "New Book"])
+    assert found["Dune"].gist == "Curated."
+    assert found["Beloved"].gist == "Generated."
+    assert found["New Book"].gist == "Generated."
+
+
+def test_local_covers_stay_inside_the_covers_directory():
+    catalog = _catalog()
+    os.makedirs(catalog.covers_dir)
+    Path(catalog.covers_dir, "dune.jpg").write_bytes(b"jpeg")
+    catalog.ingest_records([{"title": "Dune", "cover": "dune.jpg"}])
+
+    entry = catalog.lookup_many(["Dune"])["Dune"]
+    assert catalog.cover_url(entry) == "/api/catalog/covers/dune.jpg"
+    assert catalog.cover_file("dune.jpg").endswith("dune.jpg")
+    assert catalog.cover_file("../catalog.db") is None
+
+
+def test_identify_only_follows_the_hit_rate():
+    catalog = _catalog(identify_only="auto", identify_only_min_hit_rate=0.8)
+    assert not catalog.prefers_identify_only()
+    for _ in range(20):
+        catalog.record_hit_rate(9, 10)
+    assert catalog.prefers_identify_only()
+    assert _catalog(identify_only="always").prefers_identify_only()
+
+
+def test_identify_only_scan_is_enriched_from_the_catalog(monkeypatch):
+    catalog = _catalog(identify_only="always")
+    catalog.ingest_records(
+        {"title": title, "author": "Known Author", "gist": f"Catalog gist for {title}.", "cover": f"https://covers.test/{i}.jpg"}
+        for i, (title, _) in enumerate(_KNOWN_BOOKS)
+    )
+    monkeypatch.setattr(image_processing, "catalog", catalog)
+
+    response = client.post("/api/process-image", files={"image": ("shelf.png", _noise_png(7), "image/png")})
+    assert response.status_code == 200
+    books = response.json()["books"]
+    assert books
+
+    known_titles = {title for title, _ in _KNOWN_BOOKS}
+    for book in books:
+        assert book["description"]
+        if book["title"] in known_titles:
+            assert book["description"] == f"Catalog gist for {book['title']}."
+            assert book["cover"].startswith("https://covers.test/")
+    # Gists written for unknown titles are kept for the next scan
+    unknown = [book["title"] for book in books if book["title"] not in known_titles]
+    assert set(catalog.lookup_many(unknown)) == set(unknown)
+
+
+def test_a_scan_looks_its_titles_up_in_the_catalog_once(monkeypatch):
+    catalog = _catalog()
+    catalog.ingest_records({"title": title, "gist": f"Catalog gist for {title}."} for title, _ in _KNOWN_BOOKS)
+    lookups = []
+    lookup_many = catalog.lookup_many
+    monkeypatch.setattr(catalog, "lookup_many", lambda titles: lookups.append(titles) or lookup_many(titles))
+    monkeypatch.setattr(image_processing, "catalog", catalog)
+
+    response = client.post("/api/process-image", files={"image": ("shelf.png", _noise_png(11), "image/png")})
+    assert response.status_code == 200 and response.json()["books"]
+    assert len(lookups) == 1
+
+
+def test_catalog_search_endpoint():
+    response = client.get("/api/catalog/search", params={"q": "anything"})
+    assert response.status_code == 200
+    assert "books" in response.json()
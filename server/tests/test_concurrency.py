@@ -0,0 +1,69 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import pytest
+
+from agent.concurrency import LLMConcurrencyLimiter, LLMOverloadedError
+
+
+def test_limiter_caps_concurrency():
+    """Never more than max_concurrency calls run at once, and queued callers all complete."""
+    limiter = LLMConcurrencyLimiter(max_concurrency=2, max_queue=10, queue_timeout=5, retry_after=1)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.active)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(8)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert limiter.active == 0
+    assert limiter.waiting == 0
+
+
+def test_limiter_rejects_when_queue_full():
+    """Callers beyond the wait queue bound are rejected with a retry hint."""
+    limiter = LLMConcurrencyLimiter(max_concurrency=1, max_queue=1, queue_timeout=5, retry_after=7)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def holder():
+            async with limiter.slot():
+                await release.wait()
+
+        tasks = [asyncio.create_task(holder()), asyncio.create_task(holder())]
+        await asyncio.sleep(0)
+        with pytest.raises(LLMOverloadedError) as exc_info:
+            await limiter.acquire()
+        release.set()
+        await asyncio.gather(*tasks)
+        return exc_info.value
+
+    error = asyncio.run(main())
+    assert error.retry_after == 7
+    assert limiter.active == 0
+
+
+def test_limiter_queue_timeout():
+    """A waiter that exceeds the queue timeout is rejected and leaves the queue."""
+    limiter = LLMConcurrencyLimiter(max_concurrency=1, max_queue=5, queue_timeout=0.01, retry_after=1)
+
+    async def main():
+        await limiter.acquire()
+        with pytest.raises(LLMOverloadedError):
+            await limiter.acquire()
+        assert limiter.waiting == 0
+        limiter.release()
+
+    asyncio.run(main())
+    assert limiter.active == 0
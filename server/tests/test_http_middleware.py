@@ -0,0 +1,106 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import gzip
+
+import pytest
+from starlette.applications import Starlette
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.trustedhost import TrustedHostMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from config.http_middleware import HTTPEdgeMiddleware
+
+ORIGINS = ["http://localhost:5173"]
+LARGE = {"books": [{"id": i, "title": f"Book {i}", "description": "A gripping read. " * 4} for i in range(50)]}
+
+
+async def large_json(request):
+    return JSONResponse(LARGE)
+
+
+async def small_json(request):
+    return JSONResponse({"status": "healthy"})
+
+
+async def stream(request):
+    async def lines():
+        for i in range(3):
+            yield f'{{"line": {i}}}\n' * 200
+    return StreamingResponse(lines(), media_type="application/json")
+
+
+def _app(**options):
+    app = Starlette(routes=[Route("/large", large_json), Route("/small", small_json), Route("/stream", stream)])
+    settings = dict(allow_origins=ORIGINS, allow_credentials=True, allow_methods=["*"], allow_headers=["*"], expose_headers=["Server-Timing"])
+    settings.update(options)
+    return HTTPEdgeMiddleware(app, compress_min_bytes=1024, **settings)
+
+
+def test_security_headers_are_added():
+    response = TestClient(_app()).get("/small")
+    assert response.headers["x-content-type-options"] == "nosniff"
+    assert response.headers["x-frame-options"] == "DENY"
+    assert "strict-transport-security" in response.headers
+
+
+def test_untrusted_host_is_rejected():
+    client = TestClient(_app(allowed_hosts=["api.example.com", "*.example.org"]), base_url="http://evil.test")
+    assert client.get("/small").status_code == 400
+    assert TestClient(_app(allowed_hosts=["*.example.org"]), base_url="http://shelf.example.org").get("/small").status_code == 200
+
+
+def test_large_json_is_compressed_but_small_and_streamed_bodies_are_not():
+    client = TestClient(_app())
+    large = client.get("/large", headers={"accept-encoding": "gzip"})
+    assert large.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in large.headers["vary"]
+    assert large.json() == LARGE
+
+    raw = client.get("/large", headers={"accept-encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+    assert len(gzip.compress(raw.content)) < len(raw.content)
+
+    assert "content-encoding" not in client.get("/small", headers={"accept-encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/stream", headers={"accept-encoding": "gzip"}).headers
+
+
+@pytest.mark.parametrize("accept_encoding, compressed", [
+    ("gzip;q=0", False),
+    ("br, gzip; q=0.0", False),
+    ("*;q=0", False),
+    ("GZIP;q=0.5", True),
+    ("br, *", True),
+])
+def test_gzip_follows_accept_encoding_q_values(accept_encoding, compressed):
+    response = TestClient(_app()).get("/large", headers={"accept-encoding": accept_encoding})
+    assert ("content-encoding" in response.headers) is compressed
+    assert response.json() == LARGE
+
+
+@pytest.mark.parametrize("method, headers", [
+    ("GET", {"origin": "http://localhost:5173"}),
+    ("GET", {"origin": "http://elsewhere.test"}),
+    ("GET", {"origin": "http://localhost:5173", "cookie": "a=1"}),
+    ("OPTIONS", {"origin": "http://localhost:5173", "access-control-request-method": "POST", "access-control-request-headers": "X-Custom"}),
+    ("OPTIONS", {"origin": "http://elsewhere.test", "access-control-request-method": "POST"}),
+])
+@pytest.mark.parametrize("allow_origins", [ORIGINS, ["*"]])
+def test_cors_matches_starlette(method, headers, allow_origins):
+    settings = dict(allow_origins=allow_origins, allow_credentials=True, allow_methods=["*"], allow_headers=["*"], expose_headers=["Server-Timing"])
+    reference = Starlette(routes=[Route("/small", small_json)])
+    reference.add_middleware(CORSMiddleware, **settings)
+    reference.add_middleware(TrustedHostMiddleware, allowed_hosts=["*"])
+
+    expected = TestClient(reference).request(method, "/small", headers=headers)
+    actual = TestClient(_app(**settings)).request(method, "/small", headers=headers)
+
+    assert actual.status_code == expected.status_code
+    assert actual.text == expected.text
+    for name in ("access-control-allow-origin", "access-control-allow-credentials", "access-control-allow-methods",
+                 "access-control-allow-headers", "access-control-expose-headers", "access-control-max-age", "vary"):
+        assert actual.headers.get(name) == expected.headers.get(name), name
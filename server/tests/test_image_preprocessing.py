@@ -0,0 +1,157 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import random
+from PIL import Image, ImageDraw
+
+from services.spine_crop import find_spine_region
+from services.image_preprocessing import preprocess_image, preprocess_tiles, plan_tiles, max_edge_for_model, DEFAULT_MAX_EDGE
+
+EXIF_ORIENTATION = 0x0112
+
+
+def shelf_photo(size, shelf_box, seed=0):
+    """A plain wall with a band of differently coloured book spines inside shelf_box."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (205, 200, 190))
+    draw = ImageDraw.Draw(img)
+    left, upper, right, lower = shelf_box
+    x = left
+    while x < right:
+        spine = rng.randint(size[0] // 150, size[0] // 50)
+        draw.rectangle((x, upper, min(right, x + spine) - 1, lower - 1), fill=tuple(rng.randrange(256) for _ in range(3)))
+        x += spine
+    return img
+
+
+def encode(img, fmt, **kwargs):
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def test_downscales_jpeg_to_max_edge_and_strips_metadata():
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"
+    data = encode(Image.new("RGB", (4000, 3000), "blue"), "JPEG", exif=exif.tobytes())
+
+    prepared = preprocess_image(data, max_edge=1000)
+
+    assert prepared.original_size == (4000, 3000)
+    assert max(prepared.image.size) == 1000
+    assert prepared.mime_type == "image/jpeg"
+    assert len(prepared.data) < len(data)
+    output = Image.open(io.BytesIO(prepared.data))
+    assert output.size == prepared.image.size
+    assert len(output.getexif()) == 0
+
+
+def test_applies_exif_orientation():
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6  # Rotated 90 degrees clockwise
+    data = encode(Image.new("RGB", (800, 400), "green"), "JPEG", exif=exif.tobytes())
+
+    prepared = preprocess_image(data, max_edge=2000)
+
+    assert prepared.image.size == (400, 800)
+
+
+def test_transparent_png_is_flattened_to_webp():
+    data = encode(Image.new("RGBA", (300, 200), (255, 0, 0, 0)), "PNG")
+
+    prepared = preprocess_image(data, max_edge=2000, output_format="webp")
+
+    assert prepared.mime_type == "image/webp"
+    assert prepared.image.mode == "RGB"
+    assert prepared.image.getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_small_compressed_upload_is_sent_as_is():
+    data = encode(shelf_photo((640, 480), (0, 0, 640, 480)), "WEBP", quality=50)
+
+    prepared = preprocess_image(data, max_edge=2000, crop_spines=False)
+
+    assert prepared.data == data
+    assert prepared.mime_type == "image/webp"
+    assert prepared.image.size == (640, 480)
+
+
+def test_upload_with_metadata_is_still_re_encoded():
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"
+    data = encode(shelf_photo((640, 480), (0, 0, 640, 480)), "WEBP", quality=50, exif=exif.tobytes())
+
+    prepared = preprocess_image(io.BytesIO(data), max_edge=2000, crop_spines=False)
+
+    assert prepared.data != data
+    assert len(Image.open(io.BytesIO(prepared.data)).getexif()) == 0
+
+
+def test_model_targets():
+    assert max_edge_for_model("gemini-2.5-pro") == 2048
+    assert max_edge_for_model("unknown-model") == DEFAULT_MAX_EDGE
+    assert max_edge_for_model(None) == DEFAULT_MAX_EDGE
+
+
+def test_plan_tiles_covers_a_panorama_with_overlap():
+    boxes = plan_tiles((12000, 2000), min_aspect=2.5, tile_aspect=1.5, overlap=0.15, max_tiles=6)
+
+    assert len(boxes) == 5
+    assert boxes[0][0] == 0 and boxes[-1][2] == 12000
+    assert all(upper == 0 and lower == 2000 for _, upper, _, lower in boxes)
+    for (_, _, previous_right, _), (left, _, right, _) in zip(boxes, boxes[1:]):
+        assert previous_right - left >= 0.15 * (right - left) - 1
+
+
+def test_plan_tiles_grows_tiles_beyond_max_tiles_and_skips_normal_photos():
+    boxes = plan_tiles((2000, 40000), min_aspect=2.5, tile_aspect=1.5, overlap=0.15, max_tiles=4)
+    assert len(boxes) == 4
+    assert boxes[0][1] == 0 and boxes[-1][3] == 40000
+
+    assert plan_tiles((4000, 3000), min_aspect=2.5, tile_aspect=1.5, overlap=0.15, max_tiles=6) == []
+
+
+def test_preprocess_tiles_downscales_each_tile():
+    data = encode(Image.new("RGB", (9000, 1500), "red"), "JPEG")
+
+    tiled = preprocess_tiles(data, max_edge=1000)
+
+    assert tiled is not None
+    assert tiled.original_size == (9000, 1500)
+    assert len(tiled.tiles) >= 3
+    assert all(max(tile.image.size) <= 1000 for tile in tiled.tiles)
+    assert tiled.data_size == sum(len(tile.data) for tile in tiled.tiles)
+    assert preprocess_tiles(encode(Image.new("RGB", (800, 600), "red"), "JPEG")) is None
+
+
+def test_spine_crop_finds_the_shelf_and_keeps_a_margin():
+    region = find_spine_region(shelf_photo((4000, 3000), (800, 1200, 3200, 1900)))
+
+    assert region is not None
+    left, upper, right, lower = region.box
+    assert left <= 800 and upper <= 1200 and right >= 3200 and lower >= 1900
+    assert region.kept_area < 0.3
+
+
+def test_spine_crop_falls_back_to_the_full_image():
+    # Nothing but wall, a shelf filling the frame, and spines scattered all over
+    assert find_spine_region(Image.new("RGB", (2000, 1500), "white")) is None
+    assert find_spine_region(shelf_photo((2000, 1500), (0, 50, 2000, 1450))) is None
+    scattered = shelf_photo((2000, 1500), (0, 0, 2000, 200))
+    scattered.paste(shelf_photo((2000, 200), (0, 0, 2000, 200), seed=1), (0, 1300))
+    assert find_spine_region(scattered) is None
+
+
+def test_preprocess_image_crops_to_the_shelf():
+    data = encode(shelf_photo((4000, 3000), (800, 1200, 3200, 1900)), "JPEG", quality=90)
+
+    cropped = preprocess_image(data, max_edge=1000)
+    full = preprocess_image(data, max_edge=1000, crop_spines=False)
+
+    assert cropped.crop_box is not None and full.crop_box is None
+    assert cropped.original_size == (4000, 3000)
+    assert len(cropped.data) < len(full.data)
@@ -0,0 +1,113 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.testclient import TestClient
+
+import routes.recommendations as recommendations
+from main import app
+from services.library import SessionLibrary, session_id_from, session_library
+
+client = TestClient(app)
+SESSION = "session-under-test"
+
+
+def test_books_are_added_once_however_spelled():
+    library = SessionLibrary(idle_seconds=60, max_sessions=10, max_books=100, max_recommendations=4)
+
+    assert library.add_books(SESSION, ["Dune", "DUNE", "Neuromancer"]) == 2
+    assert library.add_books(SESSION, ["dune"]) == 0
+    assert library.books(SESSION) == ["Dune", "Neuromancer"]
+
+
+def test_only_new_books_are_pending_and_recommendations_merge_newest_first():
+    library = SessionLibrary(idle_seconds=60, max_sessions=10, max_books=100, max_recommendations=3)
+    library.add_books(SESSION, ["Dune", "Neuromancer"])
+    library.merge_recommendations(SESSION, ["Dune", "Neuromancer"], {"Hyperion": "a", "Foundation": "b"})
+
+    library.add_books(SESSION, ["Hyperion", "Snow Crash"])
+    assert library.pending(SESSION) == ["Hyperion", "Snow Crash"]
+
+    merged = library.merge_recommendations(SESSION, ["Hyperion", "Snow Crash"], {"Cryptonomicon": "c", "FOUNDATION": "d", "Ubik": "e"})
+    # Owned books drop out, a repeat keeps its newest description, and the oldest go past the limit
+    assert merged == {"Cryptonomicon": "c", "FOUNDATION": "d", "Ubik": "e"}
+    assert library.pending(SESSION) == []
+
+
+def test_idle_and_least_recently_used_sessions_are_evicted():
+    library = SessionLibrary(idle_seconds=60, max_sessions=2, max_books=100, max_recommendations=4)
+    library.add_books("idle-session", ["Dune"], now=0)
+    library.add_books("busy-session", ["Emma"], now=50)
+    library.add_books("other-session", ["Ulysses"], now=100)
+    assert len(library) == 2 and library.stats["evicted"] == 1
+
+    library.add_books("third-session", ["Beloved"], now=101)
+    assert len(library) == 2
+    assert library.books("busy-session", now=102) == []
+
+
+def test_malformed_session_ids_are_replaced():
+    assert session_id_from(SESSION) == SESSION
+    assert session_id_from("bad id!") != "bad id!"
+    assert session_id_from(None, create=False) is None
+
+
+def test_recommendations_only_ask_about_books_added_since_the_last_call(monkeypatch):
+    asked = []
+
+    async def generate(books_titles):
+        asked.append(list(books_titles))
+        return {f"Like {title}": f"Because you read {title}." for title in books_titles}
+
+    monkeypatch.setattr(recommendations, "_generate_recommendations", generate)
+    headers = {"X-Session-Id": "incremental-session"}
+
+    first = client.post("/api/books/recommendations", json={"books": [{"title": "Dune"}, {"title": "Emma"}]}, headers=headers)
+    second = client.post(
+        "/api/books/recommendations",
+        json={"books": [{"title": "Dune"}, {"title": "Emma"}, {"title": "Ulysses"}]},
+        headers=headers,
+    )
+    third = client.post("/api/books/recommendations", json={"books": [{"title": "Ulysses"}]}, headers=headers)
+
+    assert asked == [["Dune", "Emma"], ["Ulysses"]]
+    assert first.json()["session_id"] == "incremental-session"
+    assert [book["title"] for book in second.json()["recommendations"]] == ["Like Ulysses", "Like Dune", "Like Emma"]
+    assert third.json()["recommendations"] == second.json()["recommendations"]
+
+
+def test_sessionless_recommendations_create_no_session(monkeypatch):
+    async def generate(books_titles):
+        return {f"Like {title}": f"Because you read {title}." for title in books_titles}
+
+    monkeypatch.setattr(recommendations, "_generate_recommendations", generate)
+    sessions = len(session_library)
+
+    response = client.post("/api/books/recommendations", json={"books": [{"title": "Dune"}]})
+
+    assert response.status_code == 200
+    assert [book["title"] for book in response.json()["recommendations"]] == ["Like Dune"]
+    assert response.json()["session_id"] is None and "x-session-id" not in response.headers
+    assert len(session_library) == sessions
+
+
+def test_scanned_books_join_the_session_library(monkeypatch):
+    asked = []
+
+    async def generate(books_titles):
+        asked.append(list(books_titles))
+        return {"Hyperion": "Pilgrims on a far world."}
+
+    monkeypatch.setattr(recommendations, "_generate_recommendations", generate)
+    headers = {"X-Session-Id": "scanning-session"}
+    image = os.path.join(os.path.dirname(__file__), "images", "test_image.jpg")
+    with open(image, "rb") as f:
+        scanned = client.post("/api/process-image", files={"image": ("shelf.jpg", f, "image/jpeg")}, headers=headers)
+    titles = [book["title"] for book in scanned.json()["books"]]
+
+    response = client.post("/api/books/recommendations", json={"books": []}, headers=headers)
+
+    assert response.status_code == 200
+    assert asked == [titles]
@@ -0,0 +1,52 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import json
+import pytest
+from langchain_core.messages import HumanMessage
+
+from agent.fake_llm import FakeShelfLLM, ReplayLLM
+from agent.llm import get_llm, register_backend
+from agent.post_process import parse_book_gists
+
+
+def test_fake_backend_is_deterministic_and_parseable():
+    llm = FakeShelfLLM(latency_ms=0, min_books=25, max_books=30, fenced=True)
+    messages = [HumanMessage(content="shelf one")]
+
+    first = llm.invoke(messages).content
+    assert llm.invoke(messages).content == first
+    assert llm.invoke([HumanMessage(content="shelf two")]).content != first
+    assert 25 <= len(parse_book_gists(first).root) <= 30
+
+
+def test_fake_backend_streams_the_same_reply():
+    llm = FakeShelfLLM(latency_ms=0, stream_chunk_chars=5)
+    messages = [HumanMessage(content="shelf")]
+
+    async def collect():
+        return "".join([chunk.content async for chunk in llm.astream(messages)])
+
+    assert asyncio.run(collect()) == llm.invoke(messages).content
+
+
+def test_replay_backend_cycles_recorded_replies(tmp_path):
+    replay_file = tmp_path / "replies.jsonl"
+    replay_file.write_text("\n".join(json.dumps({"content": f'{{"Book {i}": "Gist"}}'}) for i in range(2)))
+    llm = ReplayLLM(path=str(replay_file))
+    replies = [llm.invoke([HumanMessage(content="x")]).content for _ in range(3)]
+    assert replies == ['{"Book 0": "Gist"}', '{"Book 1": "Gist"}', '{"Book 0": "Gist"}']
+
+
+def test_registry_builds_lazily_and_once():
+    builds = []
+    register_backend("counting", lambda: builds.append(1) or FakeShelfLLM(latency_ms=0))
+    assert builds == []
+    assert get_llm("counting") is get_llm("counting")
+    assert builds == [1]
+    with pytest.raises(ValueError):
+        get_llm("does-not-exist")
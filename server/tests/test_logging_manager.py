@@ -0,0 +1,127 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import json
+import logging
+import logging.handlers
+import queue
+
+from fastapi.testclient import TestClient
+from config.logging_manager import DeferredQueueHandler, JsonFormatter, get_logger, request_id_var
+from main import app
+
+client = TestClient(app)
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _capture(module_logger):
+    handler = _Capture()
+    module_logger.logger.addHandler(handler)
+    return handler
+
+
+def test_records_point_at_the_caller():
+    module_logger = get_logger("tests.caller")
+    handler = _capture(module_logger)
+    try:
+        module_logger.info("hello %s", "world")
+    finally:
+        module_logger.logger.removeHandler(handler)
+
+    record = handler.records[0]
+    assert record.getMessage() == "hello world"
+    assert record.filename == "test_logging_manager.py"
+    assert record.funcName == "test_records_point_at_the_caller"
+
+
+def test_filtered_messages_are_not_formatted():
+    class Explodes:
+        def __str__(self):
+            raise AssertionError("formatted a filtered message")
+
+    get_logger("tests.lazy").debug("value: %s", Explodes())
+
+
+def test_per_module_levels():
+    manager = get_logger()
+    module_logger = get_logger("tests.verbose")
+    handler = _capture(module_logger)
+    try:
+        module_logger.debug("hidden")
+        manager.set_level(logging.DEBUG, "tests.verbose")
+        module_logger.debug("shown")
+        assert manager.get_current_level("tests.verbose") == logging.DEBUG
+        assert manager.get_current_level() == logging.INFO
+    finally:
+        manager.set_level(logging.NOTSET, "tests.verbose")
+        module_logger.logger.removeHandler(handler)
+
+    assert [r.getMessage() for r in handler.records] == ["shown"]
+    assert "tests.verbose" not in manager.get_module_levels()
+
+
+def test_json_formatter_includes_request_context():
+    record = logging.LogRecord("shelf_scanner.routes", logging.INFO, "routes.py", 10, "scan %s", ("done",), None)
+    record.request_id = "abc123"
+    record.stage_timings = {"llm": 812.5}
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "scan done"
+    assert entry["request_id"] == "abc123"
+    assert entry["stage_timings_ms"] == {"llm": 812.5}
+    assert request_id_var.get() == "-"
+
+
+def test_queued_exceptions_reach_the_json_exception_field():
+    log_queue = queue.SimpleQueue()
+    capture = _Capture()
+    listener = logging.handlers.QueueListener(log_queue, capture)
+    logger = logging.getLogger("tests.queued")
+    logger.propagate = False
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    values = ["before"]
+    listener.start()
+    try:
+        try:
+            1 / 0
+        except ZeroDivisionError:
+            logger.error("failed with %s", values, exc_info=True, extra={"stage_timings": {"agent": 5.0}})
+        values.append("after")
+    finally:
+        listener.stop()
+        logger.handlers.clear()
+
+    record = capture.records[0]
+    # Arguments are rendered when logged; the exception is left for the listener to format
+    assert record.getMessage() == "failed with ['before']"
+    assert record.exc_text is None
+    entry = json.loads(JsonFormatter().format(record))
+    assert "ZeroDivisionError" in entry["exception"]
+    assert entry["stage_timings_ms"] == {"agent": 5.0}
+
+
+def test_request_ids_are_assigned_and_echoed():
+    assert len(client.get("/ping").headers["x-request-id"]) == 16
+    assert client.get("/ping", headers={"X-Request-ID": "trace-42"}).headers["x-request-id"] == "trace-42"
+    assert client.get("/ping", headers={"X-Request-ID": "bad id\\n"}).headers["x-request-id"] != "bad id\\n"
+
+
+def test_logging_level_endpoint_sets_module_level():
+    response = client.post("/api/logging/level", params={"level": "debug", "module": "agent.nodes"})
+    assert response.status_code == 200
+    assert client.get("/api/logging/level").json() == {"level": "info", "modules": {"agent.nodes": "debug"}}
+
+    client.post("/api/logging/level", params={"level": "default", "module": "agent.nodes"})
+    assert client.get("/api/logging/level").json()["modules"] == {}
+    assert client.post("/api/logging/level", params={"level": "verbose"}).status_code == 400
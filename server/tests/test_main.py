@@ -6,13 +6,17 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")
 
 from fastapi.testclient import TestClient
 from main import app
+import routes.image_processing as image_processing
+from agent.agent import agent
+from agent.concurrency import LLMOverloadedError
+from services.image_preprocessing import plan_tiles
 import io
 from PIL import Image
 # Import logging manager
 from config.logging_manager import get_logger
 
 # Create logger instance
-logger = get_logger()
+logger = get_logger(__name__)
 
 client = TestClient(app)
 
@@ -27,55 +31,124 @@ def create_dummy_image(filename="test_image.png"):
     return (byte_arr, filename, "image/png")
 
 def test_process_image_success():
-    """Test the /process-image endpoint with a valid image and query."""
+    """Test the /api/process-image endpoint with a valid image."""
     logger.info("Running test_process_image_success")
     image_file, filename, content_type = create_dummy_image()
-    query_text = "What is in this image?"
-    logger.debug(f"Test parameters - filename: {filename}, content_type: {content_type}, query: {query_text}")
+    logger.debug(f"Test parameters - filename: {filename}, content_type: {content_type}")
 
     response = client.post(
-        "/process-image",
-        files={"image": (filename, image_file, content_type)},
-        data={"query": query_text}
+        "/api/process-image",
+        files={"image": (filename, image_file, content_type)}
     )
     
     logger.debug(f"Response status code: {response.status_code}")
     logger.debug(f"Response JSON: {response.json()}")
 
     assert response.status_code == 200
-    assert response.json()["status"] == "success"
-    assert response.json()["query_received"] == query_text
-    assert response.json()["filename"] == filename
-    assert response.json()["content_type"] == content_type
-    assert "image_dimensions" in response.json()
-    assert response.json()["image_dimensions"]["width"] == 100
-    assert response.json()["image_dimensions"]["height"] == 100
+    books = response.json()["books"]
+    assert len(books) > 0
+    for book in books:
+        assert set(book) == {"id", "title", "description", "cover"}
+        assert book["title"] and book["description"]
+    assert [book["id"] for book in books] == list(range(1, len(books) + 1))
     logger.info("test_process_image_success completed successfully")
 
-def test_process_image_no_image():
-    """Test the /process-image endpoint without an image."""
-    logger.info("Running test_process_image_no_image")
-    query_text = "No image here"
-    logger.debug(f"Test parameter - query: {query_text}")
+def test_process_image_panorama_is_scanned_in_tiles(monkeypatch):
+    """A wide shelf photo is scanned tile by tile and the books merged into one list."""
+    # A left-to-right gradient, so every tile is a different image
+    img = Image.linear_gradient('L').rotate(90).resize((3000, 400)).convert('RGB')
+    byte_arr = io.BytesIO()
+    img.save(byte_arr, format='PNG')
+    tiles = plan_tiles((3000, 400))
+    assert len(tiles) > 1
+
+    calls = []
+
+    class CountingAgent:
+        async def ainvoke(self, state):
+            calls.append(state["messages"])
+            return await agent.ainvoke(state)
+
+    monkeypatch.setattr(image_processing, "agent", CountingAgent())
+    response = client.post(
+        "/api/process-image",
+        files={"image": ("panorama.png", byte_arr.getvalue(), "image/png")}
+    )
 
+    assert response.status_code == 200
+    # One model call per tile, each with its own image
+    assert len(calls) == len(tiles)
+    assert len({messages[0].content[-1]["image_url"]["url"] for messages in calls}) == len(tiles)
+    books = response.json()["books"]
+    assert len(books) > 0
+    titles = [book["title"] for book in books]
+    assert len(titles) == len(set(titles))
+
+def test_process_image_panorama_merges_the_tiles_that_succeed(monkeypatch):
+    """A tile whose model call fails does not fail the whole panorama."""
+    img = Image.new('RGB', (3000, 400), color = 'green')
+    byte_arr = io.BytesIO()
+    img.save(byte_arr, format='PNG')
+    calls = []
+
+    class FlakyAgent:
+        async def ainvoke(self, state):
+            calls.append(state)
+            if len(calls) == 1:
+                raise LLMOverloadedError("busy", 1)
+            return await agent.ainvoke(state)
+
+    monkeypatch.setattr(image_processing, "agent", FlakyAgent())
     response = client.post(
-        "/process-image",
-        data={"query": query_text}
+        "/api/process-image",
+        files={"image": ("panorama.png", byte_arr.getvalue(), "image/png")}
     )
+
+    assert response.status_code == 200
+    assert len(calls) == len(plan_tiles((3000, 400)))
+    assert len(response.json()["books"]) > 0
+
+def test_process_image_no_image():
+    """Test the /api/process-image endpoint without an image."""
+    logger.info("Running test_process_image_no_image")
+
+    response = client.post("/api/process-image")
     logger.debug(f"Response status code: {response.status_code}")
     assert response.status_code == 422 # Unprocessable Entity due to missing image
     logger.info("test_process_image_no_image completed successfully")
 
-def test_process_image_no_query():
-    """Test the /process-image endpoint without a query."""
-    logger.info("Running test_process_image_no_query")
-    image_file, filename, content_type = create_dummy_image()
-    logger.debug(f"Test parameters - filename: {filename}, content_type: {content_type}")
+def test_process_image_invalid_image():
+    """Test the /api/process-image endpoint with bytes that are not an image."""
+    logger.info("Running test_process_image_invalid_image")
 
     response = client.post(
-        "/process-image",
-        files={"image": (filename, image_file, content_type)}
+        "/api/process-image",
+        files={"image": ("notes.png", io.BytesIO(b"not an image"), "image/png")}
     )
     logger.debug(f"Response status code: {response.status_code}")
-    assert response.status_code == 422 # Unprocessable Entity due to missing query
-    logger.info("test_process_image_no_query completed successfully")
+    assert response.status_code == 400
+    assert response.json()["status"] == "error"
+    assert "object at" not in response.json()["message"]
+    logger.info("test_process_image_invalid_image completed successfully")
+
+def test_recommendations_success():
+    """Test the /api/books/recommendations endpoint."""
+    logger.info("Running test_recommendations_success")
+
+    response = client.post(
+        "/api/books/recommendations",
+        json={"books": [{"title": "Dune"}, {"title": "Emma"}]}
+    )
+    logger.debug(f"Response status code: {response.status_code}")
+
+    assert response.status_code == 200
+    recommendations = response.json()["recommendations"]
+    assert len(recommendations) > 0
+    assert set(recommendations[0]) == {"id", "title", "description", "cover"}
+    logger.info("test_recommendations_success completed successfully")
+
+def test_ping():
+    """Test the /ping health check endpoint."""
+    response = client.get("/ping")
+    assert response.status_code == 200
+    assert response.json()["status"] == "healthy"
@@ -0,0 +1,78 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+
+from fastapi.testclient import TestClient
+from PIL import Image
+from config.metrics import Histogram, MetricsRegistry, record_event, events, stage, stage_seconds
+from main import app
+
+client = TestClient(app)
+
+
+def _noise_png():
+    buf = io.BytesIO()
+    Image.effect_noise((64, 64), 60).convert("RGB").save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, "a")
+
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    assert samples[("test_seconds_bucket", '{stage="a",le="0.1"}')] == 1
+    assert samples[("test_seconds_bucket", '{stage="a",le="1.0"}')] == 2
+    assert samples[("test_seconds_bucket", '{stage="a",le="+Inf"}')] == 3
+    assert samples[("test_seconds_count", '{stage="a"}')] == 3
+    assert histogram.count("a") == 3
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Things.", ("kind",))
+    counter.inc("x")
+    counter.inc("x")
+    registry.gauge("test_gauge", "Level.", callback=lambda: {(): 7})
+
+    text = registry.render()
+    assert "# TYPE test_total counter" in text
+    assert 'test_total{kind="x"} 2' in text
+    assert "test_gauge 7" in text
+
+
+def test_stage_and_event_helpers_record():
+    before = stage_seconds.count("unit_test_stage")
+    with stage("unit_test_stage"):
+        pass
+    assert stage_seconds.count("unit_test_stage") == before + 1
+
+    record_event("unit_test_event")
+    assert events.get("unit_test_event") >= 1
+
+
+def test_scan_response_carries_server_timing():
+    response = client.post("/api/process-image", files={"image": ("shelf.png", _noise_png(), "image/png")})
+    assert response.status_code == 200
+
+    timing = response.headers.get("server-timing", "")
+    stages = [entry.split(";")[0].strip() for entry in timing.split(",")]
+    assert "upload_read" in stages
+    assert "cache_lookup" in stages
+    assert "build_response" in stages
+    # JSON encoding happens after the handler returns, in the response class
+    assert stages.index("serialize") > stages.index("build_response")
+
+
+def test_metrics_endpoint_exposes_route_latency():
+    client.get("/ping")
+    response = client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "shelf_scanner_stage_duration_seconds_bucket" in response.text
+    assert 'route="/ping"' in response.text
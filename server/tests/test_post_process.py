@@ -0,0 +1,38 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import pytest
+
+from agent.post_process import parse_book_gists, try_parse_book_gists, post_process_llm_response
+
+BOOKS = {"Dune": "An epic science fiction saga.", "Emma": "A comedy of manners in Regency England."}
+BODY = '{\n  "Dune": "An epic science fiction saga.",\n  "Emma": "A comedy of manners in Regency England."\n}'
+
+
+@pytest.mark.parametrize("raw_content", [
+    BODY,
+    f"```json\n{BODY}\n```",
+    f"Here are the books:\n```json\n{BODY}\n```\nHope this helps!",
+    f"```json\n{BODY}\n```\nNote: some spines {{were}} unreadable.",
+])
+def test_parse_bare_and_fenced_json(raw_content):
+    assert parse_book_gists(raw_content).root == BOOKS
+
+
+def test_parse_rejects_non_json():
+    with pytest.raises(ValueError):
+        parse_book_gists("I could not read any titles in this image.")
+    assert try_parse_book_gists("no json here") is None
+
+
+def test_parse_rejects_wrong_schema():
+    with pytest.raises(ValueError):
+        parse_book_gists('{"Dune": {"author": "Frank Herbert"}}')
+
+
+def test_post_process_llm_response_compatibility():
+    assert post_process_llm_response(BODY) == BOOKS
+    assert isinstance(post_process_llm_response("not json"), str)
@@ -0,0 +1,97 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from agent.fake_llm import FakeShelfLLM
+from agent.nodes import with_system_prompt
+from agent.prompts.registry import REQUIRED_PROMPTS, PromptError, PromptRegistry, prompts
+
+REQUIRED = {"system": frozenset(), "input": frozenset({"books"})}
+
+
+def write(path, text, mtime_ns=None):
+    path.write_text(text, encoding="utf-8")
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def make_registry(tmp_path, **kwargs):
+    write(tmp_path / "system.md", "You are helpful. Reply as {\"title\": \"gist\"}.")
+    write(tmp_path / "input.md", "Books: ${books}")
+    registry = PromptRegistry(str(tmp_path), REQUIRED, **kwargs)
+    registry.load()
+    return registry
+
+
+def test_shipped_prompts_load_and_render():
+    assert set(REQUIRED_PROMPTS) <= set(prompts._templates)
+    assert '["Dune"]' in prompts.render("recommendation_input", books='["Dune"]')
+
+
+def test_render_fills_placeholders_and_keeps_json_braces(tmp_path):
+    registry = make_registry(tmp_path)
+
+    assert registry.get("system") == "You are helpful. Reply as {\"title\": \"gist\"}."
+    assert registry.render("input", books='["Dune"]') == 'Books: ["Dune"]'
+    with pytest.raises(PromptError, match="books"):
+        registry.render("input")
+    with pytest.raises(PromptError, match="Unknown"):
+        registry.get("nope")
+
+
+def test_load_rejects_missing_and_invalid_templates(tmp_path):
+    write(tmp_path / "system.md", "Hello")
+    with pytest.raises(PromptError, match="input"):
+        PromptRegistry(str(tmp_path), REQUIRED).load()
+
+    write(tmp_path / "input.md", "Books: ${titles}")
+    with pytest.raises(PromptError, match="expected"):
+        PromptRegistry(str(tmp_path), REQUIRED).load()
+
+    write(tmp_path / "input.md", "Costs $5: ${books}")
+    with pytest.raises(PromptError, match="malformed"):
+        PromptRegistry(str(tmp_path), REQUIRED).load()
+
+
+def test_hot_reload_picks_up_changes_and_keeps_the_last_good_version(tmp_path):
+    registry = make_registry(tmp_path, reload_interval=0)
+    mtime_ns = (tmp_path / "system.md").stat().st_mtime_ns
+
+    write(tmp_path / "system.md", "Be brief.", mtime_ns + 10**9)
+    assert registry.get("system") == "Be brief."
+
+    write(tmp_path / "input.md", "No placeholder", mtime_ns + 2 * 10**9)
+    assert registry.render("input", books="x") == "Books: x"
+
+
+def test_reload_is_rate_limited(tmp_path):
+    registry = make_registry(tmp_path, reload_interval=3600)
+    mtime_ns = (tmp_path / "system.md").stat().st_mtime_ns
+
+    write(tmp_path / "system.md", "Be brief.", mtime_ns + 10**9)
+    assert registry.get("system").startswith("You are helpful")
+
+
+def test_system_prompt_is_added_only_when_the_caller_has_none():
+    scan = with_system_prompt([HumanMessage(content="[]")])
+    assert isinstance(scan[0], SystemMessage) and scan[0].content == prompts.get("sys_prompt")
+
+    own = [SystemMessage(content=prompts.get("recommendation_prompt")), HumanMessage(content="Books")]
+    assert with_system_prompt(own) == own
+
+
+def test_repeated_system_prefix_is_reported_as_cached():
+    llm = FakeShelfLLM(latency_ms=0, latency_sigma=0)
+    messages = [SystemMessage(content=prompts.get("recommendation_prompt")), HumanMessage(content="Books: Dune")]
+
+    first = asyncio.run(llm.ainvoke(messages)).usage_metadata
+    second = asyncio.run(llm.ainvoke(messages[:1] + [HumanMessage(content="Books: Emma")])).usage_metadata
+
+    assert first["input_token_details"]["cache_read"] == 0
+    assert second["input_token_details"]["cache_read"] > 0
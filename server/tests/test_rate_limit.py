@@ -0,0 +1,117 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import multiprocessing
+import tempfile
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from config.rate_limit import MemoryBucketStore, RateLimitExceeded, RateLimiter, SQLiteBucketStore, parse_rate, rate_limiter
+from main import app
+
+
+def test_parse_rate():
+    limit = parse_rate("15/minute")
+    assert limit.capacity == 15
+    assert limit.rate == pytest.approx(0.25)
+    assert parse_rate("100 per hour").rate == pytest.approx(100 / 3600)
+    assert parse_rate("5/10seconds").rate == pytest.approx(0.5)
+    with pytest.raises(ValueError):
+        parse_rate("lots")
+
+
+@pytest.mark.parametrize("store_factory", [
+    MemoryBucketStore,
+    lambda: SQLiteBucketStore(os.path.join(tempfile.mkdtemp(), "limits.db")),
+])
+def test_token_bucket_bursts_then_refills(store_factory):
+    store = store_factory()
+    limit = parse_rate("3/second")
+
+    assert [store.take("client", limit, 100.0)[0] for _ in range(4)] == [True, True, True, False]
+    # One token refills after a third of a second, and only one
+    assert store.take("client", limit, 100.34)[0]
+    assert not store.take("client", limit, 100.34)[0]
+    # Other keys have their own bucket
+    assert store.take("other", limit, 100.34)[0]
+
+
+def test_limiter_reports_retry_after():
+    limiter = RateLimiter(MemoryBucketStore())
+    limit = parse_rate("1/minute")
+    limiter.check("scan", "1.2.3.4", limit)
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.check("scan", "1.2.3.4", limit)
+    assert 1 <= excinfo.value.retry_after <= 60
+
+    limiter.enabled = False
+    limiter.check("scan", "1.2.3.4", limit)
+
+
+def _spend(path, attempts, results):
+    store = SQLiteBucketStore(path)
+    limit = parse_rate("10/hour")
+    results.put(sum(store.take("shared", limit, time.time())[0] for _ in range(attempts)))
+
+
+def test_sqlite_buckets_are_shared_across_processes():
+    path = os.path.join(tempfile.mkdtemp(), "limits.db")
+    SQLiteBucketStore(path)
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_spend, args=(path, 10, results)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+
+    # Three workers trying 10 requests each share one budget of 10
+    assert sum(results.get(timeout=5) for _ in workers) == 10
+
+
+def test_endpoint_returns_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "enabled", True)
+    monkeypatch.setattr(rate_limiter, "store", MemoryBucketStore())
+    client = TestClient(app)
+
+    statuses = [
+        client.post("/api/books/recommendations", json={"books": [{"title": "Dune"}]}).status_code
+        for _ in range(6)
+    ]
+    assert statuses[:5] == [200] * 5
+    assert statuses[5] == 429
+
+    response = client.post("/api/books/recommendations", json={"books": [{"title": "Dune"}]})
+    assert response.json()["status"] == "error"
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+class LoopCheckingStore(MemoryBucketStore):
+    """Records whether each check ran on the event loop's thread."""
+
+    def __init__(self, blocking):
+        super().__init__()
+        self.blocking = blocking
+        self.on_loop = []
+
+    def take(self, key, limit, now):
+        try:
+            asyncio.get_running_loop()
+            self.on_loop.append(True)
+        except RuntimeError:
+            self.on_loop.append(False)
+        return super().take(key, limit, now)
+
+
+def test_blocking_stores_are_checked_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "enabled", True)
+    client = TestClient(app)
+    for blocking in (True, False):
+        store = LoopCheckingStore(blocking)
+        monkeypatch.setattr(rate_limiter, "store", store)
+        assert client.post("/api/books/recommendations", json={"books": [{"title": "Dune"}]}).status_code == 200
+        assert store.on_loop == [not blocking]
@@ -0,0 +1,110 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+
+import routes.recommendations as recommendations
+from agent.concurrency import LLMOverloadedError
+from agent.fake_llm import _KNOWN_BOOKS, _synthetic_book
+from main import app
+from services.recommender import BookRecommender, build_index, load_recommender
+
+BOOKS = [(title, "", gist) for title, gist in _KNOWN_BOOKS] + [
+    (title, "", gist) for title, gist in (_synthetic_book(i) for i in range(200))
+]
+DYSTOPIAS = {"1984", "Brave New World", "Fahrenheit 451"}
+
+
+@pytest.fixture(scope="module")
+def index(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("recommender"))
+    build_index(BOOKS, directory)
+    return BookRecommender(directory)
+
+
+def test_recommends_similar_books_and_never_the_inputs(index):
+    titles = [recommendation.title for recommendation in index.recommend(["1984", "Brave New World"], k=3)]
+
+    assert titles[0] == "Fahrenheit 451"
+    assert not {"1984", "Brave New World"} & set(titles)
+
+
+def test_unindexed_titles_are_embedded_from_the_title(index):
+    titles = {recommendation.title for recommendation in index.recommend(["Another Dystopian Novel"], k=5)}
+
+    assert titles & DYSTOPIAS
+    assert index.recommend(["The Of And"]) == []
+
+
+def test_batched_queries_match_single_ones(index):
+    requests = [["Dune"], ["Jane Eyre", "Middlemarch"], ["The Quiet Library"]]
+
+    batched = index.recommend_many(requests, k=5)
+
+    for titles, together in zip(requests, batched):
+        alone = index.recommend(titles, k=5)
+        assert [r.title for r in together] == [r.title for r in alone]
+        assert [r.score for r in together] == pytest.approx([r.score for r in alone], abs=1e-5)
+
+
+def test_ivf_probing_every_list_matches_the_exact_search(index, tmp_path):
+    build_index(BOOKS, str(tmp_path), ivf_min_books=50)
+    ivf = BookRecommender(str(tmp_path), probes=1000)
+
+    assert ivf.approximate and not index.approximate
+    for titles in (["1984"], ["Dune", "Neuromancer"], ["The Silent Garden"]):
+        assert [r.title for r in ivf.recommend(titles, k=5)] == [r.title for r in index.recommend(titles, k=5)]
+
+
+def test_missing_index_loads_as_none(tmp_path):
+    assert load_recommender(str(tmp_path)) is None
+
+
+def post_recommendations(titles):
+    client = TestClient(app)
+    response = client.post("/api/books/recommendations", json={"books": [{"title": title} for title in titles]})
+    assert response.status_code == 200
+    return [book["title"] for book in response.json()["recommendations"]]
+
+
+def test_local_mode_answers_without_the_model(index, monkeypatch):
+    async def no_model(*args):
+        raise AssertionError("the model was called")
+
+    monkeypatch.setattr(recommendations, "recommender", index)
+    monkeypatch.setattr(recommendations, "RECOMMENDER_MODE", "local")
+    monkeypatch.setattr(recommendations, "_model_recommendations", no_model)
+
+    assert post_recommendations(["1984"]) == [r.title for r in index.recommend(["1984"], k=recommendations.RECOMMENDATIONS_COUNT)]
+
+
+def test_rerank_mode_keeps_the_model_to_the_shortlist(index, monkeypatch):
+    monkeypatch.setattr(recommendations, "recommender", index)
+    monkeypatch.setattr(recommendations, "RECOMMENDER_MODE", "rerank")
+    shortlist = {r.title for r in index.recommend(["Dune"], k=recommendations.RECOMMENDER_SHORTLIST)}
+
+    titles = post_recommendations(["Dune"])
+
+    assert titles and set(titles) <= shortlist
+
+
+@pytest.mark.parametrize("failure", ["overloaded", "timeout", "unparsed"])
+def test_local_recommendations_are_served_when_the_model_fails(index, monkeypatch, failure):
+    async def failing_model(*args):
+        if failure == "overloaded":
+            raise LLMOverloadedError("Server is busy, please retry shortly", 5)
+        if failure == "timeout":
+            await asyncio.sleep(1)
+        return None
+
+    monkeypatch.setattr(recommendations, "recommender", index)
+    monkeypatch.setattr(recommendations, "RECOMMENDER_MODE", "llm")
+    monkeypatch.setattr(recommendations, "RECOMMENDER_LLM_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(recommendations, "_model_recommendations", failing_model)
+
+    assert post_recommendations(["Jane Eyre"]) == [r.title for r in index.recommend(["Jane Eyre"], k=recommendations.RECOMMENDATIONS_COUNT)]
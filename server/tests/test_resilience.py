@@ -0,0 +1,210 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from langchain_core.messages import AIMessage, HumanMessage
+
+import agent.resilience as resilience
+from agent.concurrency import LLMConcurrencyLimiter
+from agent.resilience import (
+    CircuitBreaker, LatencyTracker, LLMTimeoutError, LLMUnavailableError, PerModel, StaleReplyCache, invoke_model,
+    request_budget,
+)
+from config.metrics import events
+from main import app
+
+MESSAGES = [HumanMessage(content="Books: Dune")]
+
+
+class ScriptedModel:
+    """Answers each call with the next (delay, text) step, or raises it if it is an exception."""
+
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        step = self.steps[min(self.calls, len(self.steps) - 1)]
+        self.calls += 1
+        if isinstance(step, Exception):
+            raise step
+        delay, text = step
+        await asyncio.sleep(delay)
+        return AIMessage(content=text)
+
+
+@pytest.fixture
+def isolated(monkeypatch):
+    """Fresh breaker, limiter, latency window and stale cache for each test."""
+    limiter = LLMConcurrencyLimiter(max_concurrency=4, max_queue=4, queue_timeout=1, retry_after=3, adaptive=True)
+    monkeypatch.setattr(resilience, "llm_limiter", limiter)
+    monkeypatch.setattr(resilience, "breakers", PerModel(lambda model: CircuitBreaker(failure_threshold=2, reset_timeout=30)))
+    monkeypatch.setattr(resilience, "latencies", PerModel(lambda model: LatencyTracker()))
+    monkeypatch.setattr(resilience, "stale_replies", StaleReplyCache(8))
+    return limiter
+
+
+def use_model(monkeypatch, model):
+    monkeypatch.setattr(resilience, "get_llm", lambda: model)
+    return model
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=lambda: now[0])
+
+    breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    assert breaker.retry_after() == 10
+
+    now[0] = 10.0
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 20.0
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_aimd_halves_on_congestion_and_grows_by_one_per_window():
+    limiter = LLMConcurrencyLimiter(max_concurrency=8, max_queue=4, queue_timeout=1, retry_after=1,
+                                    adaptive=True, decrease_interval=60)
+
+    limiter.record_congestion()
+    limiter.record_congestion()
+    assert limiter.limit == 4
+
+    # Roughly one slot per limit's worth of healthy calls
+    for _ in range(5):
+        limiter.record_success()
+    assert limiter.limit == 5
+
+    fixed = LLMConcurrencyLimiter(max_concurrency=8, max_queue=4, queue_timeout=1, retry_after=1)
+    fixed.record_congestion()
+    assert fixed.limit == 8
+
+
+def test_a_grown_limit_admits_waiters_at_once():
+    limiter = LLMConcurrencyLimiter(max_concurrency=2, max_queue=4, queue_timeout=1, retry_after=1, adaptive=True)
+    limiter.record_congestion()
+
+    async def main():
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        limiter.record_success()
+        await asyncio.wait_for(waiter, 1)
+        limiter.release()
+        limiter.release()
+
+    asyncio.run(main())
+    assert limiter.active == 0 and limiter.limit == 2
+
+
+def test_slow_call_times_out_and_counts_as_a_failure(isolated, monkeypatch):
+    use_model(monkeypatch, ScriptedModel((5.0, "{}")))
+    monkeypatch.setattr(resilience, "LLM_CALL_TIMEOUT_SECONDS", 0.05)
+
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(invoke_model(MESSAGES))
+    assert isolated.active == 0 and isolated.limit == 2
+
+
+def test_spent_request_budget_fails_without_calling(isolated, monkeypatch):
+    model = use_model(monkeypatch, ScriptedModel((0.0, "{}")))
+
+    async def call():
+        with request_budget(0.5):
+            return await invoke_model(MESSAGES)
+
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(call())
+    assert model.calls == 0
+
+
+def test_spent_budget_does_not_take_a_half_open_breakers_probe(isolated, monkeypatch):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    monkeypatch.setattr(resilience, "breakers", PerModel(lambda model: breaker))
+    model = use_model(monkeypatch, ScriptedModel((0.0, "{}")))
+    breaker.record_failure()
+    now[0] = 10.0
+
+    async def call(budget):
+        with request_budget(budget):
+            return await invoke_model(MESSAGES)
+
+    with pytest.raises(LLMTimeoutError):
+        asyncio.run(call(0.5))
+    # The probe is still free for the next call, which closes the breaker
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert asyncio.run(call(5)).content == "{}"
+    assert breaker.state == CircuitBreaker.CLOSED and model.calls == 1
+
+
+def test_stale_reply_key_covers_every_content_part():
+    def image(url):
+        return [HumanMessage(content=[{"type": "text", "text": "Books:"}, {"type": "image_url", "image_url": {"url": url}}])]
+
+    uri = "data:image/jpeg;base64," + "A" * 200_000
+    assert StaleReplyCache.key(image(uri)) == StaleReplyCache.key(image(uri))
+    assert StaleReplyCache.key(image(uri)) != StaleReplyCache.key(image(uri[:-1] + "B"))
+    assert StaleReplyCache.key(MESSAGES) != StaleReplyCache.key([HumanMessage(content="Books: Emma")])
+
+
+def test_open_breaker_fails_fast_or_serves_a_stale_reply(isolated, monkeypatch):
+    model = use_model(monkeypatch, ScriptedModel((0.0, '{"Dune": "Spice."}'), RuntimeError("503 from provider")))
+
+    assert asyncio.run(invoke_model(MESSAGES)).content == '{"Dune": "Spice."}'
+    # A failed call falls back to the last reply to the same request
+    assert asyncio.run(invoke_model(MESSAGES)).content == '{"Dune": "Spice."}'
+    with pytest.raises(RuntimeError):
+        asyncio.run(invoke_model([HumanMessage(content="Books: Emma")]))
+    assert resilience.breakers().state == CircuitBreaker.OPEN
+
+    calls = model.calls
+    assert asyncio.run(invoke_model(MESSAGES)).content == '{"Dune": "Spice."}'
+    with pytest.raises(LLMUnavailableError) as exc_info:
+        asyncio.run(invoke_model([HumanMessage(content="Books: Emma")]))
+    assert model.calls == calls
+    assert exc_info.value.retry_after >= 1
+
+
+def test_slow_call_is_hedged_and_the_faster_reply_wins(isolated, monkeypatch):
+    monkeypatch.setattr(resilience, "LLM_HEDGE_ENABLED", True)
+    for _ in range(30):
+        resilience.latencies().add(0.01)
+    use_model(monkeypatch, ScriptedModel((2.0, "slow"), (0.0, "fast")))
+    hedges_won = events.get("llm_hedge_won")
+
+    reply = asyncio.run(invoke_model(MESSAGES))
+
+    assert reply.content == "fast"
+    assert events.get("llm_hedge_won") == hedges_won + 1
+    assert isolated.active == 0
+
+
+def test_endpoint_returns_503_while_the_breaker_is_open(isolated, monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    # Every model's breaker is open, so there is nothing to escalate to either
+    monkeypatch.setattr(resilience, "breakers", PerModel(lambda model: breaker))
+    client = TestClient(app)
+
+    response = client.post("/api/books/recommendations", json={"books": [{"title": "A Book Nobody Asked About"}]})
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
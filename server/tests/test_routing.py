@@ -0,0 +1,164 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import random
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from PIL import Image, ImageDraw
+
+import agent.resilience as resilience
+import agent.routing as routing
+from agent.agent import agent
+from agent.concurrency import LLMOverloadedError
+from agent.llm import fast_model
+from agent.post_process import post_process_llm_response, repair_json_object
+from agent.resilience import CircuitBreaker, LatencyTracker, PerModel, StaleReplyCache
+from services.spine_crop import estimate_spine_count
+
+GOOD = '{"Dune": "Sand and spice.", "Emma": "A meddling matchmaker."}'
+
+
+@pytest.mark.parametrize("raw, repaired", [
+    ('```json\n' + GOOD, GOOD),
+    ('{"Dune": "Sand and spice.", "Emma": "A meddling matchmaker.",\n}', GOOD),
+    ('{"Dune": "Sand and spice.", "Emma": "A meddling matchmaker.", "Ulysses": "One day in Dub', GOOD),
+    ('{"Dune": "Sand and\nspice."}', '{"Dune": "Sand and\\nspice."}'),
+    ('Here you go: ' + GOOD + '\n```\nLet me know if {you} need more.', GOOD),
+    ('{"Dune": "Sand an', None),
+    ("The spines are too small to read.", None),
+])
+def test_json_repair(raw, repaired):
+    assert repair_json_object(raw) == repaired
+
+
+def test_post_processing_repairs_before_giving_up():
+    assert post_process_llm_response('```json\n{"Dune": "Sand.",}') == {"Dune": "Sand."}
+
+
+class TierModel:
+    """Replies with a fixed text, or raises the given exception, counting its calls."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return AIMessage(content=self.reply)
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    """Installs a fast and a strong model behind fresh resilience state."""
+    models = {}
+    monkeypatch.setattr(resilience, "get_llm", lambda model=None: models[model])
+    monkeypatch.setattr(resilience, "breakers", PerModel(lambda model: CircuitBreaker(failure_threshold=2, reset_timeout=30)))
+    monkeypatch.setattr(resilience, "latencies", PerModel(lambda model: LatencyTracker()))
+    monkeypatch.setattr(resilience, "stale_replies", StaleReplyCache(0))
+
+    def install(fast, strong=GOOD):
+        models[fast_model] = TierModel(fast)
+        models[None] = TierModel(strong)
+        return models[fast_model], models[None]
+
+    return install
+
+
+def scan(tier=None):
+    return asyncio.run(agent.ainvoke({"messages": [HumanMessage(content="Books: test")], "tier": tier}))
+
+
+def test_fast_model_answers_when_its_reply_parses(tiers):
+    fast, strong = tiers(GOOD)
+    state = scan()
+    assert state["book_gists"].root["Dune"] == "Sand and spice."
+    assert (fast.calls, strong.calls) == (1, 0)
+
+
+def test_repairable_reply_is_repaired_without_escalating(tiers):
+    fast, strong = tiers('```json\n{"Dune": "Sand and spice.", "Emma": "A meddling matchmaker.", "Uly')
+    repaired_before = routing.route_seconds.count("fast", "repaired")
+
+    state = scan()
+    assert list(state["book_gists"].root) == ["Dune", "Emma"]
+    assert (fast.calls, strong.calls) == (1, 0)
+    assert routing.route_seconds.count("fast", "repaired") == repaired_before + 1
+
+
+@pytest.mark.parametrize("fast_reply", ["I can't read these spines.", RuntimeError("500 Internal error")])
+def test_failures_on_the_fast_model_escalate_to_the_strong_one(tiers, fast_reply):
+    fast, strong = tiers(fast_reply)
+    state = scan()
+    assert state["book_gists"].root["Emma"] == "A meddling matchmaker."
+    assert state["tier"] == routing.STRONG
+    assert (fast.calls, strong.calls) == (1, 1)
+
+
+def test_an_open_fast_breaker_escalates_without_calling_the_fast_model(tiers):
+    fast, strong = tiers(RuntimeError("500 Internal error"))
+    for _ in range(2):
+        scan()
+    assert resilience.breakers(fast_model).state == CircuitBreaker.OPEN
+    # The fast model's failures are not held against the strong one
+    assert resilience.breakers().state == CircuitBreaker.CLOSED
+    calls = fast.calls
+
+    state = scan()
+    assert state["book_gists"].root["Dune"] == "Sand and spice."
+    assert state["tier"] == routing.STRONG
+    assert fast.calls == calls and strong.calls == 3
+
+
+def test_tiers_keep_their_own_latencies_and_stale_replies(tiers, monkeypatch):
+    monkeypatch.setattr(resilience, "stale_replies", StaleReplyCache(8))
+    fast, strong = tiers(GOOD, strong='{"Emma": "A meddling matchmaker."}')
+    messages = [HumanMessage(content="Books: test")]
+
+    assert asyncio.run(resilience.invoke_model(messages, fast_model)).content == GOOD
+    assert StaleReplyCache.key(messages, fast_model) != StaleReplyCache.key(messages)
+    assert resilience.stale_replies.get(StaleReplyCache.key(messages)) is None
+    assert len(resilience.latencies(fast_model)) == 1 and len(resilience.latencies()) == 0
+
+
+def test_overload_and_strong_model_failures_do_not_escalate(tiers):
+    fast, strong = tiers(LLMOverloadedError("busy", 3))
+    with pytest.raises(LLMOverloadedError):
+        scan()
+    assert strong.calls == 0
+
+    fast, strong = tiers(GOOD, strong="still not JSON")
+    assert scan(tier=routing.STRONG)["book_gists"] is None
+    assert (fast.calls, strong.calls) == (0, 1)
+
+
+def shelf(spines: int, width: int = 1200) -> Image.Image:
+    image = Image.new("RGB", (width, width // 2), (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    rng = random.Random(spines)
+    step = (width - 200) / spines
+    for i in range(spines):
+        draw.rectangle([100 + i * step, 100, 100 + (i + 1) * step - 2, width // 2 - 100],
+                       fill=tuple(rng.randrange(30, 220) for _ in range(3)))
+    return image
+
+
+def test_spine_count_estimate_tracks_the_shelf():
+    for spines in (10, 30, 60):
+        assert abs(estimate_spine_count(shelf(spines)) - spines) <= 3
+    assert estimate_spine_count(Image.new("RGB", (800, 600), (200, 200, 200))) == 0
+
+
+def test_dense_shelves_and_small_spines_go_to_the_strong_model(monkeypatch):
+    assert routing.image_tier([shelf(12)]) == routing.FAST
+    assert routing.image_tier([shelf(12), shelf(80)]) == routing.STRONG
+    # Few spines, but only a handful of pixels each
+    assert routing.image_tier([shelf(30, width=480)]) == routing.STRONG
+
+    monkeypatch.setattr(routing, "LLM_ROUTING_ENABLED", False)
+    assert routing.image_tier([shelf(80)]) is None
@@ -0,0 +1,87 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+from PIL import Image, ImageDraw
+
+from services.scan_cache import ScanCache, content_hash, perceptual_hash
+
+BOOKS = {"Dune": "An epic science fiction saga set on a desert planet."}
+
+
+def make_shelf_image(size=(400, 300)):
+    """Creates a synthetic shelf image with vertical spine-like stripes."""
+    img = Image.new("RGB", size, color="white")
+    draw = ImageDraw.Draw(img)
+    for i, x in enumerate(range(0, size[0], 25)):
+        draw.rectangle([x, 40, x + 18, size[1] - 40], fill=(40 * (i % 6), 90, 200 - 30 * (i % 5)))
+    return img
+
+
+def make_cache(cache_dir, **overrides):
+    options = dict(max_entries=8, cache_dir=cache_dir, ttl_seconds=3600, max_disk_bytes=1024 * 1024, phash_distance=4)
+    options.update(overrides)
+    return ScanCache(**options)
+
+
+def test_exact_hit_and_miss(tmp_path):
+    cache = make_cache(str(tmp_path))
+    img = make_shelf_image()
+    cache.put("abc", perceptual_hash(img), BOOKS)
+    assert cache.get_exact("abc") == BOOKS
+    assert cache.get_exact("missing") is None
+    assert cache.stats["exact_hits"] == 1
+
+
+def test_perceptual_hit_for_recompressed_resized_image(tmp_path):
+    cache = make_cache(str(tmp_path))
+    original = make_shelf_image()
+    cache.put("abc", perceptual_hash(original), BOOKS)
+
+    buffer = io.BytesIO()
+    original.resize((200, 150)).save(buffer, format="JPEG", quality=60)
+    variant = Image.open(io.BytesIO(buffer.getvalue()))
+    assert cache.get_similar(perceptual_hash(variant)) == BOOKS
+    assert cache.stats["perceptual_hits"] == 1
+
+    unrelated = Image.new("RGB", (400, 300), color="white")
+    ImageDraw.Draw(unrelated).rectangle([0, 0, 200, 300], fill="black")
+    assert cache.get_similar(perceptual_hash(unrelated)) is None
+    assert cache.stats["misses"] == 1
+
+
+def test_flat_images_never_match_perceptually(tmp_path):
+    cache = make_cache(str(tmp_path))
+    red = perceptual_hash(Image.new("RGB", (100, 100), "red"))
+    cache.put("red", red, BOOKS)
+    assert cache.get_similar(perceptual_hash(Image.new("RGB", (100, 100), "blue"))) is None
+    assert cache.get_exact("red") == BOOKS
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    phash = perceptual_hash(make_shelf_image())
+    make_cache(str(tmp_path)).put("abc", phash, BOOKS)
+
+    reloaded = make_cache(str(tmp_path))
+    assert reloaded.get_similar(phash) == BOOKS
+    assert reloaded.get_exact("abc") == BOOKS
+    assert reloaded.stats["disk_hits"] == 1
+
+
+def test_expired_disk_entries_are_dropped(tmp_path):
+    make_cache(str(tmp_path)).put("abc", 1, BOOKS)
+    reloaded = make_cache(str(tmp_path), ttl_seconds=-1)
+    assert reloaded.get_exact("abc") is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_memory_lru_and_disk_size_eviction(tmp_path):
+    cache = make_cache(str(tmp_path), max_entries=2, max_disk_bytes=200)
+    for i in range(5):
+        cache.put(content_hash(bytes([i])), i, {f"Book {i}": "x" * 60})
+    assert len(os.listdir(tmp_path)) < 5
+    assert cache.get_exact(content_hash(bytes([4]))) == {"Book 4": "x" * 60}
+    assert cache.get_exact(content_hash(bytes([0]))) is None
@@ -0,0 +1,170 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import hashlib
+import io
+import time
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from routes.jobs import scan_job_workers
+from services.scan_jobs import (
+    JobDeferredError, JobQueueFullError, JobRejectedError, JobWorkerPool, ScanJobStore, scan_job_wait_seconds,
+)
+from services.uploads import SpooledUpload
+
+IMAGE = os.path.join(os.path.dirname(__file__), "images", "test_image.jpg")
+
+
+def upload(data: bytes, filename: str = "shelf.jpg") -> SpooledUpload:
+    return SpooledUpload(filename, io.BytesIO(data), len(data), hashlib.sha256(data).hexdigest())
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ScanJobStore(str(tmp_path / "jobs.db"), str(tmp_path / "images"), max_queued=3, max_attempts=2,
+                        lease_seconds=10, result_ttl=100, retry_backoff=5)
+
+
+def test_identical_images_share_a_job_and_resubmitting_raises_priority(store):
+    job, deduplicated = store.submit(upload(b"one"), priority=0)
+    again, deduplicated_again = store.submit(upload(b"one", "copy.jpg"), priority=5)
+
+    assert not deduplicated and deduplicated_again
+    assert again.id == job.id and again.priority == 5
+    assert store.get(job.id).priority == 5
+    assert os.path.exists(store.image_path(job.image_sha))
+
+
+def test_claims_follow_priority_then_age(store):
+    low, _ = store.submit(upload(b"low"), priority=0, now=1)
+    high, _ = store.submit(upload(b"high"), priority=3, now=2)
+    later, _ = store.submit(upload(b"later"), priority=0, now=3)
+
+    assert store.position(store.get(later.id)) == 2
+    assert [store.claim(now=10).id for _ in range(3)] == [high.id, low.id, later.id]
+    assert store.claim(now=10) is None
+
+
+def test_expired_lease_is_claimed_again_until_attempts_run_out(store):
+    job, _ = store.submit(upload(b"crashy"), now=0)
+    assert store.claim(now=1).attempts == 1
+    assert store.claim(now=5) is None
+
+    # The first worker died: its lease runs out and another worker takes the job over
+    assert store.claim(now=12).attempts == 2
+    assert store.claim(now=30) is None
+    abandoned = store.get(job.id, now=30)
+    assert abandoned.status == "failed" and "interrupted" in abandoned.error
+
+
+def test_failures_are_retried_after_a_backoff_then_recorded(store):
+    job, _ = store.submit(upload(b"bad"), now=0)
+    assert store.fail(store.claim(now=0), "model said no", now=0)
+    assert store.get(job.id, now=0).status == "queued"
+    assert store.claim(now=4) is None
+    assert not store.fail(store.claim(now=5), "model said no again", now=5)
+
+    failed = store.get(job.id, now=5)
+    assert failed.status == "failed" and failed.error == "model said no again"
+    assert not os.path.exists(store.image_path(job.image_sha))
+    # A failed image can be submitted again
+    assert not store.submit(upload(b"bad"))[1]
+
+
+def test_results_expire_and_are_purged(store):
+    job, _ = store.submit(upload(b"done"), now=0)
+    store.complete(store.claim(now=0), {"books": []}, now=1)
+
+    assert store.get(job.id, now=50).result == {"books": []}
+    assert store.get(job.id, now=500) is None
+    assert store.purge(now=500) == 1
+    assert store.counts()["done"] == 0
+    assert not os.path.exists(store.image_path(job.image_sha))
+
+
+def test_overload_defers_without_using_up_an_attempt(store):
+    job, _ = store.submit(upload(b"busy"), now=0)
+    for now in (0, 30, 60):
+        claimed = store.claim(now=now)
+        assert claimed.attempts == 1
+        store.defer(claimed, 30, "Server is busy", now=now)
+        assert store.claim(now=now + 29) is None
+    assert store.get(job.id).error == "Server is busy"
+
+
+def test_full_queue_rejects_new_jobs_without_storing_their_images(store):
+    for data in (b"a", b"b", b"c"):
+        store.submit(upload(data))
+    rejected = upload(b"d")
+    with pytest.raises(JobQueueFullError):
+        store.submit(rejected)
+    assert not os.path.exists(store.image_path(rejected.sha256))
+    # Duplicates of queued images are still answered
+    assert store.submit(upload(b"a"))[1]
+
+
+def test_worker_pool_runs_jobs_through_the_handler(store):
+    seen = []
+
+    async def handler(spooled):
+        seen.append(spooled.open().read())
+        if spooled.filename == "broken.jpg":
+            raise ValueError("Invalid response format")
+        if spooled.filename == "busy.jpg":
+            raise JobDeferredError("Server is busy", 30)
+        if spooled.filename == "text.jpg":
+            raise JobRejectedError("The upload is not an image in a supported format")
+        return {"books": [{"title": "Dune"}]}
+
+    store.max_queued = 4
+    good, _ = store.submit(upload(b"good"))
+    broken, _ = store.submit(upload(b"broken", "broken.jpg"))
+    busy, _ = store.submit(upload(b"busy", "busy.jpg"))
+    text, _ = store.submit(upload(b"text", "text.jpg"))
+    pool = JobWorkerPool(store, handler, workers=1)
+    waits_before = scan_job_wait_seconds.count()
+
+    async def drain():
+        while await pool.run_once():
+            pass
+
+    asyncio.run(drain())
+    # Each ran once: the failed one waits out its backoff, the busy one its Retry-After
+    assert seen == [b"good", b"broken", b"busy", b"text"]
+    assert scan_job_wait_seconds.count() == waits_before + 4
+    assert store.get(good.id).result == {"books": [{"title": "Dune"}]}
+    assert store.get(broken.id).status == "queued" and store.get(broken.id).attempts == 1
+    assert store.get(busy.id).status == "queued" and store.get(busy.id).attempts == 0
+    assert store.get(text.id).status == "failed"
+
+
+def test_scan_job_api_queues_runs_and_streams_the_result(monkeypatch):
+    # Workers run in their own processes by default; have the app run one for this test
+    monkeypatch.setattr(scan_job_workers, "workers", 1)
+    with TestClient(app) as client, open(IMAGE, "rb") as f:
+        data = f.read()
+        response = client.post("/api/scan-jobs", files={"image": ("shelf.jpg", data, "image/jpeg")}, data={"priority": "2"})
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert response.headers["location"].endswith(f"/api/scan-jobs/{job_id}")
+
+        duplicate = client.post("/api/scan-jobs", files={"image": ("again.jpg", data, "image/jpeg")})
+        assert duplicate.json() == {"job_id": job_id, "status": duplicate.json()["status"], "deduplicated": True}
+
+        deadline = time.time() + 10
+        while (job := client.get(f"/api/scan-jobs/{job_id}").json())["status"] in ("queued", "running"):
+            assert time.time() < deadline
+            time.sleep(0.05)
+        assert job["status"] == "done" and job["priority"] == 2
+        assert job["result"]["books"]
+
+        events = client.get(f"/api/scan-jobs/{job_id}/events").text
+        assert "event: status" in events and "event: result" in events
+
+    assert client.get("/api/scan-jobs/no-such-job").status_code == 404
@@ -0,0 +1,118 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import io
+import json
+import random
+from fastapi.testclient import TestClient
+from PIL import Image, ImageDraw
+
+import routes.image_processing as image_processing
+from config.metrics import events
+from main import app
+
+client = TestClient(app)
+
+
+def shelf_jpeg(seed: int) -> bytes:
+    """A distinct shelf photo per seed, detailed enough to be cached."""
+    rng = random.Random(seed)
+    img = Image.new("RGB", (800, 600), (230, 225, 215))
+    draw = ImageDraw.Draw(img)
+    x = 40
+    while x < 760:
+        width = rng.randint(12, 40)
+        draw.rectangle((x, 100, x + width - 2, 500), fill=tuple(rng.randrange(256) for _ in range(3)))
+        x += width
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def sse_events(text: str):
+    """Parses a Server-Sent Events body into (event, data) pairs."""
+    parsed = []
+    for block in filter(None, text.split("\n\n")):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def stream(data: bytes, filename: str = "shelf.jpg"):
+    return client.post("/api/process-image/stream", files={"image": (filename, data, "image/jpeg")})
+
+
+def test_stream_sends_each_book_then_done():
+    response = stream(shelf_jpeg(501))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    sent = sse_events(response.text)
+    names = [name for name, _ in sent]
+    assert names[-1] == "done" and set(names[:-1]) == {"book"}
+    books = [data for name, data in sent if name == "book"]
+    assert sent[-1][1] == {"count": len(books)}
+    assert [book["id"] for book in books] == list(range(1, len(books) + 1))
+    assert all(set(book) == {"id", "title", "description", "cover"} for book in books)
+
+
+def test_stream_replays_a_cached_scan():
+    image = shelf_jpeg(502)
+    first = sse_events(stream(image).text)
+    hits_before = events.get("scan_cache_hit_exact")
+
+    second = sse_events(stream(image).text)
+
+    assert events.get("scan_cache_hit_exact") == hits_before + 1
+    assert [name for name, _ in second] == [name for name, _ in first]
+    assert [data["title"] for name, data in second if name == "book"] == [data["title"] for name, data in first if name == "book"]
+
+
+def test_stream_rejects_an_undecodable_image():
+    response = stream(b"not an image", filename="notes.jpg")
+
+    assert response.status_code == 400
+    assert response.json() == {"status": "error", "message": "The upload is not an image in a supported format"}
+
+
+def batch_lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_reports_good_and_bad_images_and_merges_the_good():
+    good = [shelf_jpeg(601), shelf_jpeg(602)]
+    response = client.post("/api/process-images/batch", files=[
+        ("images", ("first.jpg", good[0], "image/jpeg")),
+        ("images", ("junk.jpg", b"not an image", "image/jpeg")),
+        ("images", ("second.jpg", good[1], "image/jpeg")),
+    ])
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = batch_lines(response)
+    images = {line["index"]: line for line in lines if line["type"] == "image"}
+    assert sorted(images) == [0, 1, 2]
+    assert images[1]["status"] == "error" and images[1]["filename"] == "junk.jpg"
+    assert images[1]["message"] == "The upload is not an image in a supported format"
+    assert images[0]["status"] == images[2]["status"] == "ok"
+
+    summary = lines[-1]
+    assert summary["type"] == "summary"
+    assert (summary["images"], summary["failed"]) == (3, 1)
+    scanned = {book["title"] for index in (0, 2) for book in images[index]["books"]}
+    assert {book["title"] for book in summary["books"]} == scanned
+    assert len({book["id"] for book in summary["books"]}) == len(summary["books"])
+
+
+def test_batch_rejects_too_many_images(monkeypatch):
+    monkeypatch.setattr(image_processing, "BATCH_MAX_IMAGES", 2)
+
+    response = client.post("/api/process-images/batch", files=[
+        ("images", (f"shelf-{i}.jpg", b"unused", "image/jpeg")) for i in range(3)
+    ])
+
+    assert response.status_code == 413
+    assert response.json() == {"status": "error", "message": "Too many images, the limit is 2 per batch"}
@@ -0,0 +1,114 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import gzip
+import tempfile
+import time
+from pathlib import Path
+
+from services.static_site import IMMUTABLE_CACHE_CONTROL, StaticSite
+
+BUNDLE = "console.log('shelf scanner');\n" * 100
+
+
+def _build_site(reload_interval=60.0):
+    root = tempfile.mkdtemp()
+    os.makedirs(os.path.join(root, "assets"))
+    Path(root, "index.html").write_text("<html><body>" + "<div>v1</div>" * 100 + "</body></html>")
+    Path(root, "assets", "index-BdF3k2a1.js").write_text(BUNDLE)
+    return root, StaticSite(root, reload_interval=reload_interval)
+
+
+def test_serves_gzip_when_accepted():
+    _, site = _build_site()
+
+    response = site.response("assets/index-BdF3k2a1.js", {"accept-encoding": "gzip, deflate"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(response.body).decode() == BUNDLE
+
+    plain = site.response("assets/index-BdF3k2a1.js", {})
+    assert "content-encoding" not in plain.headers
+    assert plain.body.decode() == BUNDLE
+    assert plain.headers["etag"] != response.headers["etag"]
+
+
+def test_hashed_assets_are_immutable_and_index_revalidates():
+    _, site = _build_site()
+    assert site.response("assets/index-BdF3k2a1.js", {}).headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert site.response("index.html", {}).headers["cache-control"] == "no-cache"
+
+
+def test_if_none_match_returns_304():
+    _, site = _build_site()
+    etag = site.response("index.html", {"accept-encoding": "gzip"}).headers["etag"]
+
+    response = site.response("index.html", {"accept-encoding": "gzip", "if-none-match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+    assert response.body == b""
+    # A different encoding is a different representation
+    assert site.response("index.html", {"if-none-match": etag}).status_code == 200
+
+
+def test_index_reloads_when_modified():
+    root, site = _build_site(reload_interval=0)
+    Path(root, "index.html").write_text("<html>v2</html>")
+    later = time.time() + 10
+    os.utime(os.path.join(root, "index.html"), (later, later))
+
+    assert site.response("index.html", {}).body == b"<html>v2</html>"
+
+
+def test_new_assets_load_on_demand_without_escaping_root():
+    root, site = _build_site()
+    Path(root, "assets", "chunk-Zz9Yy8Xx.js").write_text("export default 1;")
+
+    assert site.response("assets/chunk-Zz9Yy8Xx.js", {}) is None
+    assert site.response("assets/chunk-Zz9Yy8Xx.js", {}, load_missing=True).body == b"export default 1;"
+    outside = Path(root).parent / f"{os.path.basename(root)}-secret.txt"
+    outside.write_text("secret")
+    assert site.response(f"../{outside.name}", {}, load_missing=True) is None
+
+
+def test_encodings_refused_with_q_zero_are_not_served():
+    root, _ = _build_site()
+    # A variant written by the build, so the test does not need the brotli package
+    Path(root, "assets", "index-BdF3k2a1.js.br").write_bytes(b"brotli bytes")
+    site = StaticSite(root)
+
+    def encoding(accept):
+        return site.response("assets/index-BdF3k2a1.js", {"accept-encoding": accept}).headers.get("content-encoding")
+
+    assert encoding("gzip, br") == "br"
+    assert encoding("br;q=0, gzip") == "gzip"
+    assert encoding("br;q=0.5, gzip;q=0.8") == "gzip"
+    assert encoding("gzip;q=0, br;q=0") is None
+    assert encoding("*;q=0") is None
+    assert encoding("*") == "br"
+    assert encoding("identity") is None
+
+
+def test_serve_compresses_new_files_off_the_event_loop(monkeypatch):
+    root, site = _build_site()
+    Path(root, "assets", "chunk-Zz9Yy8Xx.js").write_text(BUNDLE)
+    on_loop = []
+    compress = gzip.compress
+
+    def recording_compress(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return compress(*args, **kwargs)
+
+    monkeypatch.setattr(gzip, "compress", recording_compress)
+    response = asyncio.run(site.serve("assets/chunk-Zz9Yy8Xx.js", {"accept-encoding": "gzip"}, load_missing=True))
+
+    assert gzip.decompress(response.body).decode() == BUNDLE
+    assert on_loop == [False]
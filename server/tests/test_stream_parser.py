@@ -0,0 +1,55 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import json
+import pytest
+
+from agent.stream_parser import IncrementalBookParser
+
+BOOKS = {
+    "Dune": "An epic science fiction saga set on a desert planet.",
+    "The \"Quoted\" Book": "Escapes: backslash \\ and unicode é survive.",
+    "Pride and Prejudice": "A timeless romantic novel.",
+}
+RAW = "```json\n" + json.dumps(BOOKS, indent=2) + "\n```"
+
+
+def feed_in_chunks(text, size):
+    parser = IncrementalBookParser()
+    emitted = []
+    for i in range(0, len(text), size):
+        emitted.extend(parser.feed(text[i:i + size]))
+    return parser, emitted
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 16, 1000])
+def test_emits_every_pair_regardless_of_chunking(size):
+    parser, emitted = feed_in_chunks(RAW, size)
+    assert emitted == list(BOOKS.items())
+    assert parser.done
+    assert parser.books == BOOKS
+
+
+def test_emits_pair_as_soon_as_value_closes():
+    parser = IncrementalBookParser()
+    assert parser.feed('Sure! {"Dune": "Sand') == []
+    assert parser.feed(' and spice."') == [("Dune", "Sand and spice.")]
+    assert not parser.done
+    assert parser.feed(', "Emma": "Matchmaking."}') == [("Emma", "Matchmaking.")]
+    assert parser.done
+
+
+def test_empty_object():
+    parser = IncrementalBookParser()
+    assert parser.feed("{ }") == []
+    assert parser.done
+
+
+def test_non_string_value_fails():
+    parser = IncrementalBookParser()
+    assert parser.feed('{"Dune": "ok", "Emma": {"nested": 1}}') == [("Dune", "ok")]
+    assert parser.failed
+    assert parser.feed('"more"') == []
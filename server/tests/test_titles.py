@@ -0,0 +1,126 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.title_index import TitleIndex
+from services.titles import canonical_key, clean_title, normalize_title, split_subtitle, stable_book_id, merge_book_gists, merge_tile_gists
+
+
+def test_normalize_title():
+    assert normalize_title("The Hitchhiker's Guide to the Galaxy") == "the hitchhikers guide to the galaxy"
+    assert normalize_title("  DUNE!! ") == "dune"
+    assert normalize_title("Ｄｕｎｅ") == "dune"
+    assert normalize_title("Cien años de soledad") == "cien anos de soledad"
+
+
+def test_canonical_key_strips_decorations_but_keeps_subtitles():
+    assert canonical_key("The Hobbit (J.R.R. Tolkien) [Paperback]") == "hobbit"
+    assert canonical_key("Dune, by Frank Herbert") == canonical_key("DUNE") == "dune"
+    assert canonical_key("Dune: 40th Anniversary Edition") == canonical_key("Dune - A Novel") == "dune"
+    assert canonical_key("Stand by Me") == "stand by me"
+    assert canonical_key("Death by Black Hole") == "death by black hole"
+    assert canonical_key("Dune Messiah") != canonical_key("Dune")
+    assert split_subtitle("Dune: Deluxe Edition") == ("dune", "deluxe edition")
+    assert split_subtitle("Dune") == ("dune", "")
+    assert clean_title("The Hobbit (J.R.R. Tolkien) [Paperback]") == "The Hobbit"
+    assert clean_title("Dune: Deluxe Edition") == "Dune"
+
+
+def test_stable_book_id_is_stable_and_javascript_safe():
+    assert stable_book_id("Dune") == stable_book_id("DUNE") == stable_book_id("Dune (Frank Herbert)")
+    assert stable_book_id("Dune") != stable_book_id("Emma")
+    assert stable_book_id("Dune") < 2 ** 53
+
+
+def test_merge_book_gists_deduplicates_in_first_seen_order():
+    merged = merge_book_gists([
+        {"Dune": "first", "Emma": "a comedy"},
+        {"DUNE": "second", "Beloved": "a ghost story"},
+    ])
+    assert [(title, gist) for _, title, gist in merged] == [
+        ("Dune", "first"), ("Emma", "a comedy"), ("Beloved", "a ghost story"),
+    ]
+
+
+def test_title_index_resolves_variants_to_one_book():
+    index = TitleIndex()
+    index.add_many(["Dune", "Dune Messiah", "The Hitchhiker's Guide to the Galaxy", "Foundation 2"])
+
+    dune = index.lookup("Dune")
+    assert index.lookup("DUNE (Frank Herbert)") == dune
+    assert index.lookup("Dune: Deluxe Edition").id == dune.id
+    assert index.lookup("Dune, by Frank Herbert").id == dune.id
+    assert index.lookup("Dune Messiah").id != dune.id
+
+    typo = index.lookup("Hitchiker's Guide to the Galaxy")
+    assert typo.title == "The Hitchhiker's Guide to the Galaxy" and typo.score < 1
+    # Similar titles that differ in a number are different books
+    assert index.lookup("Foundation 3") is None
+    assert index.lookup("Emma") is None
+
+
+def test_title_index_canonicalizes_and_merges_gists():
+    index = TitleIndex()
+    assert index.canonicalize("Beloved").title == "Beloved"
+    merged = index.canonicalize_gists({"BELOVED": "", "Beloved (Toni Morrison)": "A ghost story.", "Emma": "A comedy."})
+    assert merged == {"Beloved": "A ghost story.", "Emma": "A comedy."}
+    assert index.book_id("beloved") == stable_book_id("Beloved")
+    # Model titles are learned apart from the catalog's
+    assert len(index) == 0
+
+
+def test_learned_titles_are_cleaned_bounded_and_never_change_ids():
+    index = TitleIndex(max_learned=4)
+    index.add_many(["Dune"])
+
+    assert index.canonicalize("DUNE (Frank Herbert) [Paperback]").title == "Dune"
+    assert index.canonicalize("Beloved (Toni Morrison) [Hardcover]").title == "Beloved"
+    assert index.canonicalize("The Hitchiker's Guide to the Galaxy").title == "The Hitchiker's Guide to the Galaxy"
+    # A later, correct spelling merges into the learned one, but its ID is its own
+    assert index.canonicalize("The Hitchhiker's Guide to the Galaxy").title == "The Hitchiker's Guide to the Galaxy"
+    assert index.book_id("The Hitchhiker's Guide to the Galaxy") == stable_book_id("The Hitchhiker's Guide to the Galaxy")
+
+    for title in ("Emma", "Ulysses", "Middlemarch", "Persuasion"):
+        index.canonicalize(title)
+    # The oldest learned titles are forgotten; the catalog's never are
+    assert index.canonicalize("beloved").title == "beloved"
+    assert index.canonicalize("dune").title == "Dune" and len(index) == 1
+
+
+def test_series_titles_do_not_swallow_their_installments():
+    index = TitleIndex()
+    index.add_many(["Batman", "Sapiens"])
+    assert index.lookup("Batman: Year One") is None
+    assert index.lookup("Sapiens: A Graphic History") is None
+
+    merged = TitleIndex().canonicalize_gists({
+        "Star Wars": "a", "Star Wars: A New Hope": "b", "Star Wars: The Empire Strikes Back": "c",
+        "Death by Black Hole": "d", "Death": "e",
+    })
+    assert list(merged) == [
+        "Star Wars", "Star Wars: A New Hope", "Star Wars: The Empire Strikes Back", "Death by Black Hole", "Death",
+    ]
+
+    # A bare title is not the one indexed installment either
+    index = TitleIndex()
+    index.add_many(["Batman: Year One"])
+    assert index.lookup("Batman") is None
+
+
+def test_merge_tile_gists_deduplicates_books_read_in_overlaps():
+    merged = merge_tile_gists([
+        {"Dune": "Spice.", "Harry Potter": "Wizard."},
+        {"Harry Potter and the Goblet of Fire": "A wizard tournament.", "The Hobbit": "A journey."},
+        None,
+        {"The Hobbit (J.R.R. Tolkien)": "Hobbit."},
+        {"Potter Harry": "Not adjacent to the first tile."},
+    ])
+
+    assert merged == {
+        "Dune": "Spice.",
+        "Harry Potter and the Goblet of Fire": "A wizard tournament.",
+        "The Hobbit (J.R.R. Tolkien)": "A journey.",
+        "Potter Harry": "Not adjacent to the first tile.",
+    }
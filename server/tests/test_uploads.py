@@ -0,0 +1,131 @@
+import sys
+import os
+
+# Add the parent directory (server/) to the Python path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import asyncio
+import base64
+import io
+import pytest
+from fastapi import APIRouter, FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.formparsers import MultiPartParser
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+import services.uploads as uploads
+from main import app
+from services.scan_cache import content_hash
+from services.uploads import (
+    SpooledMultiPartParser, UploadRoute, UploadTooLargeError, UploadLimitMiddleware, encode_data_uri, open_upload,
+)
+
+
+def test_open_upload_hashes_and_rewinds_without_copying():
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    received = io.BytesIO(data)
+    received.seek(100)
+
+    with asyncio.run(open_upload(UploadFile(received, filename="shelf.jpg"))) as upload:
+        assert upload.file is received
+        assert upload.size == len(data)
+        assert upload.sha256 == content_hash(data)
+        assert upload.filename == "shelf.jpg"
+        assert upload.open().read() == data
+        assert upload.open().read(4) == data[:4]
+
+
+def test_open_upload_detaches_the_file_from_the_request():
+    received = UploadFile(io.BytesIO(b"shelf"), filename="shelf.jpg")
+    upload = asyncio.run(open_upload(received, detach=True))
+
+    # Starlette closes the request's files when the handler returns
+    asyncio.run(received.close())
+    assert upload.open().read() == b"shelf"
+    upload.close()
+
+
+def test_open_upload_stops_at_the_size_limit():
+    upload = UploadFile(io.BytesIO(b"x" * 1000), filename="big.jpg")
+
+    with pytest.raises(UploadTooLargeError, match="big.jpg"):
+        asyncio.run(open_upload(upload, max_bytes=999))
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, 196607, 196608, 196609, 1_000_003])
+def test_encode_data_uri_matches_base64(size):
+    data = os.urandom(size)
+    assert encode_data_uri(data, "image/jpeg") == f"data:image/jpeg;base64,{base64.b64encode(data).decode()}"
+
+
+def test_upload_routes_spool_with_their_own_parser(monkeypatch):
+    monkeypatch.setattr(SpooledMultiPartParser, "max_file_size", 1024)
+    spool_app = FastAPI()
+    router = APIRouter(route_class=UploadRoute)
+
+    @router.post("/upload")
+    async def upload(image: UploadFile = File(...)):
+        return {"on_disk": image.file._rolled, "size": len(await image.read())}
+
+    spool_app.include_router(router)
+    client = TestClient(spool_app)
+    assert client.post("/upload", files={"image": ("a.jpg", b"x" * 100)}).json() == {"on_disk": False, "size": 100}
+    assert client.post("/upload", files={"image": ("a.jpg", b"x" * 4096)}).json() == {"on_disk": True, "size": 4096}
+    # Starlette's own parser, used by every other route, is left as it was
+    assert MultiPartParser.max_file_size == 1024 * 1024
+
+
+def test_oversized_upload_is_rejected_with_413(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_BYTES", 1024)
+    client = TestClient(app)
+
+    response = client.post("/api/process-image", files={"image": ("big.jpg", b"x" * 2048, "image/jpeg")})
+
+    assert response.status_code == 413
+    assert response.json()["status"] == "error"
+
+
+def _limited_app(received):
+    async def upload(request: Request):
+        body = b""
+        async for chunk in request.stream():
+            body += chunk
+            received.append(len(body))
+        return PlainTextResponse(str(len(body)))
+
+    app = Starlette(routes=[Route("/upload", upload, methods=["POST"])])
+    return UploadLimitMiddleware(app, max_bytes=1000, path_limits={"/batch": 5000})
+
+
+def test_upload_limit_refuses_a_declared_length_before_reading_the_body():
+    received = []
+    client = TestClient(_limited_app(received))
+
+    response = client.post("/upload", content=b"x" * 1001)
+
+    assert response.status_code == 413
+    assert response.json()["status"] == "error"
+    assert received == []
+    assert client.post("/upload", content=b"x" * 1000).text == "1000"
+
+
+def test_upload_limit_cuts_off_a_chunked_body_once_past_the_cap():
+    received, sent, pulled = [], [], []
+
+    async def receive():
+        pulled.append(1)
+        return {"type": "http.request", "body": b"x" * 300, "more_body": len(pulled) < 100}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/upload", "headers": [], "query_string": b""}
+    asyncio.run(_limited_app(received)(scope, receive, send))
+
+    assert sent[0]["status"] == 413
+    # Reading stopped at the chunk that passed the cap; the app saw only the bytes below it
+    assert len(pulled) == 4
+    assert received == [300, 600, 900]